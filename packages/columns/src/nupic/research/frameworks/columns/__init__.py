@@ -19,15 +19,23 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
-from .apical_dependent_temporal_memory import (
-    ApicalDependentSequenceMemory,
-    TripleMemory,
-)
-from .apical_tiebreak_temporal_memory import (
-    ApicalTiebreakSequenceMemory,
-    ApicalTiebreakPairMemory,
-)
 from .column_pooler import ColumnPooler
-from .temporal_memory_wrappers import (
-    ApicalTiebreakPairMemoryWrapper
-)
\ No newline at end of file
+from .column_pooler_stack import ColumnPoolerStack
+
+try:
+    from .apical_dependent_temporal_memory import (
+        ApicalDependentSequenceMemory,
+        TripleMemory,
+    )
+    from .apical_tiebreak_temporal_memory import (
+        ApicalTiebreakSequenceMemory,
+        ApicalTiebreakPairMemory,
+    )
+    from .temporal_memory_wrappers import (
+        ApicalTiebreakPairMemoryWrapper
+    )
+except ModuleNotFoundError as e:
+    # The temporal memories need nupic.bindings. The ColumnPooler can run without
+    # it, with sparseMatrixBackend="scipy".
+    if not e.name.startswith("nupic.bindings"):
+        raise
\ No newline at end of file
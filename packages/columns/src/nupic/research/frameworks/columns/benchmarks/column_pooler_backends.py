@@ -0,0 +1,152 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compares the sparse matrix backends of the ColumnPooler on the standard L2 sizes
+(16384 input bits, 4096 cells, 40 active cells).
+
+A network of --columns ColumnPoolers, laterally connected to each other, learns
+--objects objects of --features sensations each, then infers every object from
+--infer-sensations sensations. The script reports the learning and inference time
+per sensation for each backend, and the fraction of objects that were recognized.
+The bindings backend is skipped when nupic.bindings is not installed.
+
+    python column_pooler_backends.py
+    python column_pooler_backends.py --columns 3 --objects 50 --backends scipy
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from nupic.research.frameworks.columns import ColumnPooler
+
+INPUT_WIDTH = 2048 * 8
+CELL_COUNT = 4096
+SDR_SIZE = 40
+
+
+def generateObjects(numObjects, numFeatures, numColumns, activeInputs, seed):
+    """
+    Each object is a list of sensations, and each sensation holds the sorted active
+    feedforward bits of every column.
+    """
+    rng = np.random.default_rng(seed)
+    return [[[np.sort(rng.choice(INPUT_WIDTH, activeInputs, replace=False))
+              for _ in range(numColumns)]
+             for _ in range(numFeatures)]
+            for _ in range(numObjects)]
+
+
+def computeSensation(poolers, sensation, learn):
+    lateralInputs = [pooler.getActiveCells() for pooler in poolers]
+    for i, pooler in enumerate(poolers):
+        pooler.compute(
+            feedforwardInput=sensation[i],
+            lateralInputs=[cells for j, cells in enumerate(lateralInputs)
+                           if j != i],
+            learn=learn)
+
+
+def runBackend(backend, objects, numColumns, inferSensations, seed):
+    poolers = [ColumnPooler(inputWidth=INPUT_WIDTH,
+                            lateralInputWidths=[CELL_COUNT] * (numColumns - 1),
+                            cellCount=CELL_COUNT,
+                            sdrSize=SDR_SIZE,
+                            seed=seed + i,
+                            sparseMatrixBackend=backend)
+               for i in range(numColumns)]
+
+    numSensations = 0
+    representations = []
+    start = time.perf_counter()
+    for sensations in objects:
+        for pooler in poolers:
+            pooler.reset()
+
+        # Repeat the sensations so that the lateral connections are learned
+        for _ in range(2):
+            for sensation in sensations:
+                computeSensation(poolers, sensation, learn=True)
+                numSensations += 1
+        representations.append([set(pooler.getActiveCells()) for pooler in poolers])
+    learnTime = (time.perf_counter() - start) / numSensations
+
+    numSensations = 0
+    numRecognized = 0
+    start = time.perf_counter()
+    for sensations, representation in zip(objects, representations):
+        for pooler in poolers:
+            pooler.reset()
+
+        for sensation in sensations[:inferSensations]:
+            computeSensation(poolers, sensation, learn=False)
+            numSensations += 1
+
+        numRecognized += all(set(pooler.getActiveCells()) == cells
+                             for pooler, cells in zip(poolers, representation))
+    inferTime = (time.perf_counter() - start) / numSensations
+
+    return {
+        "learn": learnTime,
+        "infer": inferTime,
+        "recognized": numRecognized / len(objects),
+        "synapses": sum(pooler.numberOfProximalSynapses()
+                        + pooler.numberOfDistalSynapses()
+                        for pooler in poolers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=["bindings", "scipy"],
+                        default=["bindings", "scipy"])
+    parser.add_argument("--columns", type=int, default=1)
+    parser.add_argument("--objects", type=int, default=20)
+    parser.add_argument("--features", type=int, default=10)
+    parser.add_argument("--infer-sensations", type=int, default=3)
+    parser.add_argument("--active-inputs", type=int, default=40,
+                        help="number of active feedforward bits per sensation")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    objects = generateObjects(args.objects, args.features, args.columns,
+                              args.active_inputs, args.seed)
+
+    print("{:<10}{:>14}{:>14}{:>12}{:>12}".format(
+        "backend", "learn (ms)", "infer (ms)", "recognized", "synapses"))
+    for backend in args.backends:
+        try:
+            result = runBackend(backend, objects, args.columns,
+                                args.infer_sensations, args.seed)
+        except ImportError as e:
+            print("{:<10}skipped: {}".format(backend, e))
+            continue
+
+        print("{:<10}{:>14.3f}{:>14.3f}{:>12.2f}{:>12}".format(
+            backend, result["learn"] * 1000, result["infer"] * 1000,
+            result["recognized"], result["synapses"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -21,8 +21,6 @@
 
 import numpy
 
-from nupic.bindings.math import Random, SparseMatrix
-
 
 class ColumnPooler(object):
   """
@@ -58,7 +56,8 @@ class ColumnPooler(object):
                connectedPermanenceDistal=0.50,
                inertiaFactor=1.,
 
-               seed=42):
+               seed=42,
+               sparseMatrixBackend="bindings"):
     """
     Parameters:
     ----------------------------
@@ -143,6 +142,12 @@ class ColumnPooler(object):
 
     @param  seed (int)
             Random number generator seed
+
+    @param  sparseMatrixBackend (str)
+            Implementation of the permanence matrices and random number
+            generator: "bindings" for nupic.bindings SparseMatrix and Random, or
+            "scipy" for scipy.sparse matrices and a numpy generator, which don't
+            need nupic.bindings. The two backends draw different random numbers.
     """
 
     assert maxSdrSize is None or maxSdrSize >= sdrSize
@@ -176,6 +181,19 @@ class ColumnPooler(object):
     self.inertiaFactor = inertiaFactor
 
     self.activeCells = numpy.empty(0, dtype="uint32")
+
+    # Only import the selected backend, so that nupic.bindings is not required
+    # for the scipy backend.
+    if sparseMatrixBackend == "bindings":
+      from nupic.bindings.math import Random, SparseMatrix
+    elif sparseMatrixBackend == "scipy":
+      from .sparse_matrix import NumpyRandom as Random
+      from .sparse_matrix import ScipySparseMatrix as SparseMatrix
+    else:
+      raise ValueError("Unknown sparse matrix backend: {}".format(
+        sparseMatrixBackend))
+    self.sparseMatrixBackend = sparseMatrixBackend
+
     self._random = Random(seed)
 
     # These sparse matrices will hold the synapses for each segment.
@@ -348,6 +366,24 @@ class ColumnPooler(object):
         lateralInput, self.connectedPermanenceDistal)
       numActiveSegmentsByCell[overlaps >= self.activationThresholdDistal] += 1
 
+    self._activateCells(feedforwardSupportedCells, numActiveSegmentsByCell)
+
+  def _activateCells(self, feedforwardSupportedCells, numActiveSegmentsByCell):
+    """
+    Choose the active cells of inference mode from the feedforward supported
+    cells, the previously active cells and their lateral support.
+
+    Parameters:
+    ----------------------------
+    @param  feedforwardSupportedCells (numpy array)
+            Sorted indices of the cells with enough feedforward overlap
+
+    @param  numActiveSegmentsByCell (numpy array)
+            Number of active distal segments (internal and lateral) of each cell
+    """
+
+    prevActiveCells = self.activeCells
+
     chosenCells = []
 
     # First, activate the FF-supported cells that have the highest number of
@@ -660,6 +696,10 @@ def _countWhereGreaterEqualInRows(sparseMatrix, rows, threshold):
   Like countWhereGreaterOrEqual, but for an arbitrary selection of rows, and
   without any column filtering.
   """
+  if hasattr(sparseMatrix, "countWhereGreaterEqualInRows"):
+    # vectorized over the rows
+    return sparseMatrix.countWhereGreaterEqualInRows(list(rows), threshold)
+
   return sum(sparseMatrix.countWhereGreaterEqual(row, row + 1,
                                                  0, sparseMatrix.nCols(),
                                                  threshold)
@@ -0,0 +1,195 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Runs the ColumnPoolers of several laterally connected cortical columns as one
+batched computation.
+"""
+
+import numpy as np
+import scipy.sparse
+
+
+class ColumnPoolerStack(object):
+    """
+    Network of ColumnPoolers, one per cortical column, where the lateral inputs of
+    each pooler are the previous active cells of all the other poolers, in column
+    order (as in L4L2Experiment).
+
+    In inference, the connected synapses of every pooler are stacked into two
+    sparse matrices: one maps the feedforward inputs of all columns to the cells of
+    all columns, the other maps the previous active cells of all columns to the
+    distal segments (internal and lateral) of all columns. A timestep then computes
+    every overlap with two sparse matrix products, instead of one product per pooler
+    and lateral input, and each pooler only chooses its active cells. The stacked
+    matrices are rebuilt when the connected synapses of a pooler change.
+
+    Learning runs each pooler in turn. The poolers must use the scipy sparse matrix
+    backend, and give the same active cells as when they are run one by one.
+    """
+
+    def __init__(self, poolers):
+        self.poolers = list(poolers)
+
+        numColumns = len(self.poolers)
+        for i, pooler in enumerate(self.poolers):
+            if pooler.sparseMatrixBackend != "scipy":
+                raise ValueError("ColumnPoolerStack requires the scipy sparse "
+                                 "matrix backend")
+            expectedWidths = [other.numberOfCells()
+                              for j, other in enumerate(self.poolers) if j != i]
+            lateralWidths = [permanences.nCols()
+                             for permanences in pooler.distalPermanences]
+            if lateralWidths != expectedWidths:
+                raise ValueError("The lateral inputs of column {} must be the "
+                                 "cells of the other {} columns".format(
+                                     i, numColumns - 1))
+
+        self._inputOffsets = np.cumsum(
+            [0] + [pooler.numberOfInputs() for pooler in self.poolers])
+        self._cellOffsets = np.cumsum(
+            [0] + [pooler.numberOfCells() for pooler in self.poolers])
+
+        # one row of distal segments per (column, source column, cell)
+        self._segmentOffsets = np.cumsum(
+            [0] + [numColumns * pooler.numberOfCells() for pooler in self.poolers])
+
+        # connected matrices the stacked matrices were built from
+        self._blocks = None
+        self._proximal = None
+        self._distal = None
+
+    def __getstate__(self):
+        # the stacked matrices are rebuilt on the next inference
+        state = self.__dict__.copy()
+        state.update(_blocks=None, _proximal=None, _distal=None)
+        return state
+
+    def compute(self, feedforwardInputs, feedforwardGrowthCandidates=None,
+                learn=True):
+        """
+        Run one timestep of every pooler.
+
+        Parameters:
+        ----------------------------
+        @param  feedforwardInputs (list of sequences)
+                For each column, sorted indices of active feedforward input bits
+
+        @param  feedforwardGrowthCandidates (list of sequences or None)
+                For each column, sorted indices of feedforward input bits that
+                active cells may grow new synapses to. If None, the feedforward
+                inputs are used.
+
+        @param  learn (bool)
+                If True, we are learning a new object
+        """
+        prevActiveCells = [pooler.getActiveCells() for pooler in self.poolers]
+
+        if learn:
+            if feedforwardGrowthCandidates is None:
+                feedforwardGrowthCandidates = feedforwardInputs
+
+            for i, pooler in enumerate(self.poolers):
+                pooler.compute(
+                    feedforwardInput=feedforwardInputs[i],
+                    lateralInputs=[cells for j, cells in enumerate(prevActiveCells)
+                                   if j != i],
+                    feedforwardGrowthCandidates=feedforwardGrowthCandidates[i],
+                    learn=True)
+        else:
+            self._computeInferenceMode(feedforwardInputs, prevActiveCells)
+
+    def _computeInferenceMode(self, feedforwardInputs, prevActiveCells):
+        self._updateStackedMatrices()
+
+        proximalOverlaps = _stackedOverlaps(
+            self._proximal, feedforwardInputs, self._inputOffsets)
+        distalOverlaps = _stackedOverlaps(
+            self._distal, prevActiveCells, self._cellOffsets)
+
+        numColumns = len(self.poolers)
+        for i, pooler in enumerate(self.poolers):
+            overlaps = proximalOverlaps[self._cellOffsets[i]:
+                                        self._cellOffsets[i + 1]]
+            feedforwardSupportedCells = np.where(
+                overlaps >= pooler.minThresholdProximal)[0]
+
+            overlaps = distalOverlaps[self._segmentOffsets[i]:
+                                      self._segmentOffsets[i + 1]]
+            activeSegments = (overlaps.reshape(numColumns, pooler.numberOfCells())
+                              >= pooler.activationThresholdDistal)
+
+            pooler._activateCells(feedforwardSupportedCells,
+                                  activeSegments.sum(axis=0))
+
+    def _updateStackedMatrices(self):
+        """
+        Rebuild the stacked matrices if a connected matrix changed since they were
+        built. ScipySparseMatrix caches its connected matrices until a modification,
+        so an unchanged matrix is the same object.
+        """
+        numColumns = len(self.poolers)
+
+        proximalBlocks = [
+            pooler.proximalPermanences.connectedMatrix(
+                pooler.connectedPermanenceProximal)
+            for pooler in self.poolers]
+
+        # distalBlocks[i][j] connects the cells of column j to the segments of
+        # column i: the internal distal segments if i == j, else the lateral ones
+        distalBlocks = []
+        for i, pooler in enumerate(self.poolers):
+            lateral = iter(pooler.distalPermanences)
+            distalBlocks.append([
+                (pooler.internalDistalPermanences if i == j else next(lateral))
+                .connectedMatrix(pooler.connectedPermanenceDistal)
+                for j in range(numColumns)])
+
+        blocks = proximalBlocks + sum(distalBlocks, [])
+        if self._blocks is not None and all(
+                a is b for a, b in zip(blocks, self._blocks)):
+            return
+
+        self._proximal = scipy.sparse.block_diag(proximalBlocks, format="csc")
+
+        # each (column, source column) pair gets its own rows, so that the segments
+        # of a cell are thresholded separately
+        rows = []
+        for row in distalBlocks:
+            for j, block in enumerate(row):
+                rows.append([block if k == j else None for k in range(numColumns)])
+        self._distal = scipy.sparse.bmat(rows, format="csc")
+
+        self._blocks = blocks
+
+
+def _stackedOverlaps(connected, activeBits, offsets):
+    """
+    Number of active connected synapses on each row of a stacked matrix, given the
+    active bits of each column block.
+    """
+    cols = np.concatenate([np.asarray(bits, dtype=np.int64) + offset
+                           for bits, offset in zip(activeBits, offsets)])
+    if cols.size == 0:
+        return np.zeros(connected.shape[0], dtype=np.int32)
+
+    return np.asarray(connected[:, cols].sum(axis=1), dtype=np.int32).ravel()
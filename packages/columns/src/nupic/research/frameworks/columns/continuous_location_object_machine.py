@@ -144,17 +144,17 @@ class ContinuousLocationObjectMachine(ObjectMachineBase):
         #  location name and number of points
         if len(element) == 2:
           featureName, numLocations = element
-          for _ in range(numLocations):
-            location = physicalObject.sampleLocationFromFeature(featureName)
-            sensationList.append(
-              self._getSDRPairs(
-                [(location,
-                  physicalObject.getFeatureID(location))] * self.numColumns
-              )
+          locations = physicalObject.sampleLocations(numLocations, featureName)
+          featureIDs = physicalObject.getFeatureIDs(locations)
+          sensationList.extend(
+            self._getSDRPairsBatch(
+              [[(location, featureID)] * self.numColumns
+               for location, featureID in zip(locations, featureIDs)]
             )
-            if plot:
-              x, y, z = tuple(location)
-              ax.scatter(x, y, z, marker="v", s=100, c="r")
+          )
+          if plot and numLocations > 0:
+            ax.scatter(locations[:, 0], locations[:, 1], locations[:, 2],
+                       marker="v", s=100, c="r")
 
         # explicit location
         elif len(element) == 3:
@@ -237,29 +237,38 @@ class ContinuousLocationObjectMachine(ObjectMachineBase):
       fig, ax = physicalObject.plot()
       colors = plt.cm.rainbow(np.linspace(0, 1, numSteps))
 
-    sensationSteps = []
-    for step in range(numSteps):
-      pairs = [
-        inferenceConfig["pairs"][col][step] for col in range(self.numColumns)
-      ]
-      for i in range(len(pairs)):
-        if isinstance(pairs[i], str):
-          location = physicalObject.sampleLocationFromFeature(pairs[i])
-          pairs[i] = (
-            location,
-            physicalObject.getFeatureID(location)
-          )
-        else:
-          location = pairs[i]
-          pairs[i] = (
-            location,
-            physicalObject.getFeatureID(location)
-          )
-        if plot:
+    specs = [
+      [inferenceConfig["pairs"][col][step] for col in range(self.numColumns)]
+      for step in range(numSteps)
+    ]
+
+    # sample the locations of all steps at once, feature by feature
+    featureNames = [spec for pairs in specs for spec in pairs
+                    if isinstance(spec, str)]
+    sampledLocations = {
+      featureName: iter(physicalObject.sampleLocations(
+        featureNames.count(featureName), featureName))
+      for featureName in set(featureNames)
+    }
+    locations = [
+      [next(sampledLocations[spec]) if isinstance(spec, str) else spec
+       for spec in pairs]
+      for pairs in specs
+    ]
+    featureIDs = physicalObject.getFeatureIDs(
+      [location for pairs in locations for location in pairs]
+    ).reshape(numSteps, self.numColumns)
+
+    if plot:
+      for step in range(numSteps):
+        for location in locations[step]:
           x, y, z = tuple(location)
           ax.scatter(x, y, z, marker="v", s=100, c=colors[step])
 
-      sensationSteps.append(self._getSDRPairs(pairs, noise=noise))
+    sensationSteps = self._getSDRPairsBatch(
+      [list(zip(locations[step], featureIDs[step])) for step in range(numSteps)],
+      noise=noise
+    )
 
     if plot:
       plt.title("Inference points for object {}".format(
@@ -291,34 +300,65 @@ class ContinuousLocationObjectMachine(ObjectMachineBase):
     In each pair, the location is an actual integer location to be encoded,
     and the feature is just an index.
     """
-    sensations = {}
-    for col in range(self.numColumns):
-      location, featureID = pairs[col]
-      location = [int(coord) for coord in location]
+    return self._getSDRPairsBatch([pairs], noise=noise)[0]
 
-      location = self.locationEncoder.encode(
-        (np.array(location, dtype="int32"), self._getRadius(location))
-      )
-      location = set(location.nonzero()[0])
-
-      # generate empty feature if requested
-      if featureID == -1:
-        feature = set()
-      # generate union of features if requested
-      elif isinstance(featureID, tuple):
-        feature = set()
-        for idx in list(featureID):
-          feature = feature | self.features[col][idx]
-      else:
-        feature = self.features[col][featureID]
+  def _getSDRPairsBatch(self, pairsList, noise=None):
+    """
+    Batched version of _getSDRPairs: takes a list of sensations, each one being
+    a list of (location, feature) pairs, and returns the list of sensation
+    dicts.
+
+    Each distinct location is only encoded once, however many sensations and
+    cortical columns it appears in.
+    """
+    locationSDRs = self._encodeLocations(
+      [location for pairs in pairsList for location, _ in pairs]
+    )
+
+    sensationsList = []
+    for pairs in pairsList:
+      sensations = {}
+      for col in range(self.numColumns):
+        location, featureID = pairs[col]
+        location = set(locationSDRs[tuple(int(coord) for coord in location)])
+
+        # generate empty feature if requested
+        if featureID == -1:
+          feature = set()
+        # generate union of features if requested
+        elif isinstance(featureID, tuple):
+          feature = set()
+          for idx in list(featureID):
+            feature = feature | self.features[col][idx]
+        else:
+          feature = self.features[col][featureID]
+
+        if noise is not None:
+          location = self._addNoise(location, noise)
+          feature = self._addNoise(feature, noise)
+
+        sensations[col] = (location, feature)
 
-      if noise is not None:
-        location = self._addNoise(location, noise)
-        feature = self._addNoise(feature, noise)
+      sensationsList.append(sensations)
 
-      sensations[col] = (location, feature)
+    return sensationsList
 
-    return sensations
+  def _encodeLocations(self, locations):
+    """
+    Encodes the provided locations with the location encoder, after converting
+    them to integers. Returns a dict from each distinct integer location (as a
+    tuple) to the active bits of its encoding.
+    """
+    locationSDRs = {}
+    for location in locations:
+      location = tuple(int(coord) for coord in location)
+      if location not in locationSDRs:
+        encoding = self.locationEncoder.encode(
+          (np.array(location, dtype="int32"), self._getRadius(location))
+        )
+        locationSDRs[location] = encoding.nonzero()[0]
+
+    return locationSDRs
 
   def _getRadius(self, location):
     """
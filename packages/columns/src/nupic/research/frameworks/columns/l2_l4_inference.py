@@ -79,6 +79,7 @@ projects/layers/multi_column.py
 
 import collections
 import os
+import pickle
 import random
 from math import ceil
 
@@ -87,10 +88,22 @@ import numpy as np
 
 from nupic.bindings.algorithms import SpatialPooler
 from nupic.bindings.math import SparseMatrix
-from nupic.research.frameworks.columns import ColumnPooler
+from nupic.research.frameworks.columns import ColumnPooler, ColumnPoolerStack
 from nupic.research.frameworks.columns.support.logging_decorator import LoggingDecorator
 
 
+def _stackedIndices(activeBits):
+  """
+  Index of the active bits of every column in a stacked (numColumns, size)
+  array.
+  """
+  rows = np.repeat(np.arange(len(activeBits)),
+                   [len(bits) for bits in activeBits])
+  cols = np.concatenate([np.asarray(bits, dtype="int64")
+                         for bits in activeBits])
+  return rows, cols
+
+
 def rerunExperimentFromLogfile(logFilename):
   """
   Create an experiment class according to the sequence of operations in logFile
@@ -142,7 +155,8 @@ class L4L2Experiment(object):
                enableFeedForwardSP=False,
                feedForwardSPOverrides=None,
                objectNamesAreIndices=False,
-               enableFeedback=True
+               enableFeedback=True,
+               batchColumns=False
                ):
     """
     Creates the network.
@@ -213,6 +227,13 @@ class L4L2Experiment(object):
     @param   enableFeedback (bool)
              If True, enable feedback between L2 and L4
 
+    @param   batchColumns (bool)
+             If True, the L2 layers of all columns run as a ColumnPoolerStack:
+             in inference, one timestep computes the L2 overlaps of every column
+             with stacked sparse matrix products. This uses the scipy sparse
+             matrix backend for L2, and gives the same results as running the
+             columns one by one.
+
     """
     # Handle logging - this has to be done first
     self.logCalls = logCalls
@@ -238,6 +259,12 @@ class L4L2Experiment(object):
 
       self.L4FeedforwardSPs = [SpatialPooler(**SPParams)
                                for _ in range(numCorticalColumns)]
+
+      # Dense input and output of each column's SP, reused every timestep
+      self.featureDense = np.zeros((numCorticalColumns, inputSize),
+                                   dtype="uint32")
+      self.feedforwardSPOutput = np.zeros((numCorticalColumns, inputSize),
+                                          dtype="uint32")
     else:
       self.L4FeedforwardSPs = None
 
@@ -251,6 +278,11 @@ class L4L2Experiment(object):
 
       self.L4LateralSPs = [SpatialPooler(**SPParams)
                            for _ in range(numCorticalColumns)]
+
+      self.locationDense = np.zeros((numCorticalColumns, externalInputSize),
+                                    dtype="uint32")
+      self.lateralSPOutput = np.zeros((numCorticalColumns, externalInputSize),
+                                      dtype="uint32")
     else:
       self.L4LateralSPs = None
 
@@ -274,10 +306,16 @@ class L4L2Experiment(object):
     # L2
     self.L2Params = self.getDefaultL2Params(numCorticalColumns, inputSize,
                                             numInputBits)
+    if batchColumns:
+      self.L2Params["sparseMatrixBackend"] = "scipy"
     if L2Overrides is not None:
       self.L2Params.update(L2Overrides)
     self.L2Columns = [ColumnPooler(**self.L2Params)
                       for _ in range(numCorticalColumns)]
+    if batchColumns:
+      self.L2Stack = ColumnPoolerStack(self.L2Columns)
+    else:
+      self.L2Stack = None
 
     # L4
     self.L4Impl = L4Impl
@@ -325,36 +363,42 @@ class L4L2Experiment(object):
 
     prevL2Representations = [L2.getActiveCells() for L2 in self.L2Columns]
 
+    locations = [sorted(sensations[col][0]) for col in range(self.numColumns)]
+    features = [sorted(sensations[col][1]) for col in range(self.numColumns)]
+
+    # Densify the SP inputs of all columns at once
+    if self.L4FeedforwardSPs is not None:
+      self.featureDense.fill(0)
+      self.featureDense[_stackedIndices(features)] = 1
+      self.feedforwardSPOutput.fill(0)
+    if self.L4LateralSPs is not None:
+      self.locationDense.fill(0)
+      self.locationDense[_stackedIndices(locations)] = 1
+      self.lateralSPOutput.fill(0)
+
     for col in range(self.numColumns):
-      location, feature = sensations[col]
-      location = sorted(location)
-      feature = sorted(feature)
       L2 = self.L2Columns[col]
       L4 = self.L4Columns[col]
 
       # Compute L4's active columns
       if self.L4FeedforwardSPs is not None:
-        featureDense = np.zeros(self.inputSize, dtype="uint32")
-        featureDense[feature] = 1
-
-        spOutput = np.zeros(self.inputSize, dtype="uint32")
-        self.L4FeedforwardSPs[col].compute(featureDense, learn, spOutput)
+        spOutput = self.feedforwardSPOutput[col]
+        self.L4FeedforwardSPs[col].compute(self.featureDense[col], learn,
+                                           spOutput)
 
         activeColumns = spOutput.nonzero()[0]
       else:
-        activeColumns = np.asarray(feature, dtype="uint32")
+        activeColumns = np.asarray(features[col], dtype="uint32")
 
       # Compute L4's distal basal input
       if self.L4LateralSPs is not None:
-        locationDense = np.zeros(self.externalInputSize, dtype="uint32")
-        locationDense[location] = 1
-
-        spOutput = np.zeros(self.externalInputSize, dtype="uint32")
-        self.L4LateralSPs[col].compute(locationDense, learn, spOutput)
+        spOutput = self.lateralSPOutput[col]
+        self.L4LateralSPs[col].compute(self.locationDense[col], learn,
+                                       spOutput)
 
         basalInput = spOutput.nonzero()[0]
       else:
-        basalInput = np.asarray(location, dtype="uint32")
+        basalInput = np.asarray(locations[col], dtype="uint32")
 
       # Compute L4's active cells
       if self.enableFeedback:
@@ -363,6 +407,12 @@ class L4L2Experiment(object):
         apicalInput = ()
       L4.compute(activeColumns, basalInput, apicalInput, learn=learn)
 
+      # The L2 stack computes every column after the L4 loop. L4 only reads
+      # its own column's L2 cells from before this timestep, so the results
+      # are the same.
+      if self.L2Stack is not None:
+        continue
+
       # Compute L2's active cells
       lateralInputs = [prevActiveCells
                        for i, prevActiveCells in enumerate(
@@ -373,6 +423,13 @@ class L4L2Experiment(object):
                  lateralInputs=lateralInputs,
                  learn=learn)
 
+    if self.L2Stack is not None:
+      self.L2Stack.compute(
+        feedforwardInputs=[L4.getActiveCells() for L4 in self.L4Columns],
+        feedforwardGrowthCandidates=[L4.getPredictedActiveCells()
+                                     for L4 in self.L4Columns],
+        learn=learn)
+
   @LoggingDecorator()
   def learnObjects(self, objects, reset=True):
     """
@@ -538,6 +595,72 @@ class L4L2Experiment(object):
   def resetStatistics(self):
     self.statistics = []
 
+  def snapshot(self):
+    """
+    Returns a snapshot (bytes) of the full network state: the L4 and L2 layers
+    with their permanences, the SPs, the learned object representations, the
+    statistics and the state of the global random number generators.
+
+    restore() or fromSnapshot() bring the network back to this state, so a set
+    of objects can be learned once and then inferred many times with different
+    inference parameters, giving the same results as learning them each time.
+    The layers are serialized with pickle, which the Python L4 supports:
+    snapshots require L4Impl="py".
+    """
+    if self.L4Impl != "py":
+      raise ValueError("Snapshots require L4Impl='py', the nupic.bindings L4 "
+                       "(L4Impl='cpp') is not supported")
+
+    return pickle.dumps({
+      "state": self.__dict__,
+      "random": random.getstate(),
+      "numpyRandom": np.random.get_state(),
+    }, protocol=pickle.HIGHEST_PROTOCOL)
+
+  def restore(self, snapshot):
+    """
+    Restore the network state from a snapshot. The snapshot is unpickled into
+    new layers, so it can be restored any number of times.
+
+    The global random and numpy.random states are overwritten with the states
+    saved in the snapshot.
+
+    Parameters:
+    ----------------------------
+    @param   snapshot (bytes-like)
+             Snapshot returned by snapshot(), or any buffer with its bytes
+             (e.g. a numpy uint8 array)
+    """
+    snapshot = pickle.loads(snapshot)
+    self.__dict__ = snapshot["state"]
+    random.setstate(snapshot["random"])
+    np.random.set_state(snapshot["numpyRandom"])
+
+  @classmethod
+  def fromSnapshot(cls, snapshot):
+    """
+    Create a network from a snapshot, without building and learning it. Like
+    restore(), this overwrites the global random and numpy.random states.
+    """
+    exp = cls.__new__(cls)
+    exp.restore(snapshot)
+    return exp
+
+  def save(self, filename):
+    """
+    Save a snapshot of the network state to a file.
+    """
+    with open(filename, "wb") as f:
+      f.write(self.snapshot())
+
+  @classmethod
+  def load(cls, filename):
+    """
+    Create a network from a snapshot saved with save().
+    """
+    with open(filename, "rb") as f:
+      return cls.fromSnapshot(f.read())
+
   def plotInferenceStats(self,
                          fields,
                          plotDir="plots",
@@ -830,7 +953,7 @@ class L4L2Experiment(object):
     }
 
     if self.L4Impl == "py":
-      params["reducedBasalThreshold"] = int(activationThreshold * 0.6),
+      params["reducedBasalThreshold"] = int(activationThreshold * 0.6)
 
     return params
 
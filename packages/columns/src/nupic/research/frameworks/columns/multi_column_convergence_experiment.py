@@ -24,18 +24,129 @@ convergence of L4-L2 as you increase the number of columns under various
 scenarios.
 """
 
+import os
 import pickle
 import random
-import time
-from multiprocessing import Pool
 
 import numpy
 
 from nupic.research.frameworks.columns.l2_l4_inference import L4L2Experiment
 from nupic.research.frameworks.columns.object_machine_factory import createObjectMachine
+from nupic.research.frameworks.columns.sweep import runSweep
 
+# Parameters that determine the objects of an experiment
+OBJECT_PARAMS = ("numObjects", "numLocations", "numFeatures", "numColumns",
+                 "numPoints", "trialNum")
 
-def runExperiment(args):
+# Parameters that determine the learned network of an experiment
+LEARNING_PARAMS = OBJECT_PARAMS + ("longDistanceConnections", "enableFeedback",
+                                   "l2Params", "l4Params", "L4Impl")
+
+
+def generateObjects(args):
+  """
+  Create the objects of an experiment. Only the OBJECT_PARAMS of args are used,
+  so experiments that only differ in other parameters can share the objects.
+  """
+  numObjects = args.get("numObjects", 10)
+  numLocations = args.get("numLocations", 10)
+  numFeatures = args.get("numFeatures", 10)
+  numColumns = args.get("numColumns", 2)
+  numPoints = args.get("numPoints", 10)
+  trialNum = args.get("trialNum", 42)
+
+  objects = createObjectMachine(
+    machineType="simple",
+    numInputBits=20,
+    sensorInputSize=150,
+    externalInputSize=2400,
+    numCorticalColumns=numColumns,
+    numFeatures=numFeatures,
+    numLocations=numLocations,
+    seed=trialNum
+  )
+
+  objects.createRandomObjects(numObjects, numPoints=numPoints,
+                              numLocations=numLocations,
+                              numFeatures=numFeatures)
+
+  r = objects.objectConfusion()
+  print("Average common pairs in objects=", r[0], end="" "")
+  print(", locations=", r[1], ", features=", r[2])
+
+  # print "Total number of objects created:",len(objects.getObjects())
+  # print "Objects are:"
+  # for o in objects:
+  #   pairs = objects[o]
+  #   pairs.sort()
+  #   print str(o) + ": " + str(pairs)
+
+  return objects
+
+
+def createExperiment(args):
+  """
+  Create the L4L2Experiment of an experiment. Only the LEARNING_PARAMS of args
+  are used.
+  """
+  numObjects = args.get("numObjects", 10)
+  numLocations = args.get("numLocations", 10)
+  numFeatures = args.get("numFeatures", 10)
+  numColumns = args.get("numColumns", 2)
+  longDistanceConnections = args.get("longDistanceConnections", 0)
+  trialNum = args.get("trialNum", 42)
+  enableFeedback = args.get("enableFeedback", True)
+  l2Params = args.get("l2Params", None)
+  l4Params = args.get("l4Params", None)
+  L4Impl = args.get("L4Impl", "cpp")
+
+  name = "convergence_O%03d_L%03d_F%03d_C%03d_T%03d" % (
+    numObjects, numLocations, numFeatures, numColumns, trialNum
+  )
+  return L4L2Experiment(
+    name,
+    numCorticalColumns=numColumns,
+    L2Overrides=l2Params,
+    L4Overrides=l4Params,
+    L4Impl=L4Impl,
+    longDistanceConnections=longDistanceConnections,
+    inputSize=150,
+    externalInputSize=2400,
+    numInputBits=20,
+    seed=trialNum,
+    enableFeedback=enableFeedback,
+  )
+
+
+def learnExperiment(args):
+  """
+  Generate the objects of an experiment and learn them. Returns the object
+  machine and a snapshot of the learned network, to be shared by experiments
+  that only differ in inference parameters (see inferLearnedExperiment).
+  Snapshots require the Python L4: args must set "L4Impl" to "py".
+
+  The snapshot is returned as a numpy array of bytes, so that runSweep keeps a
+  single copy of it in shared memory. Each experiment still unpickles its own
+  copy of the network from it, since inference changes the network state.
+  """
+  objects = generateObjects(args)
+  exp = createExperiment(args)
+  exp.learnObjects(objects.provideObjectsToLearn())
+
+  return {"objects": objects,
+          "snapshot": numpy.frombuffer(exp.snapshot(), dtype=numpy.uint8)}
+
+
+def inferLearnedExperiment(args, learned):
+  """
+  Run an experiment on the objects and network learned by learnExperiment(args),
+  without learning them again.
+  """
+  return runExperiment(args, objects=learned["objects"],
+                       exp=L4L2Experiment.fromSnapshot(learned["snapshot"]))
+
+
+def runExperiment(args, objects=None, exp=None):
   """
   Run experiment.  What did you think this does?
 
@@ -70,6 +181,15 @@ def runExperiment(args):
   @param numAmbiguousLocations (int) number of ambiguous locations. Ambiguous
                              locations will present during inference if this
                              parameter is set to be a positive number
+  @param L4Impl (str)        "py" or "cpp" for the Python or nupic.bindings L4.
+                             Default: "cpp"
+
+  objects is the object machine from generateObjects(args). If None, the
+  objects are generated.
+
+  exp is a network that has learned the objects, e.g. restored from the snapshot
+  of learnExperiment(args). If None, the network is created and learns the
+  objects.
 
   The method returns the args dict updated with multiple additional keys
   representing accuracy metrics.
@@ -78,7 +198,6 @@ def runExperiment(args):
   numLocations = args.get("numLocations", 10)
   numFeatures = args.get("numFeatures", 10)
   numColumns = args.get("numColumns", 2)
-  longDistanceConnections = args.get("longDistanceConnections", 0)
   locationNoise = args.get("locationNoise", 0.0)
   featureNoise = args.get("featureNoise", 0.0)
   numPoints = args.get("numPoints", 10)
@@ -86,56 +205,16 @@ def runExperiment(args):
   plotInferenceStats = args.get("plotInferenceStats", True)
   settlingTime = args.get("settlingTime", 3)
   includeRandomLocation = args.get("includeRandomLocation", False)
-  enableFeedback = args.get("enableFeedback", True)
   numAmbiguousLocations = args.get("numAmbiguousLocations", 0)
-  l2Params = args.get("l2Params", None)
-  l4Params = args.get("l4Params", None)
 
   # Create the objects
-  objects = createObjectMachine(
-    machineType="simple",
-    numInputBits=20,
-    sensorInputSize=150,
-    externalInputSize=2400,
-    numCorticalColumns=numColumns,
-    numFeatures=numFeatures,
-    numLocations=numLocations,
-    seed=trialNum
-  )
-
-  objects.createRandomObjects(numObjects, numPoints=numPoints,
-                              numLocations=numLocations,
-                              numFeatures=numFeatures)
-
-  r = objects.objectConfusion()
-  print("Average common pairs in objects=", r[0], end="" "")
-  print(", locations=", r[1], ", features=", r[2])
-
-  # print "Total number of objects created:",len(objects.getObjects())
-  # print "Objects are:"
-  # for o in objects:
-  #   pairs = objects[o]
-  #   pairs.sort()
-  #   print str(o) + ": " + str(pairs)
+  if objects is None:
+    objects = generateObjects(args)
 
   # Setup experiment and train the network
-  name = "convergence_O%03d_L%03d_F%03d_C%03d_T%03d" % (
-    numObjects, numLocations, numFeatures, numColumns, trialNum
-  )
-  exp = L4L2Experiment(
-    name,
-    numCorticalColumns=numColumns,
-    L2Overrides=l2Params,
-    L4Overrides=l4Params,
-    longDistanceConnections=longDistanceConnections,
-    inputSize=150,
-    externalInputSize=2400,
-    numInputBits=20,
-    seed=trialNum,
-    enableFeedback=enableFeedback,
-  )
-
-  exp.learnObjects(objects.provideObjectsToLearn())
+  if exp is None:
+    exp = createExperiment(args)
+    exp.learnObjects(objects.provideObjectsToLearn())
 
   # For inference, we will check and plot convergence for each object. For each
   # object, we create a sequence of random sensations for each column.  We will
@@ -246,7 +325,10 @@ def runExperimentPool(numObjects,
                       settlingTime=3,
                       l2Params=None,
                       l4Params=None,
-                      resultsName="convergence_results.pkl"):
+                      resultsName="convergence_results.pkl",
+                      L4Impl="cpp",
+                      learnOnce=False,
+                      resume=False):
   """
   Allows you to run a number of experiments using multiple processes.
   For each parameter except numWorkers, pass in a list containing valid values
@@ -256,6 +338,21 @@ def runExperimentPool(numObjects,
   Returns a list of dict containing detailed results from each experiment.
   Also pickles and saves the results in resultsName for later analysis.
 
+  The experiments run with runSweep(): experiments with the same objects share
+  them, and each result is appended to a ".sweep" file next to resultsName as
+  soon as it completes. If resume is True, the results of the experiments
+  already in the ".sweep" file are reused, so running an interrupted sweep again
+  only runs the missing experiments. Otherwise the ".sweep" file of a previous
+  run is deleted and every experiment runs. Resuming doesn't detect code
+  changes: only resume sweeps interrupted with the same code.
+
+  If learnOnce is True, experiments that only differ in inference parameters
+  (noise, ambiguous locations, settling time) also share the learned network:
+  it is learned once and each experiment starts from a snapshot of it. The
+  snapshots require the Python L4, so learnOnce requires L4Impl="py". The Python
+  and nupic.bindings L4 are different models, so compare learn-once sweeps with
+  sweeps that also use L4Impl="py".
+
   Example:
     results = runExperimentPool(
                           numObjects=[10],
@@ -265,6 +362,10 @@ def runExperimentPool(numObjects,
                           numWorkers=8,
                           nTrials=5)
   """
+  if learnOnce and L4Impl != "py":
+    raise ValueError("learnOnce requires L4Impl='py': snapshots of the "
+                     "nupic.bindings L4 (L4Impl='cpp') are not supported")
+
   # Create function arguments for every possibility
   args = []
 
@@ -295,27 +396,22 @@ def runExperimentPool(numObjects,
                          "l2Params": l2Params,
                          "l4Params": l4Params,
                          "settlingTime": settlingTime,
+                         "L4Impl": L4Impl,
+                         "learnOnce": learnOnce,
                          }
                       )
-  numExperiments = len(args)
-  print("{} experiments to run, {} workers".format(numExperiments, numWorkers))
-  # Run the pool
-  if numWorkers > 1:
-    pool = Pool(processes=numWorkers)
-    rs = pool.map_async(runExperiment, args, chunksize=1)
-    while not rs.ready():
-      remaining = rs._number_left
-      pctDone = 100.0 - (100.0 * remaining) / numExperiments
-      print("    =>", remaining, "experiments remaining, percent complete=",
-            pctDone)
-      time.sleep(5)
-    pool.close()  # No more work
-    pool.join()
-    result = rs.get()
+  # Run the sweep
+  sweepName = os.path.splitext(resultsName)[0] + ".sweep"
+  if not resume and os.path.exists(sweepName):
+    os.remove(sweepName)
+  if learnOnce:
+    result = runSweep(inferLearnedExperiment, args, sweepName,
+                      setup=learnExperiment, setupKeys=LEARNING_PARAMS,
+                      numWorkers=numWorkers)
   else:
-    result = []
-    for arg in args:
-      result.append(runExperiment(arg))
+    result = runSweep(runExperiment, args, sweepName,
+                      setup=generateObjects, setupKeys=OBJECT_PARAMS,
+                      numWorkers=numWorkers)
 
   # print "Full results:"
   # pprint.pprint(result, width=150)
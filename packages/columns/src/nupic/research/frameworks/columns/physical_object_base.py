@@ -22,6 +22,7 @@
 from abc import ABCMeta, abstractmethod
 
 import matplotlib.pyplot as plt
+import numpy as np
 
 
 class PhysicalObject(object, metaclass=ABCMeta):
@@ -92,6 +93,28 @@ class PhysicalObject(object, metaclass=ABCMeta):
     Samples a location from the provided specific feature.
     """
 
+  def sampleLocations(self, numPoints, feature="random"):
+    """
+    Samples numPoints locations from the provided feature, as a
+    (numPoints, dimension) array.
+
+    This default behavior samples the locations one at a time. It should be
+    overriden with a vectorized version when possible.
+    """
+    return np.array([self.sampleLocationFromFeature(feature)
+                     for _ in range(numPoints)], dtype=float)
+
+  def getFeatureIDs(self, locations):
+    """
+    Returns the feature index associated with each of the provided locations,
+    as an array. Same as calling getFeatureID on every location.
+
+    This default behavior looks up the locations one at a time. It should be
+    overriden with a vectorized version when possible.
+    """
+    return np.array([self.getFeatureID(location) for location in locations],
+                    dtype=int)
+
   def almostEqual(self, number, other):
     """
     Checks that the two provided number are equal with a precision of epsilon.
@@ -27,12 +27,12 @@ used.
 """
 
 import random
-from itertools import combinations
 from math import cos, pi, sin, sqrt
 
 import matplotlib.pyplot as plt
 import numpy as np
 import plyfile as ply
+from scipy.spatial import cKDTree
 
 from nupic.research.frameworks.columns.physical_object_base import PhysicalObject
 
@@ -117,6 +117,25 @@ class Sphere(PhysicalObject):
     else:
       raise NameError("No such feature in {}: {}".format(self, feature))
 
+  def sampleLocations(self, numPoints, feature="random"):
+    """
+    Samples numPoints locations from the provided feature at once.
+    """
+    if feature not in ("surface", "random"):
+      raise NameError("No such feature in {}: {}".format(self, feature))
+
+    coordinates = np.random.normal(0, 1., (numPoints, self.dimension))
+    norms = np.sqrt((coordinates ** 2).sum(axis=1, keepdims=True))
+    return self.radius * coordinates / norms
+
+  def getFeatureIDs(self, locations):
+    """
+    Returns the feature index associated with each of the provided locations.
+    """
+    locations = np.asarray(locations, dtype=float)
+    onSurface = self.almostEqual((locations ** 2).sum(axis=1), self.radius ** 2)
+    return np.where(onSurface, self.SPHERICAL_SURFACE, self.EMPTY_FEATURE)
+
   def plot(self, numPoints=100):
     """
     Specific plotting method for cylinders.
@@ -295,6 +314,66 @@ class Cylinder(PhysicalObject):
     x, y = self.radius * cos(sampledAngle), self.radius * sin(sampledAngle)
     return [x, y, z]
 
+  def sampleLocations(self, numPoints, feature="random"):
+    """
+    Samples numPoints locations from the provided feature at once.
+    """
+    if feature in ("topDisc", "bottomDisc"):
+      radii = self.radius * np.sqrt(np.random.random(numPoints))
+      z = self.height / 2. if feature == "topDisc" else - self.height / 2.
+      return self._sampleLocationsOnCircles(radii, z)
+    elif feature in ("topEdge", "bottomEdge"):
+      radii = np.full(numPoints, float(self.radius))
+      z = self.height / 2. if feature == "topEdge" else - self.height / 2.
+      return self._sampleLocationsOnCircles(radii, z)
+    elif feature == "side":
+      radii = np.full(numPoints, float(self.radius))
+      z = np.random.uniform(-1, 1, numPoints) * self.height / 2.
+      return self._sampleLocationsOnCircles(radii, z)
+    elif feature == "random":
+      areaRatio = self.radius / (self.radius + self.height)
+      onDisc = np.random.random(numPoints) < areaRatio
+      numOnDisc = np.count_nonzero(onDisc)
+
+      locations = self.sampleLocations(numPoints, "side")
+      locations[onDisc] = self._sampleLocationsOnCircles(
+        self.radius * np.sqrt(np.random.random(numOnDisc)),
+        np.random.choice([-1, 1], numOnDisc) * self.height / 2.)
+      return locations
+    else:
+      raise NameError("No such feature in {}: {}".format(self, feature))
+
+  def _sampleLocationsOnCircles(self, radii, z):
+    """
+    Helper method to sample one location per radius on the horizontal circles
+    of the given radii, at height z (a number or one number per radius).
+    """
+    sampledAngles = 2 * np.random.random(len(radii)) * pi
+    return np.column_stack([radii * np.cos(sampledAngles),
+                            radii * np.sin(sampledAngles),
+                            np.broadcast_to(z, radii.shape)])
+
+  def getFeatureIDs(self, locations):
+    """
+    Returns the feature index associated with each of the provided locations,
+    following the same rules as getFeatureID and contains.
+    """
+    locations = np.asarray(locations, dtype=float)
+    squaredRadii = locations[:, 0] ** 2 + locations[:, 1] ** 2
+    z = locations[:, 2]
+
+    onSide = self.almostEqual(squaredRadii, self.radius ** 2)
+    contained = np.where(
+      onSide,
+      np.abs(z) < self.height / 2.,
+      self.almostEqual(z, self.height / 2.) & (squaredRadii < self.radius ** 2))
+    onDisc = self.almostEqual(np.abs(z), self.height / 2.)
+
+    return np.select(
+      [~contained, onDisc & onSide, onDisc],
+      [self.EMPTY_FEATURE, self.CYLINDER_EDGE, self.FLAT],
+      self.CYLINDER_SURFACE)
+
   def plot(self, numPoints=100):
     """
     Specific plotting method for cylinders.
@@ -453,6 +532,49 @@ class Box(PhysicalObject):
     ]
     return coordinates
 
+  def sampleLocations(self, numPoints, feature="random"):
+    """
+    Samples numPoints locations from the provided feature at once.
+
+    As with the other methods, "maxed out" dimensions are sampled first, then
+    their signs and the other dimensions' values.
+    """
+    if feature in ("face", "random"):
+      numMaxedOut = 1
+    elif feature == "edge":
+      numMaxedOut = 2
+    elif feature == "vertex":
+      numMaxedOut = self.dimension
+    else:
+      raise NameError("No such feature in {}: {}".format(self, feature))
+
+    halfDimensions = np.asarray(self.dimensions, dtype=float) / 2.
+    coordinates = (np.random.uniform(-1, 1, (numPoints, self.dimension))
+                   * halfDimensions)
+
+    # distinct random dimensions for each point
+    maxedOut = np.argsort(np.random.random((numPoints, self.dimension)),
+                          axis=1)[:, :numMaxedOut]
+    points = np.arange(numPoints)[:, None]
+    signs = np.random.choice([-1, 1], (numPoints, numMaxedOut))
+    coordinates[points, maxedOut] = halfDimensions[maxedOut] * signs
+
+    return coordinates
+
+  def getFeatureIDs(self, locations):
+    """
+    Returns the feature index associated with each of the provided locations,
+    following the same rules as getFeatureID. Locations on more than three
+    faces (in more than three dimensions) get the empty feature.
+    """
+    locations = np.asarray(locations, dtype=float)
+    halfDimensions = np.asarray(self.dimensions, dtype=float) / 2.
+    numFaces = self.almostEqual(np.abs(locations), halfDimensions).sum(axis=1)
+
+    return np.select([numFaces == 1, numFaces == 2, numFaces == 3],
+                     [self.FLAT, self.EDGE, self.POINTY],
+                     self.EMPTY_FEATURE)
+
   def plot(self, numPoints=100):
     """
     Specific plotting method for boxes.
@@ -557,7 +679,7 @@ class PlyModel(PhysicalObject):
 
   _FEATURES = ["face", "vertex", "edge", "surface"]
 
-  def __init__(self, file=None, normalTolerance=0., epsilon=None):
+  def __init__(self, file=None, normalTolerance=0., epsilon=None, seed=None):
     """
     The only key parameter to provide is location of file.
 
@@ -574,6 +696,10 @@ class PlyModel(PhysicalObject):
     @param    normalTolerance (float)
               Adjacent Faces Normal Tolerance. Defaults to zero - edges appear more.
 
+    @param    seed (int)
+              Seed of the random generators used to sample locations. Defaults
+              to None (unseeded).
+
     """
     try:
       self.file = file
@@ -586,11 +712,31 @@ class PlyModel(PhysicalObject):
       raise IOError
     self.graphicsWindow = None
     self.mesh = None
-    self.rng = random.Random()
+    self.rng = random.Random(seed)
+    self.generator = np.random.default_rng(seed)
     self.epsilon = self.DEFAULT_EPSILON if epsilon is None else epsilon
     self.sampledPoints = {i: [] for i in self._FEATURES}
     self.nTol = normalTolerance
 
+    # mesh as arrays, for the batched methods
+    self.vertexLocations = np.column_stack(
+      [self.vertices[t] for t in ("x", "y", "z")]).astype(float)
+    self.triangles = np.vstack(self.faces["vertex_indices"]).astype(np.int64)
+
+    faceVertices = self.vertexLocations[self.triangles]
+    areaNormals = np.cross(faceVertices[:, 1] - faceVertices[:, 0],
+                           faceVertices[:, 2] - faceVertices[:, 0])
+    self.faceNormals = self._normalize(areaNormals)
+
+    # vertex normals are the area-weighted mean normals of the adjacent faces
+    vertexNormals = np.zeros_like(self.vertexLocations)
+    np.add.at(vertexNormals, self.triangles, areaNormals[:, None, :])
+    self.vertexNormals = self._normalize(vertexNormals)
+
+    # spatial index used to match locations to features, built when needed
+    self._vertexTree = None
+    self._faceTrees = None
+
   def getFeatureID(self, location):
     """
     Returns the feature index associated with the provided location.
@@ -611,51 +757,123 @@ class PlyModel(PhysicalObject):
     else:
       return self.EMPTY_FEATURE
 
-  def _containsOnFace(self, location, face):
-    vertices = self.vertices[face]
-    vertices = np.array((vertices["x"], vertices["y"], vertices["z"])).T
-    v0 = vertices[2] - vertices[0]
-    v1 = vertices[1] - vertices[0]
-    v2 = location - vertices[0]
-    v3 = vertices[2] - location
-    N1 = np.cross(v0, v1)
-    N1 = N1 / (np.dot(N1, N1)) ** .5
-
-    N2 = np.cross(v2, v3)
-    N2 = N2 / (np.dot(N2, N2)) ** .5
-    if self.almostEqual(abs(np.dot(N1, N2)), 1.0):
-      return True
+  def contains(self, location):
+    """
+    Checks that the provided point is on the model (object), and returns the
+    kind of mesh element it is on: "vertex", "edge" or "face", or False.
+    """
+    featureID = self.getFeatureIDs([location])[0]
+    if featureID == self.POINTY:
+      return "vertex"
+    elif featureID == self.EDGE:
+      return "edge"
+    elif featureID == self.FLAT:
+      return "face"
     return False
 
-  def _containsOnEdge(self, location, edge):
-    edge = np.array((edge["x"], edge["y"], edge["z"])).T
-    v = edge[1] - location
-    av = v / (np.dot(v, v)) ** .5
-    d = edge[1] - edge[0]
-    ad = d / (np.dot(d, d)) ** .5
-    vd = np.dot(av, ad)
-    self.epsilon = 0.0001
-    if self.almostEqual(vd, 1.0):
-      self.epsilon = self.DEFAULT_EPSILON
-      return True
+  def getFeatureIDs(self, locations):
+    """
+    Returns the feature index associated with each of the provided locations.
 
-  def contains(self, location):
+    A location is on a vertex, an edge or a face if it is within epsilon of it,
+    checked in this order. Only the faces near each location are checked,
+    using KD-trees over the vertices and the face centers.
     """
-    Checks that the provided point is on the model (object).
-    """
-    for vertex in self.vertices:
-      V = np.array((vertex["x"], vertex["y"], vertex["z"])).T
-      if np.allclose(location, V, rtol=1.e-3):
-        return "vertex"
-    for face in self.faces:
-      edges = np.choose(np.array(list(combinations(list(range(3)), 2))),
-                        self.vertices[face])
-      for edge in edges:
-        if self._containsOnEdge(location, edge):
-          return "edge"
-      if self._containsOnFace(location, face):
-        return "face"
-    return False
+    locations = np.asarray(locations, dtype=float).reshape(-1, 3)
+    if self._vertexTree is None:
+      self._buildIndex()
+
+    onVertex = self._vertexTree.query(locations)[0] <= self.epsilon
+    onEdge = np.zeros(len(locations), dtype=bool)
+    onFace = np.zeros(len(locations), dtype=bool)
+
+    for faceTree, faces, radius in self._faceTrees:
+      candidates = faceTree.query_ball_point(locations, radius + self.epsilon)
+      numCandidates = np.array([len(c) for c in candidates], dtype=np.int64)
+      if numCandidates.sum() == 0:
+        continue
+
+      points = np.repeat(np.arange(len(locations)), numCandidates)
+      candidateFaces = faces[np.concatenate(candidates).astype(np.int64)]
+      edgeHits, faceHits = self._matchFaces(locations[points], candidateFaces)
+      onEdge[points[edgeHits]] = True
+      onFace[points[faceHits]] = True
+
+    return np.select([onVertex, onEdge, onFace],
+                     [self.POINTY, self.EDGE, self.FLAT],
+                     self.EMPTY_FEATURE)
+
+  def _buildIndex(self):
+    """
+    Builds the KD-trees used by getFeatureIDs. Faces are grouped by size (their
+    radius around their center, rounded up to a power of 2), so that small
+    faces are not searched with the radius of the largest ones.
+    """
+    self._vertexTree = cKDTree(self.vertexLocations)
+
+    faceVertices = self.vertexLocations[self.triangles]
+    centers = faceVertices.mean(axis=1)
+    radii = np.sqrt(
+      ((faceVertices - centers[:, None, :]) ** 2).sum(axis=2)).max(axis=1)
+    sizeClasses = np.ceil(np.log2(np.maximum(radii, 1e-12)))
+
+    self._faceTrees = []
+    for sizeClass in np.unique(sizeClasses):
+      faces = np.nonzero(sizeClasses == sizeClass)[0]
+      self._faceTrees.append(
+        (cKDTree(centers[faces]), faces, radii[faces].max()))
+
+  def _matchFaces(self, locations, faces):
+    """
+    For each location and face pair, checks whether the location is within
+    epsilon of one of the face edges, and whether it is within epsilon of the
+    face itself (its projection on the face plane being inside the face).
+    """
+    a, b, c = np.moveaxis(self.vertexLocations[self.triangles[faces]], 1, 0)
+
+    edgeDistances = np.stack([self._segmentDistances(locations, a, b),
+                              self._segmentDistances(locations, b, c),
+                              self._segmentDistances(locations, c, a)])
+    onEdge = edgeDistances.min(axis=0) <= self.epsilon
+
+    # barycentric coordinates of the projections on the face planes
+    normals = self.faceNormals[faces]
+    planeDistances = ((locations - a) * normals).sum(axis=1)
+    projections = locations - planeDistances[:, None] * normals
+    v0, v1, v2 = c - a, b - a, projections - a
+    d00 = (v0 * v0).sum(axis=1)
+    d01 = (v0 * v1).sum(axis=1)
+    d11 = (v1 * v1).sum(axis=1)
+    d20 = (v2 * v0).sum(axis=1)
+    d21 = (v2 * v1).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+      denominator = d00 * d11 - d01 * d01
+      u = (d11 * d20 - d01 * d21) / denominator
+      v = (d00 * d21 - d01 * d20) / denominator
+    inside = (u >= 0) & (v >= 0) & (u + v <= 1)
+    onFace = inside & (np.abs(planeDistances) <= self.epsilon)
+
+    return onEdge, onFace
+
+  @staticmethod
+  def _segmentDistances(locations, a, b):
+    """
+    Distance of each location to the segment [a, b] of the same row.
+    """
+    ab = b - a
+    with np.errstate(divide="ignore", invalid="ignore"):
+      t = ((locations - a) * ab).sum(axis=1) / (ab * ab).sum(axis=1)
+    t = np.clip(np.nan_to_num(t), 0, 1)
+    closest = a + t[:, None] * ab
+    return np.sqrt(((locations - closest) ** 2).sum(axis=1))
+
+  @staticmethod
+  def _normalize(vectors):
+    """
+    Normalizes each row to unit length, leaving zero rows unchanged.
+    """
+    norms = np.sqrt((vectors ** 2).sum(axis=1, keepdims=True))
+    return vectors / np.where(norms > 0, norms, 1)
 
   def sampleLocation(self):
     """
@@ -694,6 +912,59 @@ class PlyModel(PhysicalObject):
     else:
       raise NameError("No such feature in {}: {}".format(self, feature))
 
+  def sampleLocations(self, numPoints, feature="random"):
+    """
+    Samples numPoints locations from the provided feature at once.
+    """
+    return self.sampleLocationsAndNormals(numPoints, feature)[0]
+
+  def sampleLocationsAndNormals(self, numPoints, feature="random"):
+    """
+    Samples numPoints locations from the provided feature at once, and returns
+    them with the unit normal of the mesh at each location: the normal of the
+    face a location was sampled from, or the vertex normal for vertices.
+
+    As in sampleLocationFromFeature, surfaces are sampled as faces. The
+    locations are sampled with the model's numpy generator (see seed).
+    """
+    if feature == "random":
+      locations = np.empty((numPoints, 3))
+      normals = np.empty((numPoints, 3))
+      sampledFeatures = self.generator.integers(len(self._FEATURES),
+                                                size=numPoints)
+      for i, name in enumerate(self._FEATURES):
+        selected = sampledFeatures == i
+        locations[selected], normals[selected] = self.sampleLocationsAndNormals(
+          np.count_nonzero(selected), name)
+      return locations, normals
+
+    if feature == "vertex":
+      vertices = self.generator.integers(len(self.vertexLocations),
+                                         size=numPoints)
+      return (self.vertexLocations[vertices].copy(),
+              self.vertexNormals[vertices].copy())
+
+    faces = self.generator.integers(len(self.triangles), size=numPoints)
+    faceVertices = self.vertexLocations[self.triangles[faces]]
+
+    if feature in ("face", "surface"):
+      r1 = np.sqrt(self.generator.random(numPoints))
+      r2 = self.generator.random(numPoints)
+      weights = np.column_stack([1 - r1, r1 * (1 - r2), r1 * r2])
+    elif feature == "edge":
+      # two distinct vertices of each face, weighted rnd and 1 - rnd
+      corners = np.argsort(self.generator.random((numPoints, 3)), axis=1)[:, :2]
+      rnd = self.generator.random(numPoints)
+      weights = np.zeros((numPoints, 3))
+      points = np.arange(numPoints)
+      weights[points, corners[:, 0]] = rnd
+      weights[points, corners[:, 1]] = 1 - rnd
+    else:
+      raise NameError("No such feature in {}: {}".format(self, feature))
+
+    locations = (weights[:, :, None] * faceVertices).sum(axis=1)
+    return locations, self.faceNormals[faces].copy()
+
   def _sampleLocationOnEdge(self, vertices):
     rnd = self.rng.random()
     vertices = np.array([i.tolist() for i in vertices])
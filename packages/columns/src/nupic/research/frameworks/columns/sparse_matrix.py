@@ -0,0 +1,273 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+scipy.sparse replacements for the nupic.bindings SparseMatrix and Random classes,
+for algorithms that must run without nupic.bindings.
+"""
+
+import numpy as np
+import scipy.sparse
+
+
+class NumpyRandom(object):
+    """
+    Random number generator with the interface of nupic.bindings.math.Random used
+    by the Python algorithms, backed by a numpy Generator.
+    """
+
+    def __init__(self, seed=42):
+        self.generator = np.random.default_rng(seed)
+
+    def sample(self, population, out):
+        """
+        Fill "out" with len(out) distinct elements of "population", kept in their
+        order in "population" (like Random.sample).
+        """
+        population = np.asarray(population)
+        selected = self.generator.choice(len(population), size=len(out),
+                                         replace=False)
+        out[:] = population[np.sort(selected)]
+
+    def getReal64(self):
+        return self.generator.random()
+
+    def getUInt32(self, n=2 ** 32):
+        return int(self.generator.integers(n))
+
+
+class ScipySparseMatrix(object):
+    """
+    Drop-in replacement for the subset of nupic.bindings.math.SparseMatrix used by
+    the ColumnPooler, stored as a scipy.sparse CSR matrix.
+
+    Each method works on all of its rows and columns at once with numpy operations.
+    Permanence increments and clipping update the stored values in place, and new
+    synapses are added in one batch per call. Like SparseMatrix, only nonzero values
+    are stored: entries that reach 0 are removed.
+    """
+
+    def __init__(self, nRows, nCols, dtype=np.float32):
+        self.matrix = scipy.sparse.csr_matrix((nRows, nCols), dtype=dtype)
+
+        # binary CSC matrices of the entries >= threshold, cached per threshold
+        # until the next modification
+        self._connected = {}
+
+    def __getstate__(self):
+        # the connected matrices are recomputed when needed
+        state = self.__dict__.copy()
+        state["_connected"] = {}
+        return state
+
+    def nRows(self):
+        return self.matrix.shape[0]
+
+    def nCols(self):
+        return self.matrix.shape[1]
+
+    def nNonZeros(self):
+        return self.matrix.nnz
+
+    def nNonZerosOnRow(self, row):
+        return int(self.matrix.indptr[row + 1] - self.matrix.indptr[row])
+
+    def nNonZerosPerRow(self):
+        return np.diff(self.matrix.indptr)
+
+    def rowNonZeros(self, row):
+        """
+        Returns the (columns, values) of the nonzeros of "row".
+        """
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        return (self.matrix.indices[start:end].copy(),
+                self.matrix.data[start:end].copy())
+
+    def toDense(self):
+        return self.matrix.toarray()
+
+    def countWhereGreaterEqual(self, rowBegin, rowEnd, colBegin, colEnd,
+                               threshold):
+        """
+        Count the entries >= threshold in the given row and column ranges.
+        """
+        block = self.matrix[rowBegin:rowEnd, colBegin:colEnd]
+        return int(np.count_nonzero(block.data >= threshold))
+
+    def countWhereGreaterEqualInRows(self, rows, threshold):
+        """
+        Count the entries >= threshold in an arbitrary selection of rows.
+        """
+        positions, _ = self._rowEntries(rows)
+        return int(np.count_nonzero(self.matrix.data[positions] >= threshold))
+
+    def rightVecSumAtNZGteThresholdSparse(self, sparseInput, threshold):
+        """
+        For each row, count the entries >= threshold in the columns "sparseInput".
+        """
+        cols = np.asarray(sparseInput, dtype=np.int64)
+        if cols.size == 0:
+            return np.zeros(self.nRows(), dtype=np.int32)
+
+        connected = self.connectedMatrix(threshold)
+        return np.asarray(connected[:, cols].sum(axis=1), dtype=np.int32).ravel()
+
+    def connectedMatrix(self, threshold):
+        """
+        Binary int32 CSC matrix of the entries >= threshold. The matrix is cached
+        until the next modification, so the same object is returned as long as the
+        entries don't change.
+        """
+        connected = self._connected.get(threshold)
+        if connected is None:
+            connected = (self.matrix >= threshold).astype(np.int32).tocsc()
+            self._connected[threshold] = connected
+
+        return connected
+
+    def nNonZerosPerRowOnCols(self, rows, cols):
+        """
+        For each of "rows", count the nonzeros in the columns "cols".
+        """
+        positions, rowIndices = self._rowEntries(rows)
+        onCols = self._colMask(cols)[self.matrix.indices[positions]]
+        return np.bincount(rowIndices[onCols], minlength=len(rows))
+
+    def incrementNonZerosOnOuter(self, rows, cols, delta):
+        """
+        Add "delta" to the nonzeros of the outer product of "rows" and "cols".
+        """
+        positions, _ = self._rowEntries(rows)
+        positions = positions[self._colMask(cols)[self.matrix.indices[positions]]]
+        self._increment(positions, delta)
+
+    def incrementNonZerosOnRowsExcludingCols(self, rows, cols, delta):
+        """
+        Add "delta" to the nonzeros of "rows" that are not in the columns "cols".
+        """
+        positions, _ = self._rowEntries(rows)
+        positions = positions[~self._colMask(cols)[self.matrix.indices[positions]]]
+        self._increment(positions, delta)
+
+    def clipRowsBelowAndAbove(self, rows, a, b):
+        """
+        Clip the values of "rows" to [a, b]. Entries clipped to 0 are removed.
+        """
+        positions, _ = self._rowEntries(rows)
+        values = np.clip(self.matrix.data[positions], a, b)
+        self.matrix.data[positions] = values
+        self._connected = {}
+
+        if (values == 0).any():
+            self.matrix.eliminate_zeros()
+
+    def setZerosOnOuter(self, rows, cols, value):
+        """
+        Set the zeros of the outer product of "rows" and "cols" to "value".
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+
+        existing = self._existingOnOuter(rows, cols)
+        rowIndices, colIndices = np.nonzero(~existing)
+
+        self._addEntries(rows[rowIndices], cols[colIndices], value)
+
+    def setRandomZerosOnOuter(self, rows, cols, numNewNonZeros, value, rng):
+        """
+        For each of "rows", set up to "numNewNonZeros" randomly chosen zeros in the
+        columns "cols" to "value". "numNewNonZeros" is an int or one int per row, and
+        "rng" is a NumpyRandom.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        if rows.size == 0 or cols.size == 0:
+            return
+
+        existing = self._existingOnOuter(rows, cols)
+        numNew = np.broadcast_to(np.asarray(numNewNonZeros), rows.shape)
+        numNew = np.clip(numNew, 0, (~existing).sum(axis=1))
+
+        # random order of the zeros of each row, existing entries last
+        keys = rng.generator.random(existing.shape)
+        keys[existing] = np.inf
+        order = np.argsort(keys, axis=1)
+
+        selected = np.arange(cols.size) < numNew[:, None]
+        rowIndices = np.nonzero(selected)[0]
+
+        self._addEntries(rows[rowIndices], cols[order[selected]], value)
+
+    def _rowEntries(self, rows):
+        """
+        Positions in the CSR arrays of the entries of "rows", and for each entry
+        the index of its row in "rows".
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.matrix.indptr[rows]
+        counts = self.matrix.indptr[rows + 1] - starts
+
+        # concatenate the ranges [start, start + count) of every row
+        positions = np.arange(counts.sum())
+        positions += np.repeat(starts - (np.cumsum(counts) - counts), counts)
+
+        return positions, np.repeat(np.arange(rows.size), counts)
+
+    def _colMask(self, cols):
+        mask = np.zeros(self.nCols(), dtype=bool)
+        mask[np.asarray(cols, dtype=np.int64)] = True
+        return mask
+
+    def _existingOnOuter(self, rows, cols):
+        """
+        Boolean (len(rows), len(cols)) array, True where the entry is nonzero.
+        """
+        colPositions = np.full(self.nCols(), -1, dtype=np.int64)
+        colPositions[cols] = np.arange(cols.size)
+
+        positions, rowIndices = self._rowEntries(rows)
+        entryCols = colPositions[self.matrix.indices[positions]]
+        onCols = entryCols >= 0
+
+        existing = np.zeros((rows.size, cols.size), dtype=bool)
+        existing[rowIndices[onCols], entryCols[onCols]] = True
+        return existing
+
+    def _increment(self, positions, delta):
+        values = self.matrix.data[positions] + delta
+        self.matrix.data[positions] = values
+        self._connected = {}
+
+        if (values == 0).any():
+            self.matrix.eliminate_zeros()
+
+    def _addEntries(self, rows, cols, value):
+        if rows.size == 0 or value == 0:
+            return
+
+        newEntries = scipy.sparse.csr_matrix(
+            (np.full(rows.size, value, dtype=self.matrix.dtype), (rows, cols)),
+            shape=self.matrix.shape)
+
+        # the new entries are all zeros of the matrix, so the sum is their union
+        self.matrix = self.matrix + newEntries
+        self.matrix.sort_indices()
+        self._connected = {}
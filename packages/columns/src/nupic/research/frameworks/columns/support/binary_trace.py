@@ -0,0 +1,444 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Trace files for the experiment monitors (e.g. PIUNLogger).
+
+A trace is a sequence of records. Each record has a name and a list of values:
+numbers, strings, lists, dicts and numpy arrays. Trace writers have a
+writeRecord(name, *values) method:
+
+- TextTraceWriter writes the text format read by the visualizations: the name on
+  one line (if not None), then one JSON line per value.
+
+Both have a flush() method that writes out the records written so far.
+- BinaryTraceWriter writes compact binary chunks of records. Integer arrays are
+  stored with the smallest integer type that holds them, and SDRs (sorted
+  non-negative integer arrays) as the differences between consecutive indices.
+  Each chunk is optionally compressed with zlib and is checked with a crc32.
+
+BinaryTraceReader reads a binary trace lazily, one chunk at a time, and converts
+it to the text format for the existing visualizations.
+
+Example:
+
+    with BinaryTraceWriter("inference.trace") as writer:
+        with PIUNLogger(writer, exp):
+            exp.inferObjectWithRandomMovements(obj)
+
+    reader = BinaryTraceReader("inference.trace")
+    for name, values in reader:
+        ...
+    with open("inference.log", "w") as out:
+        reader.writeText(out)
+"""
+
+import bisect
+import itertools
+import json
+import operator
+import os
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b"NTRACE1\n"
+
+# chunk header: number of records, stored payload length, uncompressed payload
+# length, crc32 of the stored payload, and whether the payload is compressed
+CHUNK_HEADER = struct.Struct("<IQQIB")
+
+# JSON object that stands for an array. The arrays of a chunk are referenced in
+# order; older traces numbered the references, and the numbers are ignored.
+ARRAY_KEY = "__array__"
+ARRAY_REFERENCE = {ARRAY_KEY: None}
+
+
+class TextTraceWriter(object):
+    """
+    Writes records to a text stream, in the format read by the visualizations.
+    """
+
+    def __init__(self, out):
+        self.out = out
+
+    def writeRecord(self, name, *values):
+        if name is not None:
+            print(name, file=self.out)
+        for value in values:
+            print(json.dumps(value, default=_toJSON), file=self.out)
+
+    def flush(self):
+        self.out.flush()
+
+
+class BinaryTraceWriter(object):
+    """
+    Writes records to a binary trace file in chunks of "recordsPerChunk" records.
+
+    A chunk payload holds a JSON document with the records, in which each array is
+    replaced by a reference to it, then a table with the dtype and shape of each
+    array, then the values of the arrays. The arrays of a chunk are encoded
+    together: the values of the integer arrays as one stream, in which each SDR is
+    replaced by the differences between its consecutive indices, and the values of
+    the float arrays as another.
+
+    Records are encoded when their chunk is written, not copied by writeRecord, so
+    the values of a record must not be modified after it is written.
+    """
+
+    def __init__(self, path, recordsPerChunk=1000, compressionLevel=1):
+        """
+        @param path             (string) Path of the trace file. An existing file
+                                         is overwritten.
+        @param recordsPerChunk  (int)    Number of records of each chunk
+        @param compressionLevel (int)    zlib compression level, 0 to store the
+                                         chunks uncompressed
+        """
+        self.recordsPerChunk = recordsPerChunk
+        self.compressionLevel = compressionLevel
+
+        # (name, values) of each record of the current chunk
+        self.records = []
+
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def writeRecord(self, name, *values):
+        self.records.append((name, values))
+        if len(self.records) >= self.recordsPerChunk:
+            self.flush()
+
+    def flush(self):
+        if not self.records:
+            return
+
+        arrays = []
+
+        def encode(value):
+            """
+            JSON encoder hook: adds arrays to the chunk and replaces them by a
+            reference.
+            """
+            if isinstance(value, np.ndarray) and value.dtype.kind in "biuf":
+                arrays.append(value)
+                return ARRAY_REFERENCE
+            if isinstance(value, (set, frozenset)):
+                arrays.append(np.array(sorted(value), dtype=np.int64))
+                return ARRAY_REFERENCE
+            return _toJSON(value)
+
+        document = json.dumps(self.records, separators=(",", ":"),
+                              check_circular=False,
+                              default=encode).encode("utf-8")
+        payload = b"".join([struct.pack("<Q", len(document)), document]
+                           + _encodeArrays(arrays))
+
+        compressed = self.compressionLevel > 0
+        stored = (zlib.compress(payload, self.compressionLevel) if compressed
+                  else payload)
+
+        self.file.write(CHUNK_HEADER.pack(len(self.records), len(stored),
+                                          len(payload), zlib.crc32(stored),
+                                          compressed))
+        self.file.write(stored)
+        self.file.flush()
+
+        self.records = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class BinaryTraceReader(object):
+    """
+    Reads a binary trace file. Opening the reader only reads the chunk headers;
+    the chunks are decoded when their records are accessed.
+
+    A chunk that was only partly written (e.g. by an interrupted run) and the
+    chunks after it are ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        # (file offset, number of records) of each chunk
+        self.chunks = []
+        # index of the first record of each chunk
+        self.firstRecords = []
+        numRecords = 0
+
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("Not a binary trace file", path)
+            fileLength = os.fstat(f.fileno()).st_size
+
+            while True:
+                offset = f.tell()
+                header = f.read(CHUNK_HEADER.size)
+                if len(header) < CHUNK_HEADER.size:
+                    break
+                chunkRecords, storedLength = CHUNK_HEADER.unpack(header)[:2]
+                if offset + CHUNK_HEADER.size + storedLength > fileLength:
+                    break
+                f.seek(storedLength, 1)
+
+                self.chunks.append((offset, chunkRecords))
+                self.firstRecords.append(numRecords)
+                numRecords += chunkRecords
+
+        self.numRecords = numRecords
+        self._cachedChunk = (None, None)
+
+    def __len__(self):
+        return self.numRecords
+
+    def __iter__(self):
+        for iChunk in range(len(self.chunks)):
+            for record in self._readChunk(iChunk):
+                yield record
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.numRecords
+        if not 0 <= index < self.numRecords:
+            raise IndexError(index)
+
+        iChunk = bisect.bisect_right(self.firstRecords, index) - 1
+        return self._readChunk(iChunk)[index - self.firstRecords[iChunk]]
+
+    def writeText(self, out):
+        """
+        Write the trace in the text format of TextTraceWriter.
+        """
+        writer = TextTraceWriter(out)
+        for name, values in self:
+            writer.writeRecord(name, *values)
+
+    def _readChunk(self, iChunk):
+        """
+        Returns the (name, values) records of a chunk. The last chunk that was
+        read is cached, for sequential random access.
+        """
+        if self._cachedChunk[0] == iChunk:
+            return self._cachedChunk[1]
+
+        offset = self.chunks[iChunk][0]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            (_, storedLength, length, crc,
+             compressed) = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+            stored = f.read(storedLength)
+
+        if zlib.crc32(stored) != crc:
+            raise ValueError("Corrupted chunk in binary trace file", self.path,
+                             iChunk)
+        payload = zlib.decompress(stored) if compressed else stored
+        assert len(payload) == length
+
+        documentLength = struct.unpack_from("<Q", payload)[0]
+        documentEnd = 8 + documentLength
+        records = json.loads(payload[8:documentEnd])
+        arrays = _decodeArrays(memoryview(payload)[documentEnd:])
+
+        arrays = iter(arrays)
+        records = [(name, [_decode(value, arrays) for value in values])
+                   for name, values in records]
+        self._cachedChunk = (iChunk, records)
+        return records
+
+
+def _toJSON(value):
+    """
+    JSON encoder hook: converts numpy arrays, numpy scalars and sets to lists
+    and Python scalars.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("Object of type {} is not JSON serializable".format(
+        type(value).__name__))
+
+
+def _decode(value, arrays):
+    """
+    Replaces the array references of a decoded JSON value by the next arrays of
+    the "arrays" iterator.
+    """
+    if isinstance(value, dict):
+        if len(value) == 1 and ARRAY_KEY in value:
+            return next(arrays)
+        return {k: _decode(v, arrays) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v, arrays) for v in value]
+    return value
+
+
+def _encodeArrays(arrays):
+    """
+    Encodes the arrays of a chunk. Returns the parts of the encoding: the table,
+    then the integer and float values.
+    """
+    numArrays = len(arrays)
+    dtypes = [array.dtype for array in arrays]
+    codes = {dtype: code for code, dtype in enumerate(dict.fromkeys(dtypes))}
+    dtypeNames = [dtype.str for dtype in codes]
+    dtypeCodes = np.fromiter(map(codes.__getitem__, dtypes), dtype="<u2",
+                             count=numArrays)
+    shapes = [array.shape for array in arrays]
+    ndims = np.fromiter(map(len, shapes), dtype="u1", count=numArrays)
+    dims = np.fromiter(itertools.chain.from_iterable(shapes), dtype="<u4",
+                       count=int(ndims.sum()))
+    sizes = (dims.astype(np.int64) if (ndims == 1).all()
+             else np.fromiter(map(operator.attrgetter("size"), arrays),
+                              dtype=np.int64, count=numArrays))
+    isFloat = np.array([dtype.kind == "f" for dtype in codes],
+                       dtype=bool)[dtypeCodes]
+
+    intArrays = ([arrays[i] for i in np.flatnonzero(~isFloat)] if isFloat.any()
+                 else arrays)
+    intSizes = sizes[~isFloat]
+    values = _concatenate(intArrays, ndims[~isFloat], np.int64)
+
+    # Each array of sorted non-negative integers is stored as the differences
+    # between its consecutive values, the first value being its difference
+    # from 0.
+    starts = np.cumsum(intSizes) - intSizes
+    nonEmpty = intSizes > 0
+    deltas = np.diff(values, prepend=0)
+    deltas[starts[nonEmpty]] = values[starts[nonEmpty]]
+    isDelta = np.zeros(intSizes.size, dtype=bool)
+    if values.size > 0:
+        isDelta[nonEmpty] = np.minimum.reduceat(deltas, starts[nonEmpty]) >= 0
+    values = np.where(np.repeat(isDelta, intSizes), deltas, values)
+
+    intType = np.dtype(_smallestType(values.min(), values.max())
+                       if values.size > 0 else np.uint8).newbyteorder("<")
+    # The bytes of the integers are stored by significance (all the first bytes,
+    # then all the second bytes...): the high bytes of small differences are
+    # mostly zeros, which compress quickly.
+    shuffled = values.astype(intType).view("u1").reshape(-1, intType.itemsize).T
+    floats = _concatenate([arrays[i] for i in np.flatnonzero(isFloat)],
+                          ndims[isFloat], "<f8")
+
+    table = json.dumps({
+        "dtypes": dtypeNames,
+        "intType": intType.str,
+        "byteShuffle": True,
+    }).encode("utf-8")
+    flags = np.zeros(numArrays, dtype="u1")
+    flags[~isFloat] = isDelta
+
+    return [struct.pack("<QQQQ", len(table), numArrays, len(dims),
+                        values.size),
+            table, dtypeCodes.tobytes(), ndims.tobytes(), flags.tobytes(),
+            dims.tobytes(),
+            shuffled.tobytes(),
+            floats.tobytes()]
+
+
+def _concatenate(arrays, ndims, dtype):
+    """
+    Concatenates the values of arrays of any shape, converted to "dtype".
+    """
+    if not arrays:
+        return np.empty(0, dtype=dtype)
+    if not (ndims == 1).all():
+        arrays = [array.ravel() for array in arrays]
+    return np.concatenate(arrays).astype(dtype)
+
+
+def _decodeArrays(data):
+    """
+    Inverse of _encodeArrays. Returns the list of arrays.
+    """
+    tableLength, numArrays, numDims, numInts = struct.unpack_from("<QQQQ",
+                                                                  data)
+    offset = struct.calcsize("<QQQQ")
+
+    def read(dtype, count):
+        nonlocal offset
+        array = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += array.nbytes
+        return array
+
+    table = json.loads(bytes(read("u1", tableLength)))
+    dtypes = [np.dtype(dtype) for dtype in table["dtypes"]]
+    dtypeCodes = read("<u2", numArrays)
+    ndims = read("u1", numArrays)
+    flags = read("u1", numArrays)
+    dims = read("<u4", numDims)
+    intType = np.dtype(table["intType"])
+    if table.get("byteShuffle", False):
+        values = read("u1", numInts * intType.itemsize).reshape(
+            intType.itemsize, numInts).T.copy().view(intType).ravel()
+    else:
+        values = read(intType, numInts)
+    values = values.astype(np.int64)
+
+    arrayDims = np.split(dims, np.cumsum(ndims)[:-1]) if numArrays else []
+    shapes = [tuple(int(dim) for dim in d) for d in arrayDims]
+    sizes = np.array([int(np.prod(shape)) for shape in shapes], dtype=np.int64)
+    isFloat = np.array([dtypes[code].kind == "f" for code in dtypeCodes],
+                       dtype=bool)
+    floats = read("<f8", int(sizes[isFloat].sum()) if numArrays else 0)
+
+    # Undo the differences: cumulative sums restarted at each array.
+    intSizes = sizes[~isFloat]
+    isDelta = np.repeat(flags[~isFloat].astype(bool), intSizes)
+    sums = np.cumsum(np.where(isDelta, values, 0))
+    starts = np.cumsum(intSizes) - intSizes
+    sumsBefore = np.repeat(
+        np.concatenate([[0], sums])[starts], intSizes)
+    values = np.where(isDelta, sums - sumsBefore, values)
+
+    intValues = np.split(values, np.cumsum(intSizes)[:-1]) if len(intSizes) \
+        else []
+    floatValues = np.split(floats, np.cumsum(sizes[isFloat])[:-1]) \
+        if isFloat.any() else []
+    intValues = iter(intValues)
+    floatValues = iter(floatValues)
+
+    arrays = []
+    for code, shape, floatArray in zip(dtypeCodes, shapes, isFloat):
+        array = next(floatValues) if floatArray else next(intValues)
+        arrays.append(array.astype(dtypes[code]).reshape(shape))
+    return arrays
+
+
+def _smallestType(low, high):
+    for dtype in (np.uint8, np.uint16, np.uint32, np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
@@ -144,6 +144,8 @@ class ColumnPoolerMonitorMixin(MonitorMixinBase):
 
         self._mmTransitionTracesStale = True
 
+        self._mmIterationDone()
+
     def reset(self):
         super(ColumnPoolerMonitorMixin, self).reset()
 
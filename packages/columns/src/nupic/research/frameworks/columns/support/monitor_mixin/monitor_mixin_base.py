@@ -68,6 +68,21 @@ or define a function to return that trace:
 Any trace can be converted to a metric using the utility functions provided in
 the framework (see `metric.py`).
 
+4. Call `self._mmIterationDone()` at the end of the `compute` method, so that
+traces can be streamed (see `mmStreamTraces`).
+
+Streaming traces to a file
+-----------------------------------------
+
+By default the traces keep the whole history in memory. For long runs, call
+
+    instance.mmStreamTraces(BinaryTraceWriter("run.trace"), iterationsPerChunk=1000)
+
+and the traces are written to the trace writer (see `binary_trace.py`) every
+1000 iterations, then cleared. Call `instance.mmFlushTraces()` at the end of the
+run to write the last iterations. Metrics and plots then only cover the
+iterations since the last flush.
+
 Extending the functionality of the monitor mixin framework
 -----------------------------------------
 
@@ -107,15 +122,81 @@ class MonitorMixinBase(object, metaclass=abc.ABCMeta):
         # Mapping from key (string) => trace (Trace)
         self._mmTraces = None
         self._mmData = None
+
+        self._mmTraceWriter = None
+        self._mmIterationsPerChunk = None
+        self._mmPendingIterations = 0
+
         self.mmClearHistory()
 
     def mmClearHistory(self):
         """
-        Clears the stored history.
+        Clears the stored history. When traces are streamed, they are written
+        first.
         """
+        if self._mmTraces:
+            self.mmFlushTraces()
+
         self._mmTraces = {}
         self._mmData = {}
 
+    def mmStreamTraces(self, writer, iterationsPerChunk=1000):
+        """
+        Writes the traces to a trace writer every "iterationsPerChunk" iterations,
+        then clears them, so that they don't keep the whole history in memory. Each
+        trace is written as one record per chunk (see mmWriteTraces): concatenate
+        the values of the records with the same name to get the whole trace.
+
+        @param writer             (BinaryTraceWriter, TextTraceWriter or None)
+                                  Trace writer, or None to stop streaming
+        @param iterationsPerChunk (int) Number of iterations of each chunk
+        """
+        self.mmFlushTraces()
+
+        self._mmTraceWriter = writer
+        self._mmIterationsPerChunk = iterationsPerChunk
+        self._mmPendingIterations = 0
+
+    def mmFlushTraces(self):
+        """
+        Writes the iterations of the traces since the last flush to the trace
+        writer of mmStreamTraces, then clears the traces. Does nothing when the
+        traces aren't streamed.
+        """
+        if self._mmTraceWriter is None:
+            return
+
+        if self._mmPendingIterations > 0:
+            self.mmWriteTraces(self._mmTraceWriter, self._mmGetStreamedTraces())
+            self._mmTraceWriter.flush()
+
+            # The writer may still hold the lists, so replace them
+            for trace in self._mmTraces.values():
+                trace.data = []
+
+        self._mmPendingIterations = 0
+
+    def _mmGetStreamedTraces(self):
+        """
+        Returns the traces written by mmFlushTraces. (To be overridden to add
+        traces computed from the recorded ones.)
+
+        @return (list) Traces
+        """
+        return list(self._mmTraces.values())
+
+    def _mmIterationDone(self):
+        """
+        Counts an iteration of the traces, and flushes them at the end of a chunk.
+        Called by the monitors at the end of each compute.
+        """
+        if self._mmTraceWriter is None:
+            return
+
+        self._mmPendingIterations += 1
+        if self._mmPendingIterations >= self._mmIterationsPerChunk:
+            self.mmFlushTraces()
+
     @staticmethod
     def mmPrettyPrintTraces(traces, breakOnResets=None):
         """
@@ -165,6 +246,22 @@ class MonitorMixinBase(object, metaclass=abc.ABCMeta):
 
         return table.get_string().encode("utf-8")
 
+    @staticmethod
+    def mmWriteTraces(writer, traces):
+        """
+        Writes traces to a trace writer (see binary_trace.py), e.g. before
+        mmClearHistory() discards them. The traces are still accumulated in memory
+        until then; see mmStreamTraces to write them as they are recorded. Each
+        trace is one record, named by its title, with one value per iteration. Sets
+        of indices are written as sorted arrays. Traces of Metrics can't be
+        written.
+
+        @param writer (BinaryTraceWriter or TextTraceWriter) Trace writer
+        @param traces (list)                                Traces to write
+        """
+        for trace in traces:
+            writer.writeRecord(trace.prettyPrintTitle(), *trace.data)
+
     def mmGetDefaultTraces(self, verbosity=1):
         """
         Returns list of default traces. (To be overridden.)
@@ -351,6 +351,13 @@ class TemporalMemoryMonitorMixin(MonitorMixinBase):
 
         self._mmTransitionTracesStale = True
 
+        self._mmIterationDone()
+
+    def _mmGetStreamedTraces(self):
+        self._mmComputeTransitionTraces()
+
+        return super(TemporalMemoryMonitorMixin, self)._mmGetStreamedTraces()
+
     def reset(self):
         super(TemporalMemoryMonitorMixin, self).reset()
 
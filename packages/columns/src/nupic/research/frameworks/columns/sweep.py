@@ -0,0 +1,448 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Parallel parameter sweeps with shared setup state and resumable results.
+
+runSweep() runs a function on every cell (a dict of parameters) of a sweep:
+
+- Cells that share the values of "setupKeys" share one setup state (e.g. the
+  generated objects or a learned network). The setup is computed once per group,
+  in a worker, and published to the other workers through a file in shared
+  memory (/dev/shm). The numpy arrays of the state, including the arrays of scipy
+  sparse matrices, are not copied: every cell gets a fresh unpickled copy of the
+  state whose arrays are read-only views of the shared memory. Everything else
+  is unpickled for every cell. For example, a learned network stored as a
+  snapshot in a numpy byte array is shared once, but every cell unpickles its
+  own network from it.
+- Each result is appended to the results file as soon as its cell completes. The
+  file is a sequence of column chunks: numeric and string columns are stored as
+  numpy arrays, other values as pickled objects.
+- Cells whose results are already in the results file are skipped, so an
+  interrupted sweep resumes by running runSweep() again with the same arguments.
+
+Example:
+
+    def setup(params):
+        return generateObjects(params["numObjects"], params["seed"])
+
+    def runCell(cell, objects):
+        return {"accuracy": infer(objects, cell["noise"])}
+
+    results = runSweep(runCell,
+                       parameterGrid(numObjects=[10, 50], seed=[0, 1],
+                                     noise=[0.0, 0.1, 0.2]),
+                       "sweep_results.bin",
+                       setup=setup, setupKeys=("numObjects", "seed"),
+                       numWorkers=8)
+"""
+
+import itertools
+import json
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+CELL_ID = "cellId"
+
+# chunk header: payload length and crc32
+CHUNK_HEADER = struct.Struct("<QI")
+
+# alignment of the shared arrays
+ALIGNMENT = 64
+
+
+def parameterGrid(**ranges):
+    """
+    Returns the cross product of the parameter ranges as a list of dicts, with
+    the last parameter varying fastest.
+    """
+    names = list(ranges)
+    return [dict(zip(names, values))
+            for values in itertools.product(*ranges.values())]
+
+
+def cellId(cell):
+    """
+    Identifier of a cell in the results file: its parameters as canonical JSON.
+    """
+    return json.dumps(cell, sort_keys=True, default=repr)
+
+
+def runSweep(runCell, cells, resultsPath, setup=None, setupKeys=(),
+             numWorkers=1, flushEvery=1):
+    """
+    Run "runCell" on every cell, in parallel, and append the results to
+    "resultsPath". Cells that already have results in "resultsPath" are skipped.
+
+    @param runCell (callable) Called as runCell(cell), or runCell(cell, state) if
+                              "setup" is given. Returns a dict of result values.
+                              Must be picklable (a module-level function).
+    @param cells (list of dict) Parameters of each cell, e.g. from
+                              parameterGrid().
+    @param resultsPath (str)  Results file, created or appended to.
+    @param setup (callable)   Called as setup(params) with the "setupKeys" values
+                              of a group of cells. Returns the state shared by
+                              the cells of the group, which must be picklable.
+                              Cells may modify their copy of the state, except
+                              its numpy arrays, which are read-only.
+    @param setupKeys (tuple)  Cell parameters that determine the setup state.
+    @param numWorkers (int)   Number of worker processes. With 1 worker, the cells
+                              run in this process.
+    @param flushEvery (int)   Number of results buffered before they are appended
+                              to the results file.
+
+    Returns the results of "cells" (a list of dicts, in the order of "cells"),
+    including the results from previous runs. Each result is the cell updated
+    with the values returned by runCell.
+    """
+    completed = set(loadResults(resultsPath, columns=[CELL_ID]).get(CELL_ID, []))
+
+    pending = {}
+    for cell in cells:
+        key = cellId(cell)
+        if key not in completed:
+            pending[key] = cell
+
+    groups = {}
+    for key, cell in pending.items():
+        params = {name: cell[name] for name in setupKeys}
+        groups.setdefault(cellId(params), (params, []))[1].append(key)
+
+    print("{} cells, {} already completed, {} setup groups, {} workers".format(
+        len(cells), len(cells) - len(pending), len(groups), numWorkers))
+
+    writer = ResultsWriter(resultsPath, flushEvery)
+    sharedDir = tempfile.mkdtemp(
+        prefix="sweep-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    try:
+        if numWorkers > 1:
+            _runParallel(runCell, setup, pending, groups, writer, sharedDir,
+                         numWorkers)
+        else:
+            _runSerial(runCell, setup, pending, groups, writer, sharedDir)
+    finally:
+        writer.close()
+        shutil.rmtree(sharedDir, ignore_errors=True)
+
+    results = {}
+    for record in loadRecords(resultsPath):
+        results[record.pop(CELL_ID)] = record
+    return [results[cellId(cell)] for cell in cells]
+
+
+def loadResults(resultsPath, columns=None):
+    """
+    Load the results file as columns: a dict of column name to numpy array, with
+    one element per completed cell. Cells without a value for a column have None.
+    A truncated chunk at the end of the file (from an interrupted sweep) is
+    ignored.
+
+    @param columns (list of str) Columns to load, default all.
+    """
+    chunks, _ = _readChunks(resultsPath)
+    if not chunks:
+        return {}
+
+    if columns is None:
+        columns = list(dict.fromkeys(
+            name for chunk in chunks for name in chunk["columns"]))
+
+    results = {}
+    for name in columns:
+        parts = []
+        for chunk in chunks:
+            values = chunk["columns"].get(name)
+            if values is None:
+                values = np.full(chunk["numRows"], None, dtype=object)
+            parts.append(values)
+
+        kinds = {part.dtype.kind for part in parts}
+        if len(kinds) > 1 and not kinds <= set("biuf"):
+            parts = [part.astype(object) for part in parts]
+        results[name] = np.concatenate(parts)
+
+    return results
+
+
+def loadRecords(resultsPath):
+    """
+    Load the results file as one dict per completed cell.
+    """
+    results = loadResults(resultsPath)
+    numRows = len(next(iter(results.values()))) if results else 0
+
+    records = []
+    for i in range(numRows):
+        record = {}
+        for name, values in results.items():
+            value = values[i]
+            if isinstance(value, np.generic):
+                value = value.item()
+            if value is not None or values.dtype != object:
+                record[name] = value
+        records.append(record)
+    return records
+
+
+class ResultsWriter(object):
+    """
+    Appends rows to a results file as column chunks of "flushEvery" rows.
+    """
+
+    def __init__(self, resultsPath, flushEvery=1):
+        self.flushEvery = flushEvery
+        self.rows = []
+
+        # drop a chunk that was only partly written by an interrupted sweep
+        validLength = _readChunks(resultsPath)[1]
+        self.file = open(resultsPath, "ab")
+        if self.file.tell() > validLength:
+            self.file.truncate(validLength)
+            self.file.seek(validLength)
+
+    def append(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.flushEvery:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+
+        names = list(dict.fromkeys(name for row in self.rows for name in row))
+        payload = pickle.dumps({
+            "numRows": len(self.rows),
+            "columns": {name: _toColumn([row.get(name) for row in self.rows])
+                        for name in names},
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.file.write(CHUNK_HEADER.pack(len(payload), zlib.crc32(payload)))
+        self.file.write(payload)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def _toColumn(values):
+    """
+    numpy array of a column: a numeric or string array if every value is a
+    scalar of the same kind, else an object array.
+    """
+    if all(isinstance(value, (bool, int, float, str, np.generic))
+           for value in values):
+        column = np.asarray(values)
+        if column.dtype.kind in "biufU":
+            return column
+
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _readChunks(resultsPath):
+    """
+    Returns the complete chunks of a results file, and the length of the file
+    they occupy.
+    """
+    chunks = []
+    validLength = 0
+    if not os.path.exists(resultsPath):
+        return chunks, validLength
+
+    with open(resultsPath, "rb") as f:
+        while True:
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                break
+            length, crc = CHUNK_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            chunks.append(pickle.loads(payload))
+            validLength = f.tell()
+
+    return chunks, validLength
+
+
+def _runSerial(runCell, setup, pending, groups, writer, sharedDir):
+    numCompleted = 0
+    for params, keys in groups.values():
+        sharedPath = None
+        if setup is not None:
+            sharedPath = _publish(_runSetup(setup, params), sharedDir)
+
+        for key in keys:
+            writer.append(_runCell(runCell, sharedPath, key, pending[key]))
+            numCompleted += 1
+            _printProgress(numCompleted, len(pending))
+
+        if sharedPath is not None:
+            os.remove(sharedPath)
+
+
+def _runParallel(runCell, setup, pending, groups, writer, sharedDir,
+                 numWorkers):
+    numCompleted = 0
+    remaining = {}
+    sharedPaths = {}
+
+    with ProcessPoolExecutor(max_workers=numWorkers) as executor:
+        futures = {}
+        try:
+            for group, (params, keys) in groups.items():
+                if setup is None:
+                    for key in keys:
+                        futures[executor.submit(
+                            _runCell, runCell, None, key, pending[key])] = group
+                else:
+                    futures[executor.submit(_runSetup, setup, params)] = group
+                remaining[group] = len(keys)
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    group = futures.pop(future)
+                    result = future.result()
+
+                    if group not in sharedPaths and setup is not None:
+                        # setup done: publish the state and run the group's cells
+                        sharedPaths[group] = _publish(result, sharedDir)
+                        for key in groups[group][1]:
+                            futures[executor.submit(
+                                _runCell, runCell, sharedPaths[group], key,
+                                pending[key])] = group
+                        continue
+
+                    writer.append(result)
+                    numCompleted += 1
+                    _printProgress(numCompleted, len(pending))
+
+                    # workers that have the file mapped keep it until they unmap
+                    remaining[group] -= 1
+                    if remaining[group] == 0 and group in sharedPaths:
+                        os.remove(sharedPaths.pop(group))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def _printProgress(numCompleted, numCells):
+    print("    => {} of {} cells completed, percent complete= {:.1f}".format(
+        numCompleted, numCells, 100.0 * numCompleted / numCells))
+
+
+def _runSetup(setup, params):
+    """
+    Run the setup in a worker and serialize its state: a pickle payload, with the
+    contiguous numpy arrays as separate buffers (as bytes, to be sent back to the
+    main process).
+    """
+    buffers = []
+    payload = pickle.dumps(setup(params), protocol=5,
+                           buffer_callback=buffers.append)
+    return payload, [buffer.raw().tobytes() for buffer in buffers]
+
+
+def _publish(serialized, sharedDir):
+    """
+    Write a serialized setup state to a new file in the shared directory: the
+    header (payload and buffer offsets), then the aligned buffers.
+    """
+    payload, buffers = serialized
+
+    offsets = []
+    offset = 0
+    for buffer in buffers:
+        offsets.append(offset)
+        offset += -(-len(buffer) // ALIGNMENT) * ALIGNMENT
+
+    header = pickle.dumps({
+        "payload": payload,
+        "buffers": [(start, len(buffer))
+                    for start, buffer in zip(offsets, buffers)],
+    }, protocol=pickle.HIGHEST_PROTOCOL)
+    dataStart = -(-(8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    fd, path = tempfile.mkstemp(dir=sharedDir, suffix=".state")
+    with os.fdopen(fd, "wb") as f:
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for start, buffer in zip(offsets, buffers):
+            f.seek(dataStart + start)
+            f.write(buffer)
+
+    return path
+
+
+# Shared state mapped by this worker: (path, mapping, header, buffer views)
+_mapped = None
+
+
+def _loadShared(sharedPath):
+    """
+    Unpickle a fresh copy of a shared state, with its numpy arrays backed by the
+    read-only memory mapping of the shared file. The mapping of the last file is
+    kept, since the cells of a group usually run one after the other.
+    """
+    global _mapped
+
+    if _mapped is None or _mapped[0] != sharedPath:
+        _mapped = None
+        with open(sharedPath, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        headerLength = struct.unpack_from("<Q", mapping)[0]
+        header = pickle.loads(mapping[8:8 + headerLength])
+        dataStart = -(-(8 + headerLength) // ALIGNMENT) * ALIGNMENT
+
+        view = memoryview(mapping)
+        buffers = [view[dataStart + start:dataStart + start + nbytes]
+                   for start, nbytes in header["buffers"]]
+        _mapped = (sharedPath, mapping, header, buffers)
+
+    _, _, header, buffers = _mapped
+    return pickle.loads(header["payload"], buffers=buffers)
+
+
+def _runCell(runCell, sharedPath, key, cell):
+    if sharedPath is None:
+        values = runCell(dict(cell))
+    else:
+        values = runCell(dict(cell), _loadShared(sharedPath))
+
+    result = dict(cell)
+    result.update(values)
+    result[CELL_ID] = key
+    return result
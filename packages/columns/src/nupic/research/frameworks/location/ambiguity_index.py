@@ -25,8 +25,20 @@ A metric for the ambiguity of each sensory input.
 
 import itertools
 import numbers
+import os
 
 import numpy as np
+from scipy.special import gammaln, xlog1py, xlogy
+
+# Directory of the on-disk cache of sample minimum survival tables, from the
+# AMBIGUITY_INDEX_CACHE_DIR environment variable. None (the default) disables the
+# cache; pass cacheDir to the table functions to use one anyway.
+CACHE_DIR = os.environ.get("AMBIGUITY_INDEX_CACHE_DIR") or None
+if CACHE_DIR is not None:
+    CACHE_DIR = os.path.expanduser(CACHE_DIR)
+
+# Maximum number of (n, k) entries computed at once by the table functions
+MAX_TABLE_ENTRIES = 2 ** 22
 
 
 def choose(n, k):
@@ -42,7 +54,7 @@ def choose(n, k):
 
 def _choose(n, k):
     k = np.minimum(k, n - k)
-    return np.product(np.arange(n - k + 1, n + 1, dtype="float128")) / np.product(
+    return np.prod(np.arange(n - k + 1, n + 1, dtype="float128")) / np.prod(
         np.arange(1, k + 1, dtype="float128")
     )
 
@@ -125,7 +137,98 @@ def getExpectedValue(distribution):
     return np.sum(k * distribution.pmf(k))
 
 
-def findBinomialNsWithExpectedSampleMinimum(desiredValuesSorted, p, numSamples, nMax):
+def binomialLogPmf(n, k, p):
+    """
+    Computes log(P(X = k)) for X ~ Binomial(n, p) in log space, so it can handle
+    large n without overflow. n and k are broadcast against each other.
+
+    @return (numpy array)
+    -inf where k < 0 or k > n.
+    """
+    n = np.asarray(n, dtype="float64")
+    k = np.asarray(k, dtype="float64")
+    valid = (k >= 0) & (k <= n)
+    k = np.where(valid, k, 0)
+    logPmf = (
+        gammaln(n + 1)
+        - gammaln(k + 1)
+        - gammaln(n - k + 1)
+        + xlogy(k, p)
+        + xlog1py(n - k, -p)
+    )
+    return np.where(valid, logPmf, -np.inf)
+
+
+def binomialSurvivalTable(nValues, p, kMax):
+    """
+    Computes P(X > k) for X ~ Binomial(n, p), for every n in nValues and every
+    0 <= k <= kMax, as a whole table.
+
+    The survival function is summed from the tail of the pmf rather than computed
+    as 1 - cdf, so it stays accurate where the cdf is close to 1. Terms of the pmf
+    above kMax + 1 are left out, so the table is exact where those terms are
+    negligible.
+
+    @return (numpy array)
+    Array of shape (len(nValues), kMax + 1).
+    """
+    nValues = np.asarray(nValues)
+    pmf = np.exp(binomialLogPmf(nValues[:, None], np.arange(kMax + 2), p))
+    return np.cumsum(pmf[:, :0:-1], axis=1)[:, ::-1]
+
+
+def sampleMinimumSurvivalTable(nMax, p, numSamples, cacheDir=CACHE_DIR):
+    """
+    Computes P(min > k), where min is the sample minimum of numSamples samples of
+    Binomial(n, p), for every 0 <= n <= nMax and every k until P(min > k)
+    underflows for n = nMax. For larger k, the probability is below the smallest
+    float64 for every n, and it is left out of the table.
+
+    Tables are cached on disk in cacheDir, keyed by (p, numSamples). A cached
+    table for a larger nMax is reused.
+
+    @param cacheDir (string or None)
+    Directory of the cache, by default CACHE_DIR. None disables the cache.
+
+    @return (numpy array)
+    Array of shape (nMax + 1, numColumns), row n holds P(min > k) for
+    Binomial(n, p).
+    """
+    if cacheDir is not None:
+        path = os.path.join(
+            cacheDir, "sample_minimum_survival_p{!r}_{}.npy".format(p, numSamples)
+        )
+        if os.path.exists(path):
+            table = np.load(path)
+            if table.shape[0] > nMax:
+                return table[: nMax + 1]
+
+    # P(X > k) decreases in k and increases in n, so the columns where it is
+    # nonzero for n = nMax are the only ones needed for any n <= nMax
+    survival = binomialSurvivalTable([nMax], p, nMax)[0]
+    numColumns = max(np.count_nonzero(survival), 1)
+
+    table = np.zeros((nMax + 1, numColumns))
+    blockSize = max(MAX_TABLE_ENTRIES // numColumns, 1)
+    for start in range(0, nMax + 1, blockSize):
+        nValues = np.arange(start, min(start + blockSize, nMax + 1))
+        table[nValues] = np.power(
+            binomialSurvivalTable(nValues, p, numColumns - 1), numSamples
+        )
+
+    if cacheDir is not None:
+        os.makedirs(cacheDir, exist_ok=True)
+        tmpPath = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmpPath, "wb") as f:
+            np.save(f, table)
+        os.replace(tmpPath, path)
+
+    return table
+
+
+def findBinomialNsWithExpectedSampleMinimum(
+    desiredValuesSorted, p, numSamples, nMax, cacheDir=CACHE_DIR
+):
     """
     For each desired value, find an approximate n for which the sample minimum
     has a expected value equal to this value.
@@ -140,6 +243,10 @@ def findBinomialNsWithExpectedSampleMinimum(desiredValuesSorted, p, numSamples,
     @param numSamples (int)
     The number of samples in the sample minimum distribution.
 
+    @param cacheDir (string or None)
+    Directory of the cache of sample minimum distributions, see
+    sampleMinimumSurvivalTable.
+
     @return
     A list of results. Each result contains
       (interpolated_n, lower_value, upper_value).
@@ -147,15 +254,10 @@ def findBinomialNsWithExpectedSampleMinimum(desiredValuesSorted, p, numSamples,
     floor(interpolated_n) and ceil(interpolated_n)
     """
 
-    # mapping from n -> expected value
-    actualValues = [
-        getExpectedValue(
-            SampleMinimumDistribution(
-                numSamples, BinomialDistribution(n, p, cache=True)
-            )
-        )
-        for n in range(nMax + 1)
-    ]
+    # mapping from n -> expected value, using E[min] = sum_k P(min > k)
+    actualValues = sampleMinimumSurvivalTable(nMax, p, numSamples, cacheDir).sum(
+        axis=1
+    )
 
     results = []
 
@@ -178,7 +280,7 @@ def findBinomialNsWithExpectedSampleMinimum(desiredValuesSorted, p, numSamples,
 
 
 def findBinomialNsWithLowerBoundSampleMinimum(
-    confidence, desiredValuesSorted, p, numSamples, nMax
+    confidence, desiredValuesSorted, p, numSamples, nMax, cacheDir=CACHE_DIR
 ):
     """
     For each desired value, find an approximate n for which the sample minimum
@@ -199,6 +301,10 @@ def findBinomialNsWithLowerBoundSampleMinimum(
     @param numSamples (int)
     The number of samples in the sample minimum distribution.
 
+    @param cacheDir (string or None)
+    Directory of the cache of sample minimum distributions, see
+    sampleMinimumSurvivalTable.
+
     @return
     A list of results. Each result contains
       (interpolated_n, lower_value, upper_value).
@@ -208,13 +314,17 @@ def findBinomialNsWithLowerBoundSampleMinimum(
      ...]
     """
 
+    survival = sampleMinimumSurvivalTable(nMax, p, numSamples, cacheDir)
+
     def P(n, numOccurrences):
         """
         Given n, return probability than the sample minimum is >= numOccurrences
         """
-        return 1 - SampleMinimumDistribution(
-            numSamples, BinomialDistribution(n, p)
-        ).cdf(numOccurrences - 1)
+        if numOccurrences <= 0:
+            return 1.0
+        if numOccurrences > survival.shape[1]:
+            return 0.0
+        return survival[n, numOccurrences - 1]
 
     results = []
 
@@ -237,7 +347,9 @@ def findBinomialNsWithLowerBoundSampleMinimum(
     return results
 
 
-def generateExpectedList(numUniqueFeatures, numLocationsPerObject, maxNumObjects):
+def generateExpectedList(
+    numUniqueFeatures, numLocationsPerObject, maxNumObjects, cacheDir=CACHE_DIR
+):
     """
     Metric: How unique is each object's most unique feature? Calculate the
     expected number of occurrences of an object's most unique feature.
@@ -254,6 +366,7 @@ def generateExpectedList(numUniqueFeatures, numLocationsPerObject, maxNumObjects
                 1.0 / numUniqueFeatures,
                 numLocationsPerObject,
                 maxNumOtherLocations,
+                cacheDir,
             ),
         )
     )
@@ -267,7 +380,11 @@ def generateExpectedList(numUniqueFeatures, numLocationsPerObject, maxNumObjects
 
 
 def generateLowerBoundList(
-    confidence, numUniqueFeatures, numLocationsPerObject, maxNumObjects
+    confidence,
+    numUniqueFeatures,
+    numLocationsPerObject,
+    maxNumObjects,
+    cacheDir=CACHE_DIR,
 ):
     """
     Metric: How unique is each object's most unique feature? Calculate the
@@ -290,6 +407,7 @@ def generateLowerBoundList(
                 1.0 / numUniqueFeatures,
                 numLocationsPerObject,
                 maxNumOtherLocations,
+                cacheDir,
             ),
         )
     )
@@ -0,0 +1,195 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Compares the "exact" and "lattice" excitation methods of the
+ThresholdedGaussian2DLocationModule, and the accuracy knobs of the lattice method.
+
+For each module size and number of bumps, the bumps are put on random cells and
+shifted by a random displacement, as after sensory inference and a movement.
+With movement noise, each bump is also shifted by its own gaussian noise (in
+phase), so that the bumps no longer share an offset from the cell lattice. For
+each setting of the lattice method (no knob, offset subdivisions, cutoff radius),
+the script reports the time to compute the cell excitations, the speedup over
+the exact method, the largest difference from it, and whether the active cells
+are the same.
+
+    python location_module_excitations.py
+    python location_module_excitations.py --cells-per-axis 40 --bump-fractions 0.125
+    python location_module_excitations.py --offset-subdivisions 8 --cutoff-radii 5
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from nupic.research.frameworks.location.location_modules import (
+    ThresholdedGaussian2DLocationModule,
+)
+
+
+def timeCall(func, repetitions):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        result = func()
+    return (time.perf_counter() - start) / repetitions, result
+
+
+def latticeSettings(offsetSubdivisions, cutoffRadii):
+    """
+    (name, getCellExcitationsLattice keyword arguments) of each setting.
+    """
+    settings = [("lattice", {})]
+    for subdivisions in offsetSubdivisions:
+        settings.append(("subdivisions {}".format(subdivisions),
+                         dict(offsetSubdivisions=subdivisions)))
+    for radius in cutoffRadii:
+        settings.append(("cutoff {:g}".format(radius), dict(cutoffRadius=radius)))
+    return settings
+
+
+def compareMethods(cellsPerAxis, numBumps, movementNoise, bumpOverlapMethod,
+                   settings, repetitions, rng):
+    bumpSigma = 0.18172 * 6 / cellsPerAxis
+    threshold = ThresholdedGaussian2DLocationModule.chooseReliableActiveFiringRate(
+        cellsPerAxis, bumpSigma
+    )
+
+    cellPhasesAxis = np.linspace(0.0, 1.0, cellsPerAxis, endpoint=False)
+    cellPhases = np.array(
+        [np.repeat(cellPhasesAxis, cellsPerAxis), np.tile(cellPhasesAxis, cellsPerAxis)]
+    )
+    cellPhases += 0.5 / cellsPerAxis
+
+    cells = rng.choice(cellsPerAxis * cellsPerAxis, numBumps, replace=False)
+    bumpPhases = cellPhases[:, cells] + rng.random((2, 1))
+    if movementNoise > 0:
+        bumpPhases += rng.normal(0.0, movementNoise, size=bumpPhases.shape)
+    bumpPhases = np.mod(bumpPhases, 1.0)
+
+    exactTime, exact = timeCall(
+        lambda: ThresholdedGaussian2DLocationModule.getCellExcitations(
+            cellPhases, bumpPhases, bumpSigma, bumpOverlapMethod
+        ),
+        repetitions,
+    )
+
+    results = []
+    for name, kwargs in settings:
+        # the first call fills the stencil bank cache
+        ThresholdedGaussian2DLocationModule.getCellExcitationsLattice(
+            cellsPerAxis, bumpPhases, bumpSigma, bumpOverlapMethod, **kwargs
+        )
+        latticeTime, lattice = timeCall(
+            lambda: ThresholdedGaussian2DLocationModule.getCellExcitationsLattice(
+                cellsPerAxis, bumpPhases, bumpSigma, bumpOverlapMethod, **kwargs
+            ),
+            repetitions,
+        )
+        results.append({
+            "name": name,
+            "time": latticeTime,
+            "speedup": exactTime / latticeTime,
+            "error": np.abs(exact - lattice).max(),
+            "sameActive": np.array_equal(exact >= threshold, lattice >= threshold),
+        })
+
+    return exactTime, results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--cells-per-axis", type=int, nargs="+", default=[10, 20, 40]
+    )
+    parser.add_argument(
+        "--bump-fractions",
+        type=float,
+        nargs="+",
+        default=[0.01, 0.1, 0.25, 1.0],
+        help="number of bumps, as a fraction of the number of cells",
+    )
+    parser.add_argument(
+        "--movement-noise",
+        type=float,
+        nargs="+",
+        default=[0.0, 0.01],
+        help="standard deviation of the phase noise of each bump",
+    )
+    parser.add_argument(
+        "--offset-subdivisions", type=int, nargs="*", default=[4, 8, 16]
+    )
+    parser.add_argument(
+        "--cutoff-radii", type=float, nargs="*", default=[3.0, 4.0, 5.0],
+        help="in units of bumpSigma",
+    )
+    parser.add_argument(
+        "--bump-overlap-method",
+        choices=["probabilistic", "sum"],
+        default="probabilistic",
+    )
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    settings = latticeSettings(args.offset_subdivisions, args.cutoff_radii)
+
+    print(
+        "{:>8}{:>8}{:>8}{:>12}  {:<16}{:>10}{:>10}{:>12}{:>8}".format(
+            "cells", "bumps", "noise", "exact (ms)", "setting", "ms", "speedup",
+            "max error", "same",
+        )
+    )
+    for cellsPerAxis in args.cells_per_axis:
+        for fraction in args.bump_fractions:
+            numBumps = max(1, int(fraction * cellsPerAxis * cellsPerAxis))
+            for movementNoise in args.movement_noise:
+                exactTime, results = compareMethods(
+                    cellsPerAxis, numBumps, movementNoise, args.bump_overlap_method,
+                    settings, args.repetitions, rng,
+                )
+                for i, result in enumerate(results):
+                    if i == 0:
+                        row = "{:>8}{:>8}{:>8g}{:>12.3f}".format(
+                            cellsPerAxis * cellsPerAxis, numBumps, movementNoise,
+                            exactTime * 1000,
+                        )
+                    else:
+                        row = " " * 36
+                    print(
+                        "{}  {:<16}{:>10.3f}{:>10.1f}{:>12.1e}{:>8}".format(
+                            row,
+                            result["name"],
+                            result["time"] * 1000,
+                            result["speedup"],
+                            result["error"],
+                            str(result["sameActive"]),
+                        )
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -22,8 +22,10 @@
 """Emulates a grid cell module"""
 
 import copy
+import functools
 import math
 import random
+from collections import defaultdict
 
 import numpy as np
 
@@ -57,8 +59,13 @@ class ThresholdedGaussian2DLocationModule(object):
      2. Use a large enough set of active cells that inference accounts for
         uncertainty in the learned locations.
     Use chooseReliableActiveFiringRate() to get good parameters.
+
+    LATTICE_TIE_TOLERANCE (float) is the difference from the highest firing rate
+    below which the "lattice" excitation method considers cells tied for learning.
     """
 
+    LATTICE_TIE_TOLERANCE = 1e-8
+
     def __init__(
         self,
         cellsPerAxis,
@@ -76,6 +83,9 @@ class ThresholdedGaussian2DLocationModule(object):
         permanenceDecrement=0.0,
         maxSynapsesPerSegment=-1,
         bumpOverlapMethod="probabilistic",
+        excitationMethod="exact",
+        latticeOffsetSubdivisions=None,
+        latticeCutoffRadius=None,
         seed=42,
     ):
         """
@@ -107,6 +117,26 @@ class ThresholdedGaussian2DLocationModule(object):
 
         @param bumpOverlapMethod ("probabilistic" or "sum")
         Specifies the firing rate of a cell when it's part of two bumps.
+
+        @param excitationMethod ("exact" or "lattice")
+        How the cell firing rates are computed from the bumps. "exact" computes the
+        distance from every cell to every bump (see getCellExcitations). "lattice"
+        rasterizes the bumps onto the cell lattice and convolves them with a
+        periodic gaussian stencil (see getCellExcitationsLattice), which costs the
+        same for any number of bumps. Both give the same firing rates up to
+        floating point rounding (about 1e-9). "lattice" compares the firing rates
+        with the highest one with a tolerance (LATTICE_TIE_TOLERANCE) to choose
+        the learning cells, so the cells tied by symmetry are kept. "exact"
+        compares them exactly, and rounding sometimes breaks these ties, so the
+        learning cells of the two methods can differ.
+
+        @param latticeOffsetSubdivisions (int or None)
+        @param latticeCutoffRadius (float or None)
+        Accuracy knobs of the "lattice" method, see getCellExcitationsLattice. With
+        either of them, the firing rates are approximate, and the active and
+        learning cells can differ from the "exact" method. With movement noise,
+        use a cutoff radius: without it, every bump is convolved separately. A
+        radius of 5 keeps the firing rates within about 1e-5 of "exact".
         """
 
         self.cellsPerAxis = cellsPerAxis
@@ -156,6 +186,12 @@ class ThresholdedGaussian2DLocationModule(object):
         self.activeFiringRate = activeFiringRate
         self.bumpOverlapMethod = bumpOverlapMethod
 
+        if excitationMethod not in ("exact", "lattice"):
+            raise ValueError("Unrecognized excitation method", excitationMethod)
+        self.excitationMethod = excitationMethod
+        self.latticeOffsetSubdivisions = latticeOffsetSubdivisions
+        self.latticeCutoffRadius = latticeCutoffRadius
+
         cellPhasesAxis = np.linspace(0.0, 1.0, self.cellsPerAxis, endpoint=False)
         self.cellPhases = np.array(
             [
@@ -182,12 +218,30 @@ class ThresholdedGaussian2DLocationModule(object):
         self.sensoryAssociatedCells = np.empty(0, dtype="int")
 
     def _computeActiveCells(self):
-        cellExcitations = ThresholdedGaussian2DLocationModule.getCellExcitations(
-            self.cellPhases, self.bumpPhases, self.bumpSigma, self.bumpOverlapMethod
-        )
+        if self.excitationMethod == "lattice":
+            cellExcitations = (
+                ThresholdedGaussian2DLocationModule.getCellExcitationsLattice(
+                    self.cellsPerAxis,
+                    self.bumpPhases,
+                    self.bumpSigma,
+                    self.bumpOverlapMethod,
+                    self.latticeOffsetSubdivisions,
+                    self.latticeCutoffRadius,
+                )
+            )
+        else:
+            cellExcitations = ThresholdedGaussian2DLocationModule.getCellExcitations(
+                self.cellPhases, self.bumpPhases, self.bumpSigma, self.bumpOverlapMethod
+            )
+
+        tolerance = 0.0
+        if self.excitationMethod == "lattice":
+            tolerance = self.LATTICE_TIE_TOLERANCE
 
         self.activeCells = np.where(cellExcitations >= self.activeFiringRate)[0]
-        self.learningCells = np.where(cellExcitations == cellExcitations.max())[0]
+        self.learningCells = np.where(
+            cellExcitations >= cellExcitations.max() - tolerance
+        )[0]
 
     def activateRandomLocation(self):
         """
@@ -237,6 +291,24 @@ class ThresholdedGaussian2DLocationModule(object):
         if len(anchorInput) == 0:
             return
 
+        activeSegments, sensorySupportedCells = self._computeSensorySupport(anchorInput)
+
+        self.bumpPhases = self.cellPhases[:, sensorySupportedCells]
+        self._computeActiveCells()
+        self.activeSegments = activeSegments
+        self.sensoryAssociatedCells = sensorySupportedCells
+
+    def _computeSensorySupport(self, anchorInput):
+        """
+        Find the segments that are activated by the sensory input, and the cells
+        with an active segment.
+
+        @param anchorInput (numpy array)
+        A sensory input.
+
+        @return (tuple of numpy arrays)
+        The active segments and the cells they're on.
+        """
         overlaps = self.connections.computeActivity(
             anchorInput, self.connectedPermanence
         )
@@ -246,10 +318,7 @@ class ThresholdedGaussian2DLocationModule(object):
             self.connections.mapSegmentsToCells(activeSegments)
         )
 
-        self.bumpPhases = self.cellPhases[:, sensorySupportedCells]
-        self._computeActiveCells()
-        self.activeSegments = activeSegments
-        self.sensoryAssociatedCells = sensorySupportedCells
+        return activeSegments, sensorySupportedCells
 
     def _sensoryComputeLearningMode(self, anchorInput):
         """
@@ -429,7 +498,11 @@ class ThresholdedGaussian2DLocationModule(object):
         return np.exp(-np.power(d, 2.0) / (2 * np.power(sig, 2.0)))
 
     @staticmethod
-    def getCellExcitations(cellPhases, bumpPhases, bumpSigma, bumpOverlapMethod):
+    def getCellExcitationsFromBumps(cellPhases, bumpPhases, bumpSigma):
+        """
+        Firing rate of each cell caused by each bump, organized by cell then bump.
+        bumpSigma is a float, or an array with the sigma of each bump.
+        """
         # For each cell, compute the phase displacement from each bump. Create an
         # array of matrices, one per cell. Each column in a matrix corresponds to
         # the phase displacement from the bump to the cell.
@@ -475,10 +548,18 @@ class ThresholdedGaussian2DLocationModule(object):
         cell_bump_distance = np.amin(cell_direction_bump_distance, axis=1)
 
         # Compute the gaussian of each of these distances.
-        cellExcitationsFromBumps = ThresholdedGaussian2DLocationModule.gaussian(
+        return ThresholdedGaussian2DLocationModule.gaussian(
             bumpSigma, cell_bump_distance
         )
 
+    @staticmethod
+    def getCellExcitations(cellPhases, bumpPhases, bumpSigma, bumpOverlapMethod):
+        cellExcitationsFromBumps = (
+            ThresholdedGaussian2DLocationModule.getCellExcitationsFromBumps(
+                cellPhases, bumpPhases, bumpSigma
+            )
+        )
+
         # Combine bumps. Create an array of firing rates, organized by cell.
         if bumpOverlapMethod == "probabilistic":
             # Think of a bump as a probability distribution, with each cell's firing
@@ -509,6 +590,519 @@ class ThresholdedGaussian2DLocationModule(object):
 
         return cellExcitations
 
+    @staticmethod
+    def getCellExcitationsLattice(
+        cellsPerAxis,
+        bumpPhases,
+        bumpSigma,
+        bumpOverlapMethod,
+        offsetSubdivisions=None,
+        cutoffRadius=None,
+    ):
+        """
+        Same as getCellExcitations for the cells of a module with cellsPerAxis
+        cells per axis, computed without a cells x bumps array.
+
+        The bumps of a module are on the lattice of cell phases, shifted by a common
+        offset: sensory input puts the bumps on cells, and movement shifts all of
+        them by the same displacement. Each bump is rasterized onto the lattice
+        point it's offset from. The excitation from the bumps is then the periodic
+        convolution of the number of bumps at each lattice point with the
+        excitation of the cells from a single bump at the offset (the stencil),
+        computed with an FFT. Bumps with different offsets are convolved
+        separately, so movement noise, which gives each bump its own offset,
+        removes the speedup. Without the knobs below, the firing rates match
+        getCellExcitations up to about 1e-9, not exactly: compare them with a
+        tolerance (see LATTICE_TIE_TOLERANCE).
+
+        @param offsetSubdivisions (int or None)
+        If specified, each bump is moved to the nearest point of a grid with this
+        many points per cell along each axis, so that there are at most
+        offsetSubdivisions ** 2 offsets. Their stencils are computed once and
+        cached (see getLatticeStencilBank), and all of the offsets share one
+        inverse FFT. A bump moves by at most 0.5 / offsetSubdivisions cells along
+        each axis.
+
+        @param cutoffRadius (float or None)
+        If specified, each bump only excites the cells within cutoffRadius
+        bumpSigmas of it, and the excitations are added cell by cell instead of
+        with an FFT. Each bump's firing rate is then off by at most
+        gaussian(1, cutoffRadius), e.g. 1.1e-2 for 3 and 3.7e-6 for 5. A radius
+        that reaches around the module has no effect.
+        """
+        if bumpOverlapMethod not in ("probabilistic", "sum"):
+            raise ValueError("Unrecognized bump overlap strategy", bumpOverlapMethod)
+
+        n = cellsPerAxis
+
+        # Position of each bump in units of cells, relative to the first cell
+        bumpPositions = (bumpPhases - 0.5 / n) * n
+        if offsetSubdivisions is not None:
+            bumpPositions = (
+                np.round(bumpPositions * offsetSubdivisions) / offsetSubdivisions
+            )
+
+        if cutoffRadius is not None:
+            # Half width of the window of lattice points within the cutoff of a
+            # bump: a displacement of length d has coordinates of at most
+            # 2d / sqrt(3) along the rhombus edges.
+            cutoff = cutoffRadius * bumpSigma * n
+            radius = int(math.ceil(2.0 * cutoff / math.sqrt(3))) + 1
+            if 2 * radius + 1 <= n:
+                return ThresholdedGaussian2DLocationModule._getCellExcitationsWindowed(
+                    n, bumpPositions, bumpSigma, bumpOverlapMethod, cutoff, radius
+                )
+
+        if offsetSubdivisions is not None:
+            # Index of each bump's offset in the stencil bank
+            steps = np.round(bumpPositions * offsetSubdivisions).astype("int")
+            offsetSteps = np.mod(steps, offsetSubdivisions)
+            latticePoints = np.mod(
+                (steps - offsetSteps) // offsetSubdivisions, n
+            )
+            offsetIndices = offsetSteps[0] * offsetSubdivisions + offsetSteps[1]
+
+            uniqueOffsets, bumpOffsets = np.unique(offsetIndices, return_inverse=True)
+            bumpCounts = np.bincount(
+                (bumpOffsets.reshape(-1) * n + latticePoints[0]) * n
+                + latticePoints[1],
+                minlength=uniqueOffsets.size * n * n,
+            ).reshape(uniqueOffsets.size, n, n)
+
+            stencils = ThresholdedGaussian2DLocationModule.getLatticeStencilBank(
+                n, bumpSigma, bumpOverlapMethod, offsetSubdivisions
+            )
+            cellExcitations = np.fft.irfft2(
+                (np.fft.rfft2(bumpCounts) * stencils[uniqueOffsets]).sum(axis=0),
+                s=(n, n),
+            ).reshape(-1)
+        else:
+            cellExcitations = np.zeros(n * n)
+
+            latticePoints = np.round(bumpPositions)
+            offsets = np.round(bumpPositions - latticePoints, decimals=9)
+            latticePoints = np.mod(latticePoints, n).astype("int")
+
+            uniqueOffsets, offsetIndices = np.unique(
+                offsets, axis=1, return_inverse=True
+            )
+            offsetIndices = offsetIndices.reshape(-1)
+            for iOffset, offset in enumerate(uniqueOffsets.T):
+                bumps = latticePoints[:, offsetIndices == iOffset]
+                bumpCounts = np.zeros((n, n))
+                np.add.at(bumpCounts, (bumps[0], bumps[1]), 1)
+
+                stencil = ThresholdedGaussian2DLocationModule.getLatticeStencil(
+                    n, offset, bumpSigma, bumpOverlapMethod
+                )
+                cellExcitations += np.fft.irfft2(
+                    np.fft.rfft2(bumpCounts) * np.fft.rfft2(stencil), s=(n, n)
+                ).reshape(-1)
+
+        if bumpOverlapMethod == "probabilistic":
+            cellExcitations = 1.0 - np.exp(cellExcitations)
+
+        return cellExcitations
+
+    @staticmethod
+    def getLatticeStencil(cellsPerAxis, offset, bumpSigma, bumpOverlapMethod):
+        """
+        Excitation of the cells of getCellExcitationsLattice from a single bump at
+        `offset` cells from the first cell, as a (cellsPerAxis, cellsPerAxis)
+        array. For "probabilistic" overlap, the stencil is log(1 - e), so that the
+        bumps combine with a sum: 1 - prod(1 - e) is 1 - exp(sum(log(1 - e))).
+        """
+        n = cellsPerAxis
+
+        # Phase displacement from the lattice point (0, 0) to each cell
+        cellPhasesAxis = np.linspace(0.0, 1.0, n, endpoint=False)
+        displacements = np.array(
+            [np.repeat(cellPhasesAxis, n), np.tile(cellPhasesAxis, n)]
+        )
+
+        stencil = ThresholdedGaussian2DLocationModule.getCellExcitations(
+            displacements,
+            (np.asarray(offset) / n)[:, np.newaxis],
+            bumpSigma,
+            "sum",
+        ).reshape(n, n)
+
+        if bumpOverlapMethod == "probabilistic":
+            # A cell exactly on a bump has e = 1.
+            stencil = np.log(np.maximum(1.0 - stencil, np.finfo(float).tiny))
+
+        return stencil
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def getLatticeStencilBank(
+        cellsPerAxis, bumpSigma, bumpOverlapMethod, offsetSubdivisions
+    ):
+        """
+        The rfft2 of the stencil (see getLatticeStencil) of every offset of a grid
+        with offsetSubdivisions points per cell along each axis, ordered by the
+        first then the second coordinate of the offset. Cached, so the returned
+        array must not be modified.
+        """
+        offsets = np.arange(offsetSubdivisions) / offsetSubdivisions
+
+        return np.array([
+            np.fft.rfft2(
+                ThresholdedGaussian2DLocationModule.getLatticeStencil(
+                    cellsPerAxis, (offset0, offset1), bumpSigma, bumpOverlapMethod
+                )
+            )
+            for offset0 in offsets
+            for offset1 in offsets
+        ])
+
+    @staticmethod
+    def _getCellExcitationsWindowed(
+        cellsPerAxis, bumpPositions, bumpSigma, bumpOverlapMethod, cutoff, radius
+    ):
+        """
+        getCellExcitationsLattice with a cutoff: adds the excitation of every bump
+        to the cells within `cutoff` cells of it, among the lattice points within
+        `radius` of its nearest lattice point.
+        """
+        n = cellsPerAxis
+
+        latticePoints = np.round(bumpPositions)
+        offsets = bumpPositions - latticePoints
+        latticePoints = latticePoints.astype("int")
+
+        window = np.arange(-radius, radius + 1)
+        window = np.array([np.repeat(window, window.size),
+                           np.tile(window, window.size)])
+
+        # Displacement from each bump to each cell of its window, organized by
+        # axis, bump, then window point, in units of cells
+        displacements = window[:, np.newaxis, :] - offsets[:, :, np.newaxis]
+        distances = np.sqrt(
+            displacements[0] ** 2 + displacements[1] ** 2
+            + displacements[0] * displacements[1]
+        )
+        nearby = distances <= cutoff
+
+        cells = np.mod(latticePoints[:, :, np.newaxis] + window[:, np.newaxis, :], n)
+        cells = (cells[0] * n + cells[1])[nearby]
+        excitations = ThresholdedGaussian2DLocationModule.gaussian(
+            bumpSigma * n, distances[nearby]
+        )
+
+        if bumpOverlapMethod == "probabilistic":
+            excitations = np.log(np.maximum(1.0 - excitations, np.finfo(float).tiny))
+
+        cellExcitations = np.bincount(cells, excitations, minlength=n * n)
+
+        if bumpOverlapMethod == "probabilistic":
+            cellExcitations = 1.0 - np.exp(cellExcitations)
+
+        return cellExcitations
+
+
+class ThresholdedGaussian2DLocationModuleBank(object):
+    """
+    Runs a list of ThresholdedGaussian2DLocationModules as one population. The
+    bumps of every module live in shared arrays, so movement and anchoring update
+    all of the modules with a few numpy operations instead of a few dozen per
+    module.
+
+    The bumps are stored as one (2, numBumps) array of phases, sorted by module,
+    with the module of each bump. Modules with the same number of cells compute
+    their cell excitations together: the firing rate of each cell is computed for
+    every bump, then the bumps of each module are combined with a reduceat.
+
+    The modules stay usable on their own: after each update, the bank stores each
+    module's bumps, active cells, etc. on the module. While a bank is used, its
+    modules must only be updated through the bank.
+
+    MAX_CELL_BUMP_PAIRS (int) bounds the number of (cell, bump) pairs whose firing
+    rates are computed at once.
+
+    The synapses of each module are stored in their own connections, so the
+    segment activity of each module is still computed separately.
+    """
+
+    MAX_CELL_BUMP_PAIRS = 2 ** 14
+
+    def __init__(self, modules):
+        """
+        @param modules (list of ThresholdedGaussian2DLocationModule)
+        """
+        self.modules = list(modules)
+
+        # Matrices that convert a world displacement into the phase displacement of
+        # each module.
+        self.A = np.array([module.A for module in self.modules])
+
+        self.bumpSigmas = np.array([module.bumpSigma for module in self.modules])
+        self.activeFiringRates = np.array(
+            [module.activeFiringRate for module in self.modules]
+        )
+
+        cellCounts = [module.numberOfCells() for module in self.modules]
+        self.cellOffsets = np.cumsum([0] + cellCounts)
+
+        # Modules that have the same cells and combine their bumps the same way
+        # compute their excitations together.
+        groupsByKey = defaultdict(list)
+        for iModule, module in enumerate(self.modules):
+            if module.bumpOverlapMethod not in ("probabilistic", "sum"):
+                raise ValueError(
+                    "Unrecognized bump overlap strategy", module.bumpOverlapMethod
+                )
+            key = (
+                module.cellsPerAxis,
+                module.bumpOverlapMethod,
+                module.excitationMethod,
+            )
+            groupsByKey[key].append(iModule)
+
+        self.groups = [np.array(modules) for modules in groupsByKey.values()]
+        self.groupByModule = np.empty(len(self.modules), dtype="int")
+        for iGroup, modules in enumerate(self.groups):
+            self.groupByModule[modules] = iGroup
+
+        self._setBumps(np.empty((2, 0), dtype="float"), np.empty(0, dtype="int"))
+
+    def reset(self):
+        """
+        Clear the active cells of every module.
+        """
+        for module in self.modules:
+            module.reset()
+
+        self.bumpPhases = np.empty((2, 0), dtype="float")
+        self.bumpModules = np.empty(0, dtype="int")
+        self.bumpOffsets = np.zeros(len(self.modules) + 1, dtype="int")
+
+    def activateRandomLocation(self):
+        """
+        Set the location of every module to a random point.
+        """
+        self._setBumps(
+            np.random.random((len(self.modules), 2)).T, np.arange(len(self.modules))
+        )
+        self._computeActiveCells()
+
+    def movementCompute(self, displacement, noiseFactor=0):
+        """
+        Shift the active cells of every module by a vector.
+
+        @param displacement (pair of floats)
+        A translation vector [di, dj].
+
+        @param noiseFactor (float)
+        The standard deviation of the noise added to the displacement, drawn
+        separately for each module.
+        """
+        displacements = np.tile(
+            np.asarray(displacement, dtype="float"), (len(self.modules), 1)
+        )
+        if noiseFactor != 0:
+            displacements += np.random.normal(0, noiseFactor, displacements.shape)
+
+        # Calculate delta in the coordinates of each module.
+        phaseDisplacements = np.matmul(self.A, displacements[:, :, np.newaxis])[
+            :, :, 0
+        ]
+
+        # Shift the active coordinates.
+        np.add(
+            self.bumpPhases,
+            phaseDisplacements[self.bumpModules].T,
+            out=self.bumpPhases,
+        )
+        np.round(self.bumpPhases, decimals=9, out=self.bumpPhases)
+        np.mod(self.bumpPhases, 1.0, out=self.bumpPhases)
+
+        self._computeActiveCells()
+        for module, phaseDisplacement in zip(self.modules, phaseDisplacements):
+            module.phaseDisplacement = phaseDisplacement
+
+    def sensoryCompute(self, anchorInput, anchorGrowthCandidates, learn):
+        if learn:
+            for module in self.modules:
+                module._sensoryComputeLearningMode(anchorGrowthCandidates)
+        else:
+            self._sensoryComputeInferenceMode(anchorInput)
+
+    def _sensoryComputeInferenceMode(self, anchorInput):
+        """
+        Infer the location of every module from sensory input. See
+        ThresholdedGaussian2DLocationModule._sensoryComputeInferenceMode.
+        """
+        if len(anchorInput) == 0:
+            return
+
+        sensorySupportedCells = []
+        for module in self.modules:
+            activeSegments, cells = module._computeSensorySupport(anchorInput)
+            module.activeSegments = activeSegments
+            module.sensoryAssociatedCells = cells
+            sensorySupportedCells.append(cells)
+
+        bumpModules = np.repeat(
+            np.arange(len(self.modules)),
+            [len(cells) for cells in sensorySupportedCells],
+        )
+        cells = np.concatenate(sensorySupportedCells).astype("int")
+
+        # Put a bump on each supported cell.
+        bumpPhases = np.empty((2, len(cells)), dtype="float")
+        bumpGroups = self.groupByModule[bumpModules]
+        for iGroup, modules in enumerate(self.groups):
+            inGroup = bumpGroups == iGroup
+            bumpPhases[:, inGroup] = self.modules[modules[0]].cellPhases[
+                :, cells[inGroup]
+            ]
+
+        self._setBumps(bumpPhases, bumpModules)
+        self._computeActiveCells()
+
+    def _setBumps(self, bumpPhases, bumpModules):
+        """
+        @param bumpPhases (2 x numBumps numpy array)
+        @param bumpModules (numpy array)
+        The module of each bump, in increasing order.
+        """
+        self.bumpPhases = bumpPhases
+        self.bumpModules = bumpModules
+        self.bumpOffsets = np.searchsorted(
+            bumpModules, np.arange(len(self.modules) + 1)
+        )
+
+        for iModule, module in enumerate(self.modules):
+            start, end = self.bumpOffsets[iModule], self.bumpOffsets[iModule + 1]
+            module.bumpPhases = self.bumpPhases[:, start:end]
+
+    def _computeActiveCells(self):
+        bumpCounts = np.diff(self.bumpOffsets)
+        bumpGroups = self.groupByModule[self.bumpModules]
+
+        for iGroup, modules in enumerate(self.groups):
+            firstModule = self.modules[modules[0]]
+
+            # Firing rate of each cell of each module, organized by cell then module.
+            # Modules without bumps have no active cells.
+            cellExcitations = np.zeros((firstModule.numberOfCells(), len(modules)))
+
+            tolerance = 0.0
+            if firstModule.excitationMethod == "lattice":
+                tolerance = firstModule.LATTICE_TIE_TOLERANCE
+                for i, iModule in enumerate(modules):
+                    module = self.modules[iModule]
+                    cellExcitations[:, i] = (
+                        ThresholdedGaussian2DLocationModule.getCellExcitationsLattice(
+                            module.cellsPerAxis,
+                            module.bumpPhases,
+                            module.bumpSigma,
+                            module.bumpOverlapMethod,
+                            module.latticeOffsetSubdivisions,
+                            module.latticeCutoffRadius,
+                        )
+                    )
+            else:
+                inGroup = bumpGroups == iGroup
+                bumpPhases = self.bumpPhases[:, inGroup]
+                bumpSigmas = self.bumpSigmas[self.bumpModules[inGroup]]
+
+                # The bumps of each module are contiguous.
+                withBumps = np.nonzero(bumpCounts[modules])[0]
+                ends = np.cumsum(bumpCounts[modules][withBumps])
+                starts = ends - bumpCounts[modules][withBumps]
+
+                # Process the modules in chunks of about MAX_CELL_BUMP_PAIRS, so that
+                # the temporary arrays stay small.
+                maxBumps = max(
+                    self.MAX_CELL_BUMP_PAIRS // firstModule.numberOfCells(), 1
+                )
+                first = 0
+                while first < len(withBumps):
+                    last = max(
+                        np.searchsorted(ends, starts[first] + maxBumps, side="right"),
+                        first + 1,
+                    )
+                    chunk = slice(starts[first], ends[last - 1])
+
+                    cellExcitationsFromBumps = (
+                        ThresholdedGaussian2DLocationModule.getCellExcitationsFromBumps(
+                            firstModule.cellPhases,
+                            bumpPhases[:, chunk],
+                            bumpSigmas[chunk],
+                        )
+                    )
+
+                    # Combine the bumps of each module, as in getCellExcitations.
+                    chunkStarts = starts[first:last] - starts[first]
+                    if firstModule.bumpOverlapMethod == "probabilistic":
+                        cellExcitations[:, withBumps[first:last]] = (
+                            1.0
+                            - np.multiply.reduceat(
+                                1.0 - cellExcitationsFromBumps, chunkStarts, axis=1
+                            )
+                        )
+                    else:
+                        cellExcitations[:, withBumps[first:last]] = np.add.reduceat(
+                            cellExcitationsFromBumps, chunkStarts, axis=1
+                        )
+
+                    first = last
+
+            # Organize by module then cell.
+            cellExcitations = cellExcitations.T
+            activeCells = cellExcitations >= self.activeFiringRates[modules, np.newaxis]
+            learningCells = (
+                cellExcitations
+                >= cellExcitations.max(axis=1)[:, np.newaxis] - tolerance
+            )
+
+            splitPoints = np.cumsum(activeCells.sum(axis=1))[:-1]
+            activeCellsByModule = np.split(np.nonzero(activeCells)[1], splitPoints)
+            splitPoints = np.cumsum(learningCells.sum(axis=1))[:-1]
+            learningCellsByModule = np.split(np.nonzero(learningCells)[1], splitPoints)
+
+            for iModule, active, learning in zip(
+                modules, activeCellsByModule, learningCellsByModule
+            ):
+                self.modules[iModule].activeCells = active
+                self.modules[iModule].learningCells = learning
+
+    def getActiveCells(self):
+        """
+        The active cells of every module, with the cells of each module numbered
+        after the cells of the previous modules.
+        """
+        return self._concatenateCells(
+            [module.getActiveCells() for module in self.modules]
+        )
+
+    def getLearnableCells(self):
+        """
+        The learnable cells of every module, numbered like getActiveCells.
+        """
+        return self._concatenateCells(
+            [module.getLearnableCells() for module in self.modules]
+        )
+
+    def getSensoryAssociatedCells(self):
+        """
+        The sensory associated cells of every module, numbered like getActiveCells.
+        """
+        return self._concatenateCells(
+            [module.getSensoryAssociatedCells() for module in self.modules]
+        )
+
+    def numberOfCells(self):
+        return self.cellOffsets[-1]
+
+    def _concatenateCells(self, cellsByModule):
+        offsets = np.repeat(
+            self.cellOffsets[:-1], [len(cells) for cells in cellsByModule]
+        )
+        return np.concatenate([np.empty(0, dtype="uint32")] + cellsByModule) + offsets
+
 
 class Superficial2DLocationModule(object):
     """
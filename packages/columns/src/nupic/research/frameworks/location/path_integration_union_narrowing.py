@@ -26,6 +26,7 @@ of unions of locations that are specific to objects.
 
 import abc
 import math
+import multiprocessing
 import random
 from collections import defaultdict
 
@@ -35,10 +36,16 @@ from nupic.research.frameworks.columns import ApicalTiebreakPairMemory
 from nupic.research.frameworks.location.location_modules import (
     Superficial2DLocationModule,
     ThresholdedGaussian2DLocationModule,
+    ThresholdedGaussian2DLocationModuleBank,
 )
 
 RAT_BUMP_SIGMA = 0.18172
 
+# The (experiment, objects) inferred by the worker processes of
+# PIUNExperiment.inferObjects. It's set before the workers are forked, so they
+# share the learned network with the parent process instead of unpickling a copy.
+_inferenceTask = None
+
 
 def computeRatModuleParametersFromCellCount(cellsPerAxis, baselineCellsPerAxis=6):
     """
@@ -154,13 +161,20 @@ class PIUNCorticalColumn(object):
     arrives, call sensoryCompute.
     """
 
-    def __init__(self, locationConfigs, L4Overrides=None, bumpType="gaussian"):
+    def __init__(
+        self, locationConfigs, L4Overrides=None, bumpType="gaussian", batchModules=False
+    ):
         """
         @param L4Overrides (dict)
         Custom parameters for L4
 
         @param locationConfigs (sequence of dicts)
         Parameters for the location modules
+
+        @param batchModules (bool)
+        If True, update all of the location modules together with a
+        ThresholdedGaussian2DLocationModuleBank, rather than one at a time. Only for
+        gaussian bumps.
         """
         self.bumpType = bumpType
 
@@ -185,6 +199,12 @@ class PIUNCorticalColumn(object):
         else:
             raise ValueError("Invalid bumpType", bumpType)
 
+        self.L6aBank = None
+        if batchModules:
+            if bumpType == "square":
+                raise ValueError("batchModules requires gaussian bumps")
+            self.L6aBank = ThresholdedGaussian2DLocationModuleBank(self.L6aModules)
+
         L4Params = {
             "columnCount": 150,
             "cellsPerColumn": 16,
@@ -216,8 +236,11 @@ class PIUNCorticalColumn(object):
             "noiseFactor": moduleNoiseFactor,
         }
 
-        for module in self.L6aModules:
-            module.movementCompute(**locationParams)
+        if self.L6aBank is not None:
+            self.L6aBank.movementCompute(**locationParams)
+        else:
+            for module in self.L6aModules:
+                module.movementCompute(**locationParams)
 
         return locationParams
 
@@ -245,8 +268,11 @@ class PIUNCorticalColumn(object):
             "anchorGrowthCandidates": self.L4.getWinnerCells(),
             "learn": learn,
         }
-        for module in self.L6aModules:
-            module.sensoryCompute(**locationParams)
+        if self.L6aBank is not None:
+            self.L6aBank.sensoryCompute(**locationParams)
+        else:
+            for module in self.L6aModules:
+                module.sensoryCompute(**locationParams)
 
         return (inputParams, locationParams)
 
@@ -255,15 +281,21 @@ class PIUNCorticalColumn(object):
         Clear all cell activity.
         """
         self.L4.reset()
-        for module in self.L6aModules:
-            module.reset()
+        if self.L6aBank is not None:
+            self.L6aBank.reset()
+        else:
+            for module in self.L6aModules:
+                module.reset()
 
     def activateRandomLocation(self):
         """
         Activate a random location in the location layer.
         """
-        for module in self.L6aModules:
-            module.activateRandomLocation()
+        if self.L6aBank is not None:
+            self.L6aBank.activateRandomLocation()
+        else:
+            for module in self.L6aModules:
+                module.activateRandomLocation()
 
     def getSensoryRepresentation(self):
         """
@@ -275,6 +307,9 @@ class PIUNCorticalColumn(object):
         """
         Get the full population representation of the location layer.
         """
+        if self.L6aBank is not None:
+            return self.L6aBank.getActiveCells()
+
         activeCells = np.array([], dtype="uint32")
 
         totalPrevCells = 0
@@ -292,6 +327,9 @@ class PIUNCorticalColumn(object):
         sensory input layer representation. In some models, this is identical to the
         active cells. In others, it's a subset.
         """
+        if self.L6aBank is not None:
+            return self.L6aBank.getLearnableCells()
+
         learnableCells = np.array([], dtype="uint32")
 
         totalPrevCells = 0
@@ -308,6 +346,9 @@ class PIUNCorticalColumn(object):
         Get the location cells in the location layer that were driven by the input
         layer (or, during learning, were associated with this input.)
         """
+        if self.L6aBank is not None:
+            return self.L6aBank.getSensoryAssociatedCells()
+
         cells = np.array([], dtype="uint32")
 
         totalPrevCells = 0
@@ -577,6 +618,63 @@ class PIUNExperiment(object):
 
         return inferredStep
 
+    def inferObjects(self, objects, numWorkers=1, seed=None, **kwargs):
+        """
+        Call inferObjectWithRandomMovements on each object, optionally distributing
+        the objects over several processes.
+
+        The worker processes are forked from this process, so they share the learned
+        network copy-on-write. Inference doesn't modify the network, so each object
+        gets the same result in any process. When seed is set, `random` and
+        `numpy.random` are seeded with seed + the index of the object before
+        inferring it, so the results are the same for any number of workers.
+
+        Monitors are called in the worker processes, so their state isn't returned to
+        this process. Use numWorkers=1 to trace inference.
+
+        @param objects (list of dicts)
+        The object descriptions, see inferObjectWithRandomMovements.
+
+        @param numWorkers (int)
+        Number of worker processes. With 1 worker, the objects are inferred in this
+        process.
+
+        @param seed (int or None)
+        Seed of the first object. Required with more than 1 worker.
+
+        @param kwargs
+        Passed to inferObjectWithRandomMovements.
+
+        @return (list)
+        The return value of inferObjectWithRandomMovements for each object.
+        """
+        if numWorkers == 1:
+            return [
+                self._inferSeededObject(objectDescription, seed, iObject, kwargs)
+                for iObject, objectDescription in enumerate(objects)
+            ]
+
+        if seed is None:
+            raise ValueError("Inference with several workers requires a seed")
+
+        global _inferenceTask
+        _inferenceTask = (self, objects)
+        try:
+            with multiprocessing.get_context("fork").Pool(numWorkers) as pool:
+                return pool.map(
+                    _inferObject,
+                    [(iObject, seed, kwargs) for iObject in range(len(objects))],
+                )
+        finally:
+            _inferenceTask = None
+
+    def _inferSeededObject(self, objectDescription, seed, iObject, kwargs):
+        if seed is not None:
+            random.seed(seed + iObject)
+            np.random.seed(seed + iObject)
+
+        return self.inferObjectWithRandomMovements(objectDescription, **kwargs)
+
     def _move(self, feature, randomLocation=False, useNoise=True):
         """
         Move the sensor to the center of the specified feature. If the sensor is
@@ -682,6 +780,15 @@ class PIUNExperiment(object):
         del self.monitors[monitorToken]
 
 
+def _inferObject(args):
+    """
+    Worker of PIUNExperiment.inferObjects.
+    """
+    iObject, seed, kwargs = args
+    exp, objects = _inferenceTask
+    return exp._inferSeededObject(objects[iObject], seed, iObject, kwargs)
+
+
 class PIUNExperimentMonitor(object, metaclass=abc.ABCMeta):
     """
     Abstract base class for a PIUNExperiment monitor.
@@ -26,13 +26,13 @@ PathIntegrationUnionNarrowing.js visualization.
 
 
 import io
-import json
 import os
 from collections import defaultdict
 
 import numpy as np
 from pkg_resources import resource_string
 
+from nupic.research.frameworks.columns.support.binary_trace import TextTraceWriter
 from nupic.research.frameworks.location.path_integration_union_narrowing import (
     PIUNExperimentMonitor,
 )
@@ -41,11 +41,15 @@ from nupic.research.frameworks.location.path_integration_union_narrowing import
 class PIUNLogger(PIUNExperimentMonitor):
     """
     Logs the state of the world and the state of each layer to a file.
+
+    The log is written to a text stream, or to a trace writer such as a
+    BinaryTraceWriter (see columns/support/binary_trace.py).
     """
 
     def __init__(self, out, exp, includeSynapses=True, learnedObjectsOverride=None):
         self.exp = exp
         self.out = out
+        self.writer = out if hasattr(out, "writeRecord") else TextTraceWriter(out)
         self.includeSynapses = includeSynapses
 
         self.locationRepresentations = exp.locationRepresentations
@@ -56,38 +60,31 @@ class PIUNLogger(PIUNExperimentMonitor):
 
         self.subscriberToken = exp.addMonitor(self)
 
-        print(
-            json.dumps(
-                {
-                    "numMinicolumns": exp.column.L4.numberOfColumns(),
-                    "cellsPerColumn": exp.column.L4.getCellsPerColumn(),
-                }
-            ),
-            file=self.out,
+        self.writer.writeRecord(
+            None,
+            {
+                "numMinicolumns": exp.column.L4.numberOfColumns(),
+                "cellsPerColumn": exp.column.L4.getCellsPerColumn(),
+            },
         )
 
-        print(
-            json.dumps(
-                [
-                    {
-                        "cellDimensions": [module.cellsPerAxis, module.cellsPerAxis],
-                        "moduleMapDimensions": [module.scale, module.scale],
-                        "orientation": module.orientation,
-                    }
-                    for module in self.locationModules
-                ]
-            ),
-            file=self.out,
+        self.writer.writeRecord(
+            None,
+            [
+                {
+                    "cellDimensions": [module.cellsPerAxis, module.cellsPerAxis],
+                    "moduleMapDimensions": [module.scale, module.scale],
+                    "orientation": module.orientation,
+                }
+                for module in self.locationModules
+            ],
         )
 
-        print("learnedObjects", file=self.out)
-        print(
-            json.dumps(
-                exp.learnedObjects
-                if learnedObjectsOverride is None
-                else learnedObjectsOverride
-            ),
-            file=self.out,
+        self.writer.writeRecord(
+            "learnedObjects",
+            exp.learnedObjects
+            if learnedObjectsOverride is None
+            else learnedObjectsOverride,
         )
 
     def __enter__(self, *args):
@@ -102,61 +99,48 @@ class PIUNLogger(PIUNExperimentMonitor):
         self.subscriberToken = None
 
     def beforeSense(self, featureSDR):
-        print("featureInput", file=self.out)
-        print(json.dumps(featureSDR.tolist()), file=self.out)
-        print(
-            json.dumps(
-                [
-                    k
-                    for k, sdr in self.exp.features.items()
-                    if np.intersect1d(featureSDR, sdr).size == sdr.size
-                ]
-            ),
-            file=self.out,
+        self.writer.writeRecord(
+            "featureInput",
+            featureSDR,
+            [
+                k
+                for k, sdr in self.exp.features.items()
+                if np.intersect1d(featureSDR, sdr).size == sdr.size
+            ],
         )
 
     def afterLocationInitialize(self):
-        print("initialSensation", file=self.out)
+        self.writer.writeRecord("initialSensation")
 
     def afterReset(self):
-        print("reset", file=self.out)
+        self.writer.writeRecord("reset")
 
     def beforeSensoryRepetition(self):
-        print("sensoryRepetition", file=self.out)
+        self.writer.writeRecord("sensoryRepetition")
 
     def beforeInferObject(self, obj):
-        print("currentObject", file=self.out)
-        print(json.dumps(obj), file=self.out)
+        self.writer.writeRecord("currentObject", obj)
 
     def afterLocationChanged(self, locationOnObject):
-        print("locationOnObject", file=self.out)
-        print(json.dumps(locationOnObject), file=self.out)
+        self.writer.writeRecord("locationOnObject", locationOnObject)
 
     def afterLocationShift(self, displacement, **kwargs):
-        print("shift", file=self.out)
-        print(
-            json.dumps({"top": displacement[0], "left": displacement[1]}), file=self.out
-        )
         phaseDisplacementByModule = [
-            module.phaseDisplacement.tolist() for module in self.locationModules
+            module.phaseDisplacement for module in self.locationModules
         ]
-        print(json.dumps(phaseDisplacementByModule), file=self.out)
 
-        cellsByModule = [
-            module.getActiveCells().tolist() for module in self.locationModules
-        ]
-        print(json.dumps(cellsByModule), file=self.out)
+        cellsByModule = [module.getActiveCells() for module in self.locationModules]
 
         cellPointsByModule = []
         for module in self.locationModules:
             if hasattr(module, "activePhases"):
-                cellPoints = (
-                    module.activePhases * [module.cellsPerAxis, module.cellsPerAxis]
-                ).tolist()
+                cellPoints = module.activePhases * [
+                    module.cellsPerAxis,
+                    module.cellsPerAxis,
+                ]
             else:
                 cellPoints = []
             cellPointsByModule.append(cellPoints)
-        print(json.dumps(cellPointsByModule), file=self.out)
 
         activeLocationCells = self.exp.column.getLocationRepresentation()
 
@@ -170,11 +154,16 @@ class PIUNLogger(PIUNExperimentMonitor):
             )
             decodings.append([objectName, iFeature, amountContained])
 
-        print(json.dumps(decodings), file=self.out)
+        self.writer.writeRecord(
+            "shift",
+            {"top": displacement[0], "left": displacement[1]},
+            phaseDisplacementByModule,
+            cellsByModule,
+            cellPointsByModule,
+            decodings,
+        )
 
     def afterLocationAnchor(self, anchorInput, **kwargs):
-        print("locationLayer", file=self.out)
-
         cellsByModule = []
         for module in self.locationModules:
             activeCells = module.getActiveCells()
@@ -197,7 +186,7 @@ class PIUNLogger(PIUNExperimentMonitor):
 
                     activeSynapses = np.intersect1d(connectedSynapses, anchorInput)
                     segmentsForActiveCellsDict[cellForActiveSegments[i]].append(
-                        activeSynapses.tolist()
+                        activeSynapses
                     )
 
                 segmentsForActiveCells = [
@@ -205,23 +194,21 @@ class PIUNLogger(PIUNExperimentMonitor):
                 ]
 
                 cellsByModule.append(
-                    [activeCells.tolist(), {"inputLayer": segmentsForActiveCells}]
+                    [activeCells, {"inputLayer": segmentsForActiveCells}]
                 )
             else:
-                cellsByModule.append([activeCells.tolist()])
-
-        print(json.dumps(cellsByModule), file=self.out)
+                cellsByModule.append([activeCells])
 
         cellPointsByModule = []
         for module in self.locationModules:
             if hasattr(module, "activePhases"):
-                cellPoints = (
-                    module.activePhases * [module.cellsPerAxis, module.cellsPerAxis]
-                ).tolist()
+                cellPoints = module.activePhases * [
+                    module.cellsPerAxis,
+                    module.cellsPerAxis,
+                ]
             else:
                 cellPoints = []
             cellPointsByModule.append(cellPoints)
-        print(json.dumps(cellPointsByModule), file=self.out)
 
         activeLocationCells = self.exp.column.getLocationRepresentation()
 
@@ -234,7 +221,10 @@ class PIUNLogger(PIUNExperimentMonitor):
                 ]
             )
             decodings.append([objectName, iFeature, amountContained])
-        print(json.dumps(decodings), file=self.out)
+
+        self.writer.writeRecord(
+            "locationLayer", cellsByModule, cellPointsByModule, decodings
+        )
 
     def getInputSegments(self, cells, basalInput, apicalInput):
         basalSegmentsForCellDict = defaultdict(list)
@@ -253,9 +243,7 @@ class PIUNLogger(PIUNExperimentMonitor):
             )[0]
 
             activeSynapses = np.intersect1d(connectedSynapses, basalInput)
-            basalSegmentsForCellDict[cellForBasalSegment[i]].append(
-                activeSynapses.tolist()
-            )
+            basalSegmentsForCellDict[cellForBasalSegment[i]].append(activeSynapses)
 
         apicalSegmentsForCellDict = defaultdict(list)
 
@@ -273,9 +261,7 @@ class PIUNLogger(PIUNExperimentMonitor):
             )[0]
 
             activeSynapses = np.intersect1d(connectedSynapses, apicalInput)
-            apicalSegmentsForCellDict[cellForApicalSegment[i]].append(
-                activeSynapses.tolist()
-            )
+            apicalSegmentsForCellDict[cellForApicalSegment[i]].append(activeSynapses)
 
         return {"locationLayer": [basalSegmentsForCellDict[cell] for cell in cells]}
 
@@ -292,30 +278,32 @@ class PIUNLogger(PIUNExperimentMonitor):
         return decodings
 
     def afterInputCompute(self, activeColumns, basalInput, **kwargs):
-        activeCells = self.inputLayer.getActiveCells().tolist()
-        predictedCells = self.inputLayer.getPredictedCells().tolist()
+        activeCells = self.inputLayer.getActiveCells()
+        predictedCells = self.inputLayer.getPredictedCells()
 
-        print("predictedFeatureLocationPair", file=self.out)
         if self.includeSynapses:
             segmentsForPredictedCells = self.getInputSegments(
                 predictedCells, basalInput, []
             )
-            print(
-                json.dumps([predictedCells, segmentsForPredictedCells]), file=self.out
-            )
+            predictedCellsState = [predictedCells, segmentsForPredictedCells]
         else:
-            print(json.dumps([predictedCells]), file=self.out)
-        print(json.dumps(self.getInputDecodings(activeCells)), file=self.out)
+            predictedCellsState = [predictedCells]
+        self.writer.writeRecord(
+            "predictedFeatureLocationPair",
+            predictedCellsState,
+            self.getInputDecodings(activeCells),
+        )
 
-        print("featureLocationPair", file=self.out)
         if self.includeSynapses:
             segmentsForActiveCells = self.getInputSegments(activeCells, basalInput, [])
-
-            print(json.dumps([activeCells, segmentsForActiveCells]), file=self.out)
-
+            activeCellsState = [activeCells, segmentsForActiveCells]
         else:
-            print(json.dumps([activeCells]), file=self.out)
-        print(json.dumps(self.getInputDecodings(activeCells)), file=self.out)
+            activeCellsState = [activeCells]
+        self.writer.writeRecord(
+            "featureLocationPair",
+            activeCellsState,
+            self.getInputDecodings(activeCells),
+        )
 
 
 class PIUNVisualizer(PIUNLogger):
@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""Tests for the sample minimum tables of the ambiguity_index module."""
+
+import importlib
+import inspect
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from nupic.research.frameworks.location import ambiguity_index
+from nupic.research.frameworks.location.ambiguity_index import (
+    BinomialDistribution,
+    SampleMinimumDistribution,
+    getExpectedValue,
+    sampleMinimumSurvivalTable,
+)
+
+
+class SampleMinimumSurvivalTableTest(unittest.TestCase):
+    """Tests for sampleMinimumSurvivalTable."""
+
+    def testMatchesSampleMinimumDistribution(self):
+        """The log space table matches SampleMinimumDistribution for small n"""
+        nMax = 30
+        for p, numSamples in ((0.1, 1), (0.3, 5), (0.02, 20)):
+            table = sampleMinimumSurvivalTable(nMax, p, numSamples, cacheDir=None)
+            self.assertEqual(table.shape[0], nMax + 1)
+
+            for n in range(nMax + 1):
+                distribution = SampleMinimumDistribution(
+                    numSamples, BinomialDistribution(n, p))
+                k = np.arange(n + 1)
+                expected = 1.0 - distribution.cdf(k).astype("float64")
+
+                # columns left out of the table are below the smallest float64
+                numColumns = min(table.shape[1], n + 1)
+                np.testing.assert_allclose(table[n, :numColumns],
+                                           expected[:numColumns],
+                                           rtol=1e-9, atol=1e-12)
+                np.testing.assert_allclose(expected[numColumns:], 0.0,
+                                           atol=1e-12)
+
+                self.assertAlmostEqual(table[n].sum(),
+                                       float(getExpectedValue(distribution)))
+
+    def testCache(self):
+        """Tables are written to cacheDir and read back for smaller nMax"""
+        p, numSamples = 0.1, 5
+        with tempfile.TemporaryDirectory() as cacheDir:
+            table = sampleMinimumSurvivalTable(100, p, numSamples, cacheDir)
+            self.assertEqual(len(os.listdir(cacheDir)), 1)
+
+            # cache hit: nothing is computed
+            with patch.object(ambiguity_index, "binomialSurvivalTable",
+                              side_effect=AssertionError("computed")):
+                for nMax in (100, 40):
+                    cached = sampleMinimumSurvivalTable(nMax, p, numSamples,
+                                                        cacheDir)
+                    np.testing.assert_array_equal(cached, table[:nMax + 1])
+
+            # a larger table is computed and replaces the cached one
+            larger = sampleMinimumSurvivalTable(150, p, numSamples, cacheDir)
+            self.assertEqual(larger.shape[0], 151)
+            self.assertEqual(os.listdir(cacheDir),
+                             ["sample_minimum_survival_p0.1_5.npy"])
+            np.testing.assert_allclose(larger[:101, :table.shape[1]], table,
+                                       rtol=1e-12, atol=0)
+
+            # other parameters have their own table
+            sampleMinimumSurvivalTable(100, p, numSamples + 1, cacheDir)
+            self.assertEqual(len(os.listdir(cacheDir)), 2)
+
+    def testCacheIsOptIn(self):
+        """The cache is only on when AMBIGUITY_INDEX_CACHE_DIR is set"""
+        self.addCleanup(importlib.reload, ambiguity_index)
+
+        for env, expected in (({}, None),
+                              ({"AMBIGUITY_INDEX_CACHE_DIR": "/tmp/tables"},
+                               "/tmp/tables")):
+            environ = {k: v for k, v in os.environ.items()
+                       if k != "AMBIGUITY_INDEX_CACHE_DIR"}
+            environ.update(env)
+            with patch.dict(os.environ, environ, clear=True):
+                module = importlib.reload(ambiguity_index)
+            self.assertEqual(module.CACHE_DIR, expected)
+            for function in (module.sampleMinimumSurvivalTable,
+                             module.generateExpectedList,
+                             module.generateLowerBoundList):
+                parameter = inspect.signature(function).parameters["cacheDir"]
+                self.assertEqual(parameter.default, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+# ----------------------------------------------------------------------
+
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from nupic.research.frameworks.columns.support.binary_trace import (
+    BinaryTraceReader,
+    BinaryTraceWriter,
+    TextTraceWriter,
+)
+from nupic.research.frameworks.columns.support.monitor_mixin.monitor_mixin_base import (  # noqa: E501
+    MonitorMixinBase,
+)
+from nupic.research.frameworks.columns.support.monitor_mixin.trace import (
+    CountsTrace,
+    IndicesTrace,
+)
+
+
+def makeRecords(numRecords):
+    rng = np.random.default_rng(42)
+    records = [(None, {"numMinicolumns": 150, "cellsPerColumn": 16})]
+    for i in range(numRecords):
+        cells = np.sort(rng.choice(2400, 40, replace=False)).astype("uint32")
+        records.append(("shift",
+                        [{"top": 1.5, "left": -2.0}, None, True, "Object 1"],
+                        [cells, cells[:3] + 70000, np.array([], dtype="int64")],
+                        [rng.random((3, 2)), np.array([5, -3, 200])],
+                        [[cells[:5], {"inputLayer": [cells[5:9]]}]],
+                        [["Object 1", i, 0.25]]))
+        records.append(("reset",))
+    return records
+
+
+class CellsMonitor(MonitorMixinBase):
+    """Records the active cells and the number of segments of each compute."""
+
+    def compute(self, activeCells, numSegments):
+        self._mmTraces["activeCells"].data.append(set(activeCells))
+        self._mmTraces["numSegments"].data.append(numSegments)
+        self._mmIterationDone()
+
+    def mmClearHistory(self):
+        super(CellsMonitor, self).mmClearHistory()
+
+        self._mmTraces["activeCells"] = IndicesTrace(self, "active cells")
+        self._mmTraces["numSegments"] = CountsTrace(self, "# segments")
+
+
+class BinaryTraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempDir.name, "inference.trace")
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def writeRecords(self, records, **kwargs):
+        with BinaryTraceWriter(self.path, **kwargs) as writer:
+            for name, *values in records:
+                writer.writeRecord(name, *values)
+
+    def assertSameRecord(self, record, expected):
+        name, values = record
+        self.assertEqual(name, expected[0])
+        self.assertEqual(len(values), len(expected) - 1)
+        for value, expectedValue in zip(values, expected[1:]):
+            self.assertSameValue(value, expectedValue)
+
+    def assertSameValue(self, value, expected):
+        if isinstance(expected, np.ndarray):
+            self.assertIsInstance(value, np.ndarray)
+            self.assertEqual(value.dtype, expected.dtype)
+            np.testing.assert_array_equal(value, expected)
+        elif isinstance(expected, (list, tuple)):
+            self.assertEqual(len(value), len(expected))
+            for v, e in zip(value, expected):
+                self.assertSameValue(v, e)
+        elif isinstance(expected, dict):
+            self.assertEqual(sorted(value), sorted(expected))
+            for k in expected:
+                self.assertSameValue(value[k], expected[k])
+        else:
+            self.assertEqual(value, expected)
+
+    def testRoundTrip(self):
+        records = makeRecords(25)
+        for compressionLevel in (0, 6):
+            self.writeRecords(records, recordsPerChunk=7,
+                              compressionLevel=compressionLevel)
+            reader = BinaryTraceReader(self.path)
+
+            self.assertEqual(len(reader), len(records))
+            self.assertEqual(len(reader.chunks), 8)
+            for record, expected in zip(reader, records):
+                self.assertSameRecord(record, expected)
+
+            # Random access
+            self.assertSameRecord(reader[30], records[30])
+            self.assertSameRecord(reader[-1], records[-1])
+            self.assertSameRecord(reader[3], records[3])
+            with self.assertRaises(IndexError):
+                reader[len(records)]
+
+    def testSDRsAreCompact(self):
+        rng = np.random.default_rng(42)
+        records = [("locationLayer",
+                    [[np.sort(rng.choice(2400, 40, replace=False)),
+                      {"inputLayer": [[np.sort(rng.choice(2400, 10,
+                                                          replace=False))]
+                                      for _ in range(40)]}]])
+                   for _ in range(100)]
+        self.writeRecords(records)
+
+        out = io.StringIO()
+        writer = TextTraceWriter(out)
+        for name, *values in records:
+            writer.writeRecord(name, *values)
+
+        self.assertLess(os.path.getsize(self.path), len(out.getvalue()) / 3)
+
+    def testWriteText(self):
+        records = makeRecords(10)
+        self.writeRecords(records, recordsPerChunk=3)
+
+        expected = io.StringIO()
+        writer = TextTraceWriter(expected)
+        for name, *values in records:
+            writer.writeRecord(name, *values)
+
+        out = io.StringIO()
+        BinaryTraceReader(self.path).writeText(out)
+        self.assertEqual(out.getvalue(), expected.getvalue())
+        self.assertTrue(out.getvalue().startswith(
+            '{"numMinicolumns": 150, "cellsPerColumn": 16}\nshift\n'))
+
+    def testPartialChunk(self):
+        records = makeRecords(10)
+        self.writeRecords(records, recordsPerChunk=4)
+        with open(self.path, "ab") as f:
+            f.write(b"\x04\x00\x00\x00\x40\x00\x00\x00\x00\x00\x00\x00partial")
+
+        reader = BinaryTraceReader(self.path)
+        self.assertEqual(len(reader), len(records))
+
+    def testMonitorTraces(self):
+        activeCells = IndicesTrace(self, "active cells")
+        activeCells.data = [{3, 1, 2}, set(), {7}]
+        numSegments = CountsTrace(self, "# segments")
+        numSegments.data = [1, 2, 3]
+
+        self.mmName = None
+        with BinaryTraceWriter(self.path) as writer:
+            MonitorMixinBase.mmWriteTraces(writer, [activeCells, numSegments])
+
+        reader = BinaryTraceReader(self.path)
+        self.assertSameRecord(reader[0], ("active cells", np.array([1, 2, 3]),
+                                          np.array([], dtype=np.int64),
+                                          np.array([7])))
+        self.assertSameRecord(reader[1], ("# segments", 1, 2, 3))
+
+    def testStreamedMonitorTraces(self):
+        monitor = CellsMonitor()
+        inputs = [({3, 1, 2}, 1), (set(), 2), ({7}, 3), ({4, 5}, 4), ({6}, 5)]
+
+        with BinaryTraceWriter(self.path) as writer:
+            monitor.mmStreamTraces(writer, iterationsPerChunk=2)
+            for activeCells, numSegments in inputs:
+                monitor.compute(activeCells, numSegments)
+                self.assertLess(len(monitor._mmTraces["numSegments"].data), 2)
+            self.assertEqual(monitor._mmTraces["numSegments"].data, [5])
+            monitor.mmFlushTraces()
+
+        reader = BinaryTraceReader(self.path)
+        self.assertEqual([name for name, _ in reader],
+                         ["active cells", "# segments"] * 3)
+
+        values = {"active cells": [], "# segments": []}
+        for name, chunkValues in reader:
+            values[name].extend(chunkValues)
+        self.assertEqual([value.tolist() for value in values["active cells"]],
+                         [sorted(activeCells) for activeCells, _ in inputs])
+        self.assertEqual(values["# segments"], [n for _, n in inputs])
+
+    def testClearHistoryFlushesStreamedTraces(self):
+        monitor = CellsMonitor()
+        out = io.StringIO()
+        monitor.mmStreamTraces(TextTraceWriter(out), iterationsPerChunk=10)
+        monitor.compute({1}, 1)
+        monitor.mmClearHistory()
+
+        self.assertEqual(out.getvalue(), "active cells\n[1]\n# segments\n1\n")
+        self.assertEqual(monitor._mmTraces["numSegments"].data, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+# ----------------------------------------------------------------------
+
+import copy
+import pickle
+import unittest
+
+import numpy as np
+
+from nupic.research.frameworks.columns import ColumnPooler, ColumnPoolerStack
+
+
+def createPoolers(numColumns, **kwargs):
+    return [ColumnPooler(inputWidth=2048 * 4,
+                         lateralInputWidths=[2048] * (numColumns - 1),
+                         cellCount=2048,
+                         seed=col,
+                         sparseMatrixBackend="scipy",
+                         **kwargs)
+            for col in range(numColumns)]
+
+
+def computeOneByOne(poolers, feedforwardInputs, learn):
+    prevActiveCells = [pooler.getActiveCells() for pooler in poolers]
+    for col, pooler in enumerate(poolers):
+        pooler.compute(feedforwardInputs[col],
+                       lateralInputs=[cells
+                                      for i, cells in enumerate(prevActiveCells)
+                                      if i != col],
+                       learn=learn)
+
+
+class ColumnPoolerStackTest(unittest.TestCase):
+    """
+    Compares a ColumnPoolerStack with the same ColumnPoolers run one by one.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        numColumns = 3
+        self.objects = [[[np.sort(rng.choice(2048 * 4, 40, replace=False))
+                          for _ in range(numColumns)]
+                         for _ in range(4)]
+                        for _ in range(4)]
+
+        self.poolers = createPoolers(numColumns)
+        self.stackedPoolers = copy.deepcopy(self.poolers)
+        self.stack = ColumnPoolerStack(self.stackedPoolers)
+
+    def assertSameActiveCells(self):
+        for pooler, stackedPooler in zip(self.poolers, self.stackedPoolers):
+            np.testing.assert_array_equal(pooler.getActiveCells(),
+                                          stackedPooler.getActiveCells())
+
+    def reset(self):
+        for pooler in self.poolers + self.stackedPoolers:
+            pooler.reset()
+
+    def learnObjects(self, objects):
+        for sensations in objects:
+            for _ in range(2):
+                for sensation in sensations:
+                    computeOneByOne(self.poolers, sensation, learn=True)
+                    self.stack.compute(sensation, learn=True)
+                    self.assertSameActiveCells()
+            self.reset()
+
+    def inferObjects(self, objects):
+        for sensations in objects:
+            for sensation in sensations:
+                # Drop half of the input of the first column, so that lateral
+                # support decides which cells become active
+                sensation = [sensation[0][::2]] + sensation[1:]
+                computeOneByOne(self.poolers, sensation, learn=False)
+                self.stack.compute(sensation, learn=False)
+                self.assertSameActiveCells()
+            self.reset()
+
+    def testLearnAndInfer(self):
+        self.learnObjects(self.objects)
+        self.inferObjects(self.objects)
+
+        # Every object is recognized by every column
+        for pooler in self.stackedPoolers:
+            self.assertEqual(len(pooler.getActiveCells()), 0)
+        self.stack.compute(self.objects[0][0], learn=False)
+        for pooler in self.stackedPoolers:
+            self.assertEqual(len(pooler.getActiveCells()), 40)
+
+    def testRebuildAfterLearning(self):
+        self.learnObjects(self.objects[:2])
+        self.inferObjects(self.objects[:2])
+
+        # The stacked matrices include the synapses learned after they were built
+        self.learnObjects(self.objects[2:])
+        self.inferObjects(self.objects)
+
+    def testPickle(self):
+        self.learnObjects(self.objects)
+        self.inferObjects(self.objects[:1])
+
+        # The stacked matrices are not pickled, and are rebuilt for inference
+        stack = pickle.loads(pickle.dumps(self.stack))
+        self.assertIsNone(stack._proximal)
+        self.stackedPoolers = stack.poolers
+        self.stack = stack
+        self.inferObjects(self.objects)
+
+    def testInvalidPoolers(self):
+        with self.assertRaises(ValueError):
+            ColumnPoolerStack(createPoolers(3)[:2])
+
+        poolers = [ColumnPooler(inputWidth=2048 * 4, lateralInputWidths=[1024],
+                                cellCount=2048, sparseMatrixBackend="scipy")
+                   for _ in range(2)]
+        with self.assertRaises(ValueError):
+            ColumnPoolerStack(poolers)
+
+
+if __name__ == "__main__":
+    unittest.main()
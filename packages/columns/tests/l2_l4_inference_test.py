@@ -21,13 +21,18 @@
 
 """Tests for l2_l4_inference module."""
 
+import os
 import random
+import tempfile
 import unittest
 from unittest.mock import patch
 
 import numpy
 
-from nupic.research.frameworks.columns import l2_l4_inference
+from nupic.research.frameworks.columns import (
+    l2_l4_inference,
+    multi_column_convergence_experiment,
+)
 from nupic.research.frameworks.columns.object_machine_factory import createObjectMachine
 
 
@@ -115,6 +120,73 @@ class L4L2ExperimentTest(unittest.TestCase):
         self.assertEqual(len(exp.getL4Representations()[0]), 20)
         self.assertEqual(len(exp.getL4Representations()[1]), 20)
 
+    def testSnapshotRestore(self):
+        """Inference from a snapshot is the same as after learning."""
+        exp = l2_l4_inference.L4L2Experiment(
+            name="snapshot",
+            numCorticalColumns=2,
+            numInputBits=20,
+            numExternalInputBits=20,
+            L4Impl="py",
+        )
+
+        objects = createObjectMachine(
+            machineType="simple",
+            numInputBits=20,
+            sensorInputSize=1024,
+            externalInputSize=1024,
+            numCorticalColumns=2,
+            seed=42,
+        )
+        objects.addObject([(1, 2), (2, 3)], name=0)
+        objects.addObject([(1, 2), (4, 5)], name=1)
+        exp.learnObjects(objects.provideObjectsToLearn())
+
+        snapshot = exp.snapshot()
+
+        # Noisy inference also checks that the random state is restored
+        inferConfig = {
+            "numSteps": 2,
+            "noiseLevel": 0.05,
+            "pairs": {0: [(1, 2), (2, 3)], 1: [(2, 3), (1, 2)]},
+        }
+
+        def infer(experiment):
+            experiment.infer(objects.provideObjectToInfer(inferConfig),
+                             objectName=0, reset=False)
+            return (experiment.getInferenceStats(),
+                    experiment.getL2Representations(),
+                    experiment.getL4Representations())
+
+        expected = infer(exp)
+
+        exp.restore(snapshot)
+        self.assertEqual(exp.getInferenceStats(), [])
+        self.assertEqual(infer(exp), expected)
+
+        self.assertEqual(
+            infer(l2_l4_inference.L4L2Experiment.fromSnapshot(snapshot)),
+            expected)
+
+        with tempfile.TemporaryDirectory() as tempDir:
+            filename = os.path.join(tempDir, "exp.snapshot")
+            l2_l4_inference.L4L2Experiment.fromSnapshot(snapshot).save(filename)
+            self.assertEqual(
+                infer(l2_l4_inference.L4L2Experiment.load(filename)), expected)
+
+    def testSnapshotCppL4(self):
+        """Snapshots of the nupic.bindings L4 are rejected."""
+        exp = l2_l4_inference.L4L2Experiment(name="snapshot", L4Impl="cpp")
+        with self.assertRaises(ValueError):
+            exp.snapshot()
+
+    def testLearnOnceRequiresPythonL4(self):
+        """Learn-once sweeps don't replace the nupic.bindings L4."""
+        with self.assertRaises(ValueError):
+            multi_column_convergence_experiment.runExperimentPool(
+                numObjects=[2], numLocations=[2], numFeatures=[2],
+                numColumns=[1], learnOnce=True)
+
     def testDelayedLateralandApicalInputs(self):
         """Test whether lateral and apical inputs are synchronized across columns"""
         # Set up experiment
@@ -0,0 +1,285 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""Tests for ThresholdedGaussian2DLocationModule and its module bank."""
+
+import unittest
+
+import numpy as np
+import pytest
+
+pytest.importorskip("nupic.bindings.math")
+
+from nupic.research.frameworks.location.location_modules import (  # noqa: E402
+    ThresholdedGaussian2DLocationModule,
+    ThresholdedGaussian2DLocationModuleBank,
+)
+
+
+def createModule(excitationMethod, bumpOverlapMethod="probabilistic",
+                 cellsPerAxis=10, scale=40.0, orientation=0.3):
+    return ThresholdedGaussian2DLocationModule(
+        cellsPerAxis=cellsPerAxis,
+        scale=scale,
+        orientation=orientation,
+        anchorInputSize=100,
+        activeFiringRate=0.5,
+        initialPermanence=0.6,
+        bumpSigma=0.18172,
+        bumpOverlapMethod=bumpOverlapMethod,
+        excitationMethod=excitationMethod,
+    )
+
+
+def randomBumps(rng, module, numBumps, noise):
+    """
+    Bumps on random cells shifted by a common displacement, as after sensory
+    input and movement, plus optional per-bump movement noise.
+    """
+    bumps = module.cellPhases[:, rng.choice(module.numberOfCells(), numBumps,
+                                            replace=False)]
+    bumps = bumps + rng.uniform(size=(2, 1))
+    if noise:
+        bumps = bumps + rng.normal(0, 0.01, size=bumps.shape)
+    return np.round(np.mod(bumps, 1.0), decimals=9)
+
+
+class LatticeExcitationTest(unittest.TestCase):
+    """Tests of the "lattice" excitation method against "exact"."""
+
+    def testCellExcitations(self):
+        """The lattice excitations match the exact ones up to rounding"""
+        rng = np.random.RandomState(42)
+        for bumpOverlapMethod in ("probabilistic", "sum"):
+            for cellsPerAxis in (5, 10, 17):
+                module = createModule("exact", bumpOverlapMethod, cellsPerAxis)
+                for numBumps in (1, 3, 8):
+                    for noise in (False, True):
+                        bumps = randomBumps(rng, module, numBumps, noise)
+                        exact = ThresholdedGaussian2DLocationModule.getCellExcitations(
+                            module.cellPhases, bumps, module.bumpSigma,
+                            bumpOverlapMethod)
+                        lattice = (
+                            ThresholdedGaussian2DLocationModule
+                            .getCellExcitationsLattice(
+                                cellsPerAxis, bumps, module.bumpSigma,
+                                bumpOverlapMethod))
+                        np.testing.assert_allclose(lattice, exact, rtol=0,
+                                                   atol=1e-9)
+
+    def testOffsetSubdivisions(self):
+        """
+        With offset subdivisions, the excitations are the exact ones of the bumps
+        moved to the grid of subdivisions
+        """
+        rng = np.random.RandomState(42)
+        for bumpOverlapMethod in ("probabilistic", "sum"):
+            for cellsPerAxis in (5, 10):
+                module = createModule("exact", bumpOverlapMethod, cellsPerAxis)
+                for subdivisions in (1, 4):
+                    bumps = randomBumps(rng, module, 8, noise=True)
+                    positions = (bumps - 0.5 / cellsPerAxis) * cellsPerAxis
+                    movedBumps = (np.round(positions * subdivisions) / subdivisions
+                                  / cellsPerAxis + 0.5 / cellsPerAxis)
+                    exact = ThresholdedGaussian2DLocationModule.getCellExcitations(
+                        module.cellPhases, movedBumps, module.bumpSigma,
+                        bumpOverlapMethod)
+                    lattice = (
+                        ThresholdedGaussian2DLocationModule
+                        .getCellExcitationsLattice(
+                            cellsPerAxis, bumps, module.bumpSigma,
+                            bumpOverlapMethod, offsetSubdivisions=subdivisions))
+                    np.testing.assert_allclose(lattice, exact, rtol=0, atol=1e-9)
+
+    def testCutoffRadius(self):
+        """
+        With a cutoff radius, each bump's excitation is off by at most the gaussian
+        at the cutoff
+        """
+        rng = np.random.RandomState(42)
+        cellsPerAxis = 40
+        module = createModule("exact", "sum", cellsPerAxis)
+        bumpSigma = 0.18172 * 6 / cellsPerAxis
+        for cutoffRadius in (3.0, 5.0):
+            bumps = randomBumps(rng, module, 30, noise=True)
+            exact = ThresholdedGaussian2DLocationModule.getCellExcitationsFromBumps(
+                module.cellPhases, bumps, bumpSigma)
+            lattice = ThresholdedGaussian2DLocationModule.getCellExcitationsLattice(
+                cellsPerAxis, bumps, bumpSigma, "sum", cutoffRadius=cutoffRadius)
+
+            perBumpError = ThresholdedGaussian2DLocationModule.gaussian(
+                1.0, cutoffRadius)
+            self.assertGreater(np.abs(lattice - exact.sum(axis=1)).max(), 0.0)
+            np.testing.assert_array_less(
+                np.abs(lattice - exact.sum(axis=1)),
+                (exact <= perBumpError).sum(axis=1) * perBumpError + 1e-12)
+
+    def testActiveAndLearningCells(self):
+        """
+        The lattice method activates the same cells, and chooses the cells whose
+        exact excitation is tied with the highest one for learning
+        """
+        rng = np.random.RandomState(42)
+        tolerance = ThresholdedGaussian2DLocationModule.LATTICE_TIE_TOLERANCE
+        for bumpOverlapMethod in ("probabilistic", "sum"):
+            exactModule = createModule("exact", bumpOverlapMethod)
+            latticeModule = createModule("lattice", bumpOverlapMethod)
+            for _ in range(50):
+                bumps = randomBumps(rng, exactModule, rng.randint(1, 6),
+                                    noise=False)
+                for module in (exactModule, latticeModule):
+                    module.bumpPhases = bumps.copy()
+                    module._computeActiveCells()
+
+                exact = ThresholdedGaussian2DLocationModule.getCellExcitations(
+                    exactModule.cellPhases, bumps, exactModule.bumpSigma,
+                    bumpOverlapMethod)
+                np.testing.assert_array_equal(latticeModule.getActiveCells(),
+                                              exactModule.getActiveCells())
+                np.testing.assert_array_equal(
+                    latticeModule.getLearnableCells(),
+                    np.where(exact >= exact.max() - tolerance)[0])
+
+    def testTiedLearningCells(self):
+        """A bump halfway between two cells makes both of them learning cells"""
+        module = createModule("lattice")
+        n = module.cellsPerAxis
+        cell = 3 * n + 4
+        module.bumpPhases = (module.cellPhases[:, [cell]]
+                             + np.array([[0.5 / n], [0.0]]))
+        module._computeActiveCells()
+        np.testing.assert_array_equal(module.getLearnableCells(),
+                                      [cell, cell + n])
+
+
+class ModuleList(object):
+    """Runs a list of modules separately, with the interface of a module bank."""
+
+    def __init__(self, modules):
+        self.modules = modules
+
+    def reset(self):
+        for module in self.modules:
+            module.reset()
+
+    def activateRandomLocation(self):
+        for module in self.modules:
+            module.activateRandomLocation()
+
+    def movementCompute(self, displacement, noiseFactor=0):
+        for module in self.modules:
+            module.movementCompute(displacement, noiseFactor)
+
+    def sensoryCompute(self, anchorInput, anchorGrowthCandidates, learn):
+        for module in self.modules:
+            module.sensoryCompute(anchorInput, anchorGrowthCandidates, learn)
+
+
+class ThresholdedGaussian2DLocationModuleBankTest(unittest.TestCase):
+    """
+    The bank gives the same results as updating each module separately.
+    """
+
+    def createModules(self):
+        return [
+            createModule("exact", "probabilistic", 10, 40.0, 0.3),
+            createModule("exact", "probabilistic", 10, 57.0, 1.1),
+            createModule("exact", "sum", 8, 33.0, 0.7),
+            createModule("exact", "probabilistic", 12, 80.0, 0.2),
+            createModule("lattice", "probabilistic", 10, 46.0, 0.5),
+            createModule("lattice", "sum", 8, 61.0, 0.9),
+        ]
+
+    def runSequence(self, locationModules, modules):
+        """
+        Learn a few locations, then infer them with noisy movements. Returns the
+        bump phases, active cells and learning cells of each module after each
+        step.
+        """
+        rng = np.random.RandomState(0)
+        np.random.seed(42)
+        anchorInputs = [np.sort(rng.choice(100, 20, replace=False))
+                        for _ in range(5)]
+        # an input learned at two locations is inferred as two bumps
+        anchorInputs[3] = anchorInputs[0]
+        displacements = rng.uniform(-10, 10, size=(5, 2))
+
+        states = []
+
+        def record():
+            states.append([(module.bumpPhases.copy(),
+                            module.getActiveCells().copy(),
+                            module.getLearnableCells().copy())
+                           for module in modules])
+
+        locationModules.activateRandomLocation()
+        record()
+        for anchorInput, displacement in zip(anchorInputs, displacements):
+            locationModules.movementCompute(displacement)
+            record()
+            locationModules.sensoryCompute(anchorInput, anchorInput, learn=True)
+            record()
+
+        locationModules.reset()
+        locationModules.sensoryCompute(anchorInputs[0], anchorInputs[0],
+                                       learn=False)
+        record()
+        for anchorInput, displacement in zip(anchorInputs[1:], displacements[1:]):
+            locationModules.movementCompute(displacement, noiseFactor=0.05)
+            record()
+            locationModules.sensoryCompute(anchorInput, anchorInput, learn=False)
+            record()
+
+        return states
+
+    def testSameAsSeparateModules(self):
+        """Bump phases, active cells and learning cells are identical"""
+        modules = self.createModules()
+        expected = self.runSequence(ModuleList(modules), modules)
+
+        modules = self.createModules()
+        states = self.runSequence(ThresholdedGaussian2DLocationModuleBank(modules),
+                                  modules)
+
+        self.assertEqual(len(states), len(expected))
+        for step, (state, expectedState) in enumerate(zip(states, expected)):
+            for iModule, (values, expectedValues) in enumerate(
+                zip(state, expectedState)
+            ):
+                for name, value, expectedValue in zip(
+                    ("bumpPhases", "activeCells", "learningCells"),
+                    values, expectedValues
+                ):
+                    np.testing.assert_array_equal(
+                        value, expectedValue,
+                        err_msg=f"{name} of module {iModule} at step {step}")
+
+        # the learned locations are inferred, with several bumps in modules where
+        # the input learned at two locations is on two cells
+        bumpCounts = [bumpPhases.shape[1] for bumpPhases, _, _ in states[11]]
+        self.assertEqual(max(bumpCounts), 2)
+        self.assertTrue(all(len(module.getActiveCells()) > 0
+                            for module in modules))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""Tests for the parallel object inference of PIUNExperiment."""
+
+import random
+import unittest
+
+import numpy as np
+import pytest
+
+pytest.importorskip("nupic.bindings.math")
+
+from nupic.research.frameworks.location.path_integration_union_narrowing import (  # noqa: E402, E501
+    PIUNCorticalColumn,
+    PIUNExperiment,
+)
+
+
+def createExperiment(numObjects=6, numFeatures=5, featuresPerObject=4):
+    """
+    Small PIUN experiment with noisy movements, that has learned a few objects
+    """
+    random.seed(42)
+    np.random.seed(42)
+
+    numModules = 4
+    locationConfigs = [{
+        "cellsPerAxis": 6,
+        "scale": 40.0,
+        "orientation": np.radians(15.0 * i + 7.5),
+        "activationThreshold": 8,
+        "initialPermanence": 1.0,
+        "connectedPermanence": 0.5,
+        "learningThreshold": 8,
+        "sampleSize": 10,
+        "permanenceIncrement": 0.1,
+        "permanenceDecrement": 0.0,
+        "bumpOverlapMethod": "probabilistic",
+        "baselineCellsPerAxis": 6,
+    } for i in range(numModules)]
+    l4Overrides = {
+        "initialPermanence": 1.0,
+        "activationThreshold": numModules,
+        "reducedBasalThreshold": numModules,
+        "minThreshold": numModules,
+        "sampleSize": numModules,
+        "cellsPerColumn": 16,
+    }
+    column = PIUNCorticalColumn(locationConfigs, L4Overrides=l4Overrides)
+
+    featureNames = [str(i) for i in range(numFeatures)]
+    exp = PIUNExperiment(column, featureNames=featureNames,
+                         numActiveMinicolumns=10, noiseFactor=0.5,
+                         moduleNoiseFactor=0.5)
+
+    objects = []
+    for iObject in range(numObjects):
+        positions = random.sample(range(16), featuresPerObject)
+        objects.append({
+            "name": "Object {}".format(iObject),
+            "features": [{"top": 10 * (position // 4),
+                          "left": 10 * (position % 4),
+                          "width": 10, "height": 10,
+                          "name": random.choice(featureNames)}
+                         for position in positions],
+        })
+    for objectDescription in objects:
+        exp.learnObject(objectDescription)
+
+    return exp, objects
+
+
+class InferObjectsTest(unittest.TestCase):
+    """Tests for PIUNExperiment.inferObjects."""
+
+    def testWorkersGiveSameResults(self):
+        """Serial and parallel inference give the same result for each object"""
+        exp, objects = createExperiment()
+
+        serial = exp.inferObjects(objects, numWorkers=1, seed=7)
+        parallel = exp.inferObjects(objects, numWorkers=2, seed=7)
+        self.assertEqual(parallel, serial)
+
+        # the results don't depend on the objects inferred before
+        self.assertEqual(exp.inferObjects(objects[::-1], numWorkers=1, seed=7),
+                         exp.inferObjects(objects[::-1], numWorkers=2, seed=7))
+        self.assertEqual(exp.inferObjects(objects, numWorkers=1, seed=7), serial)
+
+        # some of the objects are recognized
+        self.assertTrue(any(step is not None for step in serial))
+
+    def testWorkersRequireSeed(self):
+        exp, objects = createExperiment(numObjects=1)
+        with self.assertRaises(ValueError):
+            exp.inferObjects(objects, numWorkers=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
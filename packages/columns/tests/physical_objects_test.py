@@ -19,18 +19,120 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import os
+import tempfile
 import unittest
+from itertools import combinations
 
 import matplotlib.pyplot as plt
+import numpy as np
+import plyfile
 
 from nupic.research.frameworks.columns.physical_objects import (
     Box,
     Cube,
     Cylinder,
+    PlyModel,
     Sphere,
 )
 
 
+def icosphere(radius, subdivisions):
+    """
+    Vertices and triangles of an icosahedron whose faces are subdivided
+    "subdivisions" times, projected on a sphere.
+    """
+    t = (1 + 5 ** .5) / 2
+    vertices = [(-1, t, 0), (1, t, 0), (-1, -t, 0), (1, -t, 0),
+                (0, -1, t), (0, 1, t), (0, -1, -t), (0, 1, -t),
+                (t, 0, -1), (t, 0, 1), (-t, 0, -1), (-t, 0, 1)]
+    faces = [(0, 11, 5), (0, 5, 1), (0, 1, 7), (0, 7, 10), (0, 10, 11),
+             (1, 5, 9), (5, 11, 4), (11, 10, 2), (10, 7, 6), (7, 1, 8),
+             (3, 9, 4), (3, 4, 2), (3, 2, 6), (3, 6, 8), (3, 8, 9),
+             (4, 9, 5), (2, 4, 11), (6, 2, 10), (8, 6, 7), (9, 8, 1)]
+    vertices = [np.array(vertex) / np.linalg.norm(vertex) for vertex in vertices]
+
+    for _ in range(subdivisions):
+        midpoints = {}
+
+        def midpoint(i, j):
+            key = (min(i, j), max(i, j))
+            if key not in midpoints:
+                vertex = vertices[i] + vertices[j]
+                vertices.append(vertex / np.linalg.norm(vertex))
+                midpoints[key] = len(vertices) - 1
+            return midpoints[key]
+
+        subdivided = []
+        for a, b, c in faces:
+            ab, bc, ca = midpoint(a, b), midpoint(b, c), midpoint(c, a)
+            subdivided += [(a, ab, ca), (b, bc, ab), (c, ca, bc), (ab, bc, ca)]
+        faces = subdivided
+
+    return np.array(vertices) * radius, np.array(faces)
+
+
+def writePly(path, vertices, faces):
+    vertices = np.array([tuple(vertex) for vertex in vertices],
+                        dtype=[("x", "f4"), ("y", "f4"), ("z", "f4")])
+    faces = np.array([(list(face),) for face in faces],
+                     dtype=[("vertex_indices", "i4", (3,))])
+    plyfile.PlyData([plyfile.PlyElement.describe(vertices, "vertex"),
+                     plyfile.PlyElement.describe(faces, "face")]).write(path)
+    return path
+
+
+def oldContains(model, location):
+    """
+    PlyModel.contains before the KD-tree lookup, for the regression test. The
+    faces are indexed by their "vertex_indices" field, which current numpy
+    requires.
+    """
+    for vertex in model.vertices:
+        V = np.array((vertex["x"], vertex["y"], vertex["z"])).T
+        if np.allclose(location, V, rtol=1.e-3):
+            return "vertex"
+    for face in model.faces:
+        vertices = model.vertices[face["vertex_indices"]]
+        edges = np.choose(np.array(list(combinations(list(range(3)), 2))),
+                          vertices)
+        for edge in edges:
+            if oldContainsOnEdge(model, location, edge):
+                return "edge"
+        if oldContainsOnFace(model, location, vertices):
+            return "face"
+    return False
+
+
+def oldContainsOnFace(model, location, vertices):
+    vertices = np.array((vertices["x"], vertices["y"], vertices["z"])).T
+    v0 = vertices[2] - vertices[0]
+    v1 = vertices[1] - vertices[0]
+    v2 = location - vertices[0]
+    v3 = vertices[2] - location
+    N1 = np.cross(v0, v1)
+    N1 = N1 / (np.dot(N1, N1)) ** .5
+
+    N2 = np.cross(v2, v3)
+    N2 = N2 / (np.dot(N2, N2)) ** .5
+    if model.almostEqual(abs(np.dot(N1, N2)), 1.0):
+        return True
+    return False
+
+
+def oldContainsOnEdge(model, location, edge):
+    edge = np.array((edge["x"], edge["y"], edge["z"])).T
+    v = edge[1] - location
+    av = v / (np.dot(v, v)) ** .5
+    d = edge[1] - edge[0]
+    ad = d / (np.dot(d, d)) ** .5
+    vd = np.dot(av, ad)
+    model.epsilon = 0.0001
+    if model.almostEqual(vd, 1.0):
+        model.epsilon = model.DEFAULT_EPSILON
+        return True
+
+
 @unittest.skip("needs work to get these running")
 class PhysicalObjectsTest(unittest.TestCase):
     """Unit tests for physical objects."""
@@ -134,5 +236,186 @@ class PhysicalObjectsTest(unittest.TestCase):
                 plt.close()
 
 
+class PhysicalObjectsBatchTest(unittest.TestCase):
+    """Unit tests for the batched sampling and feature lookup."""
+
+    def testBatchFeatureIDsMatchScalar(self):
+        """getFeatureIDs gives the same features as getFeatureID."""
+        objects = [
+            Sphere(radius=20, dimension=3),
+            Cylinder(height=50, radius=100, epsilon=2),
+            Box(dimensions=[10, 20, 30], dimension=3),
+            Cube(width=20, dimension=3),
+        ]
+        np.random.seed(42)
+
+        for obj in objects:
+            for feature in obj.getFeatures() + ["random"]:
+                locations = obj.sampleLocations(100, feature)
+                self.assertEqual(locations.shape, (100, 3))
+
+                # also check locations off the surface
+                noisy = locations + np.random.normal(0, 2, locations.shape)
+                for locs in (locations, noisy):
+                    expected = [obj.getFeatureID(list(loc)) for loc in locs]
+                    np.testing.assert_array_equal(obj.getFeatureIDs(locs),
+                                                  expected)
+
+    def testBoxSampleFeatures(self):
+        """Box samples are on one face, two faces or three faces."""
+        box = Box(dimensions=[10, 20, 30], dimension=3, epsilon=1e-6)
+        np.random.seed(42)
+
+        for feature, featureID in [("face", box.FLAT),
+                                   ("edge", box.EDGE),
+                                   ("vertex", box.POINTY)]:
+            locations = box.sampleLocations(200, feature)
+            self.assertTrue((box.getFeatureIDs(locations) == featureID).all())
+
+    def testPlyModel(self):
+        """Samples points from a tetrahedron mesh and looks up their features."""
+        vertices = np.array([(0, 0, 0), (10, 0, 0), (0, 10, 0), (0, 0, 10)],
+                            dtype=[("x", "f4"), ("y", "f4"), ("z", "f4")])
+        faces = np.array([([0, 2, 1],), ([0, 1, 3],), ([0, 3, 2],), ([1, 2, 3],)],
+                         dtype=[("vertex_indices", "i4", (3,))])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "tetrahedron.ply")
+            plyfile.PlyData([plyfile.PlyElement.describe(vertices, "vertex"),
+                             plyfile.PlyElement.describe(faces, "face")]).write(path)
+            model = PlyModel(file=path, epsilon=0.1, seed=42)
+
+        locations, normals = model.sampleLocationsAndNormals(200, "vertex")
+        self.assertTrue((model.getFeatureIDs(locations) == model.POINTY).all())
+        np.testing.assert_allclose(np.linalg.norm(normals, axis=1), 1)
+
+        locations = model.sampleLocations(200, "edge")
+        self.assertTrue(np.isin(model.getFeatureIDs(locations),
+                                [model.EDGE, model.POINTY]).all())
+
+        locations, normals = model.sampleLocationsAndNormals(200, "face")
+        self.assertTrue(np.isin(model.getFeatureIDs(locations),
+                                [model.FLAT, model.EDGE, model.POINTY]).all())
+
+        # the normal of the bottom face (z = 0) points down
+        onBottom = np.abs(locations[:, 2]) < 1e-6
+        np.testing.assert_allclose(normals[onBottom], [[0, 0, -1]] * onBottom.sum(),
+                                   atol=1e-6)
+
+        self.assertEqual(model.contains([2, 2, 0]), "face")
+        self.assertEqual(model.contains([5, 0, 0]), "edge")
+        self.assertEqual(model.contains([10, 0, 0]), "vertex")
+        self.assertFalse(model.contains([2, 2, 2]))
+        self.assertFalse(model.contains([2, 2, 1]))
+        self.assertEqual(model.getFeatureID([2, 2, 2]), model.EMPTY_FEATURE)
+
+    def testPlyModelSeed(self):
+        """PlyModel samples with its own generator, independent of np.random."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = writePly(os.path.join(tmpdir, "icosphere.ply"),
+                            *icosphere(10., 1))
+            models = [PlyModel(file=path, seed=seed) for seed in (42, 42, 43)]
+
+        samples = []
+        for model in models:
+            np.random.seed(0)
+            samples.append(model.sampleLocations(50, "random"))
+
+        np.testing.assert_array_equal(samples[0], samples[1])
+        self.assertFalse(np.array_equal(samples[0], samples[2]))
+
+
+class PlyModelContainsRegressionTest(unittest.TestCase):
+    """
+    Compares PlyModel.contains with the implementation it replaced, on an
+    icosphere mesh. The classifications agree, except where the old checks were
+    changed on purpose:
+
+    - vertices: the old check was np.allclose(location, vertex, rtol=1e-3). A
+      location is now a vertex if it is within epsilon of one.
+    - edges: the old check tested whether the direction to the edge's second
+      vertex was within 1e-4 (dot product) of the edge direction, so edges were
+      half-lines, and near-edge points were faces. A location is now on an edge
+      if it is within epsilon of the edge segment.
+    - faces: the old check only tested whether the location was in the plane of
+      a face, so faces were unbounded planes and points off the mesh were often
+      "face". A location is now on a face if it is within epsilon of the
+      triangle.
+    """
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        path = writePly(os.path.join(self.tempDir.name, "icosphere.ply"),
+                        *icosphere(10., 2))
+        self.model = PlyModel(file=path, epsilon=0.1, seed=42)
+        # the old check changes epsilon, so it gets its own model
+        self.oldModel = PlyModel(file=path, epsilon=0.1)
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def classify(self, locations):
+        return [(oldContains(self.oldModel, location),
+                 self.model.contains(location))
+                for location in locations]
+
+    def distancesToEdges(self, locations):
+        """Distance of each location to the closest mesh edge segment."""
+        a = self.model.vertexLocations[self.model.triangles]
+        b = np.roll(a, -1, axis=1)
+        a, b = a.reshape(-1, 3), b.reshape(-1, 3)
+        return np.array([
+            self.model._segmentDistances(np.tile(location, (len(a), 1)), a,
+                                         b).min()
+            for location in locations])
+
+    def distancesToVertices(self, locations):
+        return np.linalg.norm(locations[:, None, :]
+                              - self.model.vertexLocations[None, :, :],
+                              axis=2).min(axis=1)
+
+    def testVertices(self):
+        locations = self.model.sampleLocations(25, "vertex")
+        self.assertEqual(set(self.classify(locations)), {("vertex", "vertex")})
+
+    def testEdges(self):
+        locations = self.model.sampleLocations(25, "edge")
+        classifications = self.classify(locations)
+        onVertex = self.distancesToVertices(locations) <= self.model.epsilon
+
+        for (old, new), vertex in zip(classifications, onVertex):
+            self.assertEqual(new, "vertex" if vertex else "edge")
+            if new != old:
+                # points slightly off the edge line were faces, and the vertex
+                # tolerance changed
+                self.assertIn((old, new), [("face", "edge"), ("edge", "vertex"),
+                                           ("face", "vertex")])
+        self.assertGreater(classifications.count(("edge", "edge")), 15)
+
+    def testFaces(self):
+        locations = self.model.sampleLocations(25, "face")
+        classifications = self.classify(locations)
+        nearEdge = self.distancesToEdges(locations) <= self.model.epsilon
+
+        for (old, new), edge in zip(classifications, nearEdge):
+            self.assertIn(old, ("edge", "face"))
+            if new != old:
+                # near-edge points were faces
+                self.assertEqual((old, new), ("face", "edge"))
+            self.assertEqual(new == "edge", edge)
+        self.assertGreater(classifications.count(("face", "face")), 15)
+
+    def testOffMesh(self):
+        locations, normals = self.model.sampleLocationsAndNormals(25, "face")
+
+        # inside the sphere, both are False
+        self.assertEqual(set(self.classify(locations * 0.5)), {(False, False)})
+
+        # outside, the old check finds points in the plane of some face
+        classifications = self.classify(locations + normals)
+        self.assertEqual({new for _, new in classifications}, {False})
+        self.assertIn(("face", False), classifications)
+
+
 if __name__ == "__main__":
     unittest.main()
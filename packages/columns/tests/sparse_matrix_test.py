@@ -0,0 +1,160 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+# ----------------------------------------------------------------------
+
+import unittest
+
+import numpy as np
+import scipy.sparse
+
+from nupic.research.frameworks.columns import ColumnPooler
+from nupic.research.frameworks.columns.sparse_matrix import (
+    NumpyRandom,
+    ScipySparseMatrix,
+)
+
+
+class ScipySparseMatrixTest(unittest.TestCase):
+    """
+    Compares each ScipySparseMatrix operation with the same operation on a dense
+    numpy array.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.dense = rng.random((20, 30)).astype(np.float32)
+        self.dense[self.dense < 0.6] = 0
+
+        self.matrix = ScipySparseMatrix(20, 30)
+        self.matrix.matrix = scipy.sparse.csr_matrix(self.dense)
+
+        self.rows = np.array([1, 4, 5, 11, 19])
+        self.cols = np.array([0, 2, 3, 7, 8, 15, 29])
+
+    def testCounts(self):
+        np.testing.assert_array_equal(self.matrix.toDense(), self.dense)
+        self.assertEqual(self.matrix.nNonZeros(), np.count_nonzero(self.dense))
+        np.testing.assert_array_equal(self.matrix.nNonZerosPerRow(),
+                                      np.count_nonzero(self.dense, axis=1))
+        self.assertEqual(self.matrix.countWhereGreaterEqual(2, 9, 5, 20, 0.8),
+                         np.count_nonzero(self.dense[2:9, 5:20] >= 0.8))
+        self.assertEqual(self.matrix.countWhereGreaterEqualInRows(self.rows, 0.8),
+                         np.count_nonzero(self.dense[self.rows] >= 0.8))
+
+        sub = self.dense[self.rows][:, self.cols]
+        np.testing.assert_array_equal(
+            self.matrix.nNonZerosPerRowOnCols(self.rows, self.cols),
+            np.count_nonzero(sub, axis=1))
+        np.testing.assert_array_equal(
+            self.matrix.rightVecSumAtNZGteThresholdSparse(self.cols, 0.8),
+            np.count_nonzero(self.dense[:, self.cols] >= 0.8, axis=1))
+
+    def testIncrementAndClip(self):
+        self.matrix.incrementNonZerosOnOuter(self.rows, self.cols, 0.1)
+        self.matrix.incrementNonZerosOnRowsExcludingCols(self.rows, self.cols, -0.3)
+        self.matrix.clipRowsBelowAndAbove(self.rows, 0.0, 1.0)
+
+        outer = np.zeros_like(self.dense, dtype=bool)
+        outer[np.ix_(self.rows, self.cols)] = True
+        selectedRows = np.zeros_like(outer)
+        selectedRows[self.rows] = True
+
+        expected = self.dense.copy()
+        expected[outer & (expected > 0)] += 0.1
+        expected[selectedRows & ~outer & (expected > 0)] -= 0.3
+        expected[self.rows] = np.clip(expected[self.rows], 0.0, 1.0)
+
+        np.testing.assert_allclose(self.matrix.toDense(), expected, atol=1e-6)
+
+        # Entries clipped to 0 are removed
+        self.assertEqual(self.matrix.nNonZeros(), np.count_nonzero(expected))
+
+        # The cached connected matrix is updated
+        np.testing.assert_array_equal(
+            self.matrix.rightVecSumAtNZGteThresholdSparse(self.cols, 0.8),
+            np.count_nonzero(expected[:, self.cols] >= 0.8, axis=1))
+
+    def testSetZerosOnOuter(self):
+        self.matrix.setZerosOnOuter(self.rows, self.cols, 0.5)
+
+        expected = self.dense.copy()
+        sub = expected[np.ix_(self.rows, self.cols)]
+        expected[np.ix_(self.rows, self.cols)] = np.where(sub == 0, 0.5, sub)
+
+        np.testing.assert_array_equal(self.matrix.toDense(), expected)
+
+    def testSetRandomZerosOnOuter(self):
+        numNew = np.array([0, 1, 3, 7, 2])
+        self.matrix.setRandomZerosOnOuter(self.rows, self.cols, numNew, 0.5,
+                                          NumpyRandom(42))
+
+        dense = self.matrix.toDense()
+
+        # Existing entries are unchanged, and new entries are only on the outer
+        # product, with one new entry per zero up to numNew
+        changed = dense != self.dense
+        np.testing.assert_array_equal(dense[changed], 0.5)
+        np.testing.assert_array_equal(self.dense[changed], 0)
+
+        zeros = np.count_nonzero(self.dense[np.ix_(self.rows, self.cols)] == 0,
+                                 axis=1)
+        np.testing.assert_array_equal(changed[self.rows][:, self.cols].sum(axis=1),
+                                      np.minimum(numNew, zeros))
+        self.assertEqual(changed.sum(), np.minimum(numNew, zeros).sum())
+
+
+class ScipyColumnPoolerTest(unittest.TestCase):
+    """
+    Learning and inference of the ColumnPooler with the scipy backend.
+    """
+
+    def testLearnAndInferObjects(self):
+        rng = np.random.default_rng(42)
+        objects = [[np.sort(rng.choice(2048 * 8, 40, replace=False))
+                    for _ in range(5)]
+                   for _ in range(5)]
+
+        pooler = ColumnPooler(inputWidth=2048 * 8, cellCount=4096,
+                              sparseMatrixBackend="scipy")
+
+        representations = []
+        for sensations in objects:
+            pooler.reset()
+            for sensation in sensations:
+                pooler.compute(sensation, learn=True)
+            representations.append(set(pooler.getActiveCells()))
+
+        self.assertEqual(pooler.numberOfConnectedProximalSynapses(),
+                         pooler.numberOfProximalSynapses())
+
+        for sensations, representation in zip(objects, representations):
+            pooler.reset()
+            pooler.compute(sensations[0], learn=False)
+            self.assertEqual(set(pooler.getActiveCells()), representation)
+            self.assertEqual(len(representation), 40)
+
+    def testUnknownBackend(self):
+        with self.assertRaises(ValueError):
+            ColumnPooler(inputWidth=2048 * 8, sparseMatrixBackend="dense")
+
+
+if __name__ == "__main__":
+    unittest.main()
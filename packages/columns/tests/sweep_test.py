@@ -0,0 +1,169 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+# ----------------------------------------------------------------------
+
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import scipy.sparse
+
+from nupic.research.frameworks.columns.sweep import (
+    loadRecords,
+    loadResults,
+    parameterGrid,
+    runSweep,
+)
+
+
+def setup(params):
+    rng = np.random.default_rng(params["seed"])
+    return {
+        "weights": rng.random((params["size"], 100)),
+        "matrix": scipy.sparse.random(100, 100, density=0.1,
+                                      random_state=params["seed"], format="csr"),
+        "calls": [],
+    }
+
+
+def runCell(cell, state):
+    if cell.get("fail") and cell["noise"] == 0.2:
+        raise RuntimeError("Failed cell")
+
+    # Every cell gets its own copy of the state, with read-only arrays
+    state["calls"].append(cell["noise"])
+    return {
+        "value": float(state["weights"].sum() * cell["noise"]),
+        "matrixSum": float(state["matrix"].sum()),
+        "numCalls": len(state["calls"]),
+        "writeable": state["weights"].flags.writeable,
+        "pid": os.getpid(),
+        "curve": [cell["noise"]] * 3,
+    }
+
+
+def setupSnapshot(params):
+    network = {"weights": list(range(params["size"])), "steps": 0}
+    return np.frombuffer(pickle.dumps(network), dtype=np.uint8)
+
+
+def runCellFromSnapshot(cell, snapshot):
+    # The snapshot bytes are shared, the unpickled network is private
+    network = pickle.loads(snapshot)
+    network["steps"] += 1
+    return {"total": sum(network["weights"]), "steps": network["steps"],
+            "writeable": snapshot.flags.writeable}
+
+
+def runCellWithoutSetup(cell):
+    return {"square": cell["noise"] ** 2}
+
+
+class SweepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempDir.name, "results.sweep")
+        self.cells = parameterGrid(size=[10, 20], seed=[0, 1],
+                                   noise=[0.0, 0.1, 0.2])
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def expectedValue(self, cell):
+        state = setup(cell)
+        return float(state["weights"].sum() * cell["noise"])
+
+    def testParameterGrid(self):
+        self.assertEqual(len(self.cells), 12)
+        self.assertEqual(self.cells[0], {"size": 10, "seed": 0, "noise": 0.0})
+        self.assertEqual(self.cells[1], {"size": 10, "seed": 0, "noise": 0.1})
+
+    def runAndCheck(self, numWorkers):
+        results = runSweep(runCell, self.cells, self.path, setup=setup,
+                           setupKeys=("size", "seed"), numWorkers=numWorkers)
+
+        self.assertEqual(len(results), len(self.cells))
+        for cell, result in zip(self.cells, results):
+            self.assertEqual({k: result[k] for k in cell}, cell)
+            self.assertAlmostEqual(result["value"], self.expectedValue(cell))
+            self.assertEqual(result["numCalls"], 1)
+            self.assertFalse(result["writeable"])
+            self.assertEqual(result["curve"], [cell["noise"]] * 3)
+
+        columns = loadResults(self.path)
+        self.assertEqual(columns["value"].dtype, np.float64)
+        self.assertEqual(columns["size"].dtype.kind, "i")
+        self.assertEqual(len(columns["curve"]), 12)
+
+        # Running again doesn't rerun the completed cells
+        self.assertEqual(runSweep(runCell, self.cells, self.path, setup=setup,
+                                  setupKeys=("size", "seed"),
+                                  numWorkers=numWorkers), results)
+        self.assertEqual(len(loadRecords(self.path)), 12)
+
+    def testSerial(self):
+        self.runAndCheck(numWorkers=1)
+
+    def testParallel(self):
+        self.runAndCheck(numWorkers=2)
+
+    def testWithoutSetup(self):
+        results = runSweep(runCellWithoutSetup, self.cells, self.path,
+                           numWorkers=2)
+        self.assertEqual([result["square"] for result in results],
+                         [cell["noise"] ** 2 for cell in self.cells])
+
+    def testSnapshotState(self):
+        results = runSweep(runCellFromSnapshot, self.cells, self.path,
+                           setup=setupSnapshot, setupKeys=("size", "seed"),
+                           numWorkers=2)
+        for cell, result in zip(self.cells, results):
+            self.assertEqual(result["total"], sum(range(cell["size"])))
+            self.assertEqual(result["steps"], 1)
+            self.assertFalse(result["writeable"])
+
+    def testResume(self):
+        failingCells = [dict(cell, fail=True) for cell in self.cells]
+        with self.assertRaises(RuntimeError):
+            runSweep(runCell, failingCells, self.path, setup=setup,
+                     setupKeys=("size", "seed"))
+        numCompleted = len(loadRecords(self.path))
+        self.assertEqual(numCompleted, 2)
+
+        # A chunk that was only partly written is dropped
+        with open(self.path, "ab") as f:
+            f.write(b"\x40\x00\x00\x00\x00\x00\x00\x00partial")
+        self.assertEqual(len(loadRecords(self.path)), numCompleted)
+
+        cells = [cell for cell in failingCells if cell["noise"] != 0.2]
+        results = runSweep(runCell, cells, self.path, setup=setup,
+                           setupKeys=("size", "seed"))
+        self.assertEqual(len(results), 8)
+        self.assertEqual(len(loadRecords(self.path)), 8)
+        for cell, result in zip(cells, results):
+            self.assertAlmostEqual(result["value"], self.expectedValue(cell))
+
+
+if __name__ == "__main__":
+    unittest.main()
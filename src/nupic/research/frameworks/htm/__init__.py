@@ -20,6 +20,7 @@
 # ----------------------------------------------------------------------
 
 from .spatial_pooler import SpatialPooler
+from .spatial_pooler_torch import TorchSpatialPooler
 from .temporal_memory import (
     PairMemoryApicalTiebreak,
     SequenceMemoryApicalTiebreak,
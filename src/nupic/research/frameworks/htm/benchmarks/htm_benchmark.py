@@ -0,0 +1,486 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Benchmarks the htm Spatial Pooler and Temporal Memory classes over a sweep of
+minicolumn counts, cells per minicolumn, input sparsity and sequence length.
+
+Each configuration learns randomly generated sequences for a number of steps and
+reports steps/sec, peak RSS and the time spent per step in each phase (overlap,
+inhibition, segment activity, learning, ...). Every configuration runs in a fresh
+process so that peak RSS is measured per configuration. `--json` writes the results
+for regression tracking, and `--profile` attributes time to every method of the
+model.
+
+    python htm_benchmark.py --models sp sequence --minicolumns 256 1024
+    python htm_benchmark.py --models pair --cells-per-minicolumn 8 16 --json out.json
+    python htm_benchmark.py --models tm --steps 100 --profile
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import multiprocessing
+import platform
+import resource
+import time
+from collections import defaultdict
+
+import numpy as np
+import torch
+
+from nupic.research.frameworks.htm import (
+    PairMemoryApicalTiebreak,
+    SequenceMemoryApicalTiebreak,
+    SpatialPooler,
+    TemporalMemoryApicalTiebreak,
+)
+
+real_type = torch.float32
+int_type = torch.int64
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+# methods timed for each phase, per model
+SPATIAL_POOLER_PHASES = {
+    "overlap": ["calculate_overlap"],
+    "inhibition": ["inhibit_minicolumns"],
+    "learning": ["adapt_synapses", "update_duty_cycles", "bump_up_weak_minicolumns",
+                 "update_boost_factors", "update_inhibition_radius",
+                 "update_min_duty_cycles"],
+}
+
+TEMPORAL_MEMORY_PHASES = {
+    "segment activity": ["compute_basal_segment_activity",
+                         "compute_apical_segment_activity"],
+    "prediction": ["compute_predicted_cells"],
+    "learning": ["compute_basal_learning", "compute_apical_learning",
+                 "learn_synapses", "adjust_synapses_on_segments", "learn_segments"],
+}
+
+
+class MethodProfiler():
+    """
+    times the calls to methods of an object by replacing them with timing wrappers
+    on the instance, for as long as the profiler is active (use it as a context
+    manager).
+
+    `methods` maps method names to a phase name (or None). for every method the
+    profiler records the number of calls, the total time (including nested calls)
+    and the self time (excluding nested calls to other profiled methods). the time
+    of a phase is the total time of its methods, without counting the calls nested
+    in another call of the same phase twice.
+    """
+
+    def __init__(self, obj, methods):
+        self.obj = obj
+        self.methods = methods
+
+        self.calls = defaultdict(int)
+        self.total_times = defaultdict(float)
+        self.self_times = defaultdict(float)
+        self.phase_times = defaultdict(float)
+
+        # (phase, time spent in nested calls) of the calls in progress
+        self.stack = []
+
+    def __enter__(self):
+        for name, phase in self.methods.items():
+            method = getattr(self.obj, name)
+            setattr(self.obj, name, self.wrap(name, phase, method))
+
+        return self
+
+    def __exit__(self, *args):
+        for name in self.methods:
+            delattr(self.obj, name)
+
+    def wrap(self, name, phase, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            self.stack.append([phase, 0.0])
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                _, nested = self.stack.pop()
+
+                self.calls[name] += 1
+                self.total_times[name] += elapsed
+                self.self_times[name] += elapsed - nested
+
+                if self.stack:
+                    self.stack[-1][1] += elapsed
+
+                if phase is not None and all(p != phase for p, _ in self.stack):
+                    self.phase_times[phase] += elapsed
+
+        return wrapper
+
+    @classmethod
+    def for_all_methods(cls, obj, phases):
+        """
+        profiler for every public method of `obj`, with the phases of `phases`
+        (dict of phase name to list of method names).
+        """
+
+        method_phases = {
+            name: phase for phase, names in phases.items() for name in names
+        }
+
+        methods = {}
+        for name in dir(type(obj)):
+            if not name.startswith("_") and callable(getattr(obj, name)):
+                methods[name] = method_phases.get(name)
+
+        return cls(obj, methods)
+
+
+def generate_sequences(generator, num_sequences, sequence_length, size, sparsity):
+    """
+    `num_sequences` random sequences of `sequence_length` sorted index tensors, each
+    with `sparsity` of `size` bits active.
+    """
+
+    w = max(1, int(round(sparsity * size)))
+
+    return [
+        [torch.from_numpy(np.sort(generator.choice(size, w, replace=False)))
+         for _ in range(sequence_length)]
+        for _ in range(num_sequences)
+    ]
+
+
+class SpatialPoolerRunner():
+    phases = SPATIAL_POOLER_PHASES
+
+    def __init__(self, config, sequences):
+        self.model = SpatialPooler(
+            input_dims=(config["input_size"],),
+            minicolumn_dims=(config["num_minicolumns"],),
+            potential_radius=config["input_size"],
+            global_inhibition=True,
+            active_minicolumns_per_inh_area=max(
+                1, int(round(0.02 * config["num_minicolumns"]))
+            ),
+            seed=config["seed"],
+        )
+
+        self.inputs = []
+        for sequence in sequences:
+            for element in sequence:
+                input_vector = np.zeros(config["input_size"], dtype=np.uint32)
+                input_vector[element.numpy()] = 1
+                self.inputs.append(input_vector)
+
+        self.active_array = np.zeros(config["num_minicolumns"], dtype=np.uint32)
+
+    def step(self, t):
+        self.model.compute(self.inputs[t % len(self.inputs)], True, self.active_array)
+
+
+class TemporalMemoryRunner():
+    """
+    drives `TemporalMemoryApicalTiebreak` directly: the previous active cells are the
+    basal input, and the previous learning cells the basal growth candidates.
+    """
+
+    phases = TEMPORAL_MEMORY_PHASES
+
+    def __init__(self, config, sequences):
+        num_cells = config["num_minicolumns"] * config["cells_per_minicolumn"]
+
+        self.model = TemporalMemoryApicalTiebreak(
+            num_minicolumns=config["num_minicolumns"],
+            basal_input_size=num_cells,
+            num_cells_per_minicolumn=config["cells_per_minicolumn"],
+            seed=config["seed"],
+            **tm_thresholds(config)
+        )
+
+        self.sequences = sequences
+        self.empty = torch.empty(0, dtype=int_type).to(device)
+
+    def step(self, t):
+        sequence = self.sequences[t // len(self.sequences[0]) % len(self.sequences)]
+        element = t % len(sequence)
+
+        if element == 0:
+            self.model.reset()
+
+        self.model.depolarize_cells(self.model.active_cells, self.empty, True)
+        self.model.activate_cells(
+            active_minicolumns=sequence[element].to(device),
+            basal_reinforce_candidates=self.model.active_cells,
+            apical_reinforce_candidates=self.empty,
+            basal_growth_candidates=self.model.learning_cells,
+            apical_growth_candidates=self.empty,
+        )
+
+
+class PairMemoryRunner(TemporalMemoryRunner):
+    """
+    pairs each element with the active cells of the previous element as basal input,
+    and the element index as apical context.
+    """
+
+    def __init__(self, config, sequences):
+        num_cells = config["num_minicolumns"] * config["cells_per_minicolumn"]
+
+        self.model = PairMemoryApicalTiebreak(
+            num_minicolumns=config["num_minicolumns"],
+            basal_input_size=num_cells,
+            apical_input_size=config["num_minicolumns"],
+            num_cells_per_minicolumn=config["cells_per_minicolumn"],
+            seed=config["seed"],
+            **tm_thresholds(config)
+        )
+
+        self.sequences = sequences
+
+    def step(self, t):
+        sequence = self.sequences[t // len(self.sequences[0]) % len(self.sequences)]
+        element = t % len(sequence)
+
+        if element == 0:
+            self.model.reset()
+
+        self.model.compute(
+            active_minicolumns=sequence[element],
+            basal_input=self.model.get_active_cells(),
+            apical_input=sequence[element - 1],
+        )
+
+
+class SequenceMemoryRunner(TemporalMemoryRunner):
+
+    def __init__(self, config, sequences):
+        self.model = SequenceMemoryApicalTiebreak(
+            num_minicolumns=config["num_minicolumns"],
+            num_cells_per_minicolumn=config["cells_per_minicolumn"],
+            seed=config["seed"],
+            **tm_thresholds(config)
+        )
+
+        self.sequences = sequences
+
+    def step(self, t):
+        sequence = self.sequences[t // len(self.sequences[0]) % len(self.sequences)]
+        element = t % len(sequence)
+
+        if element == 0:
+            self.model.reset()
+
+        self.model.compute(sequence[element])
+
+
+RUNNERS = {
+    "sp": SpatialPoolerRunner,
+    "tm": TemporalMemoryRunner,
+    "pair": PairMemoryRunner,
+    "sequence": SequenceMemoryRunner,
+}
+
+
+def tm_thresholds(config):
+    """
+    segment thresholds scaled to the number of active minicolumns.
+    """
+
+    w = max(1, int(round(config["sparsity"] * config["num_minicolumns"])))
+
+    return {
+        "activation_threshold": max(1, int(0.6 * w)),
+        "reduced_basal_threshold": max(1, int(0.6 * w)),
+        "matching_threshold": max(1, int(0.4 * w)),
+        "sample_size": w,
+    }
+
+
+def run_benchmark(config):
+    """
+    run one configuration and return its results (dict).
+    """
+
+    torch.manual_seed(config["seed"])
+    generator = np.random.default_rng(config["seed"])
+
+    runner_class = RUNNERS[config["model"]]
+    size = (config["input_size"] if config["model"] == "sp"
+            else config["num_minicolumns"])
+
+    sequences = generate_sequences(generator, config["num_sequences"],
+                                   config["sequence_length"], size,
+                                   config["sparsity"])
+
+    runner = runner_class(config, sequences)
+
+    for t in range(config["warmup"]):
+        runner.step(t)
+
+    if config["profile"]:
+        profiler = MethodProfiler.for_all_methods(runner.model, runner.phases)
+    else:
+        profiler = MethodProfiler(runner.model, {
+            name: phase for phase, names in runner.phases.items() for name in names
+        })
+
+    with profiler:
+        start = time.perf_counter()
+        for t in range(config["warmup"], config["warmup"] + config["steps"]):
+            runner.step(t)
+        seconds = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if platform.system() != "Darwin":
+        peak_rss *= 1024
+
+    result = dict(config)
+    result.update(
+        seconds=seconds,
+        steps_per_sec=config["steps"] / seconds,
+        peak_rss_mb=peak_rss / 2 ** 20,
+        phase_ms_per_step={
+            phase: 1000 * profiler.phase_times[phase] / config["steps"]
+            for phase in runner.phases
+        },
+    )
+
+    if config["profile"]:
+        result["methods"] = {
+            name: {
+                "calls": profiler.calls[name],
+                "total_sec": profiler.total_times[name],
+                "self_sec": profiler.self_times[name],
+            }
+            for name in sorted(profiler.calls, key=profiler.self_times.get,
+                               reverse=True)
+        }
+
+    return result
+
+
+def run_isolated(config):
+    """
+    run `run_benchmark(config)` in a fresh process, so that peak RSS only accounts
+    for this configuration.
+    """
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_benchmark, (config,))
+
+
+def sweep_configs(args):
+    configs = []
+    for model in args.models:
+        # the spatial pooler has no cells
+        cells_per_minicolumn = [None] if model == "sp" else args.cells_per_minicolumn
+
+        for (num_minicolumns, cells, sparsity,
+             sequence_length) in itertools.product(args.minicolumns,
+                                                   cells_per_minicolumn,
+                                                   args.sparsity,
+                                                   args.sequence_length):
+            configs.append(dict(
+                model=model,
+                num_minicolumns=num_minicolumns,
+                cells_per_minicolumn=cells,
+                input_size=args.input_size,
+                sparsity=sparsity,
+                sequence_length=sequence_length,
+                num_sequences=args.num_sequences,
+                steps=args.steps,
+                warmup=args.warmup,
+                profile=args.profile,
+                seed=args.seed,
+            ))
+
+    return configs
+
+
+def print_result(result):
+    phases = " ".join(
+        f"{phase}={ms:.2f}ms" for phase, ms in result["phase_ms_per_step"].items()
+    )
+    print(f"{result['model']:>9} {result['num_minicolumns']:>11} "
+          f"{str(result['cells_per_minicolumn']):>6} {result['sparsity']:>8.3f} "
+          f"{result['sequence_length']:>7} {result['steps_per_sec']:>10.1f} "
+          f"{result['peak_rss_mb']:>9.1f}  {phases}")
+
+    if "methods" in result:
+        print(f"{'method':>40} {'calls':>8} {'total':>9} {'self':>9}")
+        for name, stats in result["methods"].items():
+            print(f"{name:>40} {stats['calls']:>8} {stats['total_sec']:>8.3f}s "
+                  f"{stats['self_sec']:>8.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--models", nargs="+", choices=sorted(RUNNERS),
+                        default=["sp", "sequence"])
+    parser.add_argument("--minicolumns", type=int, nargs="+", default=[256, 1024])
+    parser.add_argument("--cells-per-minicolumn", type=int, nargs="+", default=[8])
+    parser.add_argument("--sparsity", type=float, nargs="+", default=[0.02],
+                        help="fraction of active minicolumns (or spatial pooler "
+                             "input bits)")
+    parser.add_argument("--sequence-length", type=int, nargs="+", default=[10])
+    parser.add_argument("--num-sequences", type=int, default=10)
+    parser.add_argument("--input-size", type=int, default=1024,
+                        help="number of spatial pooler input bits")
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--profile", action="store_true",
+                        help="time every method of the model")
+    parser.add_argument("--no-isolate", action="store_true",
+                        help="run all configurations in this process (peak RSS "
+                             "then accumulates across configurations)")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    run = run_benchmark if args.no_isolate else run_isolated
+
+    print(f"{'model':>9} {'minicolumns':>11} {'cells':>6} {'sparsity':>8} "
+          f"{'seq len':>7} {'steps/sec':>10} {'rss (MB)':>9}  phases (per step)")
+
+    results = []
+    for config in sweep_configs(args):
+        result = run(config)
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "torch_version": torch.__version__,
+                "device": device,
+                "args": vars(args),
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
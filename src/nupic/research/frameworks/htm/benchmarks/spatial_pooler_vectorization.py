@@ -0,0 +1,167 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compares the vectorized Spatial Pooler initialization and local inhibition with
+the original per-minicolumn / per-input loops, across minicolumn counts. Both
+versions are run with the same seed and checked to produce identical
+permanences and active minicolumns.
+
+    python spatial_pooler_vectorization.py --sizes 16 32 64
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from nupic.research.frameworks.htm import SpatialPooler
+from nupic.research.frameworks.htm.spatial_pooler import real_type
+
+
+class LoopSpatialPooler(SpatialPooler):
+    """
+    Spatial Pooler with the original loop implementations of permanence
+    initialization, connected span and local inhibition. Used as a reference.
+    """
+
+    def init_permanence_values(self, num_potential):
+        permanence = np.zeros(num_potential, dtype=real_type)
+
+        for i in range(num_potential):
+            if self.generator.random() <= self.init_connected_percent:
+                p = (
+                    self.synapse_perm_connected
+                    + (self.synapse_perm_max - self.synapse_perm_connected)
+                    * self.generator.random()
+                )
+            else:
+                p = self.synapse_perm_connected * self.generator.random()
+
+            permanence[i] = int(p * 100000) / 100000.0
+
+        permanence[permanence < self.synapse_perm_trim_threshold] = 0
+
+        return permanence
+
+    def average_connected_synapses_per_minicolumn(self, minicolumn_index):
+        connected = self.connected_synapses[minicolumn_index, :].nonzero()[0]
+
+        if connected.size == 0:
+            return 0
+
+        min_coordinate = np.empty(self.input_dims.size)
+        max_coordinate = np.empty(self.input_dims.size)
+
+        min_coordinate.fill(max(self.input_dims))
+        max_coordinate.fill(-1)
+
+        for i in connected:
+            min_coordinate = np.minimum(min_coordinate,
+                                        np.unravel_index(i, self.input_dims))
+            max_coordinate = np.maximum(max_coordinate,
+                                        np.unravel_index(i, self.input_dims))
+
+        return np.average(max_coordinate - min_coordinate + 1)
+
+    def inhibit_minicolumns_local(self, overlaps, density):
+        active_array = np.zeros(self.num_minicolumns, dtype=np.bool_)
+
+        for minicolumn, overlap in enumerate(overlaps):
+            if overlap >= self.stimulus_threshold:
+                neighborhood = self.get_minicolumn_neighborhood(minicolumn)
+                neighborhood_overlaps = overlaps[neighborhood]
+
+                num_bigger = np.count_nonzero(neighborhood_overlaps > overlap)
+
+                tied_neighbors = neighborhood[
+                    np.where(neighborhood_overlaps == overlap)
+                ]
+                num_ties_lost = np.count_nonzero(active_array[tied_neighbors])
+
+                num_active = int(0.5 + density * len(neighborhood))
+
+                if (num_bigger + num_ties_lost) < num_active:
+                    active_array[minicolumn] = True
+
+        return active_array.nonzero()[0]
+
+
+def time_spatial_pooler(sp_class, size, inputs, seed):
+    params = dict(
+        input_dims=(size, size),
+        minicolumn_dims=(size, size),
+        active_minicolumns_per_inh_area=10,
+        potential_radius=8,
+        potential_percent=0.5,
+        global_inhibition=False,
+        seed=seed,
+    )
+
+    start = time.perf_counter()
+    sp = sp_class(**params)
+    init_time = time.perf_counter() - start
+
+    sp.set_inhibition_radius(4)
+    density = sp.get_inhibition_density()
+
+    overlaps = sp.calculate_overlap_batch(inputs.astype(real_type))
+
+    start = time.perf_counter()
+    active = [sp.inhibit_minicolumns_local(o, density) for o in overlaps]
+    inhibition_time = (time.perf_counter() - start) / len(inputs)
+
+    return sp, active, init_time, inhibition_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 32, 48],
+                        help="side lengths of the 2D input and minicolumn grids")
+    parser.add_argument("--steps", type=int, default=20,
+                        help="number of inputs to time local inhibition on")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'minicolumns':>12} {'init loop':>10} {'init vec':>10} {'speedup':>8} "
+          f"{'inh loop':>10} {'inh vec':>10} {'speedup':>8}")
+
+    for size in args.sizes:
+        generator = np.random.default_rng(args.seed)
+        inputs = (generator.random((args.steps, size * size)) > 0.9).astype(np.uint32)
+
+        loop_sp, loop_active, loop_init, loop_inh = time_spatial_pooler(
+            LoopSpatialPooler, size, inputs, args.seed
+        )
+        sp, active, init, inh = time_spatial_pooler(
+            SpatialPooler, size, inputs, args.seed
+        )
+
+        assert (loop_sp.permanences == sp.permanences).all()
+        assert all((a == b).all() for a, b in zip(loop_active, active))
+
+        print(f"{size * size:>12} {loop_init:>9.3f}s {init:>9.3f}s "
+              f"{loop_init / init:>7.1f}x {loop_inh * 1000:>8.2f}ms "
+              f"{inh * 1000:>8.2f}ms {loop_inh / inh:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Measures Temporal Memory learning throughput (steps/sec) over a long learning run,
+with segments allocated from a SegmentPool, and optionally with the original
+`torch.cat` growth of the connections matrices for comparison. Each step presents
+one element of randomly generated sequences, so new segments keep being created
+as the model learns.
+
+    python temporal_memory_segment_pool.py --steps 1000000 --report-every 10000
+    python temporal_memory_segment_pool.py --steps 20000 --compare
+    python temporal_memory_segment_pool.py --sparse --max-segments-per-cell 8
+"""
+
+import argparse
+import time
+
+import torch
+
+from nupic.research.frameworks.htm import PairMemoryApicalTiebreak
+
+real_type = torch.float32
+int_type = torch.int64
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class CatPairMemory(PairMemoryApicalTiebreak):
+    """
+    Pair Memory that grows its connections matrices with `torch.cat` on every new
+    segment, like the original implementation. Used as a reference.
+    """
+
+    def allocate_segments(self, segment_type, cells):
+        if segment_type == "basal":
+            connections = self.basal_connections
+        else:
+            connections = self.apical_connections
+
+        # keep the segment <--> cell mappings of the pool
+        new_segments = super().allocate_segments(segment_type, cells)
+
+        connections = torch.cat((
+            connections,
+            torch.zeros(
+                (cells.numel(), connections.shape[1]), dtype=real_type
+            ).to(device)
+        ))
+
+        if segment_type == "basal":
+            self.basal_connections = connections
+        else:
+            self.apical_connections = connections
+
+        return new_segments
+
+
+def run(tm_class, args):
+    generator = torch.Generator().manual_seed(args.seed)
+
+    num_cells = args.num_minicolumns * args.cells_per_minicolumn
+
+    tm = tm_class(
+        num_minicolumns=args.num_minicolumns,
+        num_cells_per_minicolumn=args.cells_per_minicolumn,
+        basal_input_size=num_cells,
+        activation_threshold=8,
+        reduced_basal_threshold=8,
+        matching_threshold=6,
+        sample_size=12,
+        max_segments_per_cell=args.max_segments_per_cell,
+        seed=args.seed,
+        sparse_connections=args.sparse,
+    )
+
+    sequences = [
+        [
+            torch.randperm(args.num_minicolumns, generator=generator)[:args.w]
+            for _ in range(args.sequence_length)
+        ]
+        for _ in range(args.num_sequences)
+    ]
+
+    basal_input = torch.empty(0, dtype=int_type)
+
+    window_start = time.perf_counter()
+    for step in range(1, args.steps + 1):
+        sequence = sequences[(step // args.sequence_length) % args.num_sequences]
+        minicolumns = sequence[step % args.sequence_length]
+
+        if step % args.sequence_length == 0:
+            tm.reset()
+            basal_input = torch.empty(0, dtype=int_type)
+
+        tm.compute(minicolumns, basal_input, learn=True)
+        basal_input = tm.get_active_cells()
+
+        if step % args.report_every == 0:
+            elapsed = time.perf_counter() - window_start
+            print(f"{tm_class.__name__:>24} {step:>10} "
+                  f"{args.report_every / elapsed:>10.1f} "
+                  f"{tm.basal_segments.num_segments():>10}", flush=True)
+            window_start = time.perf_counter()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=1000000)
+    parser.add_argument("--report-every", type=int, default=10000)
+    parser.add_argument("--num-minicolumns", type=int, default=256)
+    parser.add_argument("--cells-per-minicolumn", type=int, default=8)
+    parser.add_argument("--w", type=int, default=10,
+                        help="number of active minicolumns per step")
+    parser.add_argument("--num-sequences", type=int, default=100)
+    parser.add_argument("--sequence-length", type=int, default=10)
+    parser.add_argument("--sparse", action="store_true",
+                        help="use sparse connections")
+    parser.add_argument("--max-segments-per-cell", type=int, default=-1,
+                        help="replace the least recently active segment of cells "
+                             "that reach this number of segments")
+    parser.add_argument("--compare", action="store_true",
+                        help="also run the torch.cat reference implementation")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'implementation':>24} {'step':>10} {'steps/sec':>10} {'segments':>10}")
+
+    run(PairMemoryApicalTiebreak, args)
+    if args.compare:
+        run(CatPairMemory, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+compact checkpoint format for the htm models.
+
+a checkpoint file is laid out as:
+
+    magic (8 bytes) | header length (uint64) | JSON header | arrays
+
+the header holds the metadata and the state of the model: every attribute of the
+model (and of the htm objects it holds, e.g. segment pools) is stored in the header
+if it is a scalar, and in the array section otherwise. arrays are packed losslessly:
+
+- boolean arrays are stored as bits.
+- integer arrays are stored with the smallest integer type that holds their values.
+- float arrays that are mostly zeros (e.g. dense permanence matrices) are stored as
+  the flat indices and values of their nonzero elements.
+- float arrays with few distinct values (e.g. permanences, which move by fixed
+  increments) are stored as 8 or 16 bit codes into a table of their distinct
+  values. values are compared bitwise, so decoding is exact.
+
+arrays stored as is are aligned to 64 bytes, so they can be memory-mapped on load.
+packed arrays have to be decoded into memory, so memory-mapping a compact checkpoint
+gives little benefit: most of a trained model is in packed permanence and
+connection matrices. checkpoints saved with `mappable=True` store the arrays of at
+least MAPPABLE_NBYTES as is instead, so that loading with `mmap=True` maps them and
+only reads the pages that are used. such checkpoints are as large as the arrays of
+the model in memory: models with sparse synapse storage (the SpatialPooler with
+sparse_permanences, the TM with sparse_connections) keep their synapses in CSR-like
+index and value arrays, and are small and mappable.
+
+random generators are saved with their full state, so a loaded model continues
+exactly like the saved one.
+"""
+
+import importlib
+import json
+import struct
+
+import numpy as np
+import torch
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+MAGIC = b"HTMCKPT\x00"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# with mappable=True, arrays of at least this many bytes are stored as is
+MAPPABLE_NBYTES = 2 ** 16
+
+# only objects of classes defined in this package are saved attribute by attribute
+PACKAGE = __name__.rsplit(".", 1)[0]
+
+
+def save_checkpoint(obj, path, metadata=None, exclude=(), mappable=False):
+    """
+    save the state of `obj` (an htm model) to `path` (str).
+
+    `metadata` (dict or None) is stored in the header, see `load_metadata()`.
+    `exclude` lists attributes of `obj` that are not saved (e.g. views of other
+    attributes, which the model rebuilds on load).
+    with `mappable`, arrays of at least MAPPABLE_NBYTES are stored as is, so that
+    `load_checkpoint(path, mmap=True)` memory-maps them instead of decoding them.
+    """
+
+    encoder = _Encoder(mappable)
+    state = encoder.encode_object(obj, exclude)
+
+    header = json.dumps({
+        "metadata": {
+            "format_version": FORMAT_VERSION,
+            "class": _class_path(type(obj)),
+            "numpy_version": np.__version__,
+            "torch_version": torch.__version__,
+            **(metadata or {}),
+        },
+        "state": state,
+        "arrays": encoder.array_records,
+    }).encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(bytes(_padding(f.tell())))
+
+        for array in encoder.arrays:
+            f.write(bytes(_padding(f.tell())))
+            f.write(np.ascontiguousarray(array).tobytes())
+
+
+def load_checkpoint(path, cls=None, mmap=False):
+    """
+    load a model saved with `save_checkpoint()` from `path` (str).
+
+    `cls` (type or None) is the expected class of the model: a ValueError is raised
+    if the checkpoint holds another class.
+
+    with `mmap`, arrays stored as is are memory-mapped (copy-on-write) instead of
+    read, so they are only paged in when used. packed arrays are still decoded into
+    memory: save with `mappable=True` to store the large arrays as is. arrays
+    loaded as tensors on a GPU are copied to it.
+    """
+
+    header, data_offset = _read_header(path)
+
+    class_path = header["metadata"]["class"]
+    if cls is not None and class_path != _class_path(cls):
+        raise ValueError(f"{path} holds a {class_path}, not a {_class_path(cls)}")
+
+    decoder = _Decoder(path, data_offset, header["arrays"], mmap)
+
+    return decoder.decode(header["state"])
+
+
+def load_metadata(path):
+    """
+    return the metadata (dict) of the checkpoint at `path` (str), without loading
+    the model.
+    """
+
+    header, _ = _read_header(path)
+
+    return header["metadata"]
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an htm checkpoint")
+
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_length).decode("utf-8"))
+        data_offset = f.tell() + len(_padding(f.tell()))
+
+    if header["metadata"]["format_version"] > FORMAT_VERSION:
+        raise ValueError(f"{path} has an unsupported checkpoint format version")
+
+    return header, data_offset
+
+
+def _padding(position):
+    return bytes(-position % ALIGNMENT)
+
+
+def _class_path(cls):
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+class _Encoder():
+    """
+    encodes a model into a JSON-serializable tree, and the list of arrays it
+    references. values that are referenced more than once (e.g. a tensor held by two
+    attributes) are encoded once, so they are still shared after loading.
+    """
+
+    def __init__(self, mappable=False):
+        self.mappable = mappable
+
+        self.arrays = []
+        self.array_records = []
+
+        self.memo = {}
+
+        # keep the memoized values alive, so their ids are not reused
+        self.memo_values = []
+
+    def encode_object(self, obj, exclude=()):
+        # memoize before the attributes, for cyclic references
+        encoded = {
+            "type": "object",
+            "class": _class_path(type(obj)),
+            "id": self.memoize(obj),
+        }
+        encoded["state"] = {
+            name: self.encode(value)
+            for name, value in vars(obj).items() if name not in exclude
+        }
+
+        return encoded
+
+    def encode(self, value):
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return {"type": "value", "value": value}
+
+        if isinstance(value, np.generic):
+            return {"type": "numpy_scalar", "dtype": value.dtype.str,
+                    "value": value.item()}
+
+        if isinstance(value, torch.dtype):
+            return {"type": "torch_dtype", "name": str(value).split(".")[1]}
+
+        if isinstance(value, (list, tuple)):
+            return {"type": type(value).__name__,
+                    "items": [self.encode(item) for item in value]}
+
+        if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+            return {"type": "dict",
+                    "items": {k: self.encode(v) for k, v in value.items()}}
+
+        if id(value) in self.memo:
+            return {"type": "ref", "id": self.memo[id(value)]}
+
+        if isinstance(value, np.ndarray):
+            encoded = {"type": "ndarray", "array": self.encode_array(value)}
+        elif isinstance(value, torch.Tensor):
+            encoded = {"type": "tensor",
+                       "array": self.encode_array(value.detach().cpu().numpy())}
+        elif isinstance(value, np.random.Generator):
+            encoded = {"type": "numpy_generator",
+                       "state": value.bit_generator.state}
+        elif isinstance(value, torch.Generator):
+            encoded = {"type": "torch_generator",
+                       "default": value is torch.default_generator,
+                       "state": self.encode_array(value.get_state().numpy())}
+        elif type(value).__module__.startswith(PACKAGE):
+            return self.encode_object(value)
+        else:
+            raise TypeError(f"cannot save a {type(value).__name__} in a checkpoint")
+
+        encoded["id"] = self.memoize(value)
+
+        return encoded
+
+    def memoize(self, value):
+        self.memo[id(value)] = len(self.memo)
+        self.memo_values.append(value)
+
+        return self.memo[id(value)]
+
+    def encode_array(self, array):
+        record = {"dtype": array.dtype.str, "shape": list(array.shape)}
+
+        if self.mappable and array.nbytes >= MAPPABLE_NBYTES:
+            record.update(encoding="raw", data=self.add_array(array))
+
+        elif array.dtype == np.bool_:
+            record.update(encoding="bits",
+                          data=self.add_array(np.packbits(array.ravel())))
+
+        elif np.issubdtype(array.dtype, np.integer) and array.size > 0:
+            dtype = _smallest_int_type(array.min(), array.max())
+            if dtype.itemsize < array.dtype.itemsize:
+                record.update(encoding="int", data=self.add_array(array.astype(dtype)))
+            else:
+                record.update(encoding="raw", data=self.add_array(array))
+
+        elif np.issubdtype(array.dtype, np.floating) and array.size > 0:
+            flat = array.ravel()
+            nonzero = np.flatnonzero(flat)
+
+            if nonzero.size < flat.size // 4:
+                record.update(encoding="sparse",
+                              index=self.encode_array(nonzero),
+                              values=self.encode_array(flat[nonzero]))
+            else:
+                # compare bit patterns, so that e.g. -0.0 and 0.0 stay distinct
+                bits = flat.view(f"u{array.dtype.itemsize}")
+                table, codes = np.unique(bits, return_inverse=True)
+
+                if table.size <= 2 ** 16 and array.dtype.itemsize > 2:
+                    code_type = np.uint8 if table.size <= 2 ** 8 else np.uint16
+                    record.update(encoding="table",
+                                  table=self.add_array(table.view(array.dtype)),
+                                  codes=self.add_array(codes.astype(code_type)))
+                else:
+                    record.update(encoding="raw", data=self.add_array(array))
+
+        else:
+            record.update(encoding="raw", data=self.add_array(array))
+
+        return record
+
+    def add_array(self, array):
+        offset = 0
+        if self.array_records:
+            last = self.array_records[-1]
+            offset = last["offset"] + last["nbytes"]
+            offset += -offset % ALIGNMENT
+
+        self.arrays.append(array)
+        self.array_records.append({
+            "offset": offset,
+            "nbytes": array.nbytes,
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+        })
+
+        return len(self.arrays) - 1
+
+
+class _Decoder():
+
+    def __init__(self, path, data_offset, array_records, mmap):
+        self.path = path
+        self.data_offset = data_offset
+        self.array_records = array_records
+        self.mmap = mmap
+
+        self.memo = {}
+
+    def decode(self, encoded):
+        kind = encoded["type"]
+
+        if kind == "value":
+            return encoded["value"]
+        if kind == "numpy_scalar":
+            return np.dtype(encoded["dtype"]).type(encoded["value"])
+        if kind == "torch_dtype":
+            return getattr(torch, encoded["name"])
+        if kind == "list":
+            return [self.decode(item) for item in encoded["items"]]
+        if kind == "tuple":
+            return tuple(self.decode(item) for item in encoded["items"])
+        if kind == "dict":
+            return {k: self.decode(v) for k, v in encoded["items"].items()}
+        if kind == "ref":
+            return self.memo[encoded["id"]]
+
+        if kind == "ndarray":
+            value = self.decode_array(encoded["array"])
+        elif kind == "tensor":
+            value = torch.from_numpy(self.decode_array(encoded["array"])).to(device)
+        elif kind == "numpy_generator":
+            state = encoded["state"]
+            value = np.random.Generator(
+                getattr(np.random, state["bit_generator"])()
+            )
+            value.bit_generator.state = state
+        elif kind == "torch_generator":
+            if encoded["default"]:
+                value = torch.default_generator
+            else:
+                value = torch.Generator()
+            value.set_state(torch.from_numpy(self.decode_array(encoded["state"])))
+        elif kind == "object":
+            module_name, class_name = encoded["class"].split(":")
+            if not module_name.startswith(PACKAGE):
+                raise ValueError(f"cannot load a {encoded['class']} from a checkpoint")
+
+            cls = getattr(importlib.import_module(module_name), class_name)
+            value = cls.__new__(cls)
+
+            # register before decoding the attributes, for cyclic references
+            self.memo[encoded["id"]] = value
+            for name, attribute in encoded["state"].items():
+                setattr(value, name, self.decode(attribute))
+        else:
+            raise ValueError(f"unknown checkpoint entry {kind}")
+
+        self.memo[encoded["id"]] = value
+
+        return value
+
+    def decode_array(self, record):
+        dtype = np.dtype(record["dtype"])
+        shape = tuple(record["shape"])
+        encoding = record["encoding"]
+
+        if encoding == "raw":
+            return self.read_array(record["data"], mmap=self.mmap)
+
+        if encoding == "bits":
+            bits = self.read_array(record["data"])
+            size = int(np.prod(shape))
+            return np.unpackbits(bits, count=size).astype(np.bool_).reshape(shape)
+
+        if encoding == "int":
+            return self.read_array(record["data"]).astype(dtype).reshape(shape)
+
+        if encoding == "sparse":
+            array = np.zeros(int(np.prod(shape)), dtype=dtype)
+            array[self.decode_array(record["index"])] = self.decode_array(
+                record["values"]
+            )
+            return array.reshape(shape)
+
+        if encoding == "table":
+            table = self.read_array(record["table"])
+            codes = self.read_array(record["codes"])
+            return table[codes].reshape(shape)
+
+        raise ValueError(f"unknown array encoding {encoding}")
+
+    def read_array(self, index, mmap=False):
+        record = self.array_records[index]
+        dtype = np.dtype(record["dtype"])
+        shape = tuple(record["shape"])
+
+        if record["nbytes"] == 0:
+            return np.empty(shape, dtype=dtype)
+
+        offset = self.data_offset + record["offset"]
+
+        if mmap:
+            return np.memmap(self.path, dtype=dtype, mode="c", offset=offset,
+                             shape=shape)
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return np.fromfile(f, dtype=dtype,
+                               count=int(np.prod(shape))).reshape(shape)
+
+
+def _smallest_int_type(low, high):
+    for dtype in (np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+
+    return np.dtype(np.int64)
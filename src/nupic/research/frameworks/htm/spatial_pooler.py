@@ -19,10 +19,10 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
-import itertools
-
 import numpy as np
 
+from .checkpoint import load_checkpoint, save_checkpoint
+
 real_type = np.float32
 uint_type = np.uint32
 
@@ -55,6 +55,7 @@ class SpatialPooler:
         duty_cycle_period=1000,
         boost_strength=0.0,
         seed=-1,
+        sparse_permanences=False,
     ):
         """
         input_dims:                         dimensions of input vector.
@@ -180,6 +181,18 @@ class SpatialPooler:
                                             default ``0.0``.
 
         seed:                               seed for numpy random generator.
+
+        sparse_permanences:                 if True, only the synapses in each
+                                            minicolumn's potential pool are stored,
+                                            in a compressed sparse row (CSR) layout,
+                                            instead of dense (# of minicolumns) x
+                                            (# of inputs) matrices. memory then scales
+                                            with the size of the potential pools
+                                            rather than with the size of the input.
+                                            dense views of the potential pools,
+                                            permanences and connected synapses are
+                                            still available through the getters.
+                                            default ``False``.
         """
 
         # controls # of minicolumns that are on within a local inhibition area
@@ -280,23 +293,79 @@ class SpatialPooler:
         #
         # - connected_synapse_counts[i] shows the number of connected synapses for
         #   minicolumn "i".
-        self.potential_pools = np.zeros((self.num_minicolumns, self.num_inputs),
-                                        dtype=np.bool_)
+        #
+        # with sparse_permanences, the dense matrices above are not allocated. instead,
+        # the synapses of minicolumn "i" are stored in positions
+        # potential_offsets[i]:potential_offsets[i + 1] of the following arrays:
+        #
+        # - potential_indices: input bit of each potential synapse (sorted per
+        #   minicolumn).
+        #
+        # - potential_minicolumns: minicolumn of each potential synapse.
+        #
+        # - potential_permanences: permanence of each potential synapse.
+        #
+        # - potential_connected: whether each potential synapse is connected.
+        self.sparse_permanences = sparse_permanences
 
-        self.permanences = np.zeros((self.num_minicolumns, self.num_inputs),
-                                    dtype=real_type)
+        potential_indices = []
+        initial_permanences = []
+        for minicolumn_index in range(self.num_minicolumns):
+            indices = self.map_potential_indices(minicolumn_index)
+            potential_indices.append(indices)
+            initial_permanences.append(self.init_permanence_values(indices.size))
 
-        self.connected_synapses = np.zeros((self.num_minicolumns, self.num_inputs),
-                                           dtype=np.bool_)
+        pool_sizes = np.array([indices.size for indices in potential_indices])
 
-        self.connected_synapses_counts = np.zeros(self.num_minicolumns, dtype=real_type)
+        potential_offsets = np.zeros(self.num_minicolumns + 1, dtype=np.int64)
+        np.cumsum(pool_sizes, out=potential_offsets[1:])
 
-        for minicolumn_index in range(self.num_minicolumns):
-            potential = self.map_potential(minicolumn_index)
-            self.potential_pools[minicolumn_index, potential.nonzero()[0]] = 1
-            permanence = self.init_permanence(potential)
-            self.update_permanences_for_minicolumn(permanence, minicolumn_index,
-                                                   raise_perm=True)
+        potential_indices = np.concatenate(potential_indices).astype(uint_type)
+        potential_minicolumns = np.repeat(
+            np.arange(self.num_minicolumns, dtype=uint_type), pool_sizes
+        )
+
+        # raise, trim and clip the initial permanences of all minicolumns at once
+        potential_permanences = np.concatenate(initial_permanences)
+        potential_connected = self.init_connected_synapses(potential_permanences,
+                                                           potential_offsets)
+
+        self.connected_synapses_counts = np.bincount(
+            potential_minicolumns, weights=potential_connected,
+            minlength=self.num_minicolumns
+        ).astype(real_type)
+
+        if self.sparse_permanences:
+            self.potential_pools = None
+            self.permanences = None
+            self.connected_synapses = None
+
+            self.potential_offsets = potential_offsets
+            self.potential_indices = potential_indices
+            self.potential_minicolumns = potential_minicolumns
+            self.potential_permanences = potential_permanences
+            self.potential_connected = potential_connected
+        else:
+            self.potential_pools = np.zeros((self.num_minicolumns, self.num_inputs),
+                                            dtype=np.bool_)
+
+            self.permanences = np.zeros((self.num_minicolumns, self.num_inputs),
+                                        dtype=real_type)
+
+            self.connected_synapses = np.zeros(
+                (self.num_minicolumns, self.num_inputs), dtype=np.bool_
+            )
+
+            self.potential_pools[potential_minicolumns, potential_indices] = 1
+            self.permanences[potential_minicolumns,
+                             potential_indices] = potential_permanences
+            self.connected_synapses[potential_minicolumns,
+                                    potential_indices] = potential_connected
+
+        # neighborhood index table used by local inhibition, rebuilt whenever the
+        # inhibition radius changes
+        self.minicolumn_neighborhoods = None
+        self.minicolumn_neighborhoods_key = None
 
         self.inhibition_radius = 0
         self.update_inhibition_radius()
@@ -350,6 +419,70 @@ class SpatialPooler:
         active_array.fill(0)
         active_array[active_minicolumns] = 1
 
+    def compute_batch(self, input_vectors, learn=False):
+        """
+        batched version of compute. takes a 2D np.array of N input vectors (one per
+        row) and returns an [N, num_minicolumns] array populated with 1's at the
+        indices of the active minicolumns of each input and 0's everywhere else.
+
+        overlaps for the whole batch are computed with a single matrix product, and
+        global inhibition is performed with a vectorized top-k that selects the same
+        winners as inhibit_minicolumns_global. with learn=False, the output is
+        identical to calling compute on each input vector in turn.
+
+        with learn=True, the batch is treated as a single learning step:
+
+            - every input in the batch is pooled with the permanences and boost
+              factors as they were at the start of the batch.
+            - permanence changes of all inputs are summed per minicolumn and applied
+              once, followed by a single clip / trim / raise-to-threshold pass.
+            - duty cycles are updated as if the inputs were presented one at a time.
+            - weak minicolumns are bumped up and boost factors are updated once, at
+              the end of the batch. the inhibition radius and minimum duty cycles are
+              updated if the batch crosses a multiple of update_period.
+
+        learning on a batch of size 1 is therefore equivalent to calling compute.
+        """
+
+        input_vectors = np.array(input_vectors, dtype=real_type, ndmin=2)
+        input_vectors = input_vectors.reshape(input_vectors.shape[0], -1)
+
+        assert input_vectors.shape[1] == self.num_inputs
+
+        num_vectors = input_vectors.shape[0]
+
+        start_iteration_num = self.iteration_num
+        self.iteration_num += num_vectors
+        if learn:
+            self.iteration_learn_num += num_vectors
+
+        overlaps = self.calculate_overlap_batch(input_vectors)
+
+        # apply boosting when learning is on
+        if learn:
+            boosted_overlaps = self.boost_factors * overlaps
+        else:
+            boosted_overlaps = overlaps
+
+        active_arrays = self.inhibit_minicolumns_batch(boosted_overlaps)
+
+        if num_vectors > 0:
+            self.overlaps = overlaps[-1]
+            self.boosted_overlaps = boosted_overlaps[-1]
+
+        if learn:
+            self.adapt_synapses_batch(input_vectors, active_arrays)
+            self.update_duty_cycles_batch(overlaps, active_arrays, start_iteration_num)
+            self.bump_up_weak_minicolumns()
+            self.update_boost_factors()
+
+            if (self.iteration_num // self.update_period
+                    > start_iteration_num // self.update_period):
+                self.update_inhibition_radius()
+                self.update_min_duty_cycles()
+
+        return active_arrays.astype(uint_type)
+
     def map_potential(self, index):
         """
         maps minicolumn to input bits.
@@ -361,6 +494,17 @@ class SpatialPooler:
         if the potential radius is greater than or equal to the largest input dimension,
         then each minicolumn connects to all of the inputs.
         """
+        potential = np.zeros(self.num_inputs, dtype=uint_type)
+        potential[self.map_potential_indices(index)] = 1
+
+        return potential
+
+    def map_potential_indices(self, index):
+        """
+        same as map_potential, but returns the sorted indices of the input bits in the
+        minicolumn's potential pool instead of a dense array.
+        """
+
         center_input = self.map_minicolumn(index)
         minicolumn_inputs = self.get_input_neighborhood(center_input).astype(uint_type)
 
@@ -370,10 +514,7 @@ class SpatialPooler:
         selected_inputs = self.generator.choice(minicolumn_inputs, size=num_potential,
                                                 replace=False).astype(uint_type)
 
-        potential = np.zeros(self.num_inputs, dtype=uint_type)
-        potential[selected_inputs] = 1
-
-        return potential
+        return np.sort(selected_inputs)
 
     def map_minicolumn(self, index):
         """
@@ -431,11 +572,55 @@ class SpatialPooler:
         for i, dimension in enumerate(dimensions):
             left = max(0, center_position[i] - radius)
             right = min(dimension - 1, center_position[i] + radius)
-            intervals.append(range(left, right + 1))
+            intervals.append(np.arange(left, right + 1))
+
+        # coordinates are enumerated in lexicographic order
+        coordinates = np.meshgrid(*intervals, indexing="ij")
+
+        return np.ravel_multi_index(coordinates, dimensions).reshape(-1)
 
-        coordinates = np.array(list(itertools.product(*intervals)))
+    def get_minicolumn_neighborhoods(self):
+        """
+        returns a table of the neighborhoods of all minicolumns for the current
+        inhibition radius. row "i" lists the minicolumns in the neighborhood of
+        minicolumn "i" (same set as get_minicolumn_neighborhood(i)), padded with the
+        out-of-range index num_minicolumns. also returns the size of each neighborhood.
+
+        the table is cached until the inhibition radius or minicolumn dimensions
+        change.
+        """
 
-        return np.ravel_multi_index(coordinates.T, dimensions)
+        dimensions = np.array(self.minicolumn_dims, ndmin=1)
+        radius = self.inhibition_radius
+        key = (radius, tuple(dimensions), self.num_minicolumns)
+
+        if self.minicolumn_neighborhoods_key != key:
+            coordinates = np.stack(
+                np.unravel_index(np.arange(self.num_minicolumns), dimensions), axis=1
+            )
+
+            offsets = np.stack(
+                np.meshgrid(*([np.arange(-radius, radius + 1)] * dimensions.size),
+                            indexing="ij"),
+                axis=-1
+            ).reshape(-1, dimensions.size)
+
+            # coordinates of every hypercube point around every minicolumn
+            positions = coordinates[:, np.newaxis, :] + offsets[np.newaxis, :, :]
+            valid = ((positions >= 0) & (positions < dimensions)).all(axis=2)
+
+            neighborhoods = np.ravel_multi_index(
+                np.moveaxis(positions, 2, 0), dimensions, mode="clip"
+            )
+            neighborhoods[~valid] = self.num_minicolumns
+
+            # drop hypercube points that are outside of every neighborhood
+            neighborhoods = neighborhoods[:, valid.any(axis=0)]
+
+            self.minicolumn_neighborhoods = (neighborhoods, valid.sum(axis=1))
+            self.minicolumn_neighborhoods_key = key
+
+        return self.minicolumn_neighborhoods
 
     def update_inhibition_radius(self):
         """
@@ -454,12 +639,7 @@ class SpatialPooler:
             return
 
         # how many inputs a minicolumn is connected to on average
-        average_connected_span = np.average(
-            [
-                self.average_connected_synapses_per_minicolumn(m)
-                for m in range(self.num_minicolumns)
-            ]
-        )
+        average_connected_span = self.average_connected_span()
 
         # how many minicolumns exist for each input on average
         minicolumns_per_input = self.average_minicolumns_per_input()
@@ -470,28 +650,39 @@ class SpatialPooler:
 
         self.inhibition_radius = int(radius + 0.5)
 
+    def average_connected_span(self):
+        """
+        average_connected_synapses_per_minicolumn, averaged over all minicolumns.
+        """
+
+        return np.average(
+            [
+                self.average_connected_synapses_per_minicolumn(m)
+                for m in range(self.num_minicolumns)
+            ]
+        )
+
     def average_connected_synapses_per_minicolumn(self, minicolumn_index):
         """
         range of connected synapses per minicolumn, averaged for each dimension. value
         is used to calculate the inhibition radius.
         """
 
-        connected = self.connected_synapses[minicolumn_index, :].nonzero()[0]
+        if self.sparse_permanences:
+            synapses = self.potential_slice(minicolumn_index)
+            connected = self.potential_indices[synapses][
+                self.potential_connected[synapses]
+            ]
+        else:
+            connected = self.connected_synapses[minicolumn_index, :].nonzero()[0]
 
         if connected.size == 0:
             return 0
         else:
-            min_coordinate = np.empty(self.input_dims.size)
-            max_coordinate = np.empty(self.input_dims.size)
-
-            min_coordinate.fill(max(self.input_dims))
-            max_coordinate.fill(-1)
+            coordinates = np.array(np.unravel_index(connected, self.input_dims))
 
-            for i in connected:
-                min_coordinate = np.minimum(min_coordinate,
-                                            np.unravel_index(i, self.input_dims))
-                max_coordinate = np.maximum(max_coordinate,
-                                            np.unravel_index(i, self.input_dims))
+            min_coordinate = coordinates.min(axis=1).astype(float)
+            max_coordinate = coordinates.max(axis=1).astype(float)
 
             return np.average(max_coordinate - min_coordinate + 1)
 
@@ -526,35 +717,86 @@ class SpatialPooler:
 
         permanence = np.zeros(self.num_inputs, dtype=real_type)
 
-        for i in range(self.num_inputs):
-            if potential[i] < 1:
-                continue
+        potential_indices = np.nonzero(np.asarray(potential)[: self.num_inputs] >= 1)[0]
+        permanence[potential_indices] = self.init_permanence_values(
+            potential_indices.size
+        )
 
-            if self.generator.random() <= self.init_connected_percent:
-                # initialize connected permanence by using a a randomly generated
-                # permanence value that is close to synapse_perm_connected
+        return permanence
 
-                p = (
-                    self.synapse_perm_connected
-                    + (self.synapse_perm_max - self.synapse_perm_connected)
-                    * self.generator.random()
-                )
-                p = int(p * 100000) / 100000.0
+    def init_permanence_values(self, num_potential):
+        """
+        initial permanence values for the num_potential input bits of a potential pool,
+        in increasing order of input index. draws two random numbers per input bit, in
+        the same order as the per-bit initialization:
 
-                permanence[i] = p
-            else:
-                # initialize unconnected permanence
+            - first decides whether the synapse starts connected.
+            - second sets its permanence, close to synapse_perm_connected when
+              connected and below it otherwise.
+        """
 
-                p = self.synapse_perm_connected * self.generator.random()
-                p = int(p * 100000) / 100000.0
+        draws = self.generator.random((num_potential, 2))
 
-                permanence[i] = p
+        permanence = np.where(
+            draws[:, 0] <= self.init_connected_percent,
+            # initialize connected permanence by using a a randomly generated
+            # permanence value that is close to synapse_perm_connected
+            self.synapse_perm_connected
+            + (self.synapse_perm_max - self.synapse_perm_connected) * draws[:, 1],
+            # initialize unconnected permanence
+            self.synapse_perm_connected * draws[:, 1]
+        )
+        permanence = ((permanence * 100000).astype(np.int64) / 100000.0).astype(
+            real_type
+        )
 
         # clip off low values
         permanence[permanence < self.synapse_perm_trim_threshold] = 0
 
         return permanence
 
+    def init_connected_synapses(self, potential_permanences, potential_offsets):
+        """
+        applies update_permanences_for_minicolumn (with raise_perm=True) to the
+        initial permanences of all minicolumns at once. potential_permanences holds
+        the permanences of every minicolumn's potential pool, with minicolumn "i" in
+        positions potential_offsets[i]:potential_offsets[i + 1]. modified in place.
+
+        returns a boolean array marking which of the synapses are connected.
+        """
+
+        pool_sizes = np.diff(potential_offsets)
+        assert (pool_sizes >= self.stimulus_threshold).all()
+
+        np.clip(potential_permanences, self.synapse_perm_min, self.synapse_perm_max,
+                out=potential_permanences)
+
+        num_connected = np.add.reduceat(
+            np.append(potential_permanences
+                      > (self.synapse_perm_connected - self.permanence_epsilon), 0),
+            potential_offsets[:-1]
+        )
+        num_connected[pool_sizes == 0] = 0
+
+        # only few minicolumns (if any) need their permanences raised
+        for minicolumn_index in np.where(num_connected < self.stimulus_threshold)[0]:
+            permanence = potential_permanences[
+                potential_offsets[minicolumn_index]:
+                potential_offsets[minicolumn_index + 1]
+            ]
+            self.raise_permanence_to_threshold(permanence, np.arange(permanence.size))
+
+        potential_permanences[
+            potential_permanences < self.synapse_perm_trim_threshold
+        ] = 0
+
+        np.clip(potential_permanences, self.synapse_perm_min, self.synapse_perm_max,
+                out=potential_permanences)
+
+        return potential_permanences >= (
+            self.synapse_perm_connected - self.permanence_epsilon
+        )
+
     def update_permanences_for_minicolumn(self, permanence, minicolumn_index,
                                           raise_perm=True):
         """
@@ -591,6 +833,43 @@ class SpatialPooler:
         self.connected_synapses[minicolumn_index, new_connected] = 1
         self.connected_synapses_counts[minicolumn_index] = new_connected.size
 
+    def update_sparse_permanences_for_minicolumn(self, permanence, minicolumn_index,
+                                                 raise_perm=True):
+        """
+        sparse_permanences version of update_permanences_for_minicolumn.
+
+        permanence holds the permanence values of the minicolumn's potential pool
+        only, in the order of its potential_indices.
+        """
+
+        if raise_perm:
+            self.raise_permanence_to_threshold(permanence,
+                                               np.arange(permanence.size))
+
+        permanence[permanence < self.synapse_perm_trim_threshold] = 0
+
+        np.clip(permanence, self.synapse_perm_min, self.synapse_perm_max,
+                out=permanence)
+
+        synapses = self.potential_slice(minicolumn_index)
+        self.potential_permanences[synapses] = permanence
+
+        new_connected = permanence >= (
+            self.synapse_perm_connected - self.permanence_epsilon
+        )
+
+        self.potential_connected[synapses] = new_connected
+        self.connected_synapses_counts[minicolumn_index] = new_connected.sum()
+
+    def potential_slice(self, minicolumn_index):
+        """
+        with sparse_permanences, positions of a minicolumn's potential synapses in the
+        potential_* arrays.
+        """
+
+        return slice(self.potential_offsets[minicolumn_index],
+                     self.potential_offsets[minicolumn_index + 1])
+
     def raise_permanence_to_threshold(self, permanence, mask_potential):
         """
         ensures that each minicolumn has enough connections to input bits to allow it to
@@ -626,6 +905,9 @@ class SpatialPooler:
         minicolumn is the # of connected synapses to input bits which are turned on.
         """
 
+        if self.sparse_permanences:
+            return self.calculate_sparse_overlap(input_vector)
+
         overlaps = np.zeros(self.num_minicolumns, dtype=real_type)
 
         for m in range(self.num_minicolumns):
@@ -633,14 +915,39 @@ class SpatialPooler:
 
         return overlaps
 
-    def inhibit_minicolumns(self, overlaps):
+    def calculate_overlap_batch(self, input_vectors):
+        """
+        determines each minicolumn's overlap with each of the input vectors (rows of
+        input_vectors). returns an [N, num_minicolumns] array.
         """
-        performs inhibition. calculates the necessary values needed to actually perform
-        inhibition (either global or local inhibition).
 
-        takes in overlaps, which is an array containing overlap score for each
-        minicolumn. overlap score for a minicolumn = number of connected synapses to
-        input bits which are turned on.
+        if self.sparse_permanences:
+            overlaps = np.zeros((input_vectors.shape[0], self.num_minicolumns),
+                                dtype=real_type)
+            for i, input_vector in enumerate(input_vectors):
+                overlaps[i] = self.calculate_sparse_overlap(input_vector)
+
+            return overlaps
+
+        return (input_vectors @ self.connected_synapses.T.astype(real_type)).astype(
+            real_type
+        )
+
+    def calculate_sparse_overlap(self, input_vector):
+        """
+        sparse_permanences version of calculate_overlap. only visits the connected
+        synapses in the potential pools.
+        """
+
+        return np.bincount(
+            self.potential_minicolumns[self.potential_connected],
+            weights=input_vector[self.potential_indices[self.potential_connected]],
+            minlength=self.num_minicolumns
+        ).astype(real_type)
+
+    def get_inhibition_density(self):
+        """
+        desired density of active minicolumns within an inhibition area.
         """
 
         if self.local_density > 0:
@@ -654,11 +961,66 @@ class SpatialPooler:
             density = float(self.active_minicolumns_per_inh_area) / inhibition_area
             density = min(density, 0.5)
 
+        return density
+
+    def inhibit_minicolumns(self, overlaps):
+        """
+        performs inhibition. calculates the necessary values needed to actually perform
+        inhibition (either global or local inhibition).
+
+        takes in overlaps, which is an array containing overlap score for each
+        minicolumn. overlap score for a minicolumn = number of connected synapses to
+        input bits which are turned on.
+        """
+
+        density = self.get_inhibition_density()
+
         if self.global_inhibition or self.inhibition_radius > max(self.minicolumn_dims):
             return self.inhibit_minicolumns_global(overlaps, density)
         else:
             return self.inhibit_minicolumns_local(overlaps, density)
 
+    def inhibit_minicolumns_batch(self, overlaps):
+        """
+        performs inhibition on an [N, num_minicolumns] array of overlaps. returns a
+        boolean array of the same shape marking the winning minicolumns of each row.
+        """
+
+        density = self.get_inhibition_density()
+
+        if self.global_inhibition or self.inhibition_radius > max(self.minicolumn_dims):
+            return self.inhibit_minicolumns_global_batch(overlaps, density)
+
+        active_arrays = np.zeros(overlaps.shape, dtype=np.bool_)
+        for i, row_overlaps in enumerate(overlaps):
+            active_arrays[i, self.inhibit_minicolumns_local(row_overlaps, density)] = 1
+
+        return active_arrays
+
+    def inhibit_minicolumns_global_batch(self, overlaps, density):
+        """
+        vectorized global inhibition over the rows of an [N, num_minicolumns] array of
+        overlaps. picks the same winners as inhibit_minicolumns_global: the top
+        num_active minicolumns of a stable ascending sort, excluding those below the
+        stimulus_threshold.
+        """
+
+        num_active = int(density * self.num_minicolumns)
+
+        active_arrays = np.zeros(overlaps.shape, dtype=np.bool_)
+        if num_active <= 0:
+            return active_arrays
+
+        # last num_active entries of a stable ascending sort. ties are won by the
+        # minicolumn with the higher index, same as in the single-input path.
+        winners = np.argsort(overlaps, axis=1, kind="mergesort")[:, -num_active:]
+        winner_overlaps = np.take_along_axis(overlaps, winners, axis=1)
+
+        np.put_along_axis(active_arrays, winners,
+                          winner_overlaps >= self.stimulus_threshold, axis=1)
+
+        return active_arrays
+
     def inhibit_minicolumns_global(self, overlaps, density):
         """
         global inhibition -- pick the top num_active minicolumns with the highest
@@ -698,31 +1060,45 @@ class SpatialPooler:
         inhibited.
         """
 
-        active_array = np.zeros(self.num_minicolumns, dtype=np.bool_)
+        neighborhoods, neighborhood_sizes = self.get_minicolumn_neighborhoods()
+        minicolumns = np.arange(self.num_minicolumns)
 
-        for minicolumn, overlap in enumerate(overlaps):
-            if overlap >= self.stimulus_threshold:
-                neighborhood = self.get_minicolumn_neighborhood(minicolumn)
+        # neighborhood overlaps, with -inf for the padding entries
+        overlaps = np.append(np.asarray(overlaps, dtype=np.float64), -np.inf)
+        neighborhood_overlaps = overlaps[neighborhoods]
+        overlaps = overlaps[:-1, np.newaxis]
 
-                neighborhood_overlaps = overlaps[neighborhood]
+        # # of neighbors with overlap value greater than current minicolumn
+        num_bigger = np.count_nonzero(neighborhood_overlaps > overlaps, axis=1)
 
-                # # of neighbors with overlap value greater than current minicolumn
-                num_bigger = np.count_nonzero(neighborhood_overlaps > overlap)
+        # when there is a tie (neighboring minicolumns have same overlap as current
+        # minicolumn), favor neighbors already selected as active. minicolumns are
+        # visited in increasing order, so only neighbors with a lower index can have
+        # been selected.
+        tied_neighbors = (neighborhood_overlaps == overlaps) & (
+            neighborhoods < minicolumns[:, np.newaxis]
+        )
+        num_ties = np.count_nonzero(tied_neighbors, axis=1)
 
-                # when there is a tie (neighboring minicolumns have same overlap as
-                # current minicolumn), favor neighbors already selected as active
-                tied_neighbors = neighborhood[
-                    np.where(neighborhood_overlaps == overlap)
-                ]
-                num_ties_lost = np.count_nonzero(active_array[tied_neighbors])
+        # maximum number of active minicolumns in neighborhood
+        num_active = (0.5 + density * neighborhood_sizes).astype(int)
 
-                # maximum number of active minicolumns in neighborhood
-                num_active = int(0.5 + density * len(neighborhood))
+        overlaps = overlaps[:, 0]
+        candidates = overlaps >= self.stimulus_threshold
 
-                # activate current minicolumn if enough neighbors aren't "better"
-                # (better = higher overlap or same overlap value but already active)
-                if (num_bigger + num_ties_lost) < num_active:
-                    active_array[minicolumn] = True
+        # activate minicolumns that win even if they lose every tie
+        active_array = candidates & ((num_bigger + num_ties) < num_active)
+
+        # minicolumns whose outcome depends on the tied neighbors that were selected
+        # before them are resolved in order
+        undecided = candidates & ~active_array & (num_bigger < num_active)
+        for minicolumn in np.where(undecided)[0]:
+            num_ties_lost = np.count_nonzero(
+                active_array[neighborhoods[minicolumn, tied_neighbors[minicolumn]]]
+            )
+            active_array[minicolumn] = (
+                num_bigger[minicolumn] + num_ties_lost
+            ) < num_active[minicolumn]
 
         return active_array.nonzero()[0]
 
@@ -745,6 +1121,15 @@ class SpatialPooler:
         permanence_changes[input_indices] = self.synapse_perm_inc
 
         for minicolumn_index in active_minicolumns:
+            if self.sparse_permanences:
+                synapses = self.potential_slice(minicolumn_index)
+                permanence = self.potential_permanences[synapses].copy()
+                permanence += permanence_changes[self.potential_indices[synapses]]
+                self.update_sparse_permanences_for_minicolumn(
+                    permanence, minicolumn_index, raise_perm=True
+                )
+                continue
+
             # find synaptic permanences for all input bits of current minicolumn
             permanence = self.permanences[minicolumn_index, :]
 
@@ -759,6 +1144,75 @@ class SpatialPooler:
             self.update_permanences_for_minicolumn(permanence, minicolumn_index,
                                                    raise_perm=True)
 
+    def adapt_synapses_batch(self, input_vectors, active_arrays):
+        """
+        batched version of adapt_synapses. the permanence changes caused by every
+        (input vector, active minicolumns) pair in the batch are summed per minicolumn
+        and applied in one update.
+
+        active_arrays is a boolean [N, num_minicolumns] array of winning minicolumns.
+        """
+
+        # for input bits that are on, increase synaptic permanence. for inputs bits that
+        # are off, decrease synaptic permanence. changes are computed from the number
+        # of times each input bit was on / off while a minicolumn was active, so the
+        # result does not depend on the order of summation.
+        active_arrays = active_arrays.astype(real_type)
+        inputs_on = (input_vectors > 0).astype(real_type)
+        num_active = active_arrays.sum(axis=0)
+
+        def permanence_changes(num_on, num_active):
+            return (num_on * real_type(self.synapse_perm_inc)
+                    - (num_active - num_on) * real_type(self.synapse_perm_dec))
+
+        if self.sparse_permanences:
+            for minicolumn_index in np.where(num_active > 0)[0]:
+                synapses = self.potential_slice(minicolumn_index)
+                num_on = active_arrays[:, minicolumn_index] @ inputs_on[
+                    :, self.potential_indices[synapses]
+                ]
+
+                permanence = self.potential_permanences[synapses].copy()
+                permanence += permanence_changes(num_on, num_active[minicolumn_index])
+
+                self.update_sparse_permanences_for_minicolumn(
+                    permanence, minicolumn_index, raise_perm=True
+                )
+            return
+
+        num_on = active_arrays.T @ inputs_on
+
+        for minicolumn_index in np.where(num_active > 0)[0]:
+            permanence = self.permanences[minicolumn_index, :]
+
+            mask_potential = np.where(self.potential_pools[minicolumn_index, :] > 0)[0]
+
+            permanence[mask_potential] += permanence_changes(
+                num_on[minicolumn_index, mask_potential], num_active[minicolumn_index]
+            )
+
+            self.update_permanences_for_minicolumn(permanence, minicolumn_index,
+                                                   raise_perm=True)
+
+    def update_duty_cycles_batch(self, overlaps, active_arrays, start_iteration_num):
+        """
+        batched version of update_duty_cycles. applies the moving average update for
+        each row of overlaps / active_arrays in order, as if the inputs had been
+        presented one at a time starting after iteration start_iteration_num.
+        """
+
+        for i, (overlap, active) in enumerate(zip(overlaps, active_arrays)):
+            period = min(self.duty_cycle_period, start_iteration_num + i + 1)
+            assert period >= 1
+
+            self.overlap_duty_cycles = (
+                self.overlap_duty_cycles * (period - 1.0) + (overlap > 0)
+            ).astype(real_type) / period
+
+            self.active_duty_cycles = (
+                self.active_duty_cycles * (period - 1.0) + active
+            ).astype(real_type) / period
+
     def update_duty_cycles(self, overlaps, active_minicolumns):
         """
         updates the duty cycles for each minicolumn.
@@ -802,6 +1256,15 @@ class SpatialPooler:
         )[0]
 
         for minicolumn_index in weak_minicolumns:
+            if self.sparse_permanences:
+                synapses = self.potential_slice(minicolumn_index)
+                permanence = self.potential_permanences[synapses].copy()
+                permanence += self.synapse_perm_below_stimulus_inc
+                self.update_sparse_permanences_for_minicolumn(
+                    permanence, minicolumn_index, raise_perm=False
+                )
+                continue
+
             # find synaptic permanences for all input bits of current minicolumn
             permanence = self.permanences[minicolumn_index, :].astype(real_type)
 
@@ -870,9 +1333,7 @@ class SpatialPooler:
                 0.5
             )
 
-        self.boost_factors = np.exp(
-            -self.boost_strength * (self.active_duty_cycles - target_density)
-        )
+        self.boost_factors = self.calculate_boost_factors(target_density)
 
     def update_boost_factors_local(self):
         """
@@ -887,7 +1348,14 @@ class SpatialPooler:
 
             target_density[m] = np.mean(self.active_duty_cycles[mask_neighbors])
 
-        self.boost_factors = np.exp(
+        self.boost_factors = self.calculate_boost_factors(target_density)
+
+    def calculate_boost_factors(self, target_density):
+        """
+        boost_factors = exp[ - boost_strength * (duty_cycle - target_density) ]
+        """
+
+        return np.exp(
             -self.boost_strength * (self.active_duty_cycles - target_density)
         )
 
@@ -918,14 +1386,17 @@ class SpatialPooler:
         in the minicolumn's neighborhood.
         """
 
-        for minicolumn in range(self.num_minicolumns):
-            neighborhood = self.get_minicolumn_neighborhood(minicolumn)
+        neighborhoods, _ = self.get_minicolumn_neighborhoods()
 
-            max_overlap_duty = self.overlap_duty_cycles[neighborhood].max()
+        overlap_duty_cycles = np.full(self.num_minicolumns + 1, -np.inf,
+                                      dtype=self.overlap_duty_cycles.dtype)
+        overlap_duty_cycles[:-1] = self.overlap_duty_cycles
 
-            self.min_overlap_duty_cycles[minicolumn] = (
-                self.min_percent_overlap_duty_cycles * max_overlap_duty
-            )
+        max_overlap_duty = overlap_duty_cycles[neighborhoods].max(axis=1)
+
+        self.min_overlap_duty_cycles[:] = (
+            self.min_percent_overlap_duty_cycles * max_overlap_duty
+        )
 
     # getter methods
 
@@ -945,12 +1416,18 @@ class SpatialPooler:
         return self.active_duty_cycles
 
     def get_potential_pools(self):
+        if self.sparse_permanences:
+            return self.to_dense(np.ones(self.potential_indices.size, dtype=np.bool_))
         return self.potential_pools
 
     def get_permanences(self):
+        if self.sparse_permanences:
+            return self.to_dense(self.potential_permanences)
         return self.permanences
 
     def get_connected_synapses(self):
+        if self.sparse_permanences:
+            return self.to_dense(self.potential_connected)
         return self.connected_synapses
 
     def get_connected_synapses_counts(self):
@@ -965,6 +1442,17 @@ class SpatialPooler:
     def get_min_overlap_duty_cycles(self):
         return self.min_overlap_duty_cycles
 
+    def to_dense(self, values):
+        """
+        with sparse_permanences, scatter values aligned with potential_indices into a
+        dense (# of minicolumns) x (# of inputs) matrix.
+        """
+
+        dense = np.zeros((self.num_minicolumns, self.num_inputs), dtype=values.dtype)
+        dense[self.potential_minicolumns, self.potential_indices] = values
+
+        return dense
+
     # setter methods
 
     def set_inhibition_radius(self, radius):
@@ -981,3 +1469,25 @@ class SpatialPooler:
 
     def set_min_percent_overlap_duty_cycles(self, min_percent_overlap_duty_cycles):
         self.min_percent_overlap_duty_cycles = min_percent_overlap_duty_cycles
+
+    # checkpoint methods
+
+    def save(self, path, metadata=None, mappable=False):
+        """
+        save the spatial pooler to `path` (str) in the compact checkpoint format
+        (see `checkpoint.py`). `metadata` (dict or None) is stored with it. with
+        `mappable`, large arrays are stored unpacked, so that `load(path, mmap=True)`
+        can memory-map them.
+        """
+
+        save_checkpoint(self, path, metadata, mappable=mappable)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """
+        load a spatial pooler saved with `save()`. it continues exactly like the saved
+        one, random state included. with `mmap`, the large arrays of a checkpoint
+        saved with `mappable` are memory-mapped instead of read.
+        """
+
+        return load_checkpoint(path, cls, mmap)
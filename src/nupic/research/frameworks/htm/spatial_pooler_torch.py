@@ -0,0 +1,668 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import numpy as np
+import torch
+
+from .spatial_pooler import SpatialPooler
+
+real_type = torch.float32
+int_type = torch.int64
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class TorchSpatialPooler(SpatialPooler):
+    """
+    Spatial Pooler whose state is stored in torch tensors on the same `device` as the
+    Temporal Memory, so that SP -> TM pipelines can stay on one device. on the CPU,
+    computation uses torch's multithreaded kernels.
+
+    initialization is shared with the NumPy SpatialPooler (same random stream), and
+    every step stays on `device`. local inhibition breaks ties between neighbors by
+    minicolumn index in a single pass, and boost factors are computed with torch, so
+    results can differ slightly from the NumPy SpatialPooler. with match_numpy=True,
+    ties are resolved in minicolumn order like NumPy, and neighborhood means and boost
+    factors are computed in NumPy's order and on the host, so that on the CPU
+    outputs and learned permanences are identical to the NumPy SpatialPooler with the
+    same seed.
+
+    inputs can be np.ndarrays or torch.Tensors. getters return torch.Tensors.
+    """
+
+    def __init__(self, num_threads=None, match_numpy=False, **kwargs):
+        """
+        takes the same arguments as SpatialPooler, except that sparse_permanences is
+        not supported.
+
+        num_threads:                        if not None, number of threads used by
+                                            torch for intra-op parallelism on the CPU
+                                            (see torch.set_num_threads). note that
+                                            this is a process-wide setting.
+                                            default ``None``.
+
+        match_numpy:                        if True, reproduce the NumPy
+                                            SpatialPooler exactly, at the cost of
+                                            host round trips and an ordered loop in
+                                            local inhibition. meant for tests.
+                                            default ``False``.
+        """
+
+        assert not kwargs.get("sparse_permanences", False)
+
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+
+        self.match_numpy = match_numpy
+
+        super().__init__(**kwargs)
+
+        self.potential_pools = to_tensor(self.potential_pools, torch.bool)
+        self.permanences = to_tensor(self.permanences)
+        self.connected_synapses = to_tensor(self.connected_synapses, torch.bool)
+        self.connected_synapses_counts = to_tensor(self.connected_synapses_counts)
+
+        self.overlap_duty_cycles = to_tensor(self.overlap_duty_cycles)
+        self.active_duty_cycles = to_tensor(self.active_duty_cycles)
+        self.min_overlap_duty_cycles = to_tensor(self.min_overlap_duty_cycles)
+        self.boost_factors = to_tensor(self.boost_factors)
+        self.overlaps = to_tensor(self.overlaps)
+        self.boosted_overlaps = to_tensor(self.boosted_overlaps)
+
+        # coordinates of every input bit, used to compute the inhibition radius
+        self.input_coordinates = torch.from_numpy(
+            np.array(np.unravel_index(np.arange(self.num_inputs), self.input_dims))
+        ).to(int_type).to(device)
+
+        self.minicolumn_neighborhoods_tensor = None
+        self.minicolumn_neighborhoods_tensor_key = None
+        self.minicolumn_neighborhood_groups = None
+        self.minicolumn_neighborhood_groups_key = None
+
+    def compute(self, input_vector, learn, active_array):
+        """
+        same as SpatialPooler.compute. active_array can be a np.ndarray or a
+        torch.Tensor.
+        """
+
+        input_vector = to_tensor(input_vector).reshape(-1)
+
+        assert input_vector.numel() == self.num_inputs
+
+        self.iteration_num += 1
+        if learn:
+            self.iteration_learn_num += 1
+
+        self.overlaps = self.calculate_overlap(input_vector)
+
+        # apply boosting when learning is on
+        if learn:
+            self.boosted_overlaps = self.boost_factors * self.overlaps
+        else:
+            self.boosted_overlaps = self.overlaps
+
+        # apply inhibition to determine the winning minicolumns
+        active_minicolumns = self.inhibit_minicolumns(self.boosted_overlaps)
+
+        if learn:
+            self.adapt_synapses(input_vector, active_minicolumns)
+            self.update_duty_cycles(self.overlaps, active_minicolumns)
+            self.bump_up_weak_minicolumns()
+            self.update_boost_factors()
+
+            if (self.iteration_num % self.update_period) == 0:
+                self.update_inhibition_radius()
+                self.update_min_duty_cycles()
+
+        if torch.is_tensor(active_array):
+            active_array.zero_()
+            active_array.view(-1)[active_minicolumns.to(active_array.device)] = 1
+        else:
+            active_array.fill(0)
+            active_array[active_minicolumns.cpu().numpy()] = 1
+
+    def compute_batch(self, input_vectors, learn=False):
+        """
+        same as SpatialPooler.compute_batch, with the same batch learning semantics.
+        returns an [N, num_minicolumns] torch.uint8 tensor on `device`.
+        """
+
+        input_vectors = torch.atleast_2d(to_tensor(input_vectors))
+        input_vectors = input_vectors.reshape(input_vectors.shape[0], -1)
+
+        assert input_vectors.shape[1] == self.num_inputs
+
+        num_vectors = input_vectors.shape[0]
+
+        start_iteration_num = self.iteration_num
+        self.iteration_num += num_vectors
+        if learn:
+            self.iteration_learn_num += num_vectors
+
+        overlaps = self.calculate_overlap_batch(input_vectors)
+
+        # apply boosting when learning is on
+        if learn:
+            boosted_overlaps = self.boost_factors * overlaps
+        else:
+            boosted_overlaps = overlaps
+
+        active_arrays = self.inhibit_minicolumns_batch(boosted_overlaps)
+
+        if num_vectors > 0:
+            self.overlaps = overlaps[-1]
+            self.boosted_overlaps = boosted_overlaps[-1]
+
+        if learn:
+            self.adapt_synapses_batch(input_vectors, active_arrays)
+            self.update_duty_cycles_batch(overlaps, active_arrays, start_iteration_num)
+            self.bump_up_weak_minicolumns()
+            self.update_boost_factors()
+
+            if (self.iteration_num // self.update_period
+                    > start_iteration_num // self.update_period):
+                self.update_inhibition_radius()
+                self.update_min_duty_cycles()
+
+        return active_arrays.to(torch.uint8)
+
+    def average_connected_span(self):
+        """
+        average_connected_synapses_per_minicolumn for all minicolumns at once,
+        averaged over all minicolumns.
+        """
+
+        # called by SpatialPooler.__init__, before the state is moved to torch
+        if not torch.is_tensor(self.connected_synapses):
+            return super().average_connected_span()
+
+        max_coordinate = max(self.input_dims)
+
+        spans = []
+        for coordinates in self.input_coordinates:
+            min_coordinate = torch.where(self.connected_synapses, coordinates,
+                                         max_coordinate).amin(dim=1)
+            spans.append(
+                torch.where(self.connected_synapses, coordinates, -1).amax(dim=1)
+                - min_coordinate + 1
+            )
+
+        spans = torch.stack(spans).cpu().numpy().astype(np.float64)
+
+        # minicolumns without connected synapses have a span of 0
+        spans = np.where(self.connected_synapses_counts.cpu().numpy() > 0,
+                         np.average(spans, axis=0), 0)
+
+        return np.average(spans)
+
+    def update_permanences_for_minicolumns(self, permanences, minicolumns,
+                                           raise_perm=True):
+        """
+        update_permanences_for_minicolumn for the rows of permanences, which hold the
+        new permanence values of minicolumns.
+        """
+
+        potential = self.potential_pools[minicolumns]
+
+        if raise_perm:
+            self.raise_permanences_to_threshold(permanences, potential)
+
+        permanences[permanences < self.synapse_perm_trim_threshold] = 0
+
+        permanences.clamp_(self.synapse_perm_min, self.synapse_perm_max)
+        self.permanences[minicolumns] = permanences
+
+        new_connected = permanences >= (
+            self.synapse_perm_connected - self.permanence_epsilon
+        )
+
+        self.connected_synapses[minicolumns] = new_connected
+        self.connected_synapses_counts[minicolumns] = new_connected.sum(dim=1).to(
+            real_type
+        )
+
+    def raise_permanences_to_threshold(self, permanences, potential):
+        """
+        raise_permanence_to_threshold for the rows of permanences, with the potential
+        pools given by the rows of potential.
+        """
+
+        assert (potential.sum(dim=1) >= self.stimulus_threshold).all()
+
+        permanences.clamp_(self.synapse_perm_min, self.synapse_perm_max)
+
+        while True:
+            num_connected = (
+                permanences > (self.synapse_perm_connected - self.permanence_epsilon)
+            ).sum(dim=1)
+
+            below_threshold = num_connected < self.stimulus_threshold
+            if not below_threshold.any():
+                return
+
+            permanences[below_threshold] += (
+                self.synapse_perm_below_stimulus_inc
+                * potential[below_threshold].to(real_type)
+            )
+
+    def calculate_overlap(self, input_vector):
+        return self.connected_synapses.to(real_type) @ input_vector
+
+    def calculate_overlap_batch(self, input_vectors):
+        return input_vectors @ self.connected_synapses.T.to(real_type)
+
+    def inhibit_minicolumns_batch(self, overlaps):
+        density = self.get_inhibition_density()
+
+        if self.global_inhibition or self.inhibition_radius > max(self.minicolumn_dims):
+            return self.inhibit_minicolumns_global_batch(overlaps, density)
+
+        if not self.match_numpy:
+            return self.inhibit_minicolumns_local_batch(overlaps, density)
+
+        active_arrays = torch.zeros(overlaps.shape, dtype=torch.bool, device=device)
+        for i, row_overlaps in enumerate(overlaps):
+            active_arrays[i, self.inhibit_minicolumns_local(row_overlaps, density)] = 1
+
+        return active_arrays
+
+    def inhibit_minicolumns_global(self, overlaps, density):
+        num_active = int(density * self.num_minicolumns)
+
+        if num_active <= 0:
+            return torch.empty(0, dtype=int_type, device=device)
+
+        # calculate winners using a stable sort, like the NumPy mergesort
+        winning_minicolumn_indices = torch.sort(overlaps, stable=True).indices
+        winning_minicolumn_indices = winning_minicolumn_indices[-num_active:]
+
+        # enforce the stimulus threshold
+        winning_minicolumn_indices = winning_minicolumn_indices[
+            overlaps[winning_minicolumn_indices] >= self.stimulus_threshold
+        ]
+
+        return winning_minicolumn_indices.flip(0)
+
+    def inhibit_minicolumns_global_batch(self, overlaps, density):
+        num_active = int(density * self.num_minicolumns)
+
+        active_arrays = torch.zeros(overlaps.shape, dtype=torch.bool, device=device)
+        if num_active <= 0:
+            return active_arrays
+
+        winners = torch.sort(overlaps, dim=1, stable=True).indices[:, -num_active:]
+        winner_overlaps = overlaps.gather(1, winners)
+
+        active_arrays.scatter_(1, winners, winner_overlaps >= self.stimulus_threshold)
+
+        return active_arrays
+
+    def get_minicolumn_neighborhoods_tensor(self):
+        """
+        get_minicolumn_neighborhoods as tensors on `device`.
+        """
+
+        neighborhoods, neighborhood_sizes = self.get_minicolumn_neighborhoods()
+
+        key = self.minicolumn_neighborhoods_key
+        if self.minicolumn_neighborhoods_tensor_key != key:
+            self.minicolumn_neighborhoods_tensor = (
+                torch.from_numpy(neighborhoods).to(int_type).to(device),
+                torch.from_numpy(neighborhood_sizes).to(int_type).to(device),
+            )
+            self.minicolumn_neighborhoods_tensor_key = key
+
+        return self.minicolumn_neighborhoods_tensor
+
+    def get_minicolumn_neighborhood_groups(self):
+        """
+        the neighborhoods of get_minicolumn_neighborhoods without padding, grouped by
+        size. returns a list of (minicolumns, neighborhoods) tensors on `device`, where
+        row "i" of neighborhoods lists the neighborhood of minicolumns[i] in the order
+        of get_minicolumn_neighborhood.
+        """
+
+        neighborhoods, neighborhood_sizes = self.get_minicolumn_neighborhoods()
+
+        key = self.minicolumn_neighborhoods_key
+        if self.minicolumn_neighborhood_groups_key != key:
+            # move the padding entries to the end of each row
+            order = np.argsort(neighborhoods == self.num_minicolumns, axis=1,
+                               kind="stable")
+            neighborhoods = np.take_along_axis(neighborhoods, order, axis=1)
+
+            groups = []
+            for size in np.unique(neighborhood_sizes):
+                minicolumns = np.flatnonzero(neighborhood_sizes == size)
+                groups.append((
+                    torch.from_numpy(minicolumns).to(int_type).to(device),
+                    torch.from_numpy(
+                        neighborhoods[minicolumns, :size]
+                    ).to(int_type).to(device),
+                ))
+
+            self.minicolumn_neighborhood_groups = groups
+            self.minicolumn_neighborhood_groups_key = key
+
+        return self.minicolumn_neighborhood_groups
+
+    def rank_in_neighborhoods(self, overlaps, density):
+        """
+        compare each minicolumn to its neighbors, for an [N, num_minicolumns] tensor
+        of overlaps. returns the candidates above the stimulus threshold, the number
+        of neighbors with a larger overlap, the tied neighbors with a lower index (as
+        an [N, num_minicolumns, neighborhood size] mask) and the maximum number of
+        active minicolumns of each neighborhood.
+        """
+
+        neighborhoods, neighborhood_sizes = self.get_minicolumn_neighborhoods_tensor()
+        minicolumns = torch.arange(self.num_minicolumns, device=device)
+
+        # neighborhood overlaps, with -inf for the padding entries
+        overlaps = torch.cat([
+            overlaps,
+            torch.full((overlaps.shape[0], 1), -np.inf, dtype=overlaps.dtype,
+                       device=device)
+        ], dim=1)
+        neighborhood_overlaps = overlaps[:, neighborhoods]
+        overlaps = overlaps[:, :-1].unsqueeze(2)
+
+        # # of neighbors with overlap value greater than current minicolumn
+        num_bigger = (neighborhood_overlaps > overlaps).sum(dim=2)
+
+        tied_neighbors = (neighborhood_overlaps == overlaps) & (
+            neighborhoods < minicolumns.unsqueeze(1)
+        )
+
+        # maximum number of active minicolumns in neighborhood
+        num_active = (0.5 + density * neighborhood_sizes.to(torch.float64)).to(
+            int_type
+        )
+
+        candidates = overlaps.squeeze(2) >= self.stimulus_threshold
+
+        return candidates, num_bigger, tied_neighbors, num_active
+
+    def inhibit_minicolumns_local_batch(self, overlaps, density):
+        """
+        local inhibition of an [N, num_minicolumns] tensor of overlaps in one pass.
+        a minicolumn wins if fewer than the maximum number of active minicolumns of
+        its neighborhood have a larger overlap, or the same overlap and a lower index.
+        unlike the NumPy SpatialPooler, a tied neighbor with a lower index counts even
+        if it was inhibited itself. returns a boolean tensor of winners.
+        """
+
+        (candidates, num_bigger, tied_neighbors,
+         num_active) = self.rank_in_neighborhoods(overlaps, density)
+
+        return candidates & ((num_bigger + tied_neighbors.sum(dim=2)) < num_active)
+
+    def inhibit_minicolumns_local(self, overlaps, density):
+        if not self.match_numpy:
+            return self.inhibit_minicolumns_local_batch(
+                overlaps.unsqueeze(0), density
+            )[0].nonzero().squeeze(1)
+
+        neighborhoods, _ = self.get_minicolumn_neighborhoods_tensor()
+
+        (candidates, num_bigger, tied_neighbors,
+         num_active) = self.rank_in_neighborhoods(
+            overlaps.to(torch.float64).unsqueeze(0), density
+        )
+        candidates, num_bigger, tied_neighbors = (
+            candidates[0], num_bigger[0], tied_neighbors[0]
+        )
+
+        # activate minicolumns that win even if they lose every tie
+        active_array = candidates & (
+            (num_bigger + tied_neighbors.sum(dim=1)) < num_active
+        )
+
+        # resolve the remaining minicolumns in order, on the CPU
+        undecided = candidates & ~active_array & (num_bigger < num_active)
+        if undecided.any():
+            undecided = undecided.nonzero().squeeze(1)
+
+            active_array = active_array.cpu().numpy()
+            neighborhoods = neighborhoods[undecided].cpu().numpy()
+            tied_neighbors = tied_neighbors[undecided].cpu().numpy()
+            num_bigger = num_bigger[undecided].cpu().numpy()
+            num_active = num_active[undecided].cpu().numpy()
+
+            for i, minicolumn in enumerate(undecided.tolist()):
+                num_ties_lost = np.count_nonzero(
+                    active_array[neighborhoods[i, tied_neighbors[i]]]
+                )
+                active_array[minicolumn] = (
+                    num_bigger[i] + num_ties_lost
+                ) < num_active[i]
+
+            active_array = torch.from_numpy(active_array).to(device)
+
+        return active_array.nonzero().squeeze(1)
+
+    def adapt_synapses(self, input_vector, active_minicolumns):
+        if active_minicolumns.numel() == 0:
+            return
+
+        # for input bits that are on, increase synaptic permanence. for inputs bits that
+        # are off, decrease synaptic permanence.
+        permanence_changes = torch.full((self.num_inputs,), -1 * self.synapse_perm_dec,
+                                        dtype=real_type, device=device)
+        permanence_changes[input_vector > 0] = self.synapse_perm_inc
+
+        # only update synaptic permanences for input bits that can *possibly* connect
+        # to each minicolumn
+        permanences = self.permanences[active_minicolumns] + (
+            permanence_changes * self.potential_pools[active_minicolumns].to(real_type)
+        )
+
+        self.update_permanences_for_minicolumns(permanences, active_minicolumns,
+                                                raise_perm=True)
+
+    def adapt_synapses_batch(self, input_vectors, active_arrays):
+        active_arrays = active_arrays.to(real_type)
+        inputs_on = (input_vectors > 0).to(real_type)
+        num_active = active_arrays.sum(dim=0)
+
+        minicolumns = (num_active > 0).nonzero().squeeze(1)
+        if minicolumns.numel() == 0:
+            return
+
+        num_on = active_arrays[:, minicolumns].T @ inputs_on
+        num_active = num_active[minicolumns].unsqueeze(1)
+
+        permanence_changes = (
+            num_on * np.float32(self.synapse_perm_inc).item()
+            - (num_active - num_on) * np.float32(self.synapse_perm_dec).item()
+        )
+
+        permanences = self.permanences[minicolumns] + (
+            permanence_changes * self.potential_pools[minicolumns].to(real_type)
+        )
+
+        self.update_permanences_for_minicolumns(permanences, minicolumns,
+                                                raise_perm=True)
+
+    def update_duty_cycles(self, overlaps, active_minicolumns):
+        period = self.duty_cycle_period
+        if period > self.iteration_num:
+            period = self.iteration_num
+        assert period >= 1
+
+        active_array = torch.zeros(self.num_minicolumns, dtype=real_type, device=device)
+        active_array[active_minicolumns] = 1
+
+        self.update_duty_cycles_with_period(overlaps, active_array, period)
+
+    def update_duty_cycles_batch(self, overlaps, active_arrays, start_iteration_num):
+        for i, (overlap, active) in enumerate(zip(overlaps, active_arrays)):
+            period = min(self.duty_cycle_period, start_iteration_num + i + 1)
+            assert period >= 1
+
+            self.update_duty_cycles_with_period(overlap, active.to(real_type), period)
+
+    def update_duty_cycles_with_period(self, overlaps, active_array, period):
+        """
+        moving average update of the duty cycles, with the given period.
+        """
+
+        self.overlap_duty_cycles = (
+            self.overlap_duty_cycles * (period - 1.0) + (overlaps > 0).to(real_type)
+        ) / period
+
+        self.active_duty_cycles = (
+            self.active_duty_cycles * (period - 1.0) + active_array
+        ) / period
+
+    def bump_up_weak_minicolumns(self):
+        weak_minicolumns = (
+            self.overlap_duty_cycles < self.min_overlap_duty_cycles
+        ).nonzero().squeeze(1)
+
+        if weak_minicolumns.numel() == 0:
+            return
+
+        permanences = self.permanences[weak_minicolumns] + (
+            self.synapse_perm_below_stimulus_inc
+            * self.potential_pools[weak_minicolumns].to(real_type)
+        )
+
+        self.update_permanences_for_minicolumns(permanences, weak_minicolumns,
+                                                raise_perm=False)
+
+    def update_boost_factors_local(self):
+        if self.match_numpy:
+            target_density = torch.zeros(self.num_minicolumns, dtype=real_type,
+                                         device=device)
+
+            # np.mean of each neighborhood, summed in the same order as NumPy
+            for minicolumns, neighborhoods in \
+                    self.get_minicolumn_neighborhood_groups():
+                target_density[minicolumns] = (
+                    pairwise_sum(self.active_duty_cycles[neighborhoods])
+                    / neighborhoods.shape[1]
+                )
+        else:
+            neighborhoods, neighborhood_sizes = \
+                self.get_minicolumn_neighborhoods_tensor()
+
+            # mean of each neighborhood, with 0 for the padding entries
+            active_duty_cycles = torch.cat([
+                self.active_duty_cycles,
+                torch.zeros(1, dtype=real_type, device=device)
+            ])
+            target_density = (
+                active_duty_cycles[neighborhoods].sum(dim=1)
+                / neighborhood_sizes.to(real_type)
+            )
+
+        self.boost_factors = self.calculate_boost_factors(target_density)
+
+    def calculate_boost_factors(self, target_density):
+        active_duty_cycles = self.active_duty_cycles
+
+        # follow NumPy type promotion: a np.float64 target_density (global inhibition)
+        # makes the difference double precision
+        if not torch.is_tensor(target_density) and \
+                np.result_type(np.float32, target_density) == np.float64:
+            active_duty_cycles = active_duty_cycles.to(torch.float64)
+
+        exponents = -self.boost_strength * (active_duty_cycles - target_density)
+
+        # like NumPy, keep double precision boost factors in that case. the float32
+        # exp of NumPy and torch can differ in the last bit
+        if self.match_numpy:
+            return torch.from_numpy(np.exp(exponents.cpu().numpy())).to(device)
+
+        return torch.exp(exponents)
+
+    def update_min_duty_cycles_global(self):
+        self.min_overlap_duty_cycles.fill_(
+            self.min_percent_overlap_duty_cycles * self.overlap_duty_cycles.max()
+        )
+
+    def update_min_duty_cycles_local(self):
+        neighborhoods, _ = self.get_minicolumn_neighborhoods_tensor()
+
+        overlap_duty_cycles = torch.full((self.num_minicolumns + 1,), -np.inf,
+                                         dtype=real_type, device=device)
+        overlap_duty_cycles[:-1] = self.overlap_duty_cycles
+
+        max_overlap_duty = overlap_duty_cycles[neighborhoods].amax(dim=1)
+
+        self.min_overlap_duty_cycles[:] = (
+            self.min_percent_overlap_duty_cycles * max_overlap_duty
+        )
+
+    # setter methods
+
+    def set_boost_factors(self, boost_factors):
+        self.boost_factors = to_tensor(boost_factors)
+
+    def set_overlap_duty_cycles(self, overlap_duty_cycles):
+        self.overlap_duty_cycles = to_tensor(overlap_duty_cycles)
+
+    def set_active_duty_cycles(self, active_duty_cycles):
+        self.active_duty_cycles = to_tensor(active_duty_cycles)
+
+
+def pairwise_sum(a):
+    """
+    sum the rows of the 2D tensor `a` in the order of NumPy's float pairwise
+    summation, so that the result is identical to np.sum of each row.
+    """
+
+    n = a.shape[1]
+
+    if n < 8:
+        result = a[:, 0]
+        for i in range(1, n):
+            result = result + a[:, i]
+        return result
+
+    if n <= 128:
+        # eight partial sums, combined in a tree, then the remainder
+        blocks = n - n % 8
+        partial = a[:, :8]
+        for i in range(8, blocks, 8):
+            partial = partial + a[:, i:i + 8]
+
+        result = ((partial[:, 0] + partial[:, 1]) + (partial[:, 2] + partial[:, 3])) \
+            + ((partial[:, 4] + partial[:, 5]) + (partial[:, 6] + partial[:, 7]))
+        for i in range(blocks, n):
+            result = result + a[:, i]
+        return result
+
+    half = n // 2
+    half -= half % 8
+    return pairwise_sum(a[:, :half]) + pairwise_sum(a[:, half:])
+
+
+def to_tensor(a, dtype=real_type):
+    """
+    convert `a` (np.ndarray or torch.Tensor) to a `dtype` tensor on `device`.
+    """
+
+    if torch.is_tensor(a):
+        return a.to(dtype).to(device)
+
+    return torch.from_numpy(np.asarray(a)).to(dtype).to(device)
@@ -0,0 +1,298 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import torch
+
+from .sparse_connections import SparseConnections
+
+real_type = torch.float32
+int_type = torch.int64
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class SegmentPool():
+    """
+    pool of segment rows of a Temporal Memory connections matrix.
+
+    rows are preallocated and the capacity doubles when it runs out, so growing
+    segments costs amortized constant time instead of copying the whole connections
+    matrix on every new segment. destroyed segments are put on a free list and their
+    rows are reused (lowest row first) by the next segments that are created.
+    `last_used` holds the last iteration in which each segment was created or
+    active, to find the least recently used segments of a cell.
+
+    `connections` is the (num_rows, input_size) permanence matrix: a view of the
+    preallocated storage for dense connections, or a SparseConnections object.
+    `live` marks the rows that hold a segment.
+
+    the pool also maps segments to cells: `segment_to_cell` holds the cell of each
+    row (-1 for free rows) and `cell_segment_counts` the number of segments of each
+    cell, both updated incrementally. the cell -> segments lookup uses a CSR-style
+    table (segments sorted by cell, and the offset of each cell in that order),
+    rebuilt lazily after segments are created or destroyed.
+    """
+
+    def __init__(self, input_size, num_cells, sparse_connections=False,
+                 initial_capacity=64):
+        self.input_size = input_size
+        self.num_cells = num_cells
+        self.sparse_connections = sparse_connections
+
+        # number of rows that were ever handed out (live or free)
+        self.num_rows = 0
+
+        self.free_rows = torch.empty(0, dtype=int_type).to(device)
+        self.live = torch.zeros(initial_capacity, dtype=torch.bool).to(device)
+
+        # one-to-one mapping of segment to cell
+        self.segment_to_cell = torch.full(
+            (initial_capacity,), -1, dtype=int_type
+        ).to(device)
+        self.last_used = torch.zeros(initial_capacity, dtype=int_type).to(device)
+
+        # one-to-many mapping of cell to segments
+        self.cell_segment_counts = torch.zeros(
+            self.num_cells, dtype=int_type
+        ).to(device)
+        self.cell_segments = None
+        self.cell_offsets = None
+
+        if self.sparse_connections:
+            self.storage = SparseConnections(0, self.input_size)
+        else:
+            self.storage = torch.zeros(
+                (initial_capacity, self.input_size),
+                dtype=real_type
+            ).to(device)
+
+    @property
+    def capacity(self):
+        return self.live.numel()
+
+    @property
+    def connections(self):
+        if self.sparse_connections:
+            return self.storage
+
+        return self.storage[:self.num_rows]
+
+    @property
+    def live_segments(self):
+        return self.live[:self.num_rows]
+
+    def num_segments(self):
+        """
+        number of live segments.
+        """
+
+        return self.num_rows - self.free_rows.numel()
+
+    def allocate(self, cells, iteration=0):
+        """
+        create one empty segment on each of `cells` (torch.Tensor) and return the new
+        segments (torch.Tensor): free rows are reused first, then new rows are
+        appended. the new segments are marked as used at `iteration` (int).
+        """
+
+        cells = cells.to(int_type)
+        num_segments = cells.numel()
+
+        reused = self.free_rows[:num_segments]
+        self.free_rows = self.free_rows[num_segments:]
+
+        num_new_rows = num_segments - reused.numel()
+        if self.num_rows + num_new_rows > self.capacity:
+            self.grow(self.num_rows + num_new_rows)
+
+        new_rows = torch.arange(
+            self.num_rows, self.num_rows + num_new_rows
+        ).to(int_type).to(device)
+
+        self.num_rows += num_new_rows
+        if self.sparse_connections:
+            self.storage.add_segments(num_new_rows)
+
+        segments = torch.cat([reused, new_rows])
+        self.live[segments] = True
+
+        self.segment_to_cell[segments] = cells
+        self.last_used[segments] = iteration
+        self.cell_segment_counts.index_add_(0, cells, torch.ones_like(cells))
+        self.cell_offsets = None
+
+        return segments
+
+    def release(self, segments):
+        """
+        destroy `segments` (torch.Tensor): remove their synapses and put their rows on
+        the free list.
+        """
+
+        segments = torch.unique(segments.to(int_type))
+        segments = segments[self.live[segments]]
+
+        self.live[segments] = False
+
+        cells = self.segment_to_cell[segments]
+        self.cell_segment_counts.index_add_(0, cells, -torch.ones_like(cells))
+        self.segment_to_cell[segments] = -1
+        self.cell_offsets = None
+
+        if self.sparse_connections:
+            self.storage.remove_segments(segments)
+        else:
+            self.storage[segments] = 0
+
+        self.free_rows = torch.sort(torch.cat([self.free_rows, segments])).values
+
+    def grow(self, min_capacity):
+        """
+        double the capacity until it holds at least `min_capacity` rows.
+        """
+
+        capacity = max(self.capacity, 1)
+        while capacity < min_capacity:
+            capacity *= 2
+
+        live = torch.zeros(capacity, dtype=torch.bool).to(device)
+        live[:self.num_rows] = self.live[:self.num_rows]
+        self.live = live
+
+        segment_to_cell = torch.full((capacity,), -1, dtype=int_type).to(device)
+        segment_to_cell[:self.num_rows] = self.segment_to_cell[:self.num_rows]
+        self.segment_to_cell = segment_to_cell
+
+        last_used = torch.zeros(capacity, dtype=int_type).to(device)
+        last_used[:self.num_rows] = self.last_used[:self.num_rows]
+        self.last_used = last_used
+
+        if not self.sparse_connections:
+            storage = torch.zeros(
+                (capacity, self.input_size),
+                dtype=real_type
+            ).to(device)
+            storage[:self.num_rows] = self.storage[:self.num_rows]
+            self.storage = storage
+
+    def mark_used(self, segments, iteration):
+        """
+        mark `segments` (torch.Tensor) as used at `iteration` (int).
+        """
+
+        self.last_used[segments.to(int_type)] = iteration
+
+    def least_used_segments(self, cells, num_segments=None):
+        """
+        least recently used segments of each of `cells` (torch.Tensor), grouped by
+        cell in the order of `cells`: `num_segments` (torch.Tensor) of each cell, by
+        default one, or all its segments if it has fewer. ties go to the lowest
+        segment.
+        """
+
+        cells = cells.to(int_type)
+        segments = self.get_segments_for_cells(cells)
+        groups = torch.repeat_interleave(
+            torch.arange(cells.numel()).to(device), self.cell_segment_counts[cells]
+        )
+
+        # sort by group, then by last use; segments are increasing within a group
+        order = torch.argsort(self.last_used[segments], stable=True)
+        order = order[torch.argsort(groups[order], stable=True)]
+
+        # rank of each segment within its cell, from the least recently used
+        groups = groups[order]
+        first = torch.ones(order.numel(), dtype=torch.bool).to(device)
+        first[1:] = groups[1:] != groups[:-1]
+        positions = torch.arange(order.numel()).to(device)
+        ranks = positions - torch.cummax(
+            torch.where(first, positions, 0), dim=0
+        ).values
+
+        if num_segments is None:
+            return segments[order[ranks == 0]]
+        return segments[order[ranks < num_segments.to(int_type)[groups]]]
+
+    def map_segments_to_cells(self, segments):
+        """
+        cell of each of `segments` (torch.Tensor), -1 for free rows.
+        """
+
+        return self.segment_to_cell[segments.to(int_type)]
+
+    def map_segments_to_cells_batch(self, active_segments):
+        """
+        boolean (batch_size, num_cells) tensor, True for the cells of the segments set
+        in the boolean (batch_size, num_rows) tensor `active_segments`.
+        """
+
+        segment_to_cell = self.segment_to_cell[:self.num_rows]
+
+        # free rows are counted on an extra cell, which is then dropped
+        segment_to_cell = torch.where(
+            segment_to_cell >= 0, segment_to_cell, self.num_cells
+        )
+
+        counts = torch.zeros(
+            (active_segments.shape[0], self.num_cells + 1), dtype=real_type
+        ).to(device)
+        counts.index_add_(1, segment_to_cell, active_segments.to(real_type))
+
+        return counts[:, :self.num_cells] > 0
+
+    def get_segment_counts(self, cells):
+        """
+        number of segments of each of `cells` (torch.Tensor).
+        """
+
+        return self.cell_segment_counts[cells.to(int_type)]
+
+    def get_segments_for_cells(self, cells):
+        """
+        all segments of `cells` (torch.Tensor), grouped by cell in the order of
+        `cells`, in increasing order within a cell.
+        """
+
+        if self.cell_offsets is None:
+            segment_to_cell = self.segment_to_cell[:self.num_rows]
+            live_segments = torch.nonzero(segment_to_cell >= 0).squeeze(1)
+
+            # stable sort keeps the segments of each cell in increasing order
+            order = torch.argsort(segment_to_cell[live_segments], stable=True)
+            self.cell_segments = live_segments[order]
+
+            self.cell_offsets = torch.zeros(
+                self.num_cells + 1, dtype=int_type
+            ).to(device)
+            self.cell_offsets[1:] = self.cell_segment_counts.cumsum(dim=0)
+
+        cells = cells.to(int_type)
+
+        starts = self.cell_offsets[cells]
+        counts = self.cell_offsets[cells + 1] - starts
+
+        # concatenate the ranges [start, start + count) of every cell
+        positions = torch.arange(counts.sum().item()).to(device)
+        positions += torch.repeat_interleave(
+            starts - (counts.cumsum(dim=0) - counts), counts
+        )
+
+        return self.cell_segments[positions]
@@ -76,7 +76,9 @@ class SequenceMemoryApicalTiebreak(TemporalMemoryApicalTiebreak):
         basal_segment_incorrect_decrement=0.0,
         apical_segment_incorrect_decrement=0.0,
         max_synapses_per_segment=-1,
-        seed=42
+        max_segments_per_cell=-1,
+        seed=42,
+        sparse_connections=False
     ):
 
         params = {
@@ -95,7 +97,9 @@ class SequenceMemoryApicalTiebreak(TemporalMemoryApicalTiebreak):
             "basal_segment_incorrect_decrement" : basal_segment_incorrect_decrement,
             "apical_segment_incorrect_decrement" : apical_segment_incorrect_decrement,
             "max_synapses_per_segment" : max_synapses_per_segment,
-            "seed" : seed
+            "max_segments_per_cell" : max_segments_per_cell,
+            "seed" : seed,
+            "sparse_connections" : sparse_connections
         }
 
         super().__init__(**params)
@@ -106,6 +110,8 @@ class SequenceMemoryApicalTiebreak(TemporalMemoryApicalTiebreak):
         ).to(device)
         self.previous_predicted_cells = torch.empty(0, dtype=int_type).to(device)
 
+        self.reset_batch(1)
+
     def reset(self):
         """
         clear all cell and segment activity.
@@ -172,6 +178,164 @@ class SequenceMemoryApicalTiebreak(TemporalMemoryApicalTiebreak):
         self.previous_apical_input = apical_input.clone()
         self.previous_apical_growth_candidates = apical_growth_candidates.clone()
 
+    def reset_batch(self, batch_size):
+        """
+        start batched inference on `batch_size` (int) independent streams, all with
+        empty cell activity. see `compute_batch()`.
+        """
+
+        num_cells = self.num_total_cells
+
+        self.batch_active_cells = torch.zeros(
+            (batch_size, num_cells), dtype=torch.bool
+        ).to(device)
+        self.batch_predicted_cells = torch.zeros_like(self.batch_active_cells)
+        self.batch_next_predicted_cells = torch.zeros_like(self.batch_active_cells)
+
+        # cells with active apical segments lower the basal threshold at the next
+        # timestep
+        self.batch_reduced_threshold_cells = torch.zeros_like(self.batch_active_cells)
+
+    def reset_streams(self, streams):
+        """
+        clear the cell activity of `streams` (torch.Tensor), the indices of some of
+        the batched streams. same as `reset()` for a single stream.
+        """
+
+        streams = streams.to(int_type).to(device)
+
+        self.batch_active_cells[streams] = False
+        self.batch_predicted_cells[streams] = False
+        self.batch_next_predicted_cells[streams] = False
+        self.batch_reduced_threshold_cells[streams] = False
+
+    def compute_batch(self, active_minicolumns, apical_input=None):
+        """
+        perform one inference timestep on each stream of the batch, without learning.
+        stream b behaves exactly like its own instance calling
+        `compute(..., learn=False)`, but all streams share the learned connections and
+        are advanced together with a fixed number of tensor operations.
+
+        call `reset_batch()` first to set the number of streams.
+
+        `active_minicolumns` (torch.Tensor) is a boolean (batch_size, num_minicolumns)
+        tensor, True for the active minicolumns of each stream.
+
+        `apical_input` (torch.Tensor or None) is a boolean
+        (batch_size, apical_input_size) tensor, True for the active apical input bits
+        of each stream.
+        """
+
+        batch_size = self.batch_active_cells.shape[0]
+
+        active_minicolumns = active_minicolumns.to(torch.bool).to(device)
+
+        if apical_input is None:
+            apical_input = torch.zeros(
+                (batch_size, self.apical_input_size), dtype=torch.bool
+            )
+        apical_input = apical_input.to(torch.bool).to(device)
+
+        # ***** ACTIVATE CELLS ***** #
+
+        self.batch_predicted_cells = self.batch_next_predicted_cells
+
+        # arranged as streams x minicolumns x cells
+        predicted_cells = self.batch_predicted_cells.view(
+            batch_size, self.num_minicolumns, self.num_cells_per_minicolumn
+        )
+
+        # active cells:
+        #   - all correctly predicted cells
+        #   - all cells in bursting minicolumns (active minicolumns without any
+        #     predicted cells)
+        correctly_predicted_cells = predicted_cells & active_minicolumns.unsqueeze(2)
+        bursting_minicolumns = active_minicolumns & ~predicted_cells.any(dim=2)
+
+        self.batch_active_cells = (
+            correctly_predicted_cells | bursting_minicolumns.unsqueeze(2)
+        ).view(batch_size, self.num_total_cells)
+
+        # ***** DEPOLARIZE CELLS ***** #
+
+        active_apical_segments = self.compute_segment_overlaps_batch(
+            "apical", apical_input
+        ) >= self.activation_threshold
+
+        basal_overlaps = self.compute_segment_overlaps_batch(
+            "basal", self.batch_active_cells
+        )
+        active_basal_segments = basal_overlaps >= self.activation_threshold
+
+        if (self.use_apical_modulation_basal_threshold
+                and self.reduced_basal_threshold != self.activation_threshold):
+            # segments above the reduced threshold are active if their cell had an
+            # active apical segment at the previous timestep
+            segment_to_cell = self.basal_segments.segment_to_cell[
+                :basal_overlaps.shape[1]
+            ]
+            reduced_threshold_segments = self.batch_reduced_threshold_cells[
+                :, segment_to_cell.clamp(min=0)
+            ] & (segment_to_cell >= 0)
+
+            active_basal_segments |= (
+                (basal_overlaps >= self.reduced_basal_threshold)
+                & reduced_threshold_segments
+            )
+
+        cells_with_basal_segments = self.map_segments_to_cells_batch(
+            "basal", active_basal_segments
+        )
+        cells_with_apical_segments = self.map_segments_to_cells_batch(
+            "apical", active_apical_segments
+        )
+
+        if self.use_apical_tiebreak:
+            # fully depolarized cells have both active basal and apical segments.
+            # partly depolarized cells (active basal segments only) are inhibited
+            # if their minicolumn has a fully depolarized cell.
+            fully_depolarized_cells = (
+                cells_with_basal_segments & cells_with_apical_segments
+            )
+
+            inhibited_minicolumns = fully_depolarized_cells.view(
+                batch_size, self.num_minicolumns, self.num_cells_per_minicolumn
+            ).any(dim=2)
+
+            self.batch_next_predicted_cells = cells_with_basal_segments & (
+                fully_depolarized_cells
+                | ~inhibited_minicolumns.repeat_interleave(
+                    self.num_cells_per_minicolumn, dim=1
+                )
+            )
+        else:
+            self.batch_next_predicted_cells = cells_with_basal_segments
+
+        self.batch_reduced_threshold_cells = cells_with_apical_segments
+
+    def get_batch_active_cells(self):
+        """
+        return boolean (batch_size, num_cells) tensor of active cells of each stream.
+        """
+
+        return self.batch_active_cells
+
+    def get_batch_predicted_cells(self):
+        """
+        return boolean (batch_size, num_cells) tensor of predictions from previous
+        timestep of each stream.
+        """
+
+        return self.batch_predicted_cells
+
+    def get_batch_next_predicted_cells(self):
+        """
+        return boolean (batch_size, num_cells) tensor of predictions for next
+        timestep of each stream.
+        """
+
+        return self.batch_next_predicted_cells
+
     def get_active_cells(self):
         """
         return set of new active cells.
@@ -206,7 +370,7 @@ class SequenceMemoryApicalTiebreak(TemporalMemoryApicalTiebreak):
         """
 
         return torch.unique(
-            self.map_basal_segments_to_cells(self.active_basal_segments)
+            self.map_segments_to_cells("basal", self.active_basal_segments)
         )
 
     def get_next_apical_predicted_cells(self):
@@ -215,7 +379,7 @@ class SequenceMemoryApicalTiebreak(TemporalMemoryApicalTiebreak):
         """
 
         return torch.unique(
-            self.map_apical_segments_to_cells(self.active_apical_segments)
+            self.map_segments_to_cells("apical", self.active_apical_segments)
         )
 
     def get_num_basal_segments(self):
@@ -223,4 +387,4 @@ class SequenceMemoryApicalTiebreak(TemporalMemoryApicalTiebreak):
         return total number of basal segments.
         """
 
-        return len(self.basal_segment_to_cell)
+        return self.basal_segments.num_segments()
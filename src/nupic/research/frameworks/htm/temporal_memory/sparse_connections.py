@@ -0,0 +1,395 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import torch
+
+real_type = torch.float32
+int_type = torch.int64
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class SparseConnections():
+    """
+    sparse (num_segments, input_size) permanence matrix of a Temporal Memory.
+
+    only existing synapses are stored. a synapse exists iff its permanence is > 0,
+    same as a nonzero entry of the dense connections matrix: synapses whose
+    permanence drops to 0 are removed.
+
+    the synapses of segment "i" are stored in row "i" of `synapse_inputs` (input bit
+    of each synapse, -1 for empty slots) and `synapse_permanences`. a synapse is
+    identified by its slot, row * width + column. rows have a common width, which
+    doubles when a segment runs out of empty slots, and the number of rows doubles
+    when segments are added.
+
+    `input_synapses` indexes the slots by input bit, so that segment overlaps are
+    computed by visiting only the synapses of the active input bits. row "j" lists
+    the synapses to input bit "j" in its first `input_fill[j]` entries, with -1 for
+    the entries of removed synapses. new synapses are appended to the rows of their
+    input bits, and a row is compacted, or the width of the index doubled, when it
+    runs out of space.
+
+    learning steps only visit the rows of the segments and input bits involved, so
+    their cost does not grow with the total number of synapses, apart from the
+    amortized cost of the capacity doublings.
+    """
+
+    def __init__(self, num_segments, input_size, initial_capacity=64,
+                 initial_width=16):
+        self.num_segments = 0
+        self.input_size = input_size
+
+        self.width = initial_width
+        self.synapse_inputs = torch.full(
+            (initial_capacity, self.width), -1, dtype=int_type
+        ).to(device)
+        self.synapse_permanences = torch.zeros(
+            (initial_capacity, self.width), dtype=real_type
+        ).to(device)
+        self.synapse_counts = torch.zeros(initial_capacity, dtype=int_type).to(device)
+
+        # position of each synapse in its row of input_synapses
+        self.synapse_input_positions = torch.zeros(
+            (initial_capacity, self.width), dtype=int_type
+        ).to(device)
+
+        self.input_synapses = torch.full(
+            (input_size, initial_width), -1, dtype=int_type
+        ).to(device)
+        self.input_fill = torch.zeros(input_size, dtype=int_type).to(device)
+
+        self.add_segments(num_segments)
+
+    @property
+    def shape(self):
+        return (self.num_segments, self.input_size)
+
+    @property
+    def capacity(self):
+        return self.synapse_inputs.shape[0]
+
+    def add_segments(self, num_segments):
+        """
+        add `num_segments` (int) empty segments.
+        """
+
+        self.num_segments += num_segments
+
+        if self.num_segments > self.capacity:
+            capacity = max(self.capacity, 1)
+            while capacity < self.num_segments:
+                capacity *= 2
+
+            self.synapse_inputs = grow_rows(self.synapse_inputs, capacity, -1)
+            self.synapse_permanences = grow_rows(self.synapse_permanences, capacity, 0)
+            self.synapse_counts = grow_rows(self.synapse_counts, capacity, 0)
+            self.synapse_input_positions = grow_rows(self.synapse_input_positions,
+                                                     capacity, 0)
+
+    def compute_overlaps(self, active_inputs, connected_permanence):
+        """
+        for each segment, count the active connected synapses (permanence at least
+        `connected_permanence`) and the active potential synapses, given the list of
+        active input bits `active_inputs` (torch.Tensor).
+        """
+
+        synapses = self.get_synapses_for_inputs(active_inputs)
+
+        segments = synapses.div(self.width, rounding_mode="floor")
+        connected = self.synapse_permanences.view(-1)[synapses] >= connected_permanence
+
+        overlaps = torch.bincount(segments[connected], minlength=self.num_segments)
+        potential_overlaps = torch.bincount(segments, minlength=self.num_segments)
+
+        return overlaps, potential_overlaps
+
+    def compute_overlaps_batch(self, active_inputs, connected_permanence):
+        """
+        batched version of `compute_overlaps()` for the connected synapses only:
+        `active_inputs` is a boolean (batch_size, input_size) tensor, and the result
+        is the (batch_size, num_segments) tensor of active connected synapse counts.
+        """
+
+        segments, columns = (
+            self.synapse_permanences[:self.num_segments] >= connected_permanence
+        ).nonzero(as_tuple=True)
+
+        overlaps = torch.zeros(
+            (active_inputs.shape[0], self.num_segments), dtype=real_type
+        ).to(device)
+        overlaps.index_add_(
+            1,
+            segments,
+            active_inputs[:, self.synapse_inputs[segments, columns]].to(real_type)
+        )
+
+        return overlaps.to(int_type)
+
+    def get_synapses_for_inputs(self, inputs):
+        """
+        slots of the synapses connected to any of `inputs` (torch.Tensor).
+        """
+
+        inputs = torch.unique(inputs.to(int_type))
+        if inputs.numel() == 0:
+            return inputs
+
+        synapses = self.input_synapses[inputs, :self.input_fill[inputs].max()]
+
+        return synapses[synapses >= 0]
+
+    def count_nonzero(self, dim):
+        """
+        number of synapses on each segment, same as `count_nonzero(dim=1)` of the
+        dense connections matrix.
+        """
+
+        assert dim == 1
+
+        return self.synapse_counts[:self.num_segments]
+
+    def has_synapses(self, segments, inputs):
+        """
+        returns a boolean (len(segments), len(inputs)) tensor, True where segment
+        `segments[i]` has a synapse to input bit `inputs[j]`.
+        """
+
+        segments = segments.to(int_type).view(-1, 1)
+
+        keys = segments * self.input_size + inputs.to(int_type)
+
+        # only compare with the synapses of `segments`
+        synapse_inputs = self.synapse_inputs[segments.squeeze(1)]
+        synapse_keys = segments * self.input_size + synapse_inputs
+
+        return torch.isin(keys, synapse_keys[synapse_inputs >= 0])
+
+    def add_synapses(self, segments, inputs, permanence):
+        """
+        create synapses from `segments` (torch.Tensor) to `inputs` (torch.Tensor),
+        with initial `permanence` (float). none of the synapses may already exist.
+        """
+
+        if segments.numel() == 0 or permanence <= 0:
+            return
+
+        # group the new synapses by segment
+        order = torch.argsort(segments.to(int_type), stable=True)
+        segments = segments.to(int_type)[order]
+        inputs = inputs.to(int_type)[order]
+
+        unique_segments, counts = torch.unique_consecutive(segments,
+                                                           return_counts=True)
+
+        num_synapses = (self.synapse_counts[unique_segments] + counts).max().item()
+        if num_synapses > self.width:
+            self.grow_width(num_synapses)
+
+        # the new synapses of a segment take its first empty slots
+        empty_first = torch.argsort(
+            (self.synapse_inputs[unique_segments] >= 0).to(torch.uint8),
+            dim=1, stable=True
+        )
+        columns = empty_first[
+            torch.repeat_interleave(counts), rank_in_groups(counts)
+        ]
+
+        self.synapse_inputs[segments, columns] = inputs
+        self.synapse_permanences[segments, columns] = permanence
+        self.synapse_counts.index_add_(0, unique_segments, counts)
+
+        self.index_synapses(segments * self.width + columns, inputs)
+
+    def index_synapses(self, synapses, inputs):
+        """
+        append the slots `synapses` (torch.Tensor) to the rows of their input bits
+        `inputs` (torch.Tensor) in `input_synapses`.
+        """
+
+        order = torch.argsort(inputs, stable=True)
+        synapses = synapses[order]
+        inputs = inputs[order]
+
+        unique_inputs, counts = torch.unique_consecutive(inputs, return_counts=True)
+
+        full = self.input_fill[unique_inputs] + counts > self.input_synapses.shape[1]
+        if full.any():
+            self.compact_inputs(unique_inputs[full])
+
+            fill = (self.input_fill[unique_inputs] + counts).max().item()
+            if fill > self.input_synapses.shape[1]:
+                self.input_synapses = grow_columns(self.input_synapses, fill, -1)
+
+        positions = (
+            self.input_fill[unique_inputs] - (counts.cumsum(dim=0) - counts)
+        ).repeat_interleave(counts) + torch.arange(inputs.numel()).to(device)
+
+        self.input_synapses[inputs, positions] = synapses
+        self.synapse_input_positions.view(-1)[synapses] = positions
+        self.input_fill.index_add_(0, unique_inputs, counts)
+
+    def compact_inputs(self, inputs):
+        """
+        move the synapses of the rows `inputs` (torch.Tensor) of `input_synapses` to
+        the front of the rows, dropping the entries of removed synapses.
+        """
+
+        synapses = self.input_synapses[inputs]
+
+        order = torch.argsort((synapses < 0).to(torch.uint8), dim=1, stable=True)
+        synapses = torch.gather(synapses, 1, order)
+        self.input_synapses[inputs] = synapses
+
+        live = synapses >= 0
+        self.input_fill[inputs] = live.sum(dim=1)
+
+        positions = torch.arange(synapses.shape[1]).to(device).expand_as(synapses)
+        self.synapse_input_positions.view(-1)[synapses[live]] = positions[live]
+
+    def grow_width(self, min_width):
+        """
+        double the width of the segment rows until they hold `min_width` synapses.
+        """
+
+        width = self.width
+        while width < min_width:
+            width *= 2
+
+        self.synapse_inputs = grow_columns(self.synapse_inputs, width, -1)
+        self.synapse_permanences = grow_columns(self.synapse_permanences, width, 0)
+        self.synapse_input_positions = grow_columns(self.synapse_input_positions,
+                                                    width, 0)
+
+        # slots are row * width + column
+        indexed = self.input_synapses >= 0
+        synapses = self.input_synapses[indexed]
+        self.input_synapses[indexed] = (
+            synapses.div(self.width, rounding_mode="floor") * width
+            + synapses % self.width
+        )
+
+        self.width = width
+
+    def adjust_synapses(self, segments, inputs, delta, exclude_inputs=False):
+        """
+        add `delta` (float) to the permanences of the synapses from `segments`
+        (torch.Tensor) to `inputs` (torch.Tensor), or to every input bit *except*
+        `inputs` if `exclude_inputs` is True. permanences are clipped to [0, 1] and
+        synapses that reach 0 are removed.
+        """
+
+        segments = torch.unique(segments.to(int_type))
+
+        synapse_inputs = self.synapse_inputs[segments]
+        selected = (synapse_inputs >= 0) & (
+            torch.isin(synapse_inputs, inputs.to(int_type)) ^ exclude_inputs
+        )
+
+        rows, columns = selected.nonzero(as_tuple=True)
+        rows = segments[rows]
+
+        permanences = (self.synapse_permanences[rows, columns] + delta).clamp_(0, 1)
+        self.synapse_permanences[rows, columns] = permanences
+
+        destroyed = permanences == 0
+        if destroyed.any():
+            self.remove_synapses(rows[destroyed], columns[destroyed])
+
+    def remove_segments(self, segments):
+        """
+        remove all synapses of `segments` (torch.Tensor).
+        """
+
+        segments = torch.unique(segments.to(int_type))
+
+        rows, columns = (self.synapse_inputs[segments] >= 0).nonzero(as_tuple=True)
+
+        self.remove_synapses(segments[rows], columns)
+
+    def remove_synapses(self, rows, columns):
+        """
+        remove the synapses in `rows` and `columns` (torch.Tensor) of the segment
+        rows.
+        """
+
+        inputs = self.synapse_inputs[rows, columns]
+        self.input_synapses[inputs, self.synapse_input_positions[rows, columns]] = -1
+
+        self.synapse_inputs[rows, columns] = -1
+        self.synapse_permanences[rows, columns] = 0
+        self.synapse_counts.index_add_(0, rows, -torch.ones_like(rows))
+
+    def to_dense(self):
+        """
+        returns the dense (num_segments, input_size) permanence matrix.
+        """
+
+        segments, columns = (
+            self.synapse_inputs[:self.num_segments] >= 0
+        ).nonzero(as_tuple=True)
+
+        connections = torch.zeros(self.shape, dtype=real_type).to(device)
+        connections[segments, self.synapse_inputs[segments, columns]] = (
+            self.synapse_permanences[segments, columns]
+        )
+
+        return connections
+
+
+def rank_in_groups(counts):
+    """
+    position of each element within its group, for consecutive groups of `counts`
+    (torch.Tensor) elements.
+    """
+
+    starts = (counts.cumsum(dim=0) - counts).repeat_interleave(counts)
+
+    return torch.arange(starts.numel()).to(device) - starts
+
+
+def grow_rows(tensor, num_rows, fill_value):
+    """
+    copy of `tensor` with `num_rows` rows, the new rows set to `fill_value`.
+    """
+
+    grown = torch.full((num_rows,) + tuple(tensor.shape[1:]), fill_value,
+                       dtype=tensor.dtype).to(device)
+    grown[:tensor.shape[0]] = tensor
+
+    return grown
+
+
+def grow_columns(tensor, min_columns, fill_value):
+    """
+    copy of the 2D `tensor` with its number of columns doubled until it is at least
+    `min_columns`, the new columns set to `fill_value`.
+    """
+
+    num_columns = max(tensor.shape[1], 1)
+    while num_columns < min_columns:
+        num_columns *= 2
+
+    grown = torch.full((tensor.shape[0], num_columns), fill_value,
+                       dtype=tensor.dtype).to(device)
+    grown[:, :tensor.shape[1]] = tensor
+
+    return grown
@@ -19,10 +19,11 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
-from collections import defaultdict
-
 import torch
 
+from ..checkpoint import load_checkpoint, save_checkpoint
+from .segment_pool import SegmentPool
+
 real_type = torch.float32
 int_type = torch.int64
 
@@ -71,7 +72,9 @@ class TemporalMemoryApicalTiebreak():
         basal_segment_incorrect_decrement=0.0,
         apical_segment_incorrect_decrement=0.0,
         max_synapses_per_segment=-1,
-        seed=-1
+        max_segments_per_cell=-1,
+        seed=-1,
+        sparse_connections=False
     ):
         """
         num_minicolumns:                            number of minicolumns.
@@ -138,8 +141,25 @@ class TemporalMemoryApicalTiebreak():
         max_synapses_per_segment:                   max number of synapses per segment.
                                                     default `-1`.
 
+        max_segments_per_cell:                      max number of segments per cell
+                                                    and segment type. a cell that
+                                                    grows a segment beyond this
+                                                    limit first destroys its least
+                                                    recently active segment.
+                                                    default `-1` (no limit).
+
         seed:                                       seed for random number generator.
                                                     default `-1`.
+
+        sparse_connections:                         if True, store only the existing
+                                                    synapses of each segment
+                                                    (see SparseConnections) instead of
+                                                    dense segments x inputs matrices.
+                                                    segment activity is then computed
+                                                    from the synapses of the active
+                                                    input bits only. learning is
+                                                    identical.
+                                                    default `False`.
         """
 
         self.num_minicolumns = num_minicolumns
@@ -157,6 +177,8 @@ class TemporalMemoryApicalTiebreak():
         self.basal_segment_incorrect_decrement = basal_segment_incorrect_decrement
         self.apical_segment_incorrect_decrement = apical_segment_incorrect_decrement
         self.max_synapses_per_segment = max_synapses_per_segment
+        self.max_segments_per_cell = max_segments_per_cell
+        self.sparse_connections = sparse_connections
 
         # random seed
         if seed == -1:
@@ -166,17 +188,21 @@ class TemporalMemoryApicalTiebreak():
 
         self.generator = torch.manual_seed(self.seed)
 
-        self.basal_connections = torch.zeros(
-            (0, self.basal_input_size),
-            dtype=real_type
-        ).to(device)
+        self.num_total_cells = self.num_minicolumns * self.num_cells_per_minicolumn
 
-        self.apical_connections = torch.zeros(
-            (0, self.apical_input_size),
-            dtype=real_type
-        ).to(device)
+        # number of learning timesteps, used to find least recently active segments
+        self.iteration = 0
 
-        self.num_total_cells = self.num_minicolumns * self.num_cells_per_minicolumn
+        # preallocated segment rows and segment <--> cell mappings, see SegmentPool
+        self.basal_segments = SegmentPool(
+            self.basal_input_size, self.num_total_cells, self.sparse_connections
+        )
+        self.apical_segments = SegmentPool(
+            self.apical_input_size, self.num_total_cells, self.sparse_connections
+        )
+
+        self.basal_connections = self.basal_segments.connections
+        self.apical_connections = self.apical_segments.connections
 
         self.active_cells = torch.empty(0, dtype=int_type).to(device)
         self.learning_cells = torch.empty(0, dtype=int_type).to(device)
@@ -192,14 +218,6 @@ class TemporalMemoryApicalTiebreak():
         self.use_apical_tiebreak = True
         self.use_apical_modulation_basal_threshold = True
 
-        # one-to-one mapping of segment to cell
-        self.apical_segment_to_cell = defaultdict(lambda : -1)
-        self.basal_segment_to_cell = defaultdict(lambda : -1)
-
-        # one-to-many mapping of cell to segments
-        self.cell_to_apical_segments = defaultdict(set)
-        self.cell_to_basal_segments = defaultdict(set)
-
     def reset(self):
         """
         clear all cell and segment activity.
@@ -254,6 +272,11 @@ class TemporalMemoryApicalTiebreak():
             active_apical_segments
         )
 
+        if learn:
+            self.iteration += 1
+            self.basal_segments.mark_used(active_basal_segments, self.iteration)
+            self.apical_segments.mark_used(active_apical_segments, self.iteration)
+
         self.active_basal_segments = active_basal_segments
         self.active_apical_segments = active_apical_segments
         self.matching_basal_segments = matching_basal_segments
@@ -418,27 +441,35 @@ class TemporalMemoryApicalTiebreak():
         segments.
         """
 
-        apical_input_sdr = torch.zeros(self.apical_input_size).to(device)
-        apical_input_sdr[apical_input.to(int_type)] = 1
+        if self.sparse_connections:
+            (overlaps,
+             apical_potential_overlaps) = self.apical_connections.compute_overlaps(
+                apical_input, self.connected_permanence
+            )
+        else:
+            # only the columns of the active input bits are visited
+            active_connections = self.apical_connections[
+                :, torch.unique(apical_input.to(int_type))
+            ]
 
-        # compute active segments
-        overlaps = (
-            (self.apical_connections >= self.connected_permanence).to(real_type)
-            @ apical_input_sdr
-        ).squeeze().to(int_type)
+            overlaps = (
+                active_connections >= self.connected_permanence
+            ).sum(dim=1).to(int_type)
 
+            apical_potential_overlaps = (
+                active_connections > 0
+            ).sum(dim=1).to(int_type)
+
+        # compute active segments
         active_apical_segments = torch.nonzero(
             overlaps >= self.activation_threshold
-        ).squeeze().to(int_type)
+        ).squeeze(1).to(int_type)
 
         # compute matching segments
-        apical_potential_overlaps = (
-            (self.apical_connections > 0).to(real_type) @ apical_input_sdr
-        ).squeeze().to(int_type)
 
         matching_apical_segments = torch.nonzero(
             apical_potential_overlaps >= self.matching_threshold
-        ).squeeze().to(int_type)
+        ).squeeze(1).to(int_type)
 
         convert_1d(active_apical_segments)
         convert_1d(matching_apical_segments)
@@ -475,19 +506,31 @@ class TemporalMemoryApicalTiebreak():
         segments.
         """
 
-        basal_input_sdr = torch.zeros(self.basal_input_size).to(device)
-        basal_input_sdr[basal_input.to(int_type)] = 1
+        if self.sparse_connections:
+            (overlaps,
+             basal_potential_overlaps) = self.basal_connections.compute_overlaps(
+                basal_input, self.connected_permanence
+            )
+        else:
+            # only the columns of the active input bits are visited
+            active_connections = self.basal_connections[
+                :, torch.unique(basal_input.to(int_type))
+            ]
+
+            overlaps = (
+                active_connections >= self.connected_permanence
+            ).sum(dim=1).to(int_type)
+
+            basal_potential_overlaps = (
+                active_connections > 0
+            ).sum(dim=1).to(int_type)
 
         # compute active segments
-        overlaps = (
-            (self.basal_connections >= self.connected_permanence).to(real_type)
-            @ basal_input_sdr
-        ).squeeze().to(int_type)
 
         # fully active basal segments (i.e. above the activation threshold)
         fully_active_basal_segments = torch.nonzero(
             overlaps >= self.activation_threshold
-        ).squeeze().to(int_type)
+        ).squeeze(1).to(int_type)
 
         if (self.reduced_basal_threshold != self.activation_threshold
                 and reduced_threshold_basal_cells.numel() > 0):
@@ -497,7 +540,7 @@ class TemporalMemoryApicalTiebreak():
             potentially_active_basal_segments = torch.nonzero(
                 (overlaps < self.activation_threshold)
                 & (overlaps >= self.reduced_basal_threshold)
-            )
+            ).squeeze(1)
 
             # find cells that correspond to each potentially active basal segment
             potentially_active_cells = self.map_segments_to_cells(
@@ -511,21 +554,18 @@ class TemporalMemoryApicalTiebreak():
                 fully_active_basal_segments,
                 potentially_active_basal_segments[
                     isin(potentially_active_cells, reduced_threshold_basal_cells)
-                ].squeeze()
+                ]
             ])
             convert_1d(active_basal_segments)
         else:
             active_basal_segments = fully_active_basal_segments
 
-        basal_potential_overlaps = (
-            (self.basal_connections > 0).to(real_type) @ basal_input_sdr
-        ).squeeze().to(int_type)
         convert_1d(basal_potential_overlaps)
 
         # compute matching segments
         matching_basal_segments = torch.nonzero(
             basal_potential_overlaps >= self.matching_threshold
-        ).squeeze().to(int_type)
+        ).squeeze(1).to(int_type)
         convert_1d(matching_basal_segments)
 
         return (active_basal_segments, matching_basal_segments,
@@ -549,19 +589,20 @@ class TemporalMemoryApicalTiebreak():
         predicted cells (torch.Tensor) contains list of predicted cells.
         """
 
-        cells_with_basal_segments = self.map_segments_to_cells(
+        # a cell may have several active segments: keep each cell once
+        cells_with_basal_segments = torch.unique(self.map_segments_to_cells(
             "basal",
             active_basal_segments
-        )
+        ))
 
         # if not using apical tiebreak, predicted cells = cells_with_basal_segments
         if not self.use_apical_tiebreak:
             return cells_with_basal_segments
 
-        cells_with_apical_segments = self.map_segments_to_cells(
+        cells_with_apical_segments = torch.unique(self.map_segments_to_cells(
             "apical",
             active_apical_segments
-        )
+        ))
 
         # fully depolarized cells should have both active basal and apical segments
         fully_depolarized_cells = intersection(cells_with_basal_segments,
@@ -962,15 +1003,25 @@ class TemporalMemoryApicalTiebreak():
         )
 
         # decrement synapses
-        self.adjust_synapses_on_segments(
-            segment_type,
-            learning_segments,
-            difference(
-                torch.arange(connections.shape[1]).to(device),
-                reinforce_candidates
-            ),
-            -self.permanence_decrement
-        )
+        if self.sparse_connections:
+            # every input bit except the reinforce candidates
+            if learning_segments.numel() > 0:
+                connections.adjust_synapses(
+                    learning_segments,
+                    reinforce_candidates,
+                    -self.permanence_decrement,
+                    exclude_inputs=True
+                )
+        else:
+            self.adjust_synapses_on_segments(
+                segment_type,
+                learning_segments,
+                difference(
+                    torch.arange(connections.shape[1]).to(device),
+                    reinforce_candidates
+                ),
+                -self.permanence_decrement
+            )
 
         # ***** GROW NEW SYNAPSES ***** #
         if self.sample_size == -1:
@@ -1049,7 +1100,10 @@ class TemporalMemoryApicalTiebreak():
         y = y.to(int_type)
 
         # which synapses are zero in the connections matrix
-        zero_elem_mask = ~connections[x, y].to(torch.bool)
+        if self.sparse_connections:
+            zero_elem_mask = ~connections.has_synapses(segments, active_inputs)
+        else:
+            zero_elem_mask = ~connections[x, y].to(torch.bool)
 
         # number of synapses with zero permanence per segment
         num_zeros_per_segment = zero_elem_mask.sum(dim=1)
@@ -1063,6 +1117,8 @@ class TemporalMemoryApicalTiebreak():
         y = y[zero_elem_mask]
 
         # initialize synapses
+        new_x = []
+        new_y = []
         for num_synapses, x, y in zip(
             max_new_synapses[num_zeros_per_segment.to(torch.bool)],
             x.tensor_split(num_zeros_per_segment.cumsum(dim=0).cpu())[:-1],
@@ -1073,7 +1129,22 @@ class TemporalMemoryApicalTiebreak():
                 generator=self.generator
             )[:num_synapses]
 
-            connections[x[rand_inds], y[rand_inds]] = self.initial_permanence
+            if self.sparse_connections:
+                new_x.append(x[rand_inds])
+                new_y.append(y[rand_inds])
+            else:
+                connections[x[rand_inds], y[rand_inds]] = self.initial_permanence
+
+        if self.sparse_connections and new_x:
+            # a segment listed more than once can pick the same synapse twice
+            keys = torch.unique(
+                torch.cat(new_x) * connections.input_size + torch.cat(new_y)
+            )
+            connections.add_synapses(
+                keys.div(connections.input_size, rounding_mode="floor"),
+                keys % connections.input_size,
+                self.initial_permanence
+            )
 
     def learn_segments(
         self,
@@ -1089,11 +1160,6 @@ class TemporalMemoryApicalTiebreak():
 
         check_segment_type(segment_type)
 
-        if segment_type == "basal":
-            connections = self.basal_connections
-        elif segment_type == "apical":
-            connections = self.apical_connections
-
         num_new_synapses = growth_candidates.numel()
 
         if self.sample_size != -1:
@@ -1102,59 +1168,86 @@ class TemporalMemoryApicalTiebreak():
         if self.max_synapses_per_segment != -1:
             num_new_synapses = min(num_new_synapses, self.max_synapses_per_segment)
 
-        # new basal/apical segment id's
-        new_segments = range(
-            connections.shape[0],
-            connections.shape[0] + cells_with_new_segments.numel()
-        )
+        # make room on the cells that reached the segment limit
+        if self.max_segments_per_cell != -1:
+            self.destroy_least_used_segments(segment_type, cells_with_new_segments)
 
-        if segment_type == "basal":
-            # update cell <--> basal segment mappings
-            for cell, segment in zip(
-                cells_with_new_segments.tolist(),
-                new_segments
-            ):
-                self.basal_segment_to_cell[segment] = cell
-                self.cell_to_basal_segments[cell].add(segment)
-
-            # create new basal segments in permanence matrix
-            self.basal_connections = torch.cat(
-                (
-                    self.basal_connections,
-                    torch.zeros(
-                        (len(new_segments), self.basal_input_size),
-                        dtype=int_type
-                    ).to(device)
-                )
-            )
-        elif segment_type == "apical":
-            # update cell <--> apical segment mappings
-            for cell, segment in zip(
-                cells_with_new_segments.tolist(),
-                new_segments
-            ):
-                self.apical_segment_to_cell[segment] = cell
-                self.cell_to_apical_segments[cell].add(segment)
-
-            # create new apical segments in permanence matrix
-            self.apical_connections = torch.cat(
-                (
-                    self.apical_connections,
-                    torch.zeros(
-                        (len(new_segments), self.apical_input_size),
-                        dtype=int_type
-                    ).to(device)
-                )
-            )
+        # new basal/apical segment id's. also updates the cell <--> segment mappings.
+        new_segments = self.allocate_segments(segment_type, cells_with_new_segments)
 
         # grow synapses on new basal/apical segments
         self.grow_synapses_on_segments(
             segment_type,
-            torch.Tensor(new_segments).to(int_type).to(device),
+            new_segments,
             growth_candidates,
             num_new_synapses
         )
 
+    def allocate_segments(self, segment_type, cells):
+        """
+        create one empty `segment_type` (str) segment on each of `cells`
+        (torch.Tensor) in the permanence matrix. returns the new segment id's
+        (torch.Tensor).
+
+        rows come from a preallocated SegmentPool: rows of destroyed segments are
+        reused first, and the capacity doubles when it runs out.
+        """
+
+        check_segment_type(segment_type)
+
+        if segment_type == "basal":
+            new_segments = self.basal_segments.allocate(cells, self.iteration)
+            self.basal_connections = self.basal_segments.connections
+        elif segment_type == "apical":
+            new_segments = self.apical_segments.allocate(cells, self.iteration)
+            self.apical_connections = self.apical_segments.connections
+
+        return new_segments
+
+    def destroy_segments(self, segment_type, segments):
+        """
+        destroy `segment_type` (str) `segments` (torch.Tensor): remove their synapses
+        and cell mappings. their rows are reused by the next segments that are
+        created.
+        """
+
+        check_segment_type(segment_type)
+
+        if segment_type == "basal":
+            self.basal_segments.release(segments)
+        elif segment_type == "apical":
+            self.apical_segments.release(segments)
+
+    def destroy_least_used_segments(self, segment_type, cells):
+        """
+        destroy the least recently active `segment_type` (str) segments of `cells`
+        (torch.Tensor), which are about to grow one segment per occurrence, so
+        that they stay within `max_segments_per_cell` segments.
+        """
+
+        check_segment_type(segment_type)
+
+        if segment_type == "basal":
+            segment_pool = self.basal_segments
+        elif segment_type == "apical":
+            segment_pool = self.apical_segments
+
+        # a cell can be selected more than once
+        cells, num_new_segments = torch.unique(cells, return_counts=True)
+        num_excess_segments = (
+            segment_pool.get_segment_counts(cells) + num_new_segments
+            - self.max_segments_per_cell
+        )
+        full_cells = num_excess_segments > 0
+
+        if full_cells.any():
+            self.destroy_segments(
+                segment_type,
+                segment_pool.least_used_segments(
+                    cells[full_cells], num_excess_segments[full_cells]
+                )
+            )
+
     def adjust_synapses_on_segments(self, segment_type, segments, active_inputs, delta):
         """
         adjust synapses on `segment_type` (str) segments.
@@ -1177,6 +1270,10 @@ class TemporalMemoryApicalTiebreak():
         elif segment_type == "apical":
             connections = self.apical_connections
 
+        if self.sparse_connections:
+            connections.adjust_synapses(segments, active_inputs, delta)
+            return
+
         x, y = torch.meshgrid(segments, active_inputs, indexing="ij")
         x = x.to(int_type)
         y = y.to(int_type)
@@ -1201,22 +1298,98 @@ class TemporalMemoryApicalTiebreak():
         convert_1d(segments)
 
         if segment_type == "basal":
-            return segments.clone().cpu().apply_(
-                lambda segment : self.basal_segment_to_cell[segment]
-            ).to(int_type).to(device)
+            return self.basal_segments.map_segments_to_cells(segments)
+        elif segment_type == "apical":
+            return self.apical_segments.map_segments_to_cells(segments)
+
+    def map_segments_to_cells_batch(self, segment_type, active_segments):
+        """
+        map a batch of `segment_type` (str) segment sets to cell sets: returns a
+        boolean (batch_size, num_total_cells) tensor, True for the cells of the
+        segments set in the boolean (batch_size, num_segments) tensor
+        `active_segments`.
+        """
+
+        check_segment_type(segment_type)
+
+        if segment_type == "basal":
+            return self.basal_segments.map_segments_to_cells_batch(active_segments)
+        elif segment_type == "apical":
+            return self.apical_segments.map_segments_to_cells_batch(active_segments)
+
+    def compute_segment_overlaps_batch(self, segment_type, active_inputs):
+        """
+        number of active connected synapses of each `segment_type` (str) segment,
+        for a batch of inputs: `active_inputs` is a boolean (batch_size, input_size)
+        tensor, and the result a (batch_size, num_segments) tensor.
+        """
+
+        check_segment_type(segment_type)
+
+        if segment_type == "basal":
+            connections = self.basal_connections
+        elif segment_type == "apical":
+            connections = self.apical_connections
+
+        if self.sparse_connections:
+            return connections.compute_overlaps_batch(
+                active_inputs, self.connected_permanence
+            )
+
+        # one matrix product for the whole batch
+        return (
+            active_inputs.to(real_type)
+            @ (connections >= self.connected_permanence).to(real_type).T
+        ).to(int_type)
+
+    def get_segments_for_cells(self, segment_type, cells):
+        """
+        return all `segment_type` (str) segments of `cells` (torch.Tensor), grouped by
+        cell.
+        """
+
+        check_segment_type(segment_type)
+
+        if segment_type == "basal":
+            return self.basal_segments.get_segments_for_cells(cells)
         elif segment_type == "apical":
-            return segments.clone().cpu().apply_(
-                lambda segment : self.apical_segment_to_cell[segment]
-            ).to(int_type).to(device)
+            return self.apical_segments.get_segments_for_cells(cells)
 
     def get_basal_segment_counts(self, cells):
         """
         return number of basal segments for each cell in `cells` (torch.Tensor)
         """
 
-        return cells.clone().cpu().apply_(
-            lambda cell : len(self.cell_to_basal_segments[cell])
-        ).to(int_type).to(device)
+        return self.basal_segments.get_segment_counts(cells)
+
+    def save(self, path, metadata=None, mappable=False):
+        """
+        save the model to `path` (str) in the compact checkpoint format (see
+        `checkpoint.py`): synapses are stored as packed (segment, input, permanence)
+        lists. `metadata` (dict or None) is stored with it. with `mappable`, large
+        arrays are stored unpacked, so that `load(path, mmap=True)` can memory-map
+        them.
+        """
+
+        # the connections are views of the segment pools
+        save_checkpoint(self, path, metadata,
+                        exclude=("basal_connections", "apical_connections"),
+                        mappable=mappable)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """
+        load a model saved with `save()`. it continues exactly like the saved one,
+        random state included. with `mmap`, the large arrays of a checkpoint saved
+        with `mappable` are memory-mapped instead of read.
+        """
+
+        tm = load_checkpoint(path, cls, mmap)
+
+        tm.basal_connections = tm.basal_segments.connections
+        tm.apical_connections = tm.apical_segments.connections
+
+        return tm
 
 
 def check_segment_type(segment_type):
@@ -1273,6 +1446,9 @@ def difference(a, b):
     both `a` and `b` cannot have any duplicate elements.
     """
 
+    convert_1d(a)
+    convert_1d(b)
+
     return a[~isin(a, b)]
 
 
@@ -46,6 +46,7 @@ __all__ = [
     "create_validation_data_sampler",
     "select_subset",
     "UnionDataset",
+    "IndexedDataset",
     "split_dataset",
     "PreprocessedDataset",
     "CachedDatasetFolder",
@@ -165,6 +166,25 @@ class UnionDataset(Dataset):
         return len(self.datasets[0])
 
 
+class IndexedDataset(Dataset):
+    """Dataset wrapper that returns the index of each item along with its label,
+    so that per-sample data (e.g. precomputed teacher outputs) can be looked up
+    after batching. Items are returned as `(data, (label, index))`.
+
+    :param dataset: dataset to wrap
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __getitem__(self, index):
+        data, label = self.dataset[index]
+        return data, (label, index)
+
+    def __len__(self):
+        return len(self.dataset)
+
+
 def split_dataset(dataset, groupby):
     """Split the given dataset into multiple datasets grouped by the given
     groupby function. For example::
@@ -20,6 +20,7 @@
 # ----------------------------------------------------------------------
 import gzip
 import io
+import itertools
 import pickle
 import random
 import re
@@ -27,12 +28,15 @@ import sys
 import time
 import warnings
 from collections.abc import Collection
+from functools import partial
 
 import numpy as np
 import torch
 import torch.nn.functional as F
 from tqdm import tqdm
 
+from nupic.research.frameworks.pytorch.prefetch import DevicePrefetcher
+
 
 def train_model(
     model,
@@ -47,6 +51,8 @@ def train_model(
     post_batch_callback=None,
     transform_to_device_fn=None,
     progress_bar=None,
+    prefetch_batches=0,
+    prefetch_transform=True,
 ):
     """Train the given model by iterating through mini batches. An epoch ends
     after one pass through the training set, or if the number of mini batches
@@ -86,9 +92,21 @@ def train_model(
     :param progress_bar: Optional :class:`tqdm` progress bar args.
                          None for no progress bar
     :type progress_bar: dict or None
-
-    :return: mean loss for epoch
-    :rtype: float
+    :param prefetch_batches: Number of batches loaded, sent to the device and
+                             transformed ahead in a background thread while the
+                             model trains, see :class:`DevicePrefetcher`.
+                             0 to disable prefetching
+    :type prefetch_batches: int
+    :param prefetch_transform: Whether `transform_to_device_fn` is applied by the
+                               prefetching thread. If False (e.g. transforms that
+                               run the model being trained), only the copy to the
+                               device is prefetched and the transform runs in the
+                               training loop
+    :type prefetch_transform: bool
+
+    :return: the prefetching timing (see :meth:`DevicePrefetcher.timing`) when
+             prefetching, None otherwise
+    :rtype: dict or None
     """
     model.train()
     # Use asynchronous GPU copies when the memory is pinned
@@ -111,11 +129,7 @@ def train_model(
                 "Mixed precision requires NVIDA APEX."
                 "Please install apex from https://www.github.com/nvidia/apex")
 
-    t0 = time.time()
-    for batch_idx, (data, target) in enumerate(loader):
-        if batch_idx >= batches_in_epoch:
-            break
-
+    def stage_batch(data, target):
         num_images = len(target)
         if transform_to_device_fn is None:
             data = data.to(device, non_blocking=async_gpu)
@@ -123,6 +137,22 @@ def train_model(
         else:
             data, target = transform_to_device_fn(data, target, device,
                                                   non_blocking=async_gpu)
+        return data, target, num_images
+
+    batches = itertools.islice(loader, batches_in_epoch)
+    if prefetch_batches > 0:
+        # Transforms that can't run in the prefetching thread are applied to the
+        # prefetched device copies in the training loop
+        copy_batch = partial(_copy_to_device, device=device, non_blocking=async_gpu)
+        batches = DevicePrefetcher(
+            batches, stage_batch if prefetch_transform else copy_batch, device,
+            num_batches=prefetch_batches,
+            transform_fn=None if prefetch_transform else stage_batch)
+    else:
+        batches = itertools.starmap(stage_batch, batches)
+
+    t0 = time.time()
+    for batch_idx, (data, target, num_images) in enumerate(batches):
         t1 = time.time()
 
         if pre_batch_callback is not None:
@@ -182,6 +212,14 @@ def train_model(
         loader.n = loader.total
         loader.close()
 
+    if prefetch_batches > 0:
+        return batches.timing()
+
+
+def _copy_to_device(data, target, device, non_blocking):
+    return (data.to(device, non_blocking=non_blocking),
+            target.to(device, non_blocking=non_blocking))
+
 
 def evaluate_model(
     model,
@@ -194,6 +232,7 @@ def evaluate_model(
     progress=None,
     post_batch_callback=None,
     transform_to_device_fn=None,
+    prefetch_batches=0,
 ):
     """Evaluate pre-trained model using given test dataset loader.
 
@@ -225,8 +264,13 @@ def evaluate_model(
                                    the data or targets, and determining what
                                    actually needs to get sent to the device.
     :type transform_to_device_fn: function
+    :param prefetch_batches: Number of batches loaded, sent to the device and
+                             transformed ahead in a background thread, see
+                             :class:`DevicePrefetcher`. 0 to disable prefetching
+    :type prefetch_batches: int
 
-    :return: dictionary with computed "mean_accuracy", "mean_loss", "total_correct".
+    :return: dictionary with computed "mean_accuracy", "mean_loss", "total_correct",
+             and the prefetching timing when prefetching.
     :rtype: dict
     """
     model.eval()
@@ -242,18 +286,24 @@ def evaluate_model(
         loader = tqdm(loader, total=min(len(loader), batches_in_epoch),
                       **progress)
 
-    with torch.no_grad():
-        for batch_idx, (data, target) in enumerate(loader):
-            if batch_idx >= batches_in_epoch:
-                break
+    def stage_batch(data, target):
+        if transform_to_device_fn is None:
+            data = data.to(device, non_blocking=async_gpu)
+            target = target.to(device, non_blocking=async_gpu)
+        else:
+            data, target = transform_to_device_fn(data, target, device,
+                                                  non_blocking=async_gpu)
+        return data, target
 
-            if transform_to_device_fn is None:
-                data = data.to(device, non_blocking=async_gpu)
-                target = target.to(device, non_blocking=async_gpu)
-            else:
-                data, target = transform_to_device_fn(data, target, device,
-                                                      non_blocking=async_gpu)
+    batches = itertools.islice(loader, batches_in_epoch)
+    if prefetch_batches > 0:
+        batches = DevicePrefetcher(batches, torch.no_grad()(stage_batch), device,
+                                   num_batches=prefetch_batches)
+    else:
+        batches = itertools.starmap(stage_batch, batches)
 
+    with torch.no_grad():
+        for batch_idx, (data, target) in enumerate(batches):
             output = model(data)
             if active_classes is not None:
                 output = output[:, active_classes]
@@ -286,6 +336,9 @@ def evaluate_model(
     if complexity_loss is not None:
         result["complexity_loss"] = complexity_loss.item()
 
+    if prefetch_batches > 0:
+        result.update(batches.timing())
+
     return result
 
 
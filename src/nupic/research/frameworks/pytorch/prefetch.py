@@ -0,0 +1,191 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import queue
+import threading
+import time
+from contextlib import nullcontext
+
+import torch
+
+__all__ = [
+    "DevicePrefetcher",
+]
+
+
+class DevicePrefetcher(object):
+    """
+    Iterates over the batches of a data loader after staging them with
+    `stage_fn(data, target)` (e.g. sending them to the device and applying the
+    experiment transforms) in a background thread, so the next `num_batches`
+    batches are loaded and staged while the current batch is used.
+
+    On CUDA devices the batches are staged on a separate stream, and the current
+    stream waits for a batch to be staged before it is returned.
+
+    The staging functions run concurrently with the training loop and up to
+    `num_batches` batches ahead of it: they must not depend on the model updates of
+    the batches in between. Functions that do (e.g. transforms running the model
+    being trained) can be passed as `transform_fn`, which is applied to the staged
+    batches in the loop's thread instead.
+
+    The time spent loading and staging the batches and the time the loop waited
+    for them are measured, see :meth:`timing`.
+    """
+
+    def __init__(self, loader, stage_fn, device, num_batches=1, transform_fn=None):
+        """
+        :param loader: iterable of (data, target) batches
+        :param stage_fn: function staging a batch, called with (data, target)
+        :param device: device the batches are staged on
+        :param num_batches: number of batches staged ahead
+        :param transform_fn: optional function applied to the unpacked staged
+                             batches as they are returned, in the loop's thread
+        """
+        self.loader = loader
+        self.stage_fn = stage_fn
+        self.device = torch.device(device)
+        self.num_batches = num_batches
+        self.transform_fn = transform_fn
+
+        self.staging_time = 0.0
+        self.wait_time = 0.0
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.num_batches)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._stage_batches, args=(batches, stop),
+                                  daemon=True)
+        thread.start()
+
+        stream = None
+        if self.device.type == "cuda":
+            stream = torch.cuda.current_stream(self.device)
+
+        try:
+            while True:
+                t0 = time.time()
+                item = batches.get()
+                self.wait_time += time.time() - t0
+
+                if item is _END:
+                    break
+                if isinstance(item, _StagingError):
+                    raise item.error
+
+                batch, event = item
+                if event is not None:
+                    stream.wait_event(event)
+                    _record_stream(batch, stream)
+                if self.transform_fn is not None:
+                    batch = self.transform_fn(*batch)
+                yield batch
+        finally:
+            # unblock and stop the staging thread if the loop ended early
+            stop.set()
+            while thread.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    thread.join(0.01)
+
+    def timing(self):
+        """
+        Returns the loading and staging time of the batches, the time the loop
+        waited for them, and the overlap: the fraction of the staging time hidden
+        behind the loop.
+        """
+        overlap = 0.0
+        if self.staging_time > 0:
+            overlap = max(0.0, 1.0 - self.wait_time / self.staging_time)
+
+        return {
+            "data_staging_time": self.staging_time,
+            "data_wait_time": self.wait_time,
+            "data_overlap": overlap,
+        }
+
+    def _stage_batches(self, batches, stop):
+        side_stream = None
+        if self.device.type == "cuda":
+            side_stream = torch.cuda.Stream(self.device)
+
+        try:
+            t0 = time.time()
+            for data, target in self.loader:
+                if stop.is_set():
+                    return
+
+                event = None
+                with torch.cuda.stream(side_stream) if side_stream else nullcontext():
+                    batch = self.stage_fn(data, target)
+                    if side_stream is not None:
+                        event = side_stream.record_event()
+
+                self.staging_time += time.time() - t0
+                if not _put(batches, (batch, event), stop):
+                    return
+                t0 = time.time()
+
+        except Exception as error:
+            _put(batches, _StagingError(error), stop)
+            return
+
+        _put(batches, _END, stop)
+
+
+class _StagingError(object):
+    def __init__(self, error):
+        self.error = error
+
+
+_END = object()
+
+
+def _put(batches, item, stop):
+    """
+    Put `item` in the queue unless the iteration is stopped. Returns whether the
+    item was put.
+    """
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+
+    return False
+
+
+def _record_stream(value, stream):
+    """
+    Mark the tensors of `value` as used by `stream`, so their memory is not reused
+    before `stream` is done with them
+    """
+    if isinstance(value, torch.Tensor):
+        if value.is_cuda:
+            value.record_stream(stream)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _record_stream(v, stream)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _record_stream(v, stream)
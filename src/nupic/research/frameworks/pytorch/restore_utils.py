@@ -28,6 +28,7 @@ from nupic.research.frameworks.pytorch.model_utils import (
     deserialize_state_dict,
     set_module_attr,
 )
+from nupic.research.frameworks.pytorch.tensor_checkpoint import load_tensor_checkpoint
 from nupic.torch.modules.sparse_weights import SparseWeightsBase
 
 # ----------------
@@ -232,6 +233,9 @@ def get_state_dict(checkpoint_path, device=None):
         with io.BytesIO(checkpoint_dict["model"]) as buffer:
             state_dict = deserialize_state_dict(buffer, device)
         return state_dict
+    elif "checkpoint_path" in checkpoint_dict:
+        state = load_tensor_checkpoint(checkpoint_dict["checkpoint_path"], device)
+        return state["model"]
     else:
         return None
 
@@ -0,0 +1,496 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Streaming checkpoint format for state dicts holding large tensors.
+
+A checkpoint file is laid out as:
+
+    magic (8 bytes) | header length (uint64) | pickled header | tensor data
+
+The header holds the state with every tensor replaced by a record of its dtype,
+shape and position in the tensor data. Tensors are written one at a time straight
+from their storage, aligned to 64 bytes, so saving never builds a serialized copy
+of the whole state in memory and loading can memory-map them.
+
+A delta checkpoint refers to a full checkpoint (its base) and only stores what
+changed since: tensors equal to the ones of the base are read from the base, and
+tensors with few changed elements (e.g. the weights of sparse models, whose zeros
+don't change) are stored as the flat indices and values of the changed elements.
+Elements are compared bitwise, so restoring a delta checkpoint is exact.
+"""
+
+import copy
+import os
+import pickle
+import re
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+__all__ = [
+    "TensorCheckpointWriter",
+    "load_tensor_checkpoint",
+    "save_tensor_checkpoint",
+]
+
+MAGIC = b"TNSCKPT\x00"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# integer types used to compare and patch tensor elements bitwise, by element size
+_BIT_TYPES = {1: torch.uint8, 2: torch.int16, 4: torch.int32, 8: torch.int64}
+
+
+def save_tensor_checkpoint(path, state, base=None):
+    """
+    Save `state` to a checkpoint file. The state is any picklable object (usually
+    a dict of state dicts): its tensors are stored in the tensor data of the file,
+    everything else in the header.
+    :param path: checkpoint file path
+    :param state: state to save
+    :param base: Optional path of a full checkpoint. When given, only the tensors
+                 changed since that checkpoint are saved (delta checkpoint). The
+                 base must stay next to the delta checkpoint to load it.
+    """
+    _write(path, *_encode(state, base, copy_tensors=False))
+
+
+def load_tensor_checkpoint(path, device=None, mmap=True):
+    """
+    Load a checkpoint saved via :func:`save_tensor_checkpoint` or
+    :class:`TensorCheckpointWriter`
+    :param path: checkpoint file path
+    :param device: Device to map tensors to
+    :param mmap: Whether to memory-map the tensors (copy-on-write) instead of
+                 reading them, so they are only paged in when used
+    :return: the saved state
+    """
+    header, data_offset = _read_header(path)
+
+    base_tensors = None
+    if header["base"] is not None:
+        base_path = os.path.join(os.path.dirname(path), header["base"])
+        base_header, base_offset = _read_header(base_path)
+        if base_header["base"] is not None:
+            raise ValueError(f"{base_path} is not a full checkpoint")
+        base_tensors = _Decoder(base_path, base_offset, mmap).decode_tensors(
+            base_header["state"])
+
+    decoder = _Decoder(path, data_offset, mmap, base_tensors)
+    return decoder.decode(header["state"], device)
+
+
+class TensorCheckpointWriter(object):
+    """
+    Writes numbered checkpoint files to a directory, by default in a background
+    thread so training continues while the files are written.
+
+    Each full checkpoint is followed by `num_deltas` delta checkpoints relative to
+    it, and files are numbered after the ones already in the directory. The state
+    is snapshot on the calling thread (tensors are copied to CPU, and only the
+    changed tensors or elements for delta checkpoints), and a checkpoint file only
+    appears at its path once it is completely written.
+
+    With `keep`, only the last `keep` full checkpoints and their delta checkpoints
+    are kept: older ones (including the files already in the directory) are
+    deleted once a newer full checkpoint is written.
+    """
+
+    def __init__(self, directory, num_deltas=0, background=True, keep=None):
+        """
+        :param directory: directory of the checkpoint files, created if needed
+        :param num_deltas: number of delta checkpoints after each full checkpoint
+        :param background: whether to write the files in a background thread
+        :param keep: number of full checkpoints kept with their delta checkpoints,
+                     or None to keep all the checkpoints
+        """
+        if keep is not None and keep < 1:
+            raise ValueError("keep must be at least 1")
+
+        self.directory = os.path.expanduser(directory)
+        self.num_deltas = num_deltas
+        self.keep = keep
+        self.executor = ThreadPoolExecutor(max_workers=1) if background else None
+
+        self.base = None
+        self.deltas_since_base = 0
+        self.pending = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # continue the numbering of the files already in the directory (e.g. of a
+        # restored experiment), so they are never overwritten
+        names = sorted(name for name in os.listdir(self.directory)
+                       if re.fullmatch(r"checkpoint_\d+\.ckpt", name))
+        numbers = [int(name[len("checkpoint_"):-len(".ckpt")]) for name in names]
+        self.num_checkpoints = max(numbers, default=-1) + 1
+
+        # paths of the full checkpoints followed by the paths of their deltas
+        self.groups = []
+        if keep is not None:
+            self.groups = _checkpoint_groups(self.directory, names)
+
+    def save(self, state):
+        """
+        Snapshot `state` and write it to the next checkpoint file
+        :param state: state to save, see :func:`save_tensor_checkpoint`
+        :return: path of the checkpoint file
+        """
+        # the base of a delta checkpoint is read to find the changed tensors, so
+        # the previous write must be done
+        self.wait()
+
+        path = os.path.join(self.directory,
+                            f"checkpoint_{self.num_checkpoints:06d}.ckpt")
+        self.num_checkpoints += 1
+
+        obsolete = []
+        if self.base is not None and self.deltas_since_base < self.num_deltas:
+            base = self.base
+            self.deltas_since_base += 1
+            self.groups[-1].append(path)
+        else:
+            base = None
+            self.base = path
+            self.deltas_since_base = 0
+            self.groups.append([path])
+            if self.keep is not None:
+                for group in self.groups[:-self.keep]:
+                    obsolete.extend(group)
+                del self.groups[:-self.keep]
+
+        encoded = _encode(state, base, copy_tensors=self.executor is not None)
+        if self.executor is not None:
+            self.pending = self.executor.submit(_write, path, *encoded,
+                                                obsolete=obsolete)
+        else:
+            _write(path, *encoded, obsolete=obsolete)
+
+        return path
+
+    def wait(self):
+        """
+        Wait until the pending checkpoint is written, raising its errors if any
+        """
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending.result()
+
+    def close(self):
+        self.wait()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+class _TensorRecord(object):
+    """
+    Header entry of a tensor. `kind` is "data" for tensors stored in the file,
+    "base" for tensors of the base checkpoint, and "patch" for tensors of the base
+    checkpoint with the elements stored in the file.
+    """
+
+    def __init__(self, kind, dtype, shape, key, offset=None, num_changed=None):
+        self.kind = kind
+        self.dtype = dtype
+        self.shape = shape
+        self.key = key
+        self.offset = offset
+        self.num_changed = num_changed
+
+
+def _encode(state, base, copy_tensors):
+    """
+    Returns the header of the checkpoint and the arrays of its tensor data. With
+    `copy_tensors`, the arrays don't share memory with the tensors of `state`.
+    """
+    base_tensors = None
+    if base is not None:
+        base_tensors = load_tensor_checkpoint(base, mmap=True, device="cpu")
+        base_tensors = dict(_iter_tensors(base_tensors))
+
+    encoder = _Encoder(base_tensors, copy_tensors)
+    header = {
+        "format_version": FORMAT_VERSION,
+        "torch_version": torch.__version__,
+        "base": os.path.basename(base) if base is not None else None,
+        "state": encoder.encode(state, ()),
+    }
+    return header, encoder.arrays
+
+
+def _write(path, header, arrays, obsolete=()):
+    """
+    Write a checkpoint file, then delete the `obsolete` checkpoint files
+    """
+    header = pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # write to a temporary file, so the path only ever holds complete checkpoints
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+
+        for array in arrays:
+            f.write(bytes(_padding(f.tell())))
+            f.write(memoryview(array))
+
+    os.replace(tmp_path, path)
+
+    for obsolete_path in obsolete:
+        if os.path.exists(obsolete_path):
+            os.remove(obsolete_path)
+
+
+def _checkpoint_groups(directory, names):
+    """
+    Group the checkpoint files `names` of `directory` (in writing order) by full
+    checkpoint: returns lists of the path of a full checkpoint followed by the
+    paths of its delta checkpoints
+    """
+    groups = {}
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            header, _ = _read_header(path)
+        except (OSError, EOFError, ValueError, struct.error,
+                pickle.UnpicklingError):
+            continue
+        base = header["base"] if header["base"] is not None else name
+        groups.setdefault(base, []).append(path)
+
+    return list(groups.values())
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a tensor checkpoint")
+
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        header = pickle.loads(f.read(header_length))
+        data_offset = f.tell() + _padding(f.tell())
+
+    if header["format_version"] > FORMAT_VERSION:
+        raise ValueError(f"{path} was saved with a newer checkpoint format")
+
+    return header, data_offset
+
+
+def _padding(position):
+    return -position % ALIGNMENT
+
+
+def _iter_tensors(value, key=()):
+    """
+    Yields the (key, tensor) pairs of the tensors in `value`, where the key is the
+    path of the tensor in the nested dicts, lists and tuples of `value`
+    """
+    if isinstance(value, torch.Tensor):
+        yield key, value
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            yield from _iter_tensors(v, key + (k,))
+    elif isinstance(value, (list, tuple)):
+        for i, v in enumerate(value):
+            yield from _iter_tensors(v, key + (i,))
+
+
+def _is_storable(tensor):
+    # sparse and quantized tensors are pickled in the header
+    return tensor.layout == torch.strided and not tensor.is_quantized
+
+
+def _as_bits(tensor):
+    """
+    Flat view of the elements of `tensor` as integers of the same size, or None
+    if there are no such integers (e.g. complex128)
+    """
+    bit_type = _BIT_TYPES.get(tensor.element_size())
+    if bit_type is None:
+        return None
+    return tensor.reshape(-1).view(bit_type)
+
+
+class _Encoder(object):
+
+    def __init__(self, base_tensors, copy_tensors):
+        self.base_tensors = base_tensors
+        self.copy_tensors = copy_tensors
+
+        # numpy arrays of the tensor data, and the size of the data so far
+        self.arrays = []
+        self.data_size = 0
+
+    def encode(self, value, key):
+        if isinstance(value, torch.Tensor):
+            return self.encode_tensor(value, key)
+
+        if isinstance(value, dict):
+            # shallow copy keeps the type and attributes (e.g. state dict metadata)
+            encoded = copy.copy(value)
+            for k, v in value.items():
+                encoded[k] = self.encode(v, key + (k,))
+            return encoded
+
+        if type(value) in (list, tuple):
+            return type(value)(self.encode(v, key + (i,))
+                               for i, v in enumerate(value))
+
+        return value
+
+    def encode_tensor(self, tensor, key):
+        if not _is_storable(tensor):
+            return tensor
+
+        tensor = tensor.detach()
+        record = _TensorRecord("data", tensor.dtype, tuple(tensor.shape), key)
+
+        base = None
+        if self.base_tensors is not None:
+            base = self.base_tensors.get(key)
+        if (base is None or base.dtype != tensor.dtype
+                or base.shape != tensor.shape):
+            record.offset = self.add_data(tensor)
+            return record
+
+        cpu_tensor = tensor.cpu().contiguous()
+        bits, base_bits = _as_bits(cpu_tensor), _as_bits(base)
+        if bits is None:
+            if torch.equal(cpu_tensor.view(torch.uint8), base.view(torch.uint8)):
+                record.kind = "base"
+            else:
+                record.offset = self.add_data(tensor)
+            return record
+
+        changed = torch.nonzero(bits != base_bits).squeeze(1)
+        num_changed = changed.numel()
+        if num_changed == 0:
+            record.kind = "base"
+        elif num_changed * (8 + bits.element_size()) < bits.numel() * 8:
+            record.kind = "patch"
+            record.num_changed = num_changed
+            record.offset = self.add_data(changed, copy_tensor=False)
+            self.add_data(bits[changed], copy_tensor=False)
+        else:
+            record.offset = self.add_data(tensor)
+
+        return record
+
+    def add_data(self, tensor, copy_tensor=None):
+        """
+        Add the elements of `tensor` to the tensor data and return their offset
+        """
+        data = tensor.cpu().contiguous()
+        if copy_tensor is None:
+            copy_tensor = self.copy_tensors
+        if copy_tensor and data.data_ptr() == tensor.data_ptr():
+            # snapshot tensors that may change before the data is written
+            data = data.clone()
+        array = data.reshape(-1).view(torch.uint8).numpy()
+
+        offset = self.data_size + _padding(self.data_size)
+        self.arrays.append(array)
+        self.data_size = offset + array.nbytes
+
+        return offset
+
+
+class _Decoder(object):
+
+    def __init__(self, path, data_offset, mmap, base_tensors=None):
+        self.path = path
+        self.data_offset = data_offset
+        self.mmap = mmap
+        self.base_tensors = base_tensors
+
+    def decode(self, encoded, device):
+        if isinstance(encoded, _TensorRecord):
+            encoded = self.decode_tensor(encoded)
+
+        if isinstance(encoded, torch.Tensor):
+            return encoded if device is None else encoded.to(device)
+
+        if isinstance(encoded, dict):
+            decoded = copy.copy(encoded)
+            for k, v in encoded.items():
+                decoded[k] = self.decode(v, device)
+            return decoded
+
+        if type(encoded) in (list, tuple):
+            return type(encoded)(self.decode(v, device) for v in encoded)
+
+        return encoded
+
+    def decode_tensors(self, encoded):
+        """
+        dict of the tensors of the state, by key (see `_iter_tensors`)
+        """
+        return {record.key: self.decode_tensor(record)
+                for record in _iter_records(encoded)}
+
+    def decode_tensor(self, record):
+        if record.kind == "data":
+            return self.read(record.offset, record.dtype, record.shape)
+
+        base = self.base_tensors[record.key]
+        if record.kind == "base":
+            return base
+
+        tensor = base.clone()
+        bits = _as_bits(tensor)
+        changed = self.read(record.offset, torch.int64, (record.num_changed,))
+        values_offset = record.offset + changed.numel() * 8
+        values_offset += _padding(values_offset)
+        bits[changed] = self.read(values_offset, bits.dtype, (record.num_changed,))
+
+        return tensor
+
+    def read(self, offset, dtype, shape):
+        nbytes = int(np.prod(shape)) * torch.empty(0, dtype=dtype).element_size()
+        if nbytes == 0:
+            return torch.empty(shape, dtype=dtype)
+
+        offset += self.data_offset
+        if self.mmap:
+            array = np.memmap(self.path, dtype=np.uint8, mode="c", offset=offset,
+                              shape=(nbytes,))
+        else:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                array = np.frombuffer(bytearray(f.read(nbytes)), dtype=np.uint8)
+
+        return torch.from_numpy(array).view(dtype).view(shape)
+
+
+def _iter_records(encoded):
+    if isinstance(encoded, _TensorRecord):
+        yield encoded
+    elif isinstance(encoded, dict):
+        for v in encoded.values():
+            yield from _iter_records(v)
+    elif isinstance(encoded, (list, tuple)):
+        for v in encoded:
+            yield from _iter_records(v)
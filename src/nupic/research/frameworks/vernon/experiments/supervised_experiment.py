@@ -22,6 +22,7 @@
 import io
 import sys
 import time
+from functools import partial
 from pprint import pformat
 
 import torch
@@ -36,6 +37,10 @@ from nupic.research.frameworks.pytorch.model_utils import (
     serialize_state_dict,
     train_model,
 )
+from nupic.research.frameworks.pytorch.tensor_checkpoint import (
+    TensorCheckpointWriter,
+    load_tensor_checkpoint,
+)
 from nupic.research.frameworks.vernon.experiment_utils import create_lr_scheduler
 from nupic.research.frameworks.vernon.experiments.components.experiment_base import (
     ExperimentBase,
@@ -64,6 +69,12 @@ class SupervisedExperiment(ExperimentBase):
     """
     General experiment class used to train neural networks in supervised learning tasks.
     """
+
+    # Whether `transform_data_to_device` can run in the prefetching thread during
+    # training (see "prefetch_batches"). Mixins whose transform runs the model being
+    # trained set this to False.
+    prefetch_transform = True
+
     def __init__(self):
         self.model = None
         self.optimizer = None
@@ -80,6 +91,9 @@ class SupervisedExperiment(ExperimentBase):
         self.epochs_to_validate = []
         self.current_epoch = 0
         self.distributed = False
+        self.checkpoint_writer = None
+        self.prefetch_batches = 0
+        self.train_timing = None
 
     def setup_experiment(self, config):
         """
@@ -140,6 +154,31 @@ class SupervisedExperiment(ExperimentBase):
             - launch_time: time the config was created (via time.time). Used to report
                            wall clock time until the first batch is done.
                            Default: time.time() in this setup_experiment().
+            - checkpoint_dir: if not None, `get_state` writes the model, optimizer,
+                              LR scheduler and amp states to a checkpoint file in
+                              this directory and returns its path instead of their
+                              serialized bytes. See "tensor_checkpoint". The path
+                              is local, so restoring on another node requires
+                              checkpoint_dir to be on a shared filesystem.
+            - checkpoint_deltas: number of checkpoints written to checkpoint_dir
+                                 after each full checkpoint that only store the
+                                 tensors changed since it. Default: 0
+            - checkpoint_keep: number of full checkpoints kept in checkpoint_dir
+                               with their delta checkpoints, older ones are
+                               deleted. It must cover the checkpoints kept by Ray
+                               (e.g. "keep_checkpoints_num"), which can't be
+                               restored once deleted. Default: None (keep all)
+            - checkpoint_async: whether to write the checkpoint_dir checkpoints in a
+                                background thread. Default: True
+            - prefetch_batches: Number of batches loaded, sent to the device and
+                                transformed (see `transform_data_to_device`) in a
+                                background thread ahead of training and validation.
+                                The transforms must not depend on the model updates
+                                of the batches in between: if "prefetch_transform"
+                                is False, only the device copy of the training
+                                batches is prefetched. The data wait and staging
+                                times and their overlap are reported in the epoch
+                                results. Default: 0 (no prefetching)
         """
 
         self.launch_time = config.get("launch_time", time.time())
@@ -210,10 +249,30 @@ class SupervisedExperiment(ExperimentBase):
         self.train_model = config.get("train_model_func", train_model)
         self.evaluate_model = config.get("evaluate_model_func", evaluate_model)
 
+        self.prefetch_batches = config.get("prefetch_batches", 0)
+        if self.prefetch_batches > 0:
+            if not self.prefetch_transform:
+                self.logger.info("transform_data_to_device runs the model: only "
+                                 "prefetching the device copy of training batches")
+            self.train_model = partial(self.train_model,
+                                       prefetch_batches=self.prefetch_batches,
+                                       prefetch_transform=self.prefetch_transform)
+            self.evaluate_model = partial(self.evaluate_model,
+                                          prefetch_batches=self.prefetch_batches)
+
         self.progress = config.get("progress", False)
         if self.logger.disabled:
             self.progress = False
 
+        checkpoint_dir = config.get("checkpoint_dir", None)
+        if checkpoint_dir is not None:
+            self.checkpoint_writer = TensorCheckpointWriter(
+                checkpoint_dir,
+                num_deltas=config.get("checkpoint_deltas", 0),
+                keep=config.get("checkpoint_keep", None),
+                background=config.get("checkpoint_async", True),
+            )
+
     @classmethod
     def create_model(cls, config, device):
         """
@@ -362,7 +421,7 @@ class SupervisedExperiment(ExperimentBase):
         )
 
     def train_epoch(self):
-        self.train_model(
+        self.train_timing = self.train_model(
             model=self.model,
             loader=self.train_loader,
             optimizer=self.optimizer,
@@ -395,6 +454,10 @@ class SupervisedExperiment(ExperimentBase):
             learning_rate=self.get_lr()[0],
         )
 
+        if self.prefetch_batches > 0 and self.train_timing is not None:
+            self.logger.debug("train data timing: %s", self.train_timing)
+            ret.update({"train_" + k: v for k, v in self.train_timing.items()})
+
         self.logger.debug("validate time: %s", time.time() - t1)
         self.logger.debug("---------- End of run epoch ------------")
         self.logger.debug("")
@@ -491,40 +554,48 @@ class SupervisedExperiment(ExperimentBase):
     def get_state(self):
         """
         Get experiment serialized state as a dictionary of  byte arrays
-        :return: dictionary with "model", "optimizer" and "lr_scheduler" states
+        :return: dictionary with "model", "optimizer" and "lr_scheduler" states,
+                 or with the "checkpoint_path" of the file holding them when
+                 using "checkpoint_dir". That path is local to this node: restoring
+                 the state on another node requires "checkpoint_dir" to be on a
+                 shared filesystem.
         """
         state = {
             "current_epoch": self.current_epoch,
         }
 
-        # Save state into a byte array to avoid ray's GPU serialization issues
-        # See https://github.com/ray-project/ray/issues/5519
-        with io.BytesIO() as buffer:
-            model = self.model
-            if hasattr(model, "module"):
-                # DistributedDataParallel
-                model = model.module
-            serialize_state_dict(buffer, model.state_dict())
-            state["model"] = buffer.getvalue()
-
-        with io.BytesIO() as buffer:
-            serialize_state_dict(buffer, self.optimizer.state_dict())
-            state["optimizer"] = buffer.getvalue()
+        model = self.model
+        if hasattr(model, "module"):
+            # DistributedDataParallel
+            model = model.module
+        state_dicts = {
+            "model": model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+        }
 
         if self.lr_scheduler is not None:
-            with io.BytesIO() as buffer:
-                state_dict = self.lr_scheduler.state_dict()
-                if "anneal_func" in state_dict:
-                    # FIXME: This is a workaround for a PyTorch bug.
-                    # https://github.com/pytorch/pytorch/issues/42376
-                    del state_dict["anneal_func"]
-                serialize_state_dict(buffer, state_dict)
-                state["lr_scheduler"] = buffer.getvalue()
+            state_dict = self.lr_scheduler.state_dict()
+            if "anneal_func" in state_dict:
+                # FIXME: This is a workaround for a PyTorch bug.
+                # https://github.com/pytorch/pytorch/issues/42376
+                del state_dict["anneal_func"]
+            state_dicts["lr_scheduler"] = state_dict
 
         if self.mixed_precision:
+            state_dicts["amp"] = amp.state_dict()
+
+        if self.checkpoint_writer is not None:
+            # Tensors are streamed to the file (in the background) and only the
+            # path is returned, so no serialized copy of the state is kept
+            state["checkpoint_path"] = self.checkpoint_writer.save(state_dicts)
+            return state
+
+        # Save state into a byte array to avoid ray's GPU serialization issues
+        # See https://github.com/ray-project/ray/issues/5519
+        for name, state_dict in state_dicts.items():
             with io.BytesIO() as buffer:
-                serialize_state_dict(buffer, amp.state_dict())
-                state["amp"] = buffer.getvalue()
+                serialize_state_dict(buffer, state_dict)
+                state[name] = buffer.getvalue()
 
         return state
 
@@ -532,32 +603,36 @@ class SupervisedExperiment(ExperimentBase):
         """
         Restore the experiment from the state returned by `get_state`
         :param state: dictionary with "model", "optimizer", "lr_scheduler", and "amp"
-                      states
+                      states, or with the "checkpoint_path" of the file holding them
         """
-        if "model" in state:
-            with io.BytesIO(state["model"]) as buffer:
-                state_dict = deserialize_state_dict(buffer, self.device)
+        state_dicts = {}
+        if "checkpoint_path" in state:
+            if self.checkpoint_writer is not None:
+                self.checkpoint_writer.wait()
+            state_dicts.update(
+                load_tensor_checkpoint(state["checkpoint_path"], self.device))
+
+        for name in ("model", "optimizer", "lr_scheduler", "amp"):
+            if name in state:
+                with io.BytesIO(state[name]) as buffer:
+                    state_dicts[name] = deserialize_state_dict(buffer, self.device)
+
+        if "model" in state_dicts:
             model = self.model
             if hasattr(model, "module"):
                 # DistributedDataParallel
                 model = model.module
-            state_dict = get_compatible_state_dict(state_dict, model)
+            state_dict = get_compatible_state_dict(state_dicts["model"], model)
             model.load_state_dict(state_dict)
 
-        if "optimizer" in state:
-            with io.BytesIO(state["optimizer"]) as buffer:
-                state_dict = deserialize_state_dict(buffer, self.device)
-            self.optimizer.load_state_dict(state_dict)
+        if "optimizer" in state_dicts:
+            self.optimizer.load_state_dict(state_dicts["optimizer"])
 
-        if "lr_scheduler" in state:
-            with io.BytesIO(state["lr_scheduler"]) as buffer:
-                state_dict = deserialize_state_dict(buffer, self.device)
-            self.lr_scheduler.load_state_dict(state_dict)
+        if "lr_scheduler" in state_dicts:
+            self.lr_scheduler.load_state_dict(state_dicts["lr_scheduler"])
 
-        if "amp" in state and amp is not None:
-            with io.BytesIO(state["amp"]) as buffer:
-                state_dict = deserialize_state_dict(buffer, self.device)
-            amp.load_state_dict(state_dict)
+        if "amp" in state_dicts and amp is not None:
+            amp.load_state_dict(state_dicts["amp"])
 
         if "current_epoch" in state:
             self.current_epoch = state["current_epoch"]
@@ -572,6 +647,12 @@ class SupervisedExperiment(ExperimentBase):
             else:
                 self.current_epoch = last_epoch
 
+    def stop_experiment(self):
+        super().stop_experiment()
+        if self.checkpoint_writer is not None:
+            # Finish writing the last checkpoint
+            self.checkpoint_writer.close()
+
     def run_iteration(self):
         return self.run_epoch()
 
@@ -610,6 +691,7 @@ class SupervisedExperiment(ExperimentBase):
         eo["setup_experiment"].append(exp + ".setup_experiment")
         eo["get_state"].append(exp + ": Model, optimizer, LR scheduler, epoch")
         eo["set_state"].append(exp + ": Model, optimizer, LR scheduler, epoch")
+        eo["stop_experiment"].append(exp + ": Finish checkpoint writes")
 
         eo.update(
             # Overwritten methods
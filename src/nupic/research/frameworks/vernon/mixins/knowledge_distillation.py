@@ -19,8 +19,20 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
 import torch
+import torch.distributed as dist
 import torch.nn.functional as F
+from numpy.lib.format import open_memmap
+from torch.utils.data import DataLoader
+
+from nupic.research.frameworks.pytorch.dataset_utils import IndexedDataset
 
 
 class KnowledgeDistillation(object):
@@ -63,6 +75,22 @@ class KnowledgeDistillation(object):
                                   Will calculate linear decay based on
                                   kd_temperature_init and kd_temperature_end.
                                   If None, no decay is applied. Defaults to None.
+            - kd_logit_store: Directory of a store of the teacher outputs on the
+                              training set. If set, the teacher outputs are
+                              computed once (if the store doesn't exist yet) and
+                              looked up by sample index during training, instead
+                              of running the teachers on every batch. Only valid
+                              if the training data is not augmented, or
+                              deterministically augmented. An existing store must
+                              have been created with the same teacher weights,
+                              dataset, num_classes, topk and dtype (see
+                              `kd_logit_store_metadata`). Defaults to None.
+            - kd_logit_store_topk: If set, only the k largest outputs of each
+                                   teacher are stored, and the softmax is
+                                   computed over these k classes.
+                                   Defaults to None.
+            - kd_logit_store_dtype: Dtype of the stored outputs, "float32" or
+                                    "float16". Defaults to "float32".
         """
         super().setup_experiment(config)
 
@@ -113,6 +141,114 @@ class KnowledgeDistillation(object):
                 "Number of ensemble weights should match number of teacher models"
         self.logger.info(f"Ensemble weights: {self.kd_ensemble_weights}")
 
+        # initialize store of precomputed teacher outputs
+        self.kd_logit_store = None
+        store_path = config.get("kd_logit_store", None)
+        if store_path is not None:
+            metadata = self.kd_logit_store_metadata(config)
+            if not os.path.exists(store_path):
+                if not self.distributed or self.rank == 0:
+                    self.create_kd_logit_store(config, store_path, metadata)
+                if self.distributed:
+                    dist.barrier()
+
+            self.kd_logit_store = TeacherLogitStore(store_path)
+            mismatch = [key for key, value in metadata.items()
+                        if self.kd_logit_store.metadata.get(key) != value]
+            if mismatch:
+                raise ValueError(
+                    f"kd_logit_store {store_path} was created with different "
+                    f"{', '.join(mismatch)}: delete it to compute the teacher "
+                    f"outputs again")
+            self.logger.info(f"KD teacher outputs loaded from {store_path}")
+
+    @classmethod
+    def create_train_dataloader(cls, config, dataset=None):
+        """
+        Return the sample indices along with the targets when using a
+        kd_logit_store.
+        """
+        if config.get("kd_logit_store", None) is not None:
+            if dataset is None:
+                dataset = cls.load_dataset(config, train=True)
+            dataset = IndexedDataset(dataset)
+
+        return super().create_train_dataloader(config, dataset)
+
+    def kd_logit_store_metadata(self, config):
+        """
+        Describe the teacher outputs of the kd_logit_store: checksums of the
+        teacher weights, the training dataset, the number of classes and how the
+        outputs are stored. A store is only used with the metadata it was created
+        with.
+        """
+        dataset_class = config.get("dataset_class", None)
+        return {
+            "teachers": [_state_dict_checksum(model) for model in self.teacher_models],
+            "dataset_class": getattr(dataset_class, "__qualname__",
+                                     repr(dataset_class)),
+            "dataset_args": json.dumps(config.get("dataset_args", {}),
+                                       sort_keys=True, default=repr),
+            "num_samples": len(self.train_loader.dataset),
+            "num_classes": self.num_classes,
+            "topk": config.get("kd_logit_store_topk", None),
+            "dtype": config.get("kd_logit_store_dtype", "float32"),
+        }
+
+    def create_kd_logit_store(self, config, path, metadata=None):
+        """
+        Compute the teacher outputs on the whole training set and save them as a
+        TeacherLogitStore.
+        """
+        self.logger.info(f"Computing KD teacher outputs into {path}")
+        start_time = time.time()
+
+        loader = DataLoader(
+            dataset=self.train_loader.dataset,
+            batch_size=config.get("batch_size", 1),
+            shuffle=False,
+            num_workers=config.get("workers", 0),
+            pin_memory=torch.cuda.is_available(),
+        )
+        TeacherLogitStore.create(
+            path,
+            teacher_outputs=self.iter_teacher_outputs(loader),
+            num_samples=len(loader.dataset),
+            num_teachers=len(self.teacher_models),
+            num_classes=self.num_classes,
+            topk=config.get("kd_logit_store_topk", None),
+            dtype=config.get("kd_logit_store_dtype", "float32"),
+            metadata=metadata,
+        )
+        self.logger.info(
+            f"KD teacher outputs computed in {time.time() - start_time:.1f}s")
+
+    def iter_teacher_outputs(self, loader):
+        """
+        Yield the sample indices and the stacked teacher outputs, of shape
+        (batch_size, num_teachers, num_classes), for each batch of loader.
+        """
+        with torch.no_grad():
+            for data, (_, indices) in loader:
+                data = data.to(self.device)
+                outputs = torch.stack(
+                    [tmodel(data) for tmodel in self.teacher_models], dim=1)
+                yield indices, outputs.cpu()
+
+    def get_teacher_outputs(self, data, target, non_blocking):
+        """
+        Return the list of teacher outputs for data, and the targets. With a
+        kd_logit_store, the outputs are looked up using the sample indices that
+        come with the targets.
+        """
+        if self.kd_logit_store is None:
+            return [tmodel(data) for tmodel in self.teacher_models], target
+
+        target, indices = target
+        outputs = self.kd_logit_store.lookup(indices, self.num_classes)
+        outputs = outputs.to(self.device, non_blocking=non_blocking)
+        return list(outputs.unbind(dim=1)), target
+
     def pre_epoch(self):
         super().pre_epoch()
 
@@ -151,15 +287,18 @@ class KnowledgeDistillation(object):
 
         data = data.to(self.device, non_blocking=non_blocking)
         with torch.no_grad():
+            teacher_outputs, target = self.get_teacher_outputs(data, target,
+                                                               non_blocking)
+
             # if ensemble, linearly combine outputs of softmax
             softmax_output_teacher = None
-            for wfactor, tmodel in zip(self.kd_ensemble_weights, self.teacher_models):
+            for wfactor, toutput in zip(self.kd_ensemble_weights, teacher_outputs):
                 if softmax_output_teacher is None:
                     softmax_output_teacher = \
-                        F.softmax(tmodel(data) / self.kd_temperature) * wfactor
+                        F.softmax(toutput / self.kd_temperature) * wfactor
                 else:
                     softmax_output_teacher += \
-                        F.softmax(tmodel(data) / self.kd_temperature) * wfactor
+                        F.softmax(toutput / self.kd_temperature) * wfactor
 
             if self.kd_factor < 1:
                 # target is linear combination of teacher and target softmaxes
@@ -189,6 +328,8 @@ class KnowledgeDistillation(object):
     def get_execution_order(cls):
         eo = super().get_execution_order()
         eo["setup_experiment"].append("Knowledge Distillation initialization")
+        eo["create_train_dataloader"].insert(
+            0, "If kd_logit_store: return sample indices with targets")
         eo["pre_epoch"].append("Update kd factor based on linear decay")
         eo["transform_data_to_device"].insert(0, "If not training: {")
         eo["transform_data_to_device"].append(
@@ -219,14 +360,17 @@ class KnowledgeDistillationCL(KnowledgeDistillation):
             return super().transform_data_to_device(data, target, device,
                                                     non_blocking)
 
-        target = target.to(self.device, non_blocking=non_blocking)
         data = data.to(self.device, non_blocking=non_blocking)
 
         # calculate and return soft targets for each model
         with torch.no_grad():
+            teacher_outputs, target = self.get_teacher_outputs(data, target,
+                                                               non_blocking)
             soft_targets = []
-            for tmodel in self.teacher_models:
-                soft_targets.append(F.softmax(tmodel(data) / self.kd_temperature))
+            for toutput in teacher_outputs:
+                soft_targets.append(F.softmax(toutput / self.kd_temperature))
+
+        target = target.to(self.device, non_blocking=non_blocking)
 
         return data, (target, soft_targets)
 
@@ -261,6 +405,133 @@ class KnowledgeDistillationCL(KnowledgeDistillation):
         return error_loss
 
 
+class TeacherLogitStore(object):
+    """
+    Memory-mapped store of the outputs of one or more teacher models, indexed by
+    dataset sample. The outputs are saved in a directory as .npy files, so that
+    they can be read without loading the whole store in memory:
+
+        - values.npy: (num_samples, num_teachers, k) outputs
+        - indices.npy: (num_samples, num_teachers, k) classes of the outputs,
+                       only when storing the top k outputs of each teacher
+        - metadata.json: description of the outputs given when creating the store
+
+    :param path: directory of the store
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+
+        metadata_path = os.path.join(path, "metadata.json")
+        self.metadata = {}
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                self.metadata = json.load(f)
+
+        indices_path = os.path.join(path, "indices.npy")
+        if os.path.exists(indices_path):
+            self.indices = np.load(indices_path, mmap_mode="r")
+        else:
+            self.indices = None
+
+    @property
+    def num_teachers(self):
+        return self.values.shape[1]
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def lookup(self, sample_indices, num_classes):
+        """
+        Return the float32 teacher outputs for the given samples, of shape
+        (len(sample_indices), num_teachers, num_classes). When only the top k
+        outputs are stored, the other outputs are -inf, so they get a softmax
+        probability of 0.
+
+        :param sample_indices: tensor of dataset indices
+        :param num_classes: number of classes of the teacher outputs
+        """
+        sample_indices = np.asarray(sample_indices)
+        values = torch.from_numpy(
+            self.values[sample_indices].astype(np.float32, copy=False))
+        if self.indices is None:
+            return values
+
+        outputs = torch.full((len(sample_indices), self.num_teachers, num_classes),
+                             float("-inf"))
+        classes = torch.from_numpy(self.indices[sample_indices].astype(np.int64))
+        return outputs.scatter_(2, classes, values)
+
+    @classmethod
+    def create(cls, path, teacher_outputs, num_samples, num_teachers, num_classes,
+               topk=None, dtype="float32", metadata=None):
+        """
+        Write a store from an iterable of (sample_indices, outputs) batches,
+        outputs being tensors of shape (batch_size, num_teachers, num_classes).
+        The store is written to a temporary directory that is renamed to path
+        when complete, so an interrupted run leaves no partial store.
+
+        :param path: directory of the store
+        :param teacher_outputs: iterable of batches of teacher outputs
+        :param num_samples: number of samples in the dataset
+        :param num_teachers: number of teachers
+        :param num_classes: number of classes of the teacher outputs
+        :param topk: if set, only store the k largest outputs of each teacher
+        :param dtype: dtype of the stored outputs, "float32" or "float16"
+        :param metadata: JSON serializable description of the outputs, saved with
+                         them
+        """
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        os.makedirs(tmp_path)
+
+        with open(os.path.join(tmp_path, "metadata.json"), "w") as f:
+            json.dump(metadata or {}, f)
+
+        k = num_classes if topk is None else topk
+        values = open_memmap(os.path.join(tmp_path, "values.npy"), mode="w+",
+                             dtype=dtype, shape=(num_samples, num_teachers, k))
+        if topk is not None:
+            index_dtype = np.int16 if num_classes <= np.iinfo(np.int16).max \
+                else np.int32
+            indices = open_memmap(os.path.join(tmp_path, "indices.npy"), mode="w+",
+                                  dtype=index_dtype,
+                                  shape=(num_samples, num_teachers, k))
+
+        for sample_indices, outputs in teacher_outputs:
+            sample_indices = np.asarray(sample_indices)
+            if topk is not None:
+                outputs, classes = outputs.topk(topk, dim=2)
+                indices[sample_indices] = classes.numpy()
+            values[sample_indices] = outputs.numpy()
+
+        values.flush()
+        del values
+        if topk is not None:
+            indices.flush()
+            del indices
+
+        if os.path.exists(path):
+            shutil.rmtree(tmp_path)
+        else:
+            os.rename(tmp_path, path)
+
+        return cls(path)
+
+
+def _state_dict_checksum(model):
+    """
+    SHA-256 checksum of the names and values of the state dict of a model
+    """
+    checksum = hashlib.sha256()
+    for name, value in model.state_dict().items():
+        checksum.update(name.encode())
+        if isinstance(value, torch.Tensor):
+            value = value.detach().cpu().contiguous().reshape(-1).view(torch.uint8)
+            checksum.update(value.numpy().tobytes())
+    return checksum.hexdigest()
+
+
 def soft_cross_entropy(output, target, reduction="mean"):
     """ Cross entropy that accepts soft targets
     Args:
@@ -26,19 +26,35 @@ class LogCovariance(object):
     """
     During testing, record the covariance of unit activations within each
     specified layer.
+
+    The covariance is accumulated batch by batch in the forward hooks, so memory
+    use doesn't depend on the size of the validation set.
     """
     def setup_experiment(self, config):
+        """
+        :param config:
+            - log_covariance_layernames: names of the layers whose activations
+                                         covariance is recorded
+            - log_covariance_sketch_size: Optional, for layers wider than this, the
+                                          covariance sum of squares is estimated
+                                          from a random projection of the
+                                          covariance matrix on this many
+                                          dimensions instead of computed from the
+                                          full matrix. Default: None (exact)
+        """
         super().setup_experiment(config)
         self.log_covariance_layernames = config.get("log_covariance_layernames",
                                                     ())
+        self.log_covariance_sketch_size = config.get("log_covariance_sketch_size",
+                                                     None)
 
     def validate(self, *args, **kwargs):
-        activations = {layername: []
+        covariances = {layername: StreamingCovariance(self.log_covariance_sketch_size)
                        for layername in self.log_covariance_layernames}
 
         def accumulator(layername):
             def accumulate_activation(module, x, y):
-                activations[layername].append(y)
+                covariances[layername].update(y.detach())
 
             return accumulate_activation
 
@@ -49,16 +65,10 @@ class LogCovariance(object):
         for hook in hooks:
             hook.remove()
 
-        for layername, layer_activations in activations.items():
-            H = torch.cat(layer_activations) # NOQA N806
-            H -= torch.mean(H, dim=0)
-            cov = H.t().mm(H) / H.shape[0]
-            var = cov.diag()
-            # Mask out the diagonal
-            cov *= (1 - torch.eye(cov.shape[0]).to(self.device))
+        for layername, covariance in covariances.items():
             result["{}/covariance_sum_of_squares".format(layername)] = \
-                (cov.pow(2).sum() / 2).item()
-            result["{}/variance_sum".format(layername)] = var.sum().item()
+                covariance.covariance_sum_of_squares()
+            result["{}/variance_sum".format(layername)] = covariance.variance_sum()
 
         return result
 
@@ -69,3 +79,96 @@ class LogCovariance(object):
         eo["validate"].insert(0, "LogCovariance add hooks")
         eo["validate"].append("LogCovariance remove hooks, compute covariance")
         return eo
+
+
+class StreamingCovariance(object):
+    """
+    Covariance of activations accumulated one batch at a time, with the batched
+    (Chan et al.) update of the mean and of the sum of the centered outer products
+    M2, so the covariance is M2 / n.
+
+    If `sketch_size` is smaller than the number of units, only the diagonal of M2
+    and its product with a fixed random Gaussian (num_units, sketch_size) matrix are
+    kept, and the sum of squares of the covariance is estimated from that product.
+    """
+    def __init__(self, sketch_size=None, seed=42):
+        self.sketch_size = sketch_size
+        self.seed = seed
+
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+        self.m2_diag = None
+        self.projection = None
+        self.m2_sketch = None
+
+    @property
+    def sketched(self):
+        return self.projection is not None
+
+    def update(self, activations):
+        """
+        Add a batch of activations, a (batch_size, num_units, ...) tensor
+        """
+        activations = activations.flatten(start_dim=1)
+        n_batch = activations.shape[0]
+        if n_batch == 0:
+            return
+
+        if self.mean is None:
+            self._initialize(activations)
+
+        mean_batch = activations.mean(dim=0)
+        centered = activations - mean_batch
+
+        n = self.n + n_batch
+        delta = mean_batch - self.mean
+        weight = self.n * n_batch / n
+
+        self.mean += delta * (n_batch / n)
+        self.m2_diag += centered.pow(2).sum(dim=0) + delta.pow(2) * weight
+        if self.sketched:
+            self.m2_sketch += centered.t().mm(centered.mm(self.projection))
+            self.m2_sketch += torch.outer(delta, self.projection.t().mv(delta)) * weight
+        else:
+            self.m2 += centered.t().mm(centered)
+            self.m2 += torch.outer(delta, delta) * weight
+        self.n = n
+
+    def variance_sum(self):
+        if self.n == 0:
+            return 0.0
+        return (self.m2_diag.sum() / self.n).item()
+
+    def covariance_sum_of_squares(self):
+        """
+        Sum of the squares of the covariances between different units
+        """
+        if self.n == 0:
+            return 0.0
+
+        if self.sketched:
+            # E[|C g|^2] = |C|_F^2 for g ~ N(0, I)
+            total = self.m2_sketch.pow(2).sum() / self.projection.shape[1]
+        else:
+            total = self.m2.pow(2).sum()
+
+        sum_of_squares = (total - self.m2_diag.pow(2).sum()) / self.n ** 2
+        return (sum_of_squares / 2).item()
+
+    def _initialize(self, activations):
+        num_units = activations.shape[1]
+        device, dtype = activations.device, activations.dtype
+
+        self.mean = torch.zeros(num_units, device=device, dtype=dtype)
+        self.m2_diag = torch.zeros(num_units, device=device, dtype=dtype)
+        if self.sketch_size is not None and self.sketch_size < num_units:
+            # Fixed seed, so the global random state is not changed
+            generator = torch.Generator().manual_seed(self.seed)
+            self.projection = torch.randn(num_units, self.sketch_size,
+                                          generator=generator, dtype=dtype)
+            self.projection = self.projection.to(device)
+            self.m2_sketch = torch.zeros(num_units, self.sketch_size, device=device,
+                                         dtype=dtype)
+        else:
+            self.m2 = torch.zeros(num_units, num_units, device=device, dtype=dtype)
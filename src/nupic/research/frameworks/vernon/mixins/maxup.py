@@ -32,6 +32,9 @@ class MaxupStandard(object):
 
     Paper: https://arxiv.org/pdf/2002.09024.pdf
     """
+    # The transform runs the model being trained: it can't be prefetched
+    prefetch_transform = False
+
     def transform_data_to_device(self, data, target, device, non_blocking):
         """
         :param data: input to the model, as specified by dataloader
@@ -57,7 +60,7 @@ class MaxupStandard(object):
             data_variant = data[:, dim, :, :, :]
             with torch.no_grad():
                 output = self.model(data_variant)
-                losses.append(self.loss_function(output, target).item())
+                losses.append(self.error_loss(output, target).item())
 
         # choose the max loss
         max_loss_dim = np.argmax(losses)
@@ -86,6 +89,9 @@ class MaxupPerSample(object):
 
     Paper: https://arxiv.org/pdf/2002.09024.pdf
     """
+    # The transform runs the model being trained: it can't be prefetched
+    prefetch_transform = False
+
     def transform_data_to_device(self, data, target, device, non_blocking):
         """
         :param data: input to the model, as specified by dataloader
@@ -19,12 +19,16 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import itertools
+import sys
 from functools import partial
 
 import torch
+import torch.nn.functional as F
 from torchvision import transforms
+from tqdm import tqdm
 
-from nupic.research.frameworks.pytorch.model_utils import evaluate_model
+from nupic.research.frameworks.pytorch.prefetch import DevicePrefetcher
 
 
 class NoiseRobustnessTest:
@@ -35,6 +39,10 @@ class NoiseRobustnessTest:
     noise. The output of this mixin is a results dictionary which has all of the
     standard metrics for the default evaluation loop and also reports the value of each
     metric at each level of specified noise.
+
+    By default the validation set is evaluated once per noise level. With
+    "noise_single_pass", each validation batch is loaded once and evaluated with all
+    the noise levels together instead.
     """
 
     def setup_experiment(self, config):
@@ -50,6 +58,14 @@ class NoiseRobustnessTest:
             data, defaults to 0
             - noise_std: The standard deviation of the noise which will be added to
             the incoming data, defaults to 1
+            - noise_single_pass: Whether to evaluate all the noise levels in a single
+            pass over the validation set: the noise is added to each batch on the
+            device, and the noisy copies of the batch are stacked and evaluated
+            together. The "evaluate_model_func" is not used in this mode. Defaults
+            to False
+            - noise_levels_per_batch: In single pass mode, the number of noisy copies
+            of a batch (the zero noise batch counts as one) evaluated together, to
+            limit memory use. Defaults to all the noise levels at once
 
         Example config:
         config = dict(
@@ -68,14 +84,23 @@ class NoiseRobustnessTest:
         ), "Noise levels must be between (0, 1]"
         noise_mean = config.get("noise_mean", 0)
         noise_std = config.get("noise_std", 1.0)
-        default_evaluate_model_func = config.get("evaluate_model_func", evaluate_model)
-        self.evaluate_model = partial(
-            evaluate_model_with_noise,
-            evaluate_model_func=default_evaluate_model_func,
-            noise_levels=noise_levels,
-            noise_mean=noise_mean,
-            noise_std=noise_std,
-        )
+        if config.get("noise_single_pass", False):
+            self.evaluate_model = partial(
+                evaluate_model_with_noise_single_pass,
+                noise_levels=noise_levels,
+                noise_mean=noise_mean,
+                noise_std=noise_std,
+                levels_per_batch=config.get("noise_levels_per_batch", None),
+                prefetch_batches=self.prefetch_batches,
+            )
+        else:
+            self.evaluate_model = partial(
+                evaluate_model_with_noise,
+                evaluate_model_func=self.evaluate_model,
+                noise_levels=noise_levels,
+                noise_mean=noise_mean,
+                noise_std=noise_std,
+            )
 
     @classmethod
     def get_execution_order(cls):
@@ -123,6 +148,137 @@ def evaluate_model_with_noise(
     return all_results
 
 
+def evaluate_model_with_noise_single_pass(
+    model,
+    loader,
+    device,
+    noise_levels=None,
+    noise_mean=0,
+    noise_std=1,
+    levels_per_batch=None,
+    batches_in_epoch=sys.maxsize,
+    criterion=F.nll_loss,
+    complexity_loss_fn=None,
+    active_classes=None,
+    progress=None,
+    post_batch_callback=None,
+    transform_to_device_fn=None,
+    prefetch_batches=0,
+):
+    """
+    Same results as `evaluate_model_with_noise` in a single pass over the loader.
+    Each batch is sent to the device once, the noise of each noise level is added
+    to it on the device (like AddGaussianNoise), and the noisy copies of the batch
+    are concatenated and evaluated together, `levels_per_batch` copies at a time
+    (the zero noise batch counts as one, default: all of them). The metrics are
+    then accumulated separately for each noise level.
+
+    The arguments are the same as `evaluate_model`. The `post_batch_callback` is
+    only called with the zero noise outputs.
+    """
+    if noise_levels is None:
+        noise_levels = []
+    levels = [0] + list(noise_levels)
+    if levels_per_batch is None:
+        levels_per_batch = len(levels)
+
+    model.eval()
+
+    # Per noise level accumulators, on device
+    loss = torch.zeros(len(levels), device=device)
+    correct = torch.zeros(len(levels), dtype=torch.long, device=device)
+    total = 0
+
+    async_gpu = loader.pin_memory
+
+    if progress is not None:
+        loader = tqdm(loader, total=min(len(loader), batches_in_epoch),
+                      **progress)
+
+    def stage_batch(data, target):
+        if transform_to_device_fn is None:
+            data = data.to(device, non_blocking=async_gpu)
+            target = target.to(device, non_blocking=async_gpu)
+        else:
+            data, target = transform_to_device_fn(data, target, device,
+                                                  non_blocking=async_gpu)
+        return data, target
+
+    batches = itertools.islice(loader, batches_in_epoch)
+    if prefetch_batches > 0:
+        batches = DevicePrefetcher(batches, torch.no_grad()(stage_batch), device,
+                                   num_batches=prefetch_batches)
+    else:
+        batches = itertools.starmap(stage_batch, batches)
+
+    with torch.no_grad():
+        for batch_idx, (data, target) in enumerate(batches):
+            for start in range(0, len(levels), levels_per_batch):
+                chunk = levels[start:start + levels_per_batch]
+                noisy_data = torch.cat([
+                    add_gaussian_noise(data, noise_level, noise_mean, noise_std)
+                    for noise_level in chunk
+                ])
+
+                outputs = model(noisy_data)
+                if active_classes is not None:
+                    outputs = outputs[:, active_classes]
+
+                for i, output in enumerate(outputs.chunk(len(chunk))):
+                    loss[start + i] += criterion(output, target, reduction="sum")
+                    pred = output.max(1, keepdim=True)[1]
+                    correct[start + i] += pred.eq(target.view_as(pred)).sum()
+
+                    if start + i == 0 and post_batch_callback is not None:
+                        post_batch_callback(batch_idx=batch_idx, target=target,
+                                            output=output, pred=pred)
+            total += len(data)
+
+        complexity_loss = (complexity_loss_fn(model)
+                           if complexity_loss_fn is not None
+                           else None)
+
+    if progress is not None:
+        loader.close()
+
+    noise_results = {}
+    for noise_level, level_correct, level_loss in zip(levels, correct.tolist(),
+                                                      loss.tolist()):
+        results = {
+            "total_correct": level_correct,
+            "total_tested": total,
+            "mean_loss": level_loss / total if total > 0 else 0,
+            "mean_accuracy": level_correct / total if total > 0 else 0,
+        }
+        if complexity_loss is not None:
+            results["complexity_loss"] = complexity_loss.item()
+        noise_results[noise_level] = results
+
+    all_results = {
+        key + "_" + str(noise_level) + "_noise": results[key]
+        for noise_level, results in noise_results.items()
+        if noise_level != 0
+        for key in results
+    }
+    all_results.update(noise_results[0])
+    if prefetch_batches > 0:
+        all_results.update(batches.timing())
+    return all_results
+
+
+def add_gaussian_noise(data, noise_level, mean, std):
+    """
+    Add Gaussian noise to about `noise_level` of the elements of `data`, like
+    AddGaussianNoise, on the device of `data`.
+    """
+    if noise_level == 0:
+        return data
+
+    noise_indices = torch.bernoulli(torch.full_like(data, noise_level))
+    noise = torch.normal(mean, std, data.shape, device=data.device) * noise_indices
+    return data + noise
+
+
 class AddGaussianNoise:
     def __init__(self, noise_level, mean, std):
         self.mean = mean
@@ -295,6 +295,8 @@ class ApicalTiebreakTM_ApicalTiebreakTests(ApicalTiebreakTestBase, unittest.Test
     Run the "apical tiebreak" tests on the ApicalTiebreakTemporalMemory.
     """
 
+    sparse_connections = False
+
     def constructTM(
         self,
         num_minicolumns,
@@ -327,6 +329,7 @@ class ApicalTiebreakTM_ApicalTiebreakTests(ApicalTiebreakTestBase, unittest.Test
             "seed": seed,
             "basal_input_size": basal_input_size,
             "apical_input_size": apical_input_size,
+            "sparse_connections": self.sparse_connections,
         }
 
         self.tm = PairMemoryApicalTiebreak(**params)
@@ -352,5 +355,13 @@ class ApicalTiebreakTM_ApicalTiebreakTests(ApicalTiebreakTestBase, unittest.Test
         return self.tm.get_predicted_cells().tolist()
 
 
+class ApicalTiebreakTM_SparseConnectionsTests(ApicalTiebreakTM_ApicalTiebreakTests):
+    """
+    Run the "apical tiebreak" tests with sparse connection matrices.
+    """
+
+    sparse_connections = True
+
+
 if __name__ == "__main__":
     unittest.main()
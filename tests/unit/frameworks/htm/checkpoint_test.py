@@ -0,0 +1,188 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import itertools
+import os
+import pickle
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import torch
+
+from nupic.research.frameworks.htm import (
+    SequenceMemoryApicalTiebreak,
+    SpatialPooler,
+    TorchSpatialPooler,
+)
+from nupic.research.frameworks.htm import checkpoint
+from nupic.research.frameworks.htm.checkpoint import load_metadata
+
+
+class CheckpointTestBase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "model.htm")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+class SpatialPoolerCheckpointTest(CheckpointTestBase):
+
+    def run_sp(self, sp, inputs):
+        active_array = np.zeros(sp.get_num_minicolumns(), dtype=np.uint32)
+        outputs = []
+        for input_vector in inputs:
+            sp.compute(input_vector, True, active_array)
+            outputs.append(active_array.copy())
+        return np.array(outputs)
+
+    def check_round_trip(self, sp_class, **kwargs):
+        generator = np.random.default_rng(0)
+        inputs = (generator.random((40, 100)) > 0.8).astype(np.uint32)
+
+        sp = sp_class(input_dims=(100,), minicolumn_dims=(64,),
+                      potential_radius=100, boost_strength=1.0, seed=7, **kwargs)
+        self.run_sp(sp, inputs[:20])
+
+        for mappable in (False, True):
+            sp.save(self.path, mappable=mappable)
+            for mmap in (False, True):
+                loaded = sp_class.load(self.path, mmap=mmap)
+
+                self.assertEqual(sorted(vars(loaded)), sorted(vars(sp)))
+                np.testing.assert_array_equal(
+                    self.run_sp(loaded, inputs[20:]),
+                    self.run_sp(pickle.loads(pickle.dumps(sp)), inputs[20:])
+                )
+
+    def test_round_trip(self):
+        self.check_round_trip(SpatialPooler)
+
+    def test_round_trip_sparse_permanences(self):
+        self.check_round_trip(SpatialPooler, sparse_permanences=True)
+
+    def test_round_trip_torch(self):
+        self.check_round_trip(TorchSpatialPooler)
+
+    def test_mappable(self):
+        sp = SpatialPooler(input_dims=(256,), minicolumn_dims=(128,),
+                           potential_radius=256, seed=7)
+
+        sp.save(self.path)
+        compact_size = os.path.getsize(self.path)
+        self.assertNotIsInstance(SpatialPooler.load(self.path, mmap=True).permanences,
+                                 np.memmap)
+
+        # the dense permanences are stored as is and memory-mapped
+        sp.save(self.path, mappable=True)
+        self.assertGreater(os.path.getsize(self.path), compact_size)
+        loaded = SpatialPooler.load(self.path, mmap=True)
+        self.assertIsInstance(loaded.permanences, np.memmap)
+        np.testing.assert_array_equal(loaded.permanences, sp.permanences)
+
+        # so are the synapse arrays of sparse permanences
+        sp = SpatialPooler(input_dims=(256,), minicolumn_dims=(128,),
+                           potential_radius=256, seed=7, sparse_permanences=True)
+        sp.save(self.path, mappable=True)
+        loaded = SpatialPooler.load(self.path, mmap=True)
+        self.assertIsInstance(loaded.potential_permanences, np.memmap)
+        self.assertIsInstance(loaded.potential_indices, np.memmap)
+
+    def test_wrong_class(self):
+        SpatialPooler(input_dims=(10,), minicolumn_dims=(10,)).save(self.path)
+
+        with self.assertRaises(ValueError):
+            SequenceMemoryApicalTiebreak.load(self.path)
+
+
+class TemporalMemoryCheckpointTest(CheckpointTestBase):
+
+    def run_tm(self, tm, sequences):
+        outputs = []
+        for sequence in sequences:
+            for minicolumns in sequence:
+                tm.compute(minicolumns)
+                outputs.append((tm.get_active_cells().tolist(),
+                                tm.get_learning_cells().tolist(),
+                                tm.get_next_predicted_cells().tolist()))
+            tm.reset()
+        return outputs
+
+    def test_round_trip(self):
+        generator = torch.Generator().manual_seed(0)
+        sequences = [
+            [torch.randperm(64, generator=generator)[:6] for _ in range(5)]
+            for _ in range(4)
+        ]
+
+        for sparse_connections in (False, True):
+            tm = SequenceMemoryApicalTiebreak(
+                num_minicolumns=64, num_cells_per_minicolumn=4,
+                activation_threshold=4, reduced_basal_threshold=4,
+                matching_threshold=3, sample_size=6,
+                basal_segment_incorrect_decrement=0.02,
+                sparse_connections=sparse_connections
+            )
+            self.run_tm(tm, sequences)
+
+            tm.save(self.path, metadata={"steps": 20})
+            saved = pickle.dumps(tm)
+            self.assertEqual(load_metadata(self.path)["steps"], 20)
+
+            # store every array as is, so that even this small model is mapped
+            mappable_path = os.path.join(self.directory.name, "mappable.htm")
+            with patch.object(checkpoint, "MAPPABLE_NBYTES", 0):
+                tm.save(mappable_path, mappable=True)
+
+            for path, mmap in itertools.product((self.path, mappable_path),
+                                                (False, True)):
+                torch.manual_seed(mmap)
+                loaded = SequenceMemoryApicalTiebreak.load(path, mmap=mmap)
+
+                # the connections views still share the segment pool storage
+                if not sparse_connections:
+                    self.assertEqual(
+                        loaded.basal_connections.data_ptr(),
+                        loaded.basal_segments.storage.data_ptr()
+                    )
+                self.assertEqual(loaded.get_num_basal_segments(),
+                                 tm.get_num_basal_segments())
+
+                # both continue from the saved random state
+                expected = self.run_tm(pickle.loads(saved), sequences)
+                self.assertEqual(self.run_tm(loaded, sequences), expected)
+
+    def test_smaller_than_pickle(self):
+        tm = SequenceMemoryApicalTiebreak(num_minicolumns=256,
+                                          num_cells_per_minicolumn=8)
+        for _ in range(3):
+            tm.compute(torch.randperm(256)[:20])
+
+        tm.save(self.path)
+        self.assertLess(os.path.getsize(self.path), len(pickle.dumps(tm)) / 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
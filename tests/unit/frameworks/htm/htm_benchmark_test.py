@@ -0,0 +1,62 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import unittest
+
+from nupic.research.frameworks.htm.benchmarks.htm_benchmark import (
+    RUNNERS,
+    run_benchmark,
+)
+
+
+class HTMBenchmarkTest(unittest.TestCase):
+
+    def test_every_model_runs(self):
+        """
+        every `--models` choice runs a few steps, with one active minicolumn per
+        element so that cells grow single segments.
+        """
+
+        for model in sorted(RUNNERS):
+            for profile in (False, True):
+                with self.subTest(model=model, profile=profile):
+                    result = run_benchmark(dict(
+                        model=model,
+                        num_minicolumns=64,
+                        cells_per_minicolumn=None if model == "sp" else 4,
+                        input_size=128,
+                        sparsity=0.02,
+                        sequence_length=4,
+                        num_sequences=2,
+                        steps=12,
+                        warmup=2,
+                        profile=profile,
+                        seed=42,
+                    ))
+
+                    self.assertGreater(result["steps_per_sec"], 0)
+                    self.assertEqual(set(result["phase_ms_per_step"]),
+                                     set(RUNNERS[model].phases))
+                    self.assertEqual("methods" in result, profile)
+
+
+if __name__ == "__main__":
+    unittest.main()
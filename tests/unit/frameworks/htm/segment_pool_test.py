@@ -0,0 +1,237 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import pickle
+import unittest
+
+import torch
+
+from nupic.research.frameworks.htm import PairMemoryApicalTiebreak
+from nupic.research.frameworks.htm.temporal_memory.segment_pool import SegmentPool
+
+int_type = torch.int64
+
+
+class SegmentPoolTest(unittest.TestCase):
+
+    def test_capacity_doubles(self):
+        pool = SegmentPool(input_size=10, num_cells=5, initial_capacity=4)
+
+        self.assertEqual(pool.allocate(torch.tensor([0, 1, 2])).tolist(), [0, 1, 2])
+        self.assertEqual(pool.capacity, 4)
+
+        self.assertEqual(pool.allocate(torch.tensor([3, 4, 0, 1, 2, 3])).tolist(),
+                         [3, 4, 5, 6, 7, 8])
+        self.assertEqual(pool.capacity, 16)
+        self.assertEqual(pool.connections.shape, (9, 10))
+        self.assertEqual(pool.num_segments(), 9)
+
+    def test_released_rows_are_reused(self):
+        for sparse_connections in (False, True):
+            pool = SegmentPool(input_size=10, num_cells=5,
+                               sparse_connections=sparse_connections,
+                               initial_capacity=4)
+            pool.allocate(torch.tensor([0, 1, 2, 3]))
+
+            if sparse_connections:
+                pool.connections.add_synapses(torch.tensor([1, 3]),
+                                              torch.tensor([2, 5]), 0.5)
+            else:
+                pool.connections[[1, 3], [2, 5]] = 0.5
+
+            pool.release(torch.tensor([3, 1]))
+
+            self.assertEqual(pool.num_segments(), 2)
+            self.assertEqual(pool.live_segments.tolist(), [True, False, True, False])
+            self.assertEqual(pool.allocate(torch.tensor([4, 4, 4])).tolist(), [1, 3, 4])
+
+            connections = pool.connections
+            if sparse_connections:
+                connections = connections.to_dense()
+            self.assertEqual(connections.count_nonzero(), 0)
+
+    def test_cell_mappings(self):
+        pool = SegmentPool(input_size=10, num_cells=5, initial_capacity=2)
+        pool.allocate(torch.tensor([3, 1, 3, 0, 3]))
+
+        self.assertEqual(
+            pool.map_segments_to_cells(torch.tensor([4, 0, 1])).tolist(), [3, 3, 1]
+        )
+        self.assertEqual(
+            pool.get_segment_counts(torch.arange(5)).tolist(), [1, 1, 0, 3, 0]
+        )
+        self.assertEqual(
+            pool.get_segments_for_cells(torch.tensor([3, 2, 0])).tolist(),
+            [0, 2, 4, 3]
+        )
+
+        pool.release(torch.tensor([2]))
+        pool.allocate(torch.tensor([2]))
+
+        self.assertEqual(
+            pool.get_segment_counts(torch.arange(5)).tolist(), [1, 1, 1, 2, 0]
+        )
+        self.assertEqual(
+            pool.get_segments_for_cells(torch.tensor([3, 2])).tolist(), [0, 4, 2]
+        )
+
+    def test_least_used_segments(self):
+        pool = SegmentPool(input_size=10, num_cells=5, initial_capacity=2)
+        pool.allocate(torch.tensor([3, 1, 3, 0, 3]), iteration=1)
+        pool.mark_used(torch.tensor([0, 1, 3]), 2)
+        pool.mark_used(torch.tensor([4]), 3)
+
+        # ties go to the lowest segment
+        self.assertEqual(
+            pool.least_used_segments(torch.tensor([3, 0, 1])).tolist(), [2, 3, 1]
+        )
+
+        self.assertEqual(
+            pool.least_used_segments(torch.tensor([0, 3]),
+                                     torch.tensor([2, 2])).tolist(), [3, 2, 0]
+        )
+
+        pool.release(torch.tensor([2]))
+        pool.allocate(torch.tensor([3]), iteration=4)
+        self.assertEqual(pool.least_used_segments(torch.tensor([3])).tolist(), [0])
+
+
+class DestroySegmentsTest(unittest.TestCase):
+
+    def test_destroyed_segments_are_reused(self):
+        """
+        destroyed segments stop predicting, and their rows are reused by new
+        segments.
+        """
+
+        tm = PairMemoryApicalTiebreak(
+            num_minicolumns=20,
+            num_cells_per_minicolumn=4,
+            basal_input_size=50,
+            activation_threshold=3,
+            matching_threshold=3,
+            sample_size=4,
+            initial_permanence=0.6,
+            connected_permanence=0.5,
+            seed=42
+        )
+
+        minicolumns = torch.tensor([0, 1], dtype=int_type)
+        basal_input = torch.tensor([5, 6, 7, 8], dtype=int_type)
+
+        tm.compute(minicolumns, basal_input, learn=True)
+        self.assertEqual(tm.basal_segments.num_segments(), 2)
+
+        tm.compute(minicolumns, basal_input, learn=False)
+        self.assertEqual(tm.get_predicted_cells().numel(), 2)
+
+        tm.destroy_segments("basal", torch.tensor([0, 1]))
+        self.assertEqual(tm.basal_segments.num_segments(), 0)
+        self.assertEqual(
+            tm.get_basal_segment_counts(torch.arange(tm.num_total_cells)).sum(), 0
+        )
+
+        tm.compute(minicolumns, basal_input, learn=True)
+        self.assertEqual(tm.get_predicted_cells().numel(), 0)
+        self.assertEqual(tm.basal_segments.num_rows, 2)
+        self.assertEqual(
+            tm.get_segments_for_cells("basal", tm.get_active_cells()).tolist(), [0, 1]
+        )
+
+    def test_max_segments_per_cell(self):
+        """
+        cells at the segment limit replace their least recently active segment, and
+        the pool reuses its rows.
+        """
+
+        for sparse_connections in (False, True):
+            tm = PairMemoryApicalTiebreak(
+                num_minicolumns=4,
+                num_cells_per_minicolumn=1,
+                basal_input_size=50,
+                activation_threshold=3,
+                matching_threshold=3,
+                sample_size=4,
+                initial_permanence=0.6,
+                connected_permanence=0.5,
+                max_segments_per_cell=2,
+                seed=42,
+                sparse_connections=sparse_connections
+            )
+
+            minicolumns = torch.tensor([0], dtype=int_type)
+            contexts = [torch.arange(i * 10, i * 10 + 4) for i in range(3)]
+
+            # learn one segment per context on cell 0, then use the first one
+            for basal_input in contexts[:2]:
+                tm.compute(minicolumns, basal_input, learn=True)
+            tm.compute(minicolumns, contexts[0], learn=True)
+            self.assertEqual(tm.get_predicted_cells().tolist(), [0])
+            self.assertEqual(tm.get_basal_segment_counts(minicolumns).item(), 2)
+
+            # the third context replaces the segment of the second one
+            tm.compute(minicolumns, contexts[2], learn=True)
+            self.assertEqual(tm.get_basal_segment_counts(minicolumns).item(), 2)
+            self.assertEqual(tm.basal_segments.num_rows, 2)
+
+            for basal_input, predicted in zip(contexts, ([0], [], [0])):
+                tm.compute(minicolumns, basal_input, learn=False)
+                self.assertEqual(tm.get_predicted_cells().tolist(), predicted)
+
+            # a cell that grows two segments at once makes room for both
+            tm.destroy_least_used_segments("basal", torch.tensor([0, 0]))
+            self.assertEqual(tm.get_basal_segment_counts(minicolumns).item(), 0)
+
+    def test_pickle(self):
+        """
+        a learned model round-trips through pickle.
+        """
+
+        tm = PairMemoryApicalTiebreak(
+            num_minicolumns=20,
+            num_cells_per_minicolumn=4,
+            basal_input_size=50,
+            activation_threshold=3,
+            matching_threshold=3,
+            sample_size=4,
+            initial_permanence=0.6,
+            connected_permanence=0.5,
+            seed=42
+        )
+
+        minicolumns = torch.tensor([0, 1], dtype=int_type)
+        basal_input = torch.tensor([5, 6, 7, 8], dtype=int_type)
+        tm.compute(minicolumns, basal_input, learn=True)
+
+        loaded = pickle.loads(pickle.dumps(tm))
+
+        self.assertTrue(torch.equal(loaded.basal_connections, tm.basal_connections))
+        self.assertTrue(torch.equal(
+            loaded.map_segments_to_cells("basal", torch.tensor([0, 1])),
+            tm.map_segments_to_cells("basal", torch.tensor([0, 1]))
+        ))
+
+        loaded.compute(minicolumns, basal_input, learn=False)
+        self.assertEqual(loaded.get_predicted_cells().numel(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
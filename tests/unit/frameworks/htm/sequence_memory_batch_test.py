@@ -0,0 +1,142 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import copy
+import unittest
+
+import torch
+
+from nupic.research.frameworks.htm import SequenceMemoryApicalTiebreak
+
+NUM_MINICOLUMNS = 64
+APICAL_INPUT_SIZE = 100
+BATCH_SIZE = 5
+
+
+def to_mask(indices, size):
+    mask = torch.zeros(size, dtype=torch.bool)
+    mask[indices] = True
+    return mask
+
+
+class SequenceMemoryBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        generator = torch.Generator().manual_seed(42)
+
+        def random_sdr(size, w):
+            return torch.sort(torch.randperm(size, generator=generator)[:w]).values
+
+        # sequences share all but their first element, and each has its own apical
+        # context: the shared elements are only disambiguated by the apical input
+        shared = [random_sdr(NUM_MINICOLUMNS, 8) for _ in range(5)]
+
+        self.sequences = []
+        for _ in range(BATCH_SIZE):
+            context = random_sdr(APICAL_INPUT_SIZE, 10)
+            self.sequences.append([
+                (minicolumns, context)
+                for minicolumns in [random_sdr(NUM_MINICOLUMNS, 8)] + shared
+            ])
+
+    def train(self, sparse_connections):
+        tm = SequenceMemoryApicalTiebreak(
+            num_minicolumns=NUM_MINICOLUMNS,
+            apical_input_size=APICAL_INPUT_SIZE,
+            num_cells_per_minicolumn=4,
+            activation_threshold=6,
+            reduced_basal_threshold=4,
+            initial_permanence=0.41,
+            matching_threshold=4,
+            sample_size=8,
+            sparse_connections=sparse_connections
+        )
+
+        for _ in range(10):
+            for sequence in self.sequences:
+                for minicolumns, apical_input in sequence:
+                    tm.compute(minicolumns, apical_input)
+                tm.reset()
+
+        return tm
+
+    def test_batch_matches_separate_instances(self):
+        for sparse_connections in (False, True):
+            tm = self.train(sparse_connections)
+            instances = [copy.deepcopy(tm) for _ in range(BATCH_SIZE)]
+
+            tm.reset_batch(BATCH_SIZE)
+            num_predicted = 0
+
+            # streams play the sequences shifted by one, with some apical
+            # inputs dropped
+            for t in range(12):
+                inputs = [
+                    self.sequences[b][(t + b) % 6] for b in range(BATCH_SIZE)
+                ]
+                apical_inputs = [
+                    apical_input if (t + b) % 3 else torch.tensor([], dtype=int)
+                    for b, (_, apical_input) in enumerate(inputs)
+                ]
+
+                tm.compute_batch(
+                    torch.stack([to_mask(minicolumns, NUM_MINICOLUMNS)
+                                 for minicolumns, _ in inputs]),
+                    torch.stack([to_mask(apical_input, APICAL_INPUT_SIZE)
+                                 for apical_input in apical_inputs])
+                )
+
+                num_predicted += tm.get_batch_predicted_cells().sum()
+
+                for b, instance in enumerate(instances):
+                    instance.compute(inputs[b][0], apical_inputs[b], learn=False)
+
+                    num_cells = tm.num_total_cells
+                    self.assertTrue(torch.equal(
+                        tm.get_batch_active_cells()[b],
+                        to_mask(instance.get_active_cells(), num_cells)
+                    ))
+                    self.assertTrue(torch.equal(
+                        tm.get_batch_predicted_cells()[b],
+                        to_mask(instance.get_predicted_cells(), num_cells)
+                    ))
+                    self.assertTrue(torch.equal(
+                        tm.get_batch_next_predicted_cells()[b],
+                        to_mask(instance.get_next_predicted_cells(), num_cells)
+                    ))
+
+            self.assertGreater(num_predicted, 0)
+
+    def test_reset_streams(self):
+        tm = self.train(sparse_connections=False)
+        tm.reset_batch(2)
+
+        minicolumns = to_mask(self.sequences[0][0][0], NUM_MINICOLUMNS)
+        tm.compute_batch(torch.stack([minicolumns, minicolumns]))
+        tm.reset_streams(torch.tensor([1]))
+
+        self.assertTrue(tm.get_batch_active_cells()[0].any())
+        self.assertFalse(tm.get_batch_active_cells()[1].any())
+        self.assertFalse(tm.get_batch_next_predicted_cells()[1].any())
+
+
+if __name__ == "__main__":
+    unittest.main()
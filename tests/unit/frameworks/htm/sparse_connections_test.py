@@ -0,0 +1,145 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import unittest
+
+import torch
+
+from nupic.research.frameworks.htm import SequenceMemoryApicalTiebreak
+from nupic.research.frameworks.htm.temporal_memory.sparse_connections import (
+    SparseConnections,
+)
+
+real_type = torch.float32
+int_type = torch.int64
+
+
+class SparseConnectionsTest(unittest.TestCase):
+
+    def test_matches_dense(self):
+        """
+        random learning steps give the same permanences and overlaps as a dense
+        connections matrix, through row and index growth and synapse removal.
+        """
+
+        generator = torch.Generator().manual_seed(0)
+        input_size = 40
+
+        connections = SparseConnections(0, input_size, initial_capacity=2,
+                                        initial_width=2)
+        dense = torch.zeros((0, input_size), dtype=real_type)
+
+        for _ in range(300):
+            if torch.rand(1, generator=generator) < 0.2 or dense.shape[0] == 0:
+                connections.add_segments(3)
+                dense = torch.cat([dense, torch.zeros((3, input_size))])
+
+            num_segments = dense.shape[0]
+            segments = torch.randint(num_segments, (4,), generator=generator)
+            inputs = torch.randperm(input_size, generator=generator)[:10]
+
+            # grow synapses to the inputs the segments are not connected to yet
+            existing = connections.has_synapses(segments, inputs)
+            self.assertTrue(torch.equal(existing, dense[segments][:, inputs] > 0))
+
+            rows, columns = (~existing).nonzero(as_tuple=True)
+            keys = torch.unique(segments[rows] * input_size + inputs[columns])
+            new_segments = keys.div(input_size, rounding_mode="floor")
+            connections.add_synapses(new_segments, keys % input_size, 0.3)
+            dense[new_segments, keys % input_size] = 0.3
+
+            # reinforce the active inputs and punish the others
+            learning = segments[:2]
+            connections.adjust_synapses(learning, inputs[:5], 0.1)
+            connections.adjust_synapses(learning, inputs[:5], -0.15,
+                                        exclude_inputs=True)
+            active = torch.zeros(input_size, dtype=torch.bool)
+            active[inputs[:5]] = True
+            rows = dense[learning]
+            rows = torch.where(active & (rows > 0), rows + 0.1, rows)
+            rows = torch.where(~active & (rows > 0), rows - 0.15, rows)
+            dense[learning] = rows.clamp(0, 1)
+
+            if torch.rand(1, generator=generator) < 0.1:
+                destroyed = torch.randint(num_segments, (2,), generator=generator)
+                connections.remove_segments(destroyed)
+                dense[destroyed] = 0
+
+            self.assertTrue(torch.equal(connections.to_dense(), dense))
+            self.assertTrue(torch.equal(connections.count_nonzero(dim=1),
+                                        (dense > 0).sum(dim=1)))
+
+            active_inputs = torch.randperm(input_size, generator=generator)[:12]
+            overlaps, potential_overlaps = connections.compute_overlaps(
+                active_inputs, 0.5
+            )
+            self.assertTrue(torch.equal(
+                overlaps, (dense[:, active_inputs] >= 0.5).sum(dim=1)
+            ))
+            self.assertTrue(torch.equal(
+                potential_overlaps, (dense[:, active_inputs] > 0).sum(dim=1)
+            ))
+
+        # the rows and the input index grew past their initial sizes
+        self.assertGreater(connections.width, 2)
+        self.assertGreater(connections.input_synapses.shape[1], 2)
+
+    def test_tm_matches_dense(self):
+        """
+        a sequence memory learns the same way with sparse and dense connections.
+        """
+
+        generator = torch.Generator().manual_seed(1)
+        sequences = [
+            [torch.randperm(64, generator=generator)[:5] for _ in range(6)]
+            for _ in range(10)
+        ]
+
+        outputs = []
+        for sparse_connections in (False, True):
+            tm = SequenceMemoryApicalTiebreak(
+                num_minicolumns=64, num_cells_per_minicolumn=4,
+                activation_threshold=3, reduced_basal_threshold=3,
+                matching_threshold=2, sample_size=4,
+                basal_segment_incorrect_decrement=0.02, seed=42,
+                sparse_connections=sparse_connections
+            )
+
+            output = []
+            for _ in range(3):
+                for sequence in sequences:
+                    for minicolumns in sequence:
+                        tm.compute(minicolumns)
+                        output.append((tm.get_active_cells().tolist(),
+                                       tm.get_next_predicted_cells().tolist()))
+                    tm.reset()
+
+            connections = tm.basal_connections
+            if sparse_connections:
+                connections = connections.to_dense()
+            outputs.append((output, connections))
+
+        self.assertEqual(outputs[0][0], outputs[1][0])
+        self.assertTrue(torch.equal(outputs[0][1], outputs[1][1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
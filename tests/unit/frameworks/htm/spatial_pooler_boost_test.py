@@ -52,6 +52,77 @@ def sdrs_unique(sdrs_dict):
     return True
 
 
+class ReferenceSpatialPooler(SpatialPooler):
+    """
+    SpatialPooler with the original minicolumn by minicolumn implementations of local
+    inhibition, boosting and minimum duty cycles, used as the reference for the
+    vectorized versions.
+    """
+
+    def inhibit_minicolumns_local(self, overlaps, density):
+        active_array = np.zeros(self.num_minicolumns, dtype=np.bool_)
+
+        for minicolumn, overlap in enumerate(overlaps):
+            if overlap >= self.stimulus_threshold:
+                neighborhood = self.get_minicolumn_neighborhood(minicolumn)
+
+                neighborhood_overlaps = overlaps[neighborhood]
+
+                num_bigger = np.count_nonzero(neighborhood_overlaps > overlap)
+
+                tied_neighbors = neighborhood[
+                    np.where(neighborhood_overlaps == overlap)
+                ]
+                num_ties_lost = np.count_nonzero(active_array[tied_neighbors])
+
+                num_active = int(0.5 + density * len(neighborhood))
+
+                if (num_bigger + num_ties_lost) < num_active:
+                    active_array[minicolumn] = True
+
+        return active_array.nonzero()[0]
+
+    def update_boost_factors_global(self):
+        if self.local_density > 0:
+            target_density = self.local_density
+        else:
+            inhibition_area = min(
+                (2 * self.inhibition_radius + 1) ** self.minicolumn_dims.size,
+                self.num_minicolumns,
+            )
+
+            target_density = min(
+                float(self.active_minicolumns_per_inh_area) / inhibition_area,
+                0.5
+            )
+
+        self.boost_factors = np.exp(
+            -self.boost_strength * (self.active_duty_cycles - target_density)
+        )
+
+    def update_boost_factors_local(self):
+        target_density = np.zeros(self.num_minicolumns, dtype=real_type)
+
+        for m in range(self.num_minicolumns):
+            mask_neighbors = self.get_minicolumn_neighborhood(m)
+
+            target_density[m] = np.mean(self.active_duty_cycles[mask_neighbors])
+
+        self.boost_factors = np.exp(
+            -self.boost_strength * (self.active_duty_cycles - target_density)
+        )
+
+    def update_min_duty_cycles_local(self):
+        for minicolumn in range(self.num_minicolumns):
+            neighborhood = self.get_minicolumn_neighborhood(minicolumn)
+
+            max_overlap_duty = self.overlap_duty_cycles[neighborhood].max()
+
+            self.min_overlap_duty_cycles[minicolumn] = (
+                self.min_percent_overlap_duty_cycles * max_overlap_duty
+            )
+
+
 class SpatialPoolerBoostTest(unittest.TestCase):
     """
     Test boosting.
@@ -279,6 +350,57 @@ class SpatialPoolerBoostTest(unittest.TestCase):
         self.boost_test_phase3()
         self.boost_test_phase4()
 
+    def learn_matches_reference(self, global_inhibition):
+        """
+        learning with boosting over many steps gives exactly the same minicolumns,
+        permanences, duty cycles and boost factors as ReferenceSpatialPooler.
+        """
+
+        params = dict(
+            input_dims=[20, 20],
+            minicolumn_dims=[16, 16],
+            potential_radius=5,
+            global_inhibition=global_inhibition,
+            active_minicolumns_per_inh_area=10,
+            duty_cycle_period=20,
+            boost_strength=2.0,
+            seed=SEED,
+        )
+
+        print("learn_matches_reference, SP seed set to:", SEED)
+
+        sp = SpatialPooler(**params)
+        reference_sp = ReferenceSpatialPooler(**params)
+
+        generator = np.random.default_rng(SEED)
+        inputs = (generator.random((40, 400)) > 0.85).astype(uint_type)
+
+        active = np.zeros(256, dtype=uint_type)
+        reference_active = np.zeros(256, dtype=uint_type)
+        for step in range(300):
+            sp.compute(inputs[step % len(inputs)], True, active)
+            reference_sp.compute(inputs[step % len(inputs)], True, reference_active)
+
+            np.testing.assert_array_equal(active, reference_active,
+                                          "step {}".format(step))
+
+        np.testing.assert_array_equal(sp.get_permanences(),
+                                      reference_sp.get_permanences())
+        np.testing.assert_array_equal(sp.get_active_duty_cycles(),
+                                      reference_sp.get_active_duty_cycles())
+        np.testing.assert_array_equal(sp.get_min_overlap_duty_cycles(),
+                                      reference_sp.get_min_overlap_duty_cycles())
+        np.testing.assert_array_equal(sp.get_boost_factors(),
+                                      reference_sp.get_boost_factors())
+        self.assertEqual(sp.get_boost_factors().dtype,
+                         reference_sp.get_boost_factors().dtype)
+
+    def test_learn_matches_reference_local(self):
+        self.learn_matches_reference(global_inhibition=False)
+
+    def test_learn_matches_reference_global(self):
+        self.learn_matches_reference(global_inhibition=True)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -126,6 +126,185 @@ class SpatialPoolerComputeTest(unittest.TestCase):
 
         self.basic_compute_loop(sp, input_size, minicolumn_dims)
 
+    def batch_compute_matches_compute(self, sp, input_size, minicolumn_dims):
+        """
+        check that compute_batch without learning gives the same outputs as calling
+        compute on each input vector.
+        """
+
+        num_records = 50
+        generator = np.random.default_rng(sp.seed)
+
+        input_matrix = (generator.random((num_records, input_size)) > 0.8).astype(
+            uint_type
+        )
+
+        # learn a little so that permanences are not at their initial state
+        y = np.zeros(minicolumn_dims, dtype=uint_type)
+        for v in input_matrix[:10]:
+            sp.compute(v, True, y)
+
+        expected = np.zeros((num_records, minicolumn_dims), dtype=uint_type)
+        for i, v in enumerate(input_matrix):
+            sp.compute(v, False, expected[i])
+
+        active = sp.compute_batch(input_matrix, learn=False)
+
+        self.assertEqual(active.shape, (num_records, minicolumn_dims))
+        self.assertTrue((active == expected).all())
+
+    def test_compute_batch_global_inhibition(self):
+        """
+        compute_batch matches compute with global inhibition.
+        """
+
+        sp = SpatialPooler(
+            input_dims=[64],
+            minicolumn_dims=[128],
+            active_minicolumns_per_inh_area=10,
+            potential_radius=64,
+            global_inhibition=True,
+            stimulus_threshold=1.0,
+            seed=int((time.time() % 10000) * 10),
+        )
+
+        print("test_compute_batch_global_inhibition, SP seed set to:", sp.seed)
+
+        self.batch_compute_matches_compute(sp, 64, 128)
+
+    def test_compute_batch_local_inhibition(self):
+        """
+        compute_batch matches compute with local inhibition.
+        """
+
+        sp = SpatialPooler(
+            input_dims=[64],
+            minicolumn_dims=[64],
+            active_minicolumns_per_inh_area=3,
+            potential_radius=8,
+            global_inhibition=False,
+            seed=int((time.time() % 10000) * 10),
+        )
+
+        print("test_compute_batch_local_inhibition, SP seed set to:", sp.seed)
+
+        self.batch_compute_matches_compute(sp, 64, 64)
+
+    def test_compute_batch_learn_single_input(self):
+        """
+        learning on a batch of one input vector is equivalent to compute.
+        """
+
+        params = dict(
+            input_dims=[32],
+            minicolumn_dims=[64],
+            active_minicolumns_per_inh_area=5,
+            potential_radius=32,
+            global_inhibition=True,
+            boost_strength=2.0,
+            seed=int((time.time() % 10000) * 10),
+        )
+
+        sp1 = SpatialPooler(**params)
+        sp2 = SpatialPooler(**params)
+
+        generator = np.random.default_rng(sp1.seed)
+        input_matrix = (generator.random((20, 32)) > 0.7).astype(uint_type)
+
+        y = np.zeros(64, dtype=uint_type)
+        for v in input_matrix:
+            sp1.compute(v, True, y)
+            active = sp2.compute_batch(v[np.newaxis], learn=True)
+            self.assertTrue((active[0] == y).all())
+
+        self.assertEqual(sp1.iteration_learn_num, sp2.iteration_learn_num)
+        np.testing.assert_array_equal(sp1.permanences, sp2.permanences)
+        np.testing.assert_array_equal(sp1.active_duty_cycles, sp2.active_duty_cycles)
+        np.testing.assert_array_equal(sp1.boost_factors, sp2.boost_factors)
+
+    def test_compute_batch_learn(self):
+        """
+        learning on a batch keeps the number of winners and advances the counters by
+        the batch size.
+        """
+
+        sp = SpatialPooler(
+            input_dims=[30],
+            minicolumn_dims=[50],
+            active_minicolumns_per_inh_area=10,
+            potential_radius=30,
+            global_inhibition=True,
+            seed=int((time.time() % 10000) * 10),
+        )
+
+        generator = np.random.default_rng(sp.seed)
+        input_matrix = (generator.random((100, 30)) > 0.8).astype(uint_type)
+
+        initial_permanences = sp.permanences.copy()
+
+        active = sp.compute_batch(input_matrix, learn=True)
+
+        self.assertEqual(sp.iteration_num, 100)
+        self.assertEqual(sp.iteration_learn_num, 100)
+        self.assertTrue((active.sum(axis=1) == 10).all())
+        self.assertFalse((sp.permanences == initial_permanences).all())
+
+    def test_sparse_permanences_match_dense(self):
+        """
+        a spatial pooler with sparse_permanences learns and computes exactly like the
+        dense one under the same seed.
+        """
+
+        params = dict(
+            input_dims=[16, 16],
+            minicolumn_dims=[12, 12],
+            active_minicolumns_per_inh_area=5,
+            potential_radius=3,
+            potential_percent=0.5,
+            global_inhibition=False,
+            stimulus_threshold=1,
+            min_percent_overlap_duty_cycles=0.1,
+            duty_cycle_period=10,
+            boost_strength=2.0,
+            seed=int((time.time() % 10000) * 10),
+        )
+
+        print("test_sparse_permanences_match_dense, SP seed set to:", params["seed"])
+
+        dense_sp = SpatialPooler(**params)
+        sparse_sp = SpatialPooler(sparse_permanences=True, **params)
+
+        self.assertIsNone(sparse_sp.permanences)
+        np.testing.assert_array_equal(dense_sp.get_potential_pools(),
+                                      sparse_sp.get_potential_pools())
+        np.testing.assert_array_equal(dense_sp.get_permanences(),
+                                      sparse_sp.get_permanences())
+        self.assertEqual(dense_sp.inhibition_radius, sparse_sp.inhibition_radius)
+
+        generator = np.random.default_rng(params["seed"])
+        input_matrix = (generator.random((60, 256)) > 0.8).astype(uint_type)
+
+        dense_active = np.zeros(144, dtype=uint_type)
+        sparse_active = np.zeros(144, dtype=uint_type)
+        for v in input_matrix:
+            dense_sp.compute(v, True, dense_active)
+            sparse_sp.compute(v, True, sparse_active)
+            np.testing.assert_array_equal(dense_active, sparse_active)
+
+        np.testing.assert_array_equal(dense_sp.get_permanences(),
+                                      sparse_sp.get_permanences())
+        np.testing.assert_array_equal(dense_sp.get_connected_synapses(),
+                                      sparse_sp.get_connected_synapses())
+        np.testing.assert_array_equal(dense_sp.get_connected_synapses_counts(),
+                                      sparse_sp.get_connected_synapses_counts())
+
+        np.testing.assert_array_equal(
+            dense_sp.compute_batch(input_matrix, learn=True),
+            sparse_sp.compute_batch(input_matrix, learn=True)
+        )
+        np.testing.assert_array_equal(dense_sp.get_permanences(),
+                                      sparse_sp.get_permanences())
+
 
 if __name__ == "__main__":
     unittest.main()
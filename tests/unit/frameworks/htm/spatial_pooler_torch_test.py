@@ -0,0 +1,246 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import time
+import unittest
+
+import numpy as np
+import torch
+
+from nupic.research.frameworks.htm import SpatialPooler, TorchSpatialPooler
+
+real_type = np.float32
+uint_type = np.uint32
+
+
+class TorchSpatialPoolerTest(unittest.TestCase):
+    """
+    with match_numpy=True, TorchSpatialPooler computes and learns exactly like
+    SpatialPooler under the same seed.
+    """
+
+    def assert_same_state(self, sp, torch_sp):
+        np.testing.assert_array_equal(sp.get_permanences(),
+                                      torch_sp.get_permanences().cpu().numpy())
+        np.testing.assert_array_equal(sp.get_connected_synapses_counts(),
+                                      torch_sp.get_connected_synapses_counts().cpu())
+        np.testing.assert_array_equal(sp.get_active_duty_cycles(),
+                                      torch_sp.get_active_duty_cycles().cpu())
+        np.testing.assert_array_equal(sp.get_boost_factors(),
+                                      torch_sp.get_boost_factors().cpu())
+        np.testing.assert_array_equal(sp.get_min_overlap_duty_cycles(),
+                                      torch_sp.get_min_overlap_duty_cycles().cpu())
+        self.assertEqual(sp.inhibition_radius, torch_sp.inhibition_radius)
+
+    def compute_matches(self, params, num_inputs, num_minicolumns):
+        sp = SpatialPooler(**params)
+        torch_sp = TorchSpatialPooler(match_numpy=True, **params)
+
+        self.assert_same_state(sp, torch_sp)
+
+        generator = np.random.default_rng(params["seed"])
+        input_matrix = (generator.random((200, num_inputs)) > 0.8).astype(uint_type)
+
+        active = np.zeros(num_minicolumns, dtype=uint_type)
+        torch_active = torch.zeros(num_minicolumns, dtype=torch.uint8)
+        for v in input_matrix:
+            sp.compute(v, True, active)
+            torch_sp.compute(v, True, torch_active)
+            np.testing.assert_array_equal(active, torch_active.numpy())
+
+        self.assert_same_state(sp, torch_sp)
+
+        np.testing.assert_array_equal(
+            sp.compute_batch(input_matrix, learn=False),
+            torch_sp.compute_batch(input_matrix, learn=False).cpu().numpy()
+        )
+        np.testing.assert_array_equal(
+            sp.compute_batch(input_matrix, learn=True),
+            torch_sp.compute_batch(input_matrix, learn=True).cpu().numpy()
+        )
+
+        self.assert_same_state(sp, torch_sp)
+
+    def test_global_inhibition(self):
+        """
+        global inhibition with boosting.
+        """
+
+        params = dict(
+            input_dims=[64],
+            minicolumn_dims=[128],
+            active_minicolumns_per_inh_area=10,
+            potential_radius=64,
+            global_inhibition=True,
+            stimulus_threshold=1.0,
+            min_percent_overlap_duty_cycles=0.1,
+            duty_cycle_period=10,
+            boost_strength=2.0,
+            seed=int((time.time() % 10000) * 10),
+        )
+
+        print("test_global_inhibition, SP seed set to:", params["seed"])
+
+        self.compute_matches(params, 64, 128)
+
+    def test_local_inhibition(self):
+        """
+        local inhibition on a 2D topology with boosting.
+        """
+
+        params = dict(
+            input_dims=[16, 16],
+            minicolumn_dims=[12, 12],
+            active_minicolumns_per_inh_area=5,
+            potential_radius=3,
+            potential_percent=0.5,
+            global_inhibition=False,
+            stimulus_threshold=1,
+            min_percent_overlap_duty_cycles=0.1,
+            duty_cycle_period=10,
+            boost_strength=2.0,
+            seed=int((time.time() % 10000) * 10),
+        )
+
+        print("test_local_inhibition, SP seed set to:", params["seed"])
+
+        self.compute_matches(params, 256, 144)
+
+    def test_accepts_tensors(self):
+        """
+        compute takes torch.Tensor inputs and numpy active arrays.
+        """
+
+        torch_sp = TorchSpatialPooler(
+            input_dims=[32],
+            minicolumn_dims=[64],
+            active_minicolumns_per_inh_area=5,
+            potential_radius=32,
+            global_inhibition=True,
+            seed=42,
+        )
+
+        input_vector = (torch.rand(32) > 0.5).to(torch.float32)
+        active = np.zeros(64, dtype=uint_type)
+        torch_sp.compute(input_vector, False, active)
+
+        self.assertEqual(active.sum(), 5)
+        np.testing.assert_array_equal(
+            active, torch_sp.compute_batch(input_vector)[0].cpu().numpy()
+        )
+
+
+class TorchSpatialPoolerDeviceTest(unittest.TestCase):
+    """
+    the default TorchSpatialPooler, which stays on the device and inhibits locally in
+    one pass.
+    """
+
+    def setUp(self):
+        self.params = dict(
+            input_dims=[16, 16],
+            minicolumn_dims=[12, 12],
+            active_minicolumns_per_inh_area=5,
+            potential_radius=3,
+            potential_percent=0.5,
+            global_inhibition=False,
+            stimulus_threshold=1,
+            boost_strength=2.0,
+            seed=42,
+        )
+        self.generator = np.random.default_rng(42)
+
+    def test_local_inhibition_without_ties(self):
+        """
+        without ties, local inhibition picks the same minicolumns as SpatialPooler,
+        one row at a time or in a batch.
+        """
+
+        sp = SpatialPooler(**self.params)
+        torch_sp = TorchSpatialPooler(**self.params)
+        density = sp.get_inhibition_density()
+
+        overlaps = self.generator.random((5, 144)).astype(real_type) * 10
+
+        expected = np.zeros(overlaps.shape, dtype=bool)
+        for i, row in enumerate(overlaps):
+            expected[i, sp.inhibit_minicolumns_local(row, density)] = True
+            np.testing.assert_array_equal(
+                np.sort(sp.inhibit_minicolumns_local(row, density)),
+                torch_sp.inhibit_minicolumns_local(torch.from_numpy(row),
+                                                   density).cpu().numpy()
+            )
+
+        np.testing.assert_array_equal(
+            expected,
+            torch_sp.inhibit_minicolumns_batch(torch.from_numpy(overlaps)).cpu()
+        )
+
+    def test_local_inhibition_breaks_ties_by_index(self):
+        """
+        a minicolumn wins if fewer than the allowed number of neighbors have a larger
+        overlap, or the same overlap and a lower index.
+        """
+
+        torch_sp = TorchSpatialPooler(**self.params)
+        density = torch_sp.get_inhibition_density()
+
+        overlaps = self.generator.integers(0, 4, 144).astype(real_type)
+        active = torch_sp.inhibit_minicolumns_local(torch.from_numpy(overlaps),
+                                                    density).cpu().numpy()
+
+        expected = []
+        for m in range(144):
+            neighbors = torch_sp.get_minicolumn_neighborhood(m)
+            num_beaten_by = np.count_nonzero(
+                (overlaps[neighbors] > overlaps[m])
+                | ((overlaps[neighbors] == overlaps[m]) & (neighbors < m))
+            )
+            if (overlaps[m] >= torch_sp.stimulus_threshold
+                    and num_beaten_by < int(0.5 + density * neighbors.size)):
+                expected.append(m)
+
+        np.testing.assert_array_equal(active, expected)
+
+    def test_boost_factors_close_to_numpy(self):
+        """
+        boost factors computed on the device are within float32 rounding of the
+        NumPy SpatialPooler's.
+        """
+
+        sp = SpatialPooler(**self.params)
+        torch_sp = TorchSpatialPooler(**self.params)
+
+        active_duty_cycles = self.generator.random(144).astype(real_type) * 0.1
+        sp.set_active_duty_cycles(active_duty_cycles)
+        torch_sp.set_active_duty_cycles(active_duty_cycles)
+
+        sp.update_boost_factors()
+        torch_sp.update_boost_factors()
+
+        self.assertEqual(torch_sp.get_boost_factors().device.type,
+                         torch_sp.active_duty_cycles.device.type)
+        np.testing.assert_allclose(sp.get_boost_factors(),
+                                   torch_sp.get_boost_factors().cpu(), rtol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import threading
+import unittest
+
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, TensorDataset
+
+from nupic.research.frameworks.pytorch.model_utils import evaluate_model, train_model
+from nupic.research.frameworks.pytorch.prefetch import DevicePrefetcher
+
+
+def simple_linear_net():
+    torch.manual_seed(42)
+    return torch.nn.Sequential(
+        torch.nn.Flatten(),
+        torch.nn.Linear(16, 8),
+        torch.nn.ReLU(),
+        torch.nn.Linear(8, 4),
+    )
+
+
+def random_loader(num_samples=64, batch_size=8):
+    generator = torch.Generator().manual_seed(0)
+    dataset = TensorDataset(torch.randn(num_samples, 4, 4, generator=generator),
+                            torch.randint(4, (num_samples,), generator=generator))
+    return DataLoader(dataset, batch_size=batch_size)
+
+
+class DevicePrefetcherTest(unittest.TestCase):
+
+    def test_batches_in_order(self):
+        """Batches are staged and returned in the order of the loader"""
+        loader = random_loader()
+        prefetcher = DevicePrefetcher(loader, lambda data, target: (data * 2, target),
+                                      "cpu", num_batches=2)
+
+        batches = list(prefetcher)
+        self.assertEqual(len(batches), len(loader))
+        for (data, target), (expected_data, expected_target) in zip(batches, loader):
+            self.assertTrue(torch.equal(data, expected_data * 2))
+            self.assertTrue(torch.equal(target, expected_target))
+
+        timing = prefetcher.timing()
+        self.assertGreaterEqual(timing["data_overlap"], 0.0)
+        self.assertLessEqual(timing["data_overlap"], 1.0)
+
+    def test_staging_error(self):
+        """Errors raised by the staging function are raised by the loop"""
+        def stage_fn(data, target):
+            raise ValueError("staging failed")
+
+        with self.assertRaisesRegex(ValueError, "staging failed"):
+            list(DevicePrefetcher(random_loader(), stage_fn, "cpu"))
+
+    def test_early_stop(self):
+        """The staging thread stops when the loop ends early"""
+        num_threads = threading.active_count()
+        batches = iter(DevicePrefetcher(random_loader(), lambda *batch: batch, "cpu"))
+        next(batches)
+        batches.close()
+        self.assertEqual(threading.active_count(), num_threads)
+
+    def test_train_and_evaluate(self):
+        """Prefetching doesn't change training and evaluation results"""
+        results = []
+        for prefetch_batches in (0, 2):
+            model = simple_linear_net()
+            optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+            timing = train_model(model, random_loader(), optimizer, "cpu",
+                                 criterion=F.cross_entropy, batches_in_epoch=5,
+                                 prefetch_batches=prefetch_batches)
+            result = evaluate_model(model, random_loader(), "cpu",
+                                    criterion=F.cross_entropy,
+                                    prefetch_batches=prefetch_batches)
+            results.append((model.state_dict(), timing, result))
+
+        (state_dict, timing, result), (prefetch_state_dict, prefetch_timing,
+                                       prefetch_result) = results
+        for name, value in state_dict.items():
+            self.assertTrue(torch.equal(prefetch_state_dict[name], value), name)
+
+        self.assertIsNone(timing)
+        self.assertEqual(set(prefetch_timing),
+                         {"data_staging_time", "data_wait_time", "data_overlap"})
+        for key, value in result.items():
+            self.assertEqual(prefetch_result[key], value)
+        self.assertIn("data_overlap", prefetch_result)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
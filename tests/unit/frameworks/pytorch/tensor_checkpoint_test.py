@@ -0,0 +1,164 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+
+import torch
+
+from nupic.research.frameworks.pytorch.tensor_checkpoint import (
+    TensorCheckpointWriter,
+    load_tensor_checkpoint,
+    save_tensor_checkpoint,
+)
+
+
+def sparse_linear_net():
+    torch.manual_seed(42)
+    net = torch.nn.Sequential(
+        torch.nn.Linear(64, 32),
+        torch.nn.BatchNorm1d(32),
+        torch.nn.Linear(32, 2),
+    )
+    with torch.no_grad():
+        net[0].weight[torch.rand(32, 64) < 0.9] = 0
+    return net
+
+
+def train_step(net, optimizer):
+    net(torch.randn(8, 64)).sum().backward()
+    optimizer.step()
+    optimizer.zero_grad()
+
+
+def assert_states_equal(test, state, expected):
+    test.assertEqual(state.keys(), expected.keys())
+    for key, value in expected.items():
+        if isinstance(value, torch.Tensor):
+            test.assertEqual(state[key].dtype, value.dtype)
+            test.assertTrue(torch.equal(state[key], value), key)
+        elif isinstance(value, dict):
+            assert_states_equal(test, state[key], value)
+        else:
+            test.assertEqual(state[key], value)
+
+
+class TensorCheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_save_load(self):
+        """Loaded state is equal to the saved state, with or without mmap"""
+        net = sparse_linear_net()
+        state = dict(
+            model=net.state_dict(),
+            other=dict(
+                step=3,
+                flags=torch.tensor([True, False]),
+                half=torch.arange(5, dtype=torch.bfloat16),
+                scalar=torch.tensor(2.5),
+                empty=torch.empty(0, 4),
+            ),
+        )
+        path = os.path.join(self.tmpdir.name, "checkpoint.ckpt")
+        save_tensor_checkpoint(path, state)
+
+        for mmap in (True, False):
+            loaded = load_tensor_checkpoint(path, mmap=mmap)
+            assert_states_equal(self, loaded, state)
+            self.assertEqual(loaded["model"]._metadata, state["model"]._metadata)
+
+        sparse_linear_net().load_state_dict(loaded["model"])
+
+    def test_delta_checkpoint(self):
+        """Delta checkpoints only store the changed elements and load exactly"""
+        net = sparse_linear_net()
+        base_path = os.path.join(self.tmpdir.name, "base.ckpt")
+        save_tensor_checkpoint(base_path, net.state_dict())
+
+        # update the nonzero weights of the sparse layer only
+        with torch.no_grad():
+            weight = net[0].weight
+            weight[weight != 0] += 1.0
+        state = net.state_dict()
+
+        path = os.path.join(self.tmpdir.name, "delta.ckpt")
+        save_tensor_checkpoint(path, state, base=base_path)
+        self.assertLess(os.path.getsize(path), os.path.getsize(base_path) / 2)
+
+        assert_states_equal(self, load_tensor_checkpoint(path), state)
+
+    def test_writer(self):
+        """Background writes of full and delta checkpoints are snapshots"""
+        net = sparse_linear_net()
+        optimizer = torch.optim.SGD(net.parameters(), lr=0.1, momentum=0.9)
+        writer = TensorCheckpointWriter(self.tmpdir.name, num_deltas=2)
+
+        paths, expected = [], []
+        for _ in range(4):
+            train_step(net, optimizer)
+            state = dict(model=net.state_dict(), optimizer=optimizer.state_dict())
+            paths.append(writer.save(state))
+            expected.append(dict(
+                model={k: v.clone() for k, v in state["model"].items()},
+                momentum=[optimizer.state[p]["momentum_buffer"].clone()
+                          for p in net.parameters()],
+            ))
+        writer.close()
+
+        self.assertEqual(len(set(paths)), 4)
+        for path, expected_state in zip(paths, expected):
+            state = load_tensor_checkpoint(path)
+            assert_states_equal(self, state["model"], expected_state["model"])
+            momentum = [s["momentum_buffer"]
+                        for s in state["optimizer"]["state"].values()]
+            for value, expected_value in zip(momentum, expected_state["momentum"]):
+                self.assertTrue(torch.equal(value, expected_value))
+
+    def test_writer_keep(self):
+        """Old full checkpoints are deleted with their deltas"""
+        net = sparse_linear_net()
+        optimizer = torch.optim.SGD(net.parameters(), lr=0.1)
+        state = dict(model=net.state_dict(), optimizer=optimizer.state_dict())
+
+        writer = TensorCheckpointWriter(self.tmpdir.name, num_deltas=1, keep=2)
+        paths = [writer.save(state) for _ in range(5)]
+        writer.close()
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)),
+                         [os.path.basename(path) for path in paths[2:]])
+
+        # files already in the directory are deleted too
+        writer = TensorCheckpointWriter(self.tmpdir.name, num_deltas=1, keep=1)
+        paths = [writer.save(state) for _ in range(2)]
+        writer.close()
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)),
+                         [os.path.basename(path) for path in paths])
+        assert_states_equal(self, load_tensor_checkpoint(paths[-1])["model"],
+                            state["model"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
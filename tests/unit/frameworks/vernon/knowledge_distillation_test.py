@@ -0,0 +1,207 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+from torchvision.datasets import FakeData
+from torchvision.transforms import ToTensor
+
+from nupic.research.frameworks.vernon import SupervisedExperiment, mixins
+
+
+class KnowledgeDistillationExperiment(mixins.KnowledgeDistillation,
+                                      SupervisedExperiment):
+    pass
+
+
+class KnowledgeDistillationCLExperiment(mixins.KnowledgeDistillationCL,
+                                        SupervisedExperiment):
+    pass
+
+
+class SimpleMLP(torch.nn.Module):
+    def __init__(self, num_classes=10, input_shape=(28, 28)):
+        super().__init__()
+        in_features = np.prod(input_shape)
+        self.flatten = torch.nn.Flatten()
+        self.classifier = torch.nn.Linear(in_features, num_classes, bias=False)
+
+    def forward(self, x):
+        y = self.flatten(x)
+        return self.classifier(y)
+
+
+class CountingTeacher(SimpleMLP):
+    """Teacher with fixed weights that counts its forward passes."""
+    num_calls = 0
+
+    def __init__(self, seed=0):
+        torch.manual_seed(seed)
+        super().__init__()
+
+    def forward(self, x):
+        CountingTeacher.num_calls += 1
+        return super().forward(x)
+
+
+class OtherTeacher(CountingTeacher):
+    def __init__(self):
+        super().__init__(seed=1)
+
+
+def fake_data(size=64, image_size=(1, 28, 28), train=False):
+    return FakeData(size=size, image_size=image_size, transform=ToTensor())
+
+
+def kd_config(**kwargs):
+    config = dict(
+        experiment_class=KnowledgeDistillationExperiment,
+        num_classes=10,
+        dataset_class=fake_data,
+        epochs=2,
+        batch_size=16,
+        model_class=SimpleMLP,
+        model_args=dict(num_classes=10, input_shape=(28, 28)),
+        optimizer_args=dict(lr=0.001),
+        teacher_model_class=[CountingTeacher, OtherTeacher],
+        kd_ensemble_weights=[0.7, 0.3],
+        kd_factor_init=0.8,
+        kd_temperature_init=2.0,
+        log_level="NOTSET",
+    )
+    config.update(kwargs)
+    return config
+
+
+class KnowledgeDistillationTest(unittest.TestCase):
+    """
+    Tests for the `KnowledgeDistillation` mixins with a teacher logit store.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.tmpdir.name, "teacher_logits")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def get_targets(self, config, batch):
+        exp = config["experiment_class"]()
+        exp.setup_experiment(config)
+        exp.model.train()
+
+        data, target = batch
+        if exp.kd_logit_store is not None:
+            indices = torch.arange(len(target))
+            target = (target, indices)
+        return exp.transform_data_to_device(data, target, exp.device, False)[1]
+
+    def test_store_gives_same_targets(self):
+        """Targets looked up in the store match the ones computed by teachers"""
+        dataset = fake_data()
+        batch = next(iter(torch.utils.data.DataLoader(dataset, batch_size=16)))
+
+        for experiment_class in (KnowledgeDistillationExperiment,
+                                 KnowledgeDistillationCLExperiment):
+            config = kd_config(experiment_class=experiment_class)
+            expected = self.get_targets(config, batch)
+
+            config.update(kd_logit_store=self.store_path)
+            targets = self.get_targets(config, batch)
+
+            if experiment_class is KnowledgeDistillationExperiment:
+                torch.testing.assert_close(targets, expected)
+            else:
+                torch.testing.assert_close(targets[0], expected[0])
+                for soft_target, expected_soft_target in zip(targets[1],
+                                                             expected[1]):
+                    torch.testing.assert_close(soft_target, expected_soft_target)
+
+    def test_teachers_not_run_during_training(self):
+        """The teachers are only run once, when creating the store"""
+        config = kd_config(kd_logit_store=self.store_path)
+        exp = KnowledgeDistillationExperiment()
+
+        CountingTeacher.num_calls = 0
+        exp.setup_experiment(config)
+        self.assertEqual(CountingTeacher.num_calls, 2 * 64 // 16)
+
+        ret = exp.run_epoch()
+        self.assertIn("mean_accuracy", ret)
+        self.assertEqual(CountingTeacher.num_calls, 2 * 64 // 16)
+
+        # the store is reused
+        KnowledgeDistillationExperiment().setup_experiment(config)
+        self.assertEqual(CountingTeacher.num_calls, 2 * 64 // 16)
+
+    def test_topk_store(self):
+        """Top-k fp16 stores keep the k largest outputs of each teacher"""
+        config = kd_config(kd_logit_store=self.store_path,
+                           kd_logit_store_topk=3,
+                           kd_logit_store_dtype="float16")
+        exp = KnowledgeDistillationExperiment()
+        exp.setup_experiment(config)
+
+        store = exp.kd_logit_store
+        self.assertEqual(store.values.shape, (64, 2, 3))
+        self.assertEqual(store.values.dtype, np.float16)
+        self.assertEqual(store.indices.shape, (64, 2, 3))
+
+        data, _ = exp.train_loader.dataset[5]
+        full_outputs = torch.stack([t(data[None]) for t in exp.teacher_models], 1)
+        outputs = store.lookup(torch.tensor([5]), num_classes=10)
+
+        self.assertEqual(outputs.shape, (1, 2, 10))
+        topk = full_outputs.topk(3, dim=2)
+        torch.testing.assert_close(outputs.gather(2, topk.indices), topk.values,
+                                   atol=1e-2, rtol=1e-2)
+        self.assertEqual(torch.isinf(outputs).sum().item(), 2 * 7)
+        torch.testing.assert_close(torch.softmax(outputs, dim=2).sum(dim=2),
+                                   torch.ones(1, 2))
+
+    def test_store_metadata(self):
+        """A store is only reused with the teachers and data it was created with"""
+        config = kd_config(kd_logit_store=self.store_path)
+        KnowledgeDistillationExperiment().setup_experiment(config)
+
+        different_configs = [
+            dict(teacher_model_class=[OtherTeacher, CountingTeacher]),
+            dict(dataset_args=dict(image_size=(1, 28, 28))),
+            dict(kd_logit_store_topk=3),
+            dict(kd_logit_store_dtype="float16"),
+        ]
+        for changes in different_configs:
+            with self.assertRaises(ValueError):
+                KnowledgeDistillationExperiment().setup_experiment(
+                    dict(config, **changes))
+
+        # the same config still reuses the store
+        CountingTeacher.num_calls = 0
+        KnowledgeDistillationExperiment().setup_experiment(config)
+        self.assertEqual(CountingTeacher.num_calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
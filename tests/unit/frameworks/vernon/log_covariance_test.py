@@ -0,0 +1,126 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import unittest
+
+import torch
+from torchvision.datasets import FakeData
+from torchvision.transforms import ToTensor
+
+from nupic.research.frameworks.vernon import SupervisedExperiment, mixins
+from nupic.research.frameworks.vernon.mixins.log_covariance import (
+    StreamingCovariance,
+)
+
+
+class LogCovarianceExperiment(mixins.LogCovariance, SupervisedExperiment):
+    @property
+    def module(self):
+        return self.model
+
+
+class SimpleMLP(torch.nn.Module):
+    def __init__(self, num_classes=10, input_shape=(28, 28)):
+        super().__init__()
+        self.flatten = torch.nn.Flatten()
+        self.hidden = torch.nn.Linear(input_shape[0] * input_shape[1], 32)
+        self.relu = torch.nn.ReLU()
+        self.classifier = torch.nn.Linear(32, num_classes)
+
+    def forward(self, x):
+        return self.classifier(self.relu(self.hidden(self.flatten(x))))
+
+
+def fake_data(size=100, image_size=(1, 28, 28), train=False):
+    return FakeData(size=size, image_size=image_size, transform=ToTensor())
+
+
+def covariance_stats(activations):
+    """Covariance statistics computed from all the activations at once"""
+    H = torch.cat(activations).double()  # NOQA N806
+    H -= H.mean(dim=0)
+    cov = H.t().mm(H) / H.shape[0]
+    var = cov.diag()
+    cov *= 1 - torch.eye(cov.shape[0], dtype=cov.dtype)
+    return (cov.pow(2).sum() / 2).item(), var.sum().item()
+
+
+class LogCovarianceTest(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+        mixing = torch.randn(64, 64) / 8
+        self.batches = [torch.relu(torch.randn(batch_size, 64).mm(mixing) + 1)
+                        for batch_size in (16, 3, 32, 1, 20)]
+
+    def test_streaming_covariance(self):
+        """Batched updates give the covariance of all the activations"""
+        covariance = StreamingCovariance()
+        for batch in self.batches:
+            covariance.update(batch)
+
+        sum_of_squares, variance_sum = covariance_stats(self.batches)
+        self.assertAlmostEqual(covariance.covariance_sum_of_squares()
+                               / sum_of_squares, 1, places=4)
+        self.assertAlmostEqual(covariance.variance_sum() / variance_sum, 1,
+                               places=4)
+
+    def test_sketched_covariance(self):
+        """The sketched sum of squares is close to the exact one"""
+        covariance = StreamingCovariance(sketch_size=32)
+        for batch in self.batches:
+            covariance.update(batch)
+
+        self.assertIsNone(covariance.m2)
+        self.assertEqual(covariance.m2_sketch.shape, (64, 32))
+
+        sum_of_squares, variance_sum = covariance_stats(self.batches)
+        self.assertAlmostEqual(covariance.covariance_sum_of_squares()
+                               / sum_of_squares, 1, delta=0.25)
+        self.assertAlmostEqual(covariance.variance_sum() / variance_sum, 1,
+                               places=4)
+
+    def test_log_covariance_experiment(self):
+        """The experiment reports the covariance of the hooked layers"""
+        exp = LogCovarianceExperiment()
+        exp.setup_experiment(dict(
+            dataset_class=fake_data,
+            batch_size=16,
+            model_class=SimpleMLP,
+            log_covariance_layernames=["relu"],
+            log_level="NOTSET",
+        ))
+
+        activations = []
+        hook = exp.model.relu.register_forward_hook(
+            lambda module, x, y: activations.append(y))
+        result = exp.validate()
+        hook.remove()
+
+        sum_of_squares, variance_sum = covariance_stats(activations)
+        self.assertAlmostEqual(result["relu/covariance_sum_of_squares"]
+                               / sum_of_squares, 1, places=4)
+        self.assertAlmostEqual(result["relu/variance_sum"] / variance_sum, 1,
+                               places=4)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
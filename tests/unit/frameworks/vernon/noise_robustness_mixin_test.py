@@ -27,6 +27,10 @@ from torchvision.datasets import FakeData
 from torchvision.transforms import ToTensor
 
 from nupic.research.frameworks.vernon import SupervisedExperiment, mixins
+from nupic.research.frameworks.vernon.mixins.noise_robustness_test import (
+    AddGaussianNoise,
+    add_gaussian_noise,
+)
 
 
 class NoiseRobustnessSupervisedExperiment(
@@ -51,6 +55,19 @@ def fake_data(size=100, image_size=(1, 28, 28), train=False):
     return FakeData(size=size, image_size=image_size, transform=ToTensor())
 
 
+class CountingFakeData(FakeData):
+    """FakeData counting the samples loaded."""
+    num_loads = 0
+
+    def __getitem__(self, index):
+        CountingFakeData.num_loads += 1
+        return super().__getitem__(index)
+
+
+def counting_fake_data(size=100, image_size=(1, 28, 28), train=False):
+    return CountingFakeData(size=size, image_size=image_size, transform=ToTensor())
+
+
 simple_supervised_config = dict(
     experiment_class=NoiseRobustnessSupervisedExperiment,
     num_classes=10,
@@ -95,6 +112,87 @@ class NoiseRobustnessMixinUnitTest(unittest.TestCase):
         assert "mean_accuracy_0.5_noise" in ret.keys()
         assert "mean_accuracy_0.9_noise" in ret.keys()
 
+    def test_single_pass(self):
+        """
+        Test whether the single pass mode loads each batch once and gives the same
+        results as the default mode.
+        """
+        config = dict(simple_supervised_config, dataset_class=counting_fake_data,
+                      noise_std=0.0)
+        exp = config["experiment_class"]()
+        exp.setup_experiment(config)
+        expected = exp.validate()
+
+        for levels_per_batch in (None, 2):
+            config.update(noise_single_pass=True,
+                          noise_levels_per_batch=levels_per_batch)
+            exp = config["experiment_class"]()
+            exp.setup_experiment(config)
+
+            CountingFakeData.num_loads = 0
+            results = exp.validate()
+            self.assertEqual(CountingFakeData.num_loads, 100)
+            self.assertEqual(results.keys(), expected.keys())
+            for key, value in expected.items():
+                self.assertAlmostEqual(results[key], value, places=4, msg=key)
+
+            # without noise, all the noise levels have the zero noise results
+            for noise_level in config["noise_levels"]:
+                self.assertEqual(
+                    results[f"total_correct_{noise_level}_noise"],
+                    results["total_correct"])
+
+    def test_add_gaussian_noise(self):
+        """
+        Test whether the device noise of the single pass mode has the same mask and
+        values as the AddGaussianNoise transform of the default mode.
+        """
+        data = torch.rand(100, 1, 28, 28)
+        for noise_level, mean, std in ((0.1, 0.0, 1.0), (0.5, 0.2, 0.5)):
+            torch.manual_seed(42)
+            expected = AddGaussianNoise(noise_level, mean, std)(data)
+            torch.manual_seed(42)
+            noisy = add_gaussian_noise(data, noise_level, mean, std)
+            self.assertTrue(torch.equal(noisy, expected))
+
+            # about noise_level of the elements get N(mean, std) noise
+            noise = (noisy - data)[noisy != data]
+            self.assertAlmostEqual(noise.numel() / data.numel(), noise_level,
+                                   delta=0.01)
+            self.assertAlmostEqual(noise.mean().item(), mean, delta=0.02)
+            self.assertAlmostEqual(noise.std().item(), std, delta=0.02)
+
+        self.assertIs(add_gaussian_noise(data, 0, 0.0, 1.0), data)
+
+    def test_single_pass_with_noise(self):
+        """
+        Test whether the single pass mode gives the same loss trend over the noise
+        levels as the default mode, with noise. The noise draws of the two modes
+        differ, so the losses are compared on a larger validation set.
+        """
+        losses = []
+        for single_pass in (False, True):
+            config = dict(simple_supervised_config, noise_single_pass=single_pass,
+                          noise_levels=[0.1, 0.5, 0.9],
+                          dataset_args=dict(size=1000))
+            exp = config["experiment_class"]()
+            exp.setup_experiment(config)
+
+            torch.manual_seed(42)
+            results = exp.validate()
+            losses.append([results["mean_loss"]] + [
+                results[f"mean_loss_{noise_level}_noise"]
+                for noise_level in config["noise_levels"]
+            ])
+
+        for default_loss, single_pass_loss in zip(*losses):
+            self.assertAlmostEqual(single_pass_loss, default_loss, delta=0.05)
+
+        # in both modes, the loss increases with the noise level
+        for mode_losses in losses:
+            self.assertEqual(mode_losses, sorted(mode_losses))
+            self.assertGreater(mode_losses[-1], mode_losses[0] + 0.05)
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
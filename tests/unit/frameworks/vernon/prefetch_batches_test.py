@@ -0,0 +1,160 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import threading
+import unittest
+
+import torch
+from torchvision.datasets import FakeData
+from torchvision.transforms import Compose, ToTensor
+
+from nupic.research.frameworks.vernon import SupervisedExperiment, mixins
+
+
+class ScaleInputs(object):
+    """Transform scaling the training inputs on the device."""
+    def transform_data_to_device(self, data, target, device, non_blocking):
+        data, target = super().transform_data_to_device(data, target, device,
+                                                        non_blocking)
+        if self.model.training:
+            data = data * 2
+        return data, target
+
+
+class ScaleInputsExperiment(ScaleInputs, SupervisedExperiment):
+    pass
+
+
+class RecordTransformThreads(object):
+    """Records the threads running the transform of the training batches."""
+    def transform_data_to_device(self, data, target, device, non_blocking):
+        if self.model.training:
+            self.transform_threads.add(threading.current_thread())
+        return super().transform_data_to_device(data, target, device,
+                                                non_blocking)
+
+
+class MaxupStandardExperiment(RecordTransformThreads,
+                              mixins.MaxupStandard,
+                              SupervisedExperiment):
+    transform_threads = set()
+
+
+class MaxupPerSampleExperiment(RecordTransformThreads,
+                               mixins.MaxupPerSample,
+                               SupervisedExperiment):
+    transform_threads = set()
+
+
+class SimpleMLP(torch.nn.Module):
+    def __init__(self, num_classes=10, input_shape=(28, 28)):
+        super().__init__()
+        self.flatten = torch.nn.Flatten()
+        self.classifier = torch.nn.Linear(input_shape[0] * input_shape[1],
+                                          num_classes)
+
+    def forward(self, x):
+        return self.classifier(self.flatten(x))
+
+
+def fake_data(size=64, image_size=(1, 28, 28), train=False):
+    return FakeData(size=size, image_size=image_size, transform=ToTensor())
+
+
+def replicas(image):
+    return torch.stack([image, 1 - image])
+
+
+def fake_replica_data(size=64, image_size=(1, 28, 28), train=False):
+    """Fake data with 2 replicas per training sample, as used by Maxup"""
+    transform = Compose([ToTensor(), replicas]) if train else ToTensor()
+    return FakeData(size=size, image_size=image_size, transform=transform)
+
+
+def simple_config(**kwargs):
+    config = dict(
+        num_classes=10,
+        dataset_class=fake_data,
+        epochs=2,
+        batch_size=16,
+        model_class=SimpleMLP,
+        optimizer_args=dict(lr=0.1),
+        epochs_to_validate=[0, 1],
+        log_level="NOTSET",
+    )
+    config.update(kwargs)
+    return config
+
+
+class PrefetchBatchesTest(unittest.TestCase):
+    """
+    Tests for the "prefetch_batches" option of `SupervisedExperiment`.
+    """
+
+    def run_experiment(self, experiment_class, config):
+        torch.manual_seed(42)
+        exp = experiment_class()
+        exp.setup_experiment(config)
+        results = [exp.run_epoch() for _ in range(exp.epochs)]
+        return exp, results
+
+    def test_prefetch_batches(self):
+        """Prefetching reports the data timing and doesn't change the results"""
+        for experiment_class in (SupervisedExperiment, ScaleInputsExperiment):
+            exp, results = self.run_experiment(experiment_class, simple_config())
+            prefetch_exp, prefetch_results = self.run_experiment(
+                experiment_class, simple_config(prefetch_batches=2))
+
+            for name, value in exp.model.state_dict().items():
+                self.assertTrue(
+                    torch.equal(prefetch_exp.model.state_dict()[name], value), name)
+
+            for result, prefetch_result in zip(results, prefetch_results):
+                self.assertEqual(prefetch_result["mean_loss"], result["mean_loss"])
+                self.assertNotIn("train_data_overlap", result)
+                for key in ("train_data_overlap", "train_data_wait_time",
+                            "train_data_staging_time", "data_overlap"):
+                    self.assertIn(key, prefetch_result)
+
+    def test_prefetch_batches_maxup(self):
+        """
+        Maxup transforms run the model being trained: they run in the training
+        loop when prefetching, with the same results
+        """
+        for experiment_class in (MaxupStandardExperiment, MaxupPerSampleExperiment):
+            config = simple_config(dataset_class=fake_replica_data)
+            exp, results = self.run_experiment(experiment_class, config)
+            experiment_class.transform_threads.clear()
+            prefetch_exp, prefetch_results = self.run_experiment(
+                experiment_class, dict(config, prefetch_batches=2))
+
+            self.assertEqual(experiment_class.transform_threads,
+                             {threading.main_thread()})
+            for name, value in exp.model.state_dict().items():
+                self.assertTrue(
+                    torch.equal(prefetch_exp.model.state_dict()[name], value), name)
+            for result, prefetch_result in zip(results, prefetch_results):
+                self.assertEqual(prefetch_result["mean_loss"], result["mean_loss"])
+                self.assertIn("train_data_overlap", prefetch_result)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,142 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2022, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+
+import torch
+from torchvision.datasets import FakeData
+from torchvision.transforms import ToTensor
+
+from nupic.research.frameworks.vernon import SupervisedExperiment
+
+
+class SimpleMLP(torch.nn.Module):
+    def __init__(self, num_classes=10, input_shape=(28, 28)):
+        super().__init__()
+        self.flatten = torch.nn.Flatten()
+        self.classifier = torch.nn.Linear(input_shape[0] * input_shape[1],
+                                          num_classes)
+
+    def forward(self, x):
+        return self.classifier(self.flatten(x))
+
+
+def fake_data(size=64, image_size=(1, 28, 28), train=False):
+    return FakeData(size=size, image_size=image_size, transform=ToTensor())
+
+
+def simple_config(**kwargs):
+    config = dict(
+        experiment_class=SupervisedExperiment,
+        num_classes=10,
+        dataset_class=fake_data,
+        epochs=4,
+        batch_size=16,
+        model_class=SimpleMLP,
+        optimizer_class=torch.optim.SGD,
+        optimizer_args=dict(lr=0.1, momentum=0.9),
+        lr_scheduler_class=torch.optim.lr_scheduler.StepLR,
+        lr_scheduler_args=dict(step_size=1, gamma=0.5),
+        log_level="NOTSET",
+    )
+    config.update(kwargs)
+    return config
+
+
+class SupervisedCheckpointTest(unittest.TestCase):
+    """
+    Tests for the `SupervisedExperiment` checkpoints written to "checkpoint_dir".
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assert_same_experiment(self, exp, expected):
+        self.assertEqual(exp.current_epoch, expected.current_epoch)
+        for name, value in expected.model.state_dict().items():
+            self.assertTrue(torch.equal(exp.model.state_dict()[name], value), name)
+        self.assertEqual(exp.lr_scheduler.state_dict(),
+                         expected.lr_scheduler.state_dict())
+        for p, expected_p in zip(exp.model.parameters(),
+                                 expected.model.parameters()):
+            self.assertTrue(torch.equal(exp.optimizer.state[p]["momentum_buffer"],
+                                        expected.optimizer.state[expected_p][
+                                            "momentum_buffer"]))
+
+    def test_checkpoint_dir(self):
+        """Checkpoint files restore the experiment like the serialized state"""
+        for background in (True, False):
+            checkpoint_dir = os.path.join(self.tmpdir.name, str(background))
+            config = simple_config(checkpoint_dir=checkpoint_dir,
+                                   checkpoint_deltas=1,
+                                   checkpoint_async=background)
+            exp = SupervisedExperiment()
+            exp.setup_experiment(config)
+
+            # full, delta, full, delta checkpoints
+            states = []
+            for _ in range(4):
+                exp.run_epoch()
+                states.append(exp.get_state())
+                self.assertNotIn("model", states[-1])
+
+            # restoring waits for the pending write
+            restored = SupervisedExperiment()
+            restored.setup_experiment(config)
+            restored.set_state(states[-1])
+            self.assert_same_experiment(restored, exp)
+
+            # the restored experiment doesn't overwrite the existing files
+            restored.run_epoch()
+            restored.get_state()
+            restored.stop_experiment()
+            exp.stop_experiment()
+            self.assertEqual(len(os.listdir(checkpoint_dir)), 5)
+
+            # files can also be restored without a checkpoint writer
+            restored = SupervisedExperiment()
+            restored.setup_experiment(simple_config())
+            restored.set_state(states[1])
+            self.assertEqual(restored.current_epoch, 2)
+            restored.run_epoch()
+            self.assertEqual(restored.current_epoch, 3)
+
+    def test_checkpoint_keep(self):
+        """Only the last "checkpoint_keep" checkpoints are kept"""
+        checkpoint_dir = os.path.join(self.tmpdir.name, "keep")
+        exp = SupervisedExperiment()
+        exp.setup_experiment(simple_config(checkpoint_dir=checkpoint_dir,
+                                           checkpoint_keep=2))
+        states = [exp.get_state() for _ in range(3)]
+        exp.stop_experiment()
+
+        self.assertEqual(sorted(os.listdir(checkpoint_dir)),
+                         [os.path.basename(state["checkpoint_path"])
+                          for state in states[1:]])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)